@@ -2,7 +2,7 @@
 import { useState, useEffect } from "react";
 import "./App.css";
 import SearchIcon from "./search.svg";
-import MovieCard from "./MovieCard";
+import MovieCard, { MOVIE_CARD_FIELDS } from "./MovieCard";
 import Login from "./Login";
 import Register from "./Register";
 import Navbar from "./Navbar";
@@ -174,13 +174,9 @@ const RecommendationsPage = () => {
   useEffect(() => {
     const fetchRecommendations = async () => {
       try {
-        const response = await fetch(`${BACKEND_URL}/recommendations`, {
-          method: "POST",
-          headers: {
-            "Content-Type": "application/json",
-          },
-          body: JSON.stringify({ mood }),
-        });
+        // GET so the browser can revalidate with the ETag and reuse its copy on 304
+        const params = new URLSearchParams({ mood, fields: MOVIE_CARD_FIELDS });
+        const response = await fetch(`${BACKEND_URL}/recommendations?${params}`);
 
         if (!response.ok) {
           throw new Error("Failed to fetch recommendations");
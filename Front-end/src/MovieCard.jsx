@@ -107,4 +107,7 @@ MovieCard.propTypes = {
   }).isRequired,
 };
 
+// Fields the card renders; pass as ?fields= so the backend only sends these
+export const MOVIE_CARD_FIELDS = "id,title,overview,poster_path,release_year";
+
 export default MovieCard;
\ No newline at end of file
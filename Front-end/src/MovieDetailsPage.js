@@ -1,51 +1,31 @@
 import React, { useState, useEffect } from "react";
 import { useParams } from "react-router-dom";
-
-const TMDB_API_KEY = process.env.REACT_APP_TMDB_API_KEY;
-const TMDB_API_URL = "https://api.themoviedb.org/3";
+import api from "./api";
 
 const MovieDetailsPage = () => {
   const { id } = useParams();
   const [movie, setMovie] = useState(null);
   const [cast, setCast] = useState([]);
   const [crew, setCrew] = useState([]);
+  const [ratings, setRatings] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
   useEffect(() => {
-    const fetchMovieDetails = async () => {
+    // One backend request returns details, credits and ratings, cached on the server
+    const fetchData = async () => {
+      setLoading(true);
+      setError(null);
       try {
-        const response = await fetch(`${TMDB_API_URL}/movie/${id}?api_key=${TMDB_API_KEY}&language=en-US`);
-        if (!response.ok) {
-          throw new Error("Failed to fetch movie details.");
-        }
-        const data = await response.json();
-        setMovie(data);
+        const response = await api.get(`/movie/${id}`);
+        setMovie(response.data);
+        setCast(response.data.cast);
+        setCrew(response.data.crew);
+        setRatings(response.data.ratings);
       } catch (err) {
         console.error("Error fetching movie details:", err);
-        setError(err.message);
+        setError(err.response?.status === 404 ? "Movie not found." : "Failed to fetch movie details.");
       }
-    };
-
-    const fetchMovieCredits = async () => {
-      try {
-        const response = await fetch(`${TMDB_API_URL}/movie/${id}/credits?api_key=${TMDB_API_KEY}&language=en-US`);
-        if (!response.ok) {
-          throw new Error("Failed to fetch movie credits.");
-        }
-        const data = await response.json();
-        setCast(data.cast.slice(0, 10)); 
-        setCrew(data.crew);
-      } catch (err) {
-        console.error("Error fetching credits:", err);
-        setError(err.message);
-      }
-    };
-
-    const fetchData = async () => {
-      setLoading(true);
-      setError(null);
-      await Promise.all([fetchMovieDetails(), fetchMovieCredits()]);
       setLoading(false);
     };
 
@@ -61,7 +41,7 @@ const MovieDetailsPage = () => {
     ? `https://image.tmdb.org/t/p/w500${movie.poster_path}`
     : "https://via.placeholder.com/500x750?text=No+Image";
 
-  const releaseYear = movie.release_date ? movie.release_date.split('-')[0] : "Unknown";
+  const releaseYear = movie.release_year || "Unknown";
 
   return (
     <div className="container mt-4">
@@ -82,7 +62,7 @@ const MovieDetailsPage = () => {
       <ul>
         {cast.map((actor) => (
           <li key={actor.id}>
-            {actor.name} as {actor.character}
+            {actor.character ? `${actor.name} as ${actor.character}` : actor.name}
           </li>
         ))}
       </ul>
@@ -90,11 +70,25 @@ const MovieDetailsPage = () => {
       <h3>Crew</h3>
       <ul>
         {crew.map((member) => (
-          <li key={member.id}>
+          <li key={`${member.id}-${member.job}`}>
             {member.name} - {member.job}
           </li>
         ))}
       </ul>
+
+      {ratings.length > 0 && (
+        <>
+          <h3>CineMood Ratings</h3>
+          <ul>
+            {ratings.map((rating) => (
+              <li key={rating.user_id}>
+                <strong>{rating.username}</strong>: {rating.rating}/5
+                {rating.review && ` - ${rating.review}`}
+              </li>
+            ))}
+          </ul>
+        </>
+      )}
     </div>
   );
 };
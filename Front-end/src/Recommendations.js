@@ -1,6 +1,6 @@
 import React, { useEffect, useState, useContext } from "react";
 import axios from "axios";
-import MovieCard from "./MovieCard";
+import MovieCard, { MOVIE_CARD_FIELDS } from "./MovieCard";
 import MoodSelector from "./MoodSelector"; 
 import { AuthContext } from "./AuthContext";
 
@@ -9,16 +9,13 @@ const fetchRecommendations = async (mood, token, setMovies, setError, setLoading
     setError(null);
   
     try {
-      const response = await axios.post(
-        "http://localhost:8000/recommendations",
-        { mood },
-        {
-          headers: {
-            Authorization: `Bearer ${token}`,
-            "Content-Type": "application/json",
-          },
-        }
-      );
+      // GET so the browser can revalidate with the ETag and reuse its copy on 304
+      const response = await axios.get("http://localhost:8000/recommendations", {
+        params: { mood, fields: MOVIE_CARD_FIELDS },
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
   
       if (response.data.error) {
         setError(response.data.error);
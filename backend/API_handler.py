@@ -1,14 +1,91 @@
-import requests
-from database_handler import DatabaseHandler
-from config import api_config, db_config
-
-from tmdbv3api import TMDb, Discover, Movie
-from config import tmdb_api_key
+import logging
+import os
+import sys
+import time
+
+import tracing
+import tmdb_scheduler
+import warmer
+from circuit_breaker import CircuitOpenError, create_breaker
+from disk_cache import DiskCachedSession, MemoryCache, create_cache
+from hedging import HedgedSession, HedgingPolicy
+from metrics import CACHE_REQUESTS, TMDB_REQUEST_SECONDS, TMDB_REQUESTS
+from config import api_config
+
+from config import (tmdb_api_key, tmdb_base_url, tmdb_circuit_config, tmdb_disk_cache_config, tmdb_hedging_config,
+                    tmdb_memory_cache_config, tmdb_request_timeout, tmdb_scheduler_config)
 from mood_to_genres import get_genre_mapping, filter_movies_by_mood
+from movie import Movie
+
+# requests, tmdbv3api and database_handler are imported where they are first needed so
+# importing this module (and therefore app.py) stays cheap
+
+logger = logging.getLogger(__name__)
+
+# Every request to TMDb goes through this scheduler (see get_tmdb_session), so user requests,
+# prefetching and ingestion share the rate limit in priority order
+scheduler = tmdb_scheduler.create_scheduler(tmdb_scheduler_config)
+# ...and through this circuit breaker, so an outage fails requests at once instead of
+# holding workers until they time out
+breaker = create_breaker("tmdb", tmdb_circuit_config)
+# Interactive GETs slower than their endpoint's usual p95 are sent twice (TMDB_HEDGING=true)
+hedging_policy = HedgingPolicy(**tmdb_hedging_config)
+_tmdb_session = None
+
+
+def get_tmdb_session():
+    """
+    :return: The shared HTTP session for TMDb, rate limited and prioritised by the scheduler,
+             guarded by the circuit breaker, hedged for interactive calls and answered from the
+             disk cache when those are enabled.
+    """
+    global _tmdb_session
+    if _tmdb_session is None:
+        import requests
+
+        scheduled = tmdb_scheduler.ScheduledSession(requests.Session(), scheduler, breaker,
+                                                    timeout=tmdb_request_timeout)
+        session = HedgedSession(scheduled, hedging_policy)
+        # Outermost, so cached responses take no rate limit token and are never hedged
+        disk_cache = create_cache(tmdb_disk_cache_config)
+        _tmdb_session = session if disk_cache is None else DiskCachedSession(session, disk_cache)
+    return _tmdb_session
+
+
+def is_tmdb_outage(error):
+    """
+    :return: True if the error means TMDb could not be reached (open circuit, connection
+             error or timeout), as opposed to a bad request.
+    """
+    if isinstance(error, CircuitOpenError):
+        return True
+    requests = sys.modules.get("requests")
+    return requests is not None and isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def _tmdb_call(endpoint, func, *args, **kwargs):
+    """
+    Runs a single TMDb request inside a trace span, counting it and timing it per endpoint.
+
+    :param endpoint: Short endpoint name (discover, search, movie_details, credits, ...).
+    :param func: Callable performing the request; requests must be sent with
+                 get_tmdb_session() or a tmdbv3api client from this module.
+    :return: Whatever func returns.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with tracing.span(f"tmdb.{endpoint}", {"tmdb.endpoint": endpoint}):
+            result = func(*args, **kwargs)
+        outcome = "ok"
+        return result
+    finally:
+        TMDB_REQUESTS.inc((endpoint, outcome))
+        TMDB_REQUEST_SECONDS.observe((endpoint,), time.perf_counter() - start)
 
 
 class TMDbAPIHandler:
-    BASE_URL = "https://api.themoviedb.org/3"
+    BASE_URL = tmdb_base_url
 
     # Genre IDs for Action, Comedy, Drama, Adventure
     GENRE_IDS = {
@@ -24,16 +101,17 @@ class TMDbAPIHandler:
         if not self.api_key:
             raise ValueError("API key not found.")
 
-        # Initialize DatabaseHandler with dotenv and file config
-        self.db_handler = DatabaseHandler(
-            host=db_config['host'],
-            user=db_config['user'],
-            password=db_config['password'],
-            database=db_config['database']
-        )
+        from database_handler import DatabaseHandler
+        from ingestion import Interner
+
+        self.db_handler = DatabaseHandler()
+        # Directors, actors and genres written by this handler, so each is inserted once
+        self.interner = Interner()
 
     def test_connection(self):
         """Check if the API key (bearer token) is valid by making a simple request to TMDb API."""
+        import requests
+
         test_url = f"{self.BASE_URL}/authentication"  # Correct TMDb endpoint
         headers = {
             "accept": "application/json",
@@ -41,7 +119,7 @@ class TMDbAPIHandler:
         }
 
         try:
-            response = requests.get(test_url, headers=headers, timeout=10)
+            response = _tmdb_call("authentication", get_tmdb_session().get, test_url, headers=headers, timeout=10)
             response.raise_for_status()  # Raise an exception for HTTP errors
         except requests.exceptions.RequestException as e:
             raise ConnectionError(f"Failed to connect to TMDb API: {e}")
@@ -50,84 +128,147 @@ class TMDbAPIHandler:
         if response.status_code != 200:
             raise ValueError(f"Unexpected response from TMDb API: {response.status_code}")
 
-        print("TMDb API connection established successfully.")
+        logger.info("TMDb API connection established successfully.")
 
     def get_movie_details(self, movie_id):
         # Fetch detailed information about a movie, including director and country ID
+        from ingestion import parse_movie
+
+        with tmdb_scheduler.priority(tmdb_scheduler.BACKFILL):
+            data = fetch_details_json(movie_id)
+        if data is None:
+            return None
+        movie = parse_movie(data)["movie"]
+        return Movie(
+            id=movie["id"],
+            title=movie["title"],
+            release_year=str(movie["release_year"]) if movie["release_year"] else None,
+            director_id=movie["director_id"],
+            country_id=movie["country_id"],
+        )
 
-        # Fetch movie details
-        movie_url = f"{self.BASE_URL}/movie/{movie_id}"
-        movie_params = {"api_key": self.api_key}
-        movie_response = requests.get(movie_url, params=movie_params)
-        movie_response.raise_for_status()
-        movie_data = movie_response.json()
-
-        # Fetch credits for the director information
-        credits_url = f"{self.BASE_URL}/movie/{movie_id}/credits"
-        credits_response = requests.get(credits_url, params={"api_key": self.api_key})
-        credits_response.raise_for_status()
-        credits_data = credits_response.json()
-
-        # Extract director ID
-        director_id = None
-        for crew_member in credits_data['crew']:
-            if crew_member['job'] == 'Director':
-                director_id = crew_member['id']
-                break
-
-        # Extract country ID
-        country_id = None
-        if movie_data['production_countries']:
-            country_id = movie_data['production_countries'][0]['iso_3166_1']
-
-        return {
-            "title": movie_data["title"],
-            "release_year": movie_data["release_date"][:4],  # Use only the year
-            "director_id": director_id,
-            "country_id": country_id
-        }
+    def ingest_movies(self, movie_ids):
+        """
+        Fetches movies from TMDb and stores them with their director, cast and genres.
+
+        :param movie_ids: TMDb movie ids.
+        :return: Number of movies stored, None if they could not be written.
+        """
+        from ingestion import fetch_records
+
+        with tmdb_scheduler.priority(tmdb_scheduler.BACKFILL):
+            records, missing = fetch_records(movie_ids, workers=1)
+        if missing:
+            logger.info(f"Movies {missing} not found on TMDb")
+        return self.db_handler.upsert_movies(records, interner=self.interner)
 
     def get_movies_by_genre(self, genre_name, page=1):
         # Fetch a list of movies for a given genre name and store them in the database.
-
+        # Bulk ingestion yields to user requests for the TMDb rate limit.
         genre_id = self.GENRE_IDS.get(genre_name)
         if not genre_id:
-            print(f"Error: Genre '{genre_name}' not found.")
+            logger.error(f"Error: Genre '{genre_name}' not found.")
             return
 
-        url = f"{self.BASE_URL}/discover/movie"
-        params = {
-            "api_key": self.api_key,
-            "with_genres": genre_id,
-            "page": page
-        }
-
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()  # Raise an error for HTTP codes like 401 or 404
-            data = response.json()
-
-            movies = data.get("results", [])
-            for movie in movies:
-                details = self.get_movie_details(movie["id"])
-                # Save the movie details to the database
-                self.db_handler.add_movie(details)
-                print(f"Movie '{details['title']}' added to the database.")
-
-        except requests.exceptions.HTTPError as http_err:
-            print(f"HTTP error occurred: {http_err}")
+            with tmdb_scheduler.priority(tmdb_scheduler.BACKFILL):
+                movie_ids, _ = fetch_discover_page(genre_id, page)
+            stored = self.ingest_movies(movie_ids)
+            logger.info(f"{stored or 0} '{genre_name}' movies of page {page} stored in the database.")
         except Exception as err:
-            print(f"An unexpected error occurred: {err}")
+            logger.error(f"An unexpected error occurred: {err}")
 
 
 ## this is from Aleksandra files:
 
 
-# Configure TMDb
-tmdb = TMDb()
-tmdb.api_key = tmdb_api_key
-tmdb.language = 'en'
-movie_api = Movie()
+# TMDb is configured on first use rather than at import time
+_tmdb_configured = False
+_movie_api = None
+
+
+def configure_tmdb():
+    """
+    Sets the API key and language of tmdbv3api. The settings are process wide, so this
+    only does work on its first call.
+    """
+    global _tmdb_configured
+    if not _tmdb_configured:
+        from tmdbv3api import TMDb
+
+        tmdb = TMDb()
+        tmdb.api_key = tmdb_api_key
+        tmdb.language = 'en'
+        # tmdbv3api sends cached GETs with requests.request through an unbounded lru_cache;
+        # send them through the scheduler and a bounded cache with a TTL instead, so only
+        # misses take a rate limit token and expired responses are read again from the disk cache
+        TMDb.cached_request = staticmethod(_request_cache)
+        _tmdb_configured = True
+
+
+def _cached_request(method, url, data):
+    import http_caching
+
+    response = get_tmdb_session().request(method, url, data=data)
+    # The in-process cache gets a new response: ETags built on the "tmdb" stamp must change
+    http_caching.versions.bump("tmdb")
+    return response
+
+
+_request_cache = MemoryCache(_cached_request, tmdb_memory_cache_config['max_entries'],
+                             tmdb_memory_cache_config['ttl'])
+
+
+def forget_responses(urls):
+    """
+    Drops the in-process copies of TMDb responses that were just refreshed in the disk
+    cache, so the next request reads the new ones, and changes the ETags built on them.
+
+    :param urls: URLs of the refreshed GET requests.
+    """
+    import http_caching
+
+    for url in urls:
+        _request_cache.discard("GET", url, None)
+    if urls:
+        http_caching.versions.bump("tmdb")
+
+
+def request_cache_period():
+    """
+    :return: Number of the current TTL period of the in-process TMDb cache. ETags built on
+             the "tmdb" stamp include it, so they change at least once per TTL, as cached
+             responses expire, even while no request refetches them.
+    """
+    ttl = _request_cache.ttl
+    return int(time.time() // ttl) if ttl > 0 else 0
+
+
+def get_movie_api():
+    """
+    :return: The shared tmdbv3api Movie client, created on first call.
+    """
+    global _movie_api
+    if _movie_api is None:
+        from tmdbv3api import Movie
+
+        configure_tmdb()
+        movie_api = Movie(session=get_tmdb_session())
+        movie_api._base = tmdb_base_url
+        _movie_api = movie_api
+    return _movie_api
+
+
+def upstream_cache_enabled():
+    """
+    :return: True if tmdbv3api memoises TMDb responses (the default; TMDB_CACHE_ENABLED=False disables it).
+    """
+    return os.environ.get("TMDB_CACHE_ENABLED") != "False"
+
+
+# tmdbv3api memoises GET requests in _request_cache; surface its hit ratio on /metrics
+CACHE_REQUESTS.set_function(("tmdbv3api", "hit"), lambda: _request_cache.cache_info().hits)
+CACHE_REQUESTS.set_function(("tmdbv3api", "miss"), lambda: _request_cache.cache_info().misses)
 
 def fetch_movies_by_genre(genre_name, mood, limit=1000):
     """
@@ -135,32 +276,15 @@ def fetch_movies_by_genre(genre_name, mood, limit=1000):
 
     :param genre_name: The genre to search for.
     :param limit: The number of movies to fetch.
-    :return: List of movies with title, release year, and overview.
+    :return: List of Movie records with title, release year, and overview.
     """
-    discover = Discover()
     genre_map = get_genre_mapping()  # Map genre names to TMDb genre IDs
     genre_id = genre_map.get(genre_name.lower())
 
     if not genre_id:
         raise ValueError(f"Genre '{genre_name}' not found in TMDb.")
 
-    # Fetch movies for the genre
-    results = discover.discover_movies({
-        'with_genres': genre_id,
-        'sort_by': 'popularity.desc'
-    })
-
-    movies = [
-        {
-            "id": m['id'],
-            "title": m['title'],
-            "release_year": m['release_date'].split('-')[0],
-            "overview": m['overview'],
-            "genre_ids": m['genre_ids'],
-            "poster_path": m['poster_path']
-        }
-        for m in results
-    ]
+    movies = fetch_genre_movies(genre_id)
 
     # Filter movies by mood
     filtered_movies = filter_movies_by_mood(movies, mood)
@@ -169,6 +293,29 @@ def fetch_movies_by_genre(genre_name, mood, limit=1000):
     return filtered_movies[:limit]
 
 
+def fetch_genre_movies(genre_id, cached=True):
+    """
+    Fetches the most popular movies of a genre from TMDb, for any mood.
+
+    :param genre_id: TMDb genre ID.
+    :param cached: False skips tmdbv3api's in-process cache (the disk cache still applies).
+    :return: List of Movie records.
+    """
+    from tmdbv3api import Discover
+
+    configure_tmdb()
+    discover = Discover(obj_cached=cached, session=get_tmdb_session())
+    discover._base = tmdb_base_url
+
+    # Fetch movies for the genre
+    results = _tmdb_call("discover", discover.discover_movies, {
+        'with_genres': genre_id,
+        'sort_by': 'popularity.desc'
+    })
+
+    return [Movie.from_discover(m) for m in results]
+
+
 def fetch_movie_info(title, db_handler):
 
     """
@@ -176,7 +323,7 @@ def fetch_movie_info(title, db_handler):
 
     :param title: Movie title to search for.
     :param db_handler: Instance of the DatabaseHandler class.
-    :return: Dictionary with movie details or None if not found.
+    :return: Dictionary from the database, list of Movie records from TMDb, or None if not found.
     """
     if not title:
         raise ValueError("Movie title is required")
@@ -186,25 +333,205 @@ def fetch_movie_info(title, db_handler):
     if movie:
         return movie
 
-
-    tmdb_results = movie_api.search(title)
+    warmer.record("search", title)
+    tmdb_results = search_movies(title)
     if not tmdb_results:
         return None
 
     movies = []
     for tmdb_movie in tmdb_results:
-        movies.append({
-            "id": tmdb_movie.id,
-            "title": tmdb_movie.title,
-            "release_year": tmdb_movie.release_date.split('-')[0] if tmdb_movie.release_date else "Unknown",
-            "overview": tmdb_movie.overview,
-            "genres": [genre['name'] for genre in tmdb_movie.genres] if hasattr(tmdb_movie, 'genres') else [],
-            "popularity": tmdb_movie.popularity
-        })
+        movies.append(Movie(
+            id=tmdb_movie.id,
+            title=tmdb_movie.title,
+            release_year=tmdb_movie.release_date.split('-')[0] if tmdb_movie.release_date else "Unknown",
+            overview=tmdb_movie.overview,
+            genres=[genre['name'] for genre in tmdb_movie.genres] if hasattr(tmdb_movie, 'genres') else [],
+            popularity=tmdb_movie.popularity,
+        ))
 
     return movies
 
 
+def search_movies(title, cached=True):
+    """
+    Searches TMDb for movies by title.
+
+    :param title: Movie title to search for.
+    :param cached: False skips tmdbv3api's in-process cache (the disk cache still applies).
+    :return: tmdbv3api search results.
+    """
+    if cached:
+        movie_api = get_movie_api()
+    else:
+        from tmdbv3api import Movie as MovieAPI
+
+        configure_tmdb()
+        movie_api = MovieAPI(obj_cached=False, session=get_tmdb_session())
+        movie_api._base = tmdb_base_url
+    return _tmdb_call("search", movie_api.search, title)
+
+
+# Shown on the details page; TMDb credits list every cast member
+DETAILS_CAST_SIZE = 10
+
+
+def fetch_movie_details(movie_id, db_handler):
+    """
+    Fetches everything the movie details page shows: the movie, its cast and crew, and
+    the ratings left by CineMood users. Movies in the local database are served from
+    it, with the overview, poster, runtime, crew and characters the movie table lacks
+    taken from TMDb's cached details; others take a single TMDb request (details with
+    credits appended).
+
+    :param movie_id: TMDb movie id.
+    :param db_handler: Instance of the DatabaseHandler class.
+    :return: Dictionary with the details and 'source' ('local' or 'tmdb'), or None if TMDb does not know the movie.
+    """
+    movie = db_handler.get_movie_details(movie_id)
+    if movie:
+        director = None
+        if movie["director_id"]:
+            director = {"id": movie["director_id"], "name": movie["director_name"]}
+        details = {
+            "id": movie["id"],
+            "title": movie["title"],
+            "release_year": str(movie["release_year"]) if movie["release_year"] else None,
+            "overview": None,
+            "poster_path": None,
+            "runtime": None,
+            "genres": movie["genres"],
+            "country": movie["country"],
+            "director": director,
+            "cast": [{"id": actor["id"], "name": actor["name"], "character": None}
+                     for actor in movie["cast"][:DETAILS_CAST_SIZE]],
+            "crew": [dict(director, job="Director")] if director else [],
+            "ratings": db_handler.get_movie_ratings(movie_id) or [],
+            "source": "local",
+        }
+        _add_tmdb_details(details)
+        return details
+
+    details = _get_tmdb_details(movie_id)
+    # Copied, so the cached dictionary is never changed by the caller
+    return None if details is None else dict(details)
+
+
+def _get_tmdb_details(movie_id):
+    return _cached_tmdb_details(movie_id) if upstream_cache_enabled() else _tmdb_details(movie_id)
+
+
+def _add_tmdb_details(details):
+    """
+    Fills in what the local database does not store from TMDb's details of the movie. The
+    local data is served as it is when TMDb cannot be asked.
+    """
+    try:
+        tmdb = _get_tmdb_details(details["id"])
+    except Exception as e:
+        logger.warning(f"Serving movie {details['id']} without TMDb's details: {e}")
+        return
+    if tmdb is None:
+        return
+    for key in ("overview", "poster_path", "runtime"):
+        details[key] = tmdb[key]
+    if tmdb["crew"]:
+        details["crew"] = tmdb["crew"]
+    characters = {actor["id"]: actor["character"] for actor in tmdb["cast"]}
+    details["cast"] = [dict(actor, character=characters.get(actor["id"])) for actor in details["cast"]]
+
+
+def fetch_details_json(movie_id):
+    """
+    Fetches a movie's TMDb details with its credits appended, in one request.
+
+    :param movie_id: TMDb movie id.
+    :return: The TMDb JSON (credits under 'credits'), or None if TMDb does not know the movie.
+    """
+    url = f"{tmdb_base_url}/movie/{movie_id}"
+    params = {"api_key": tmdb_api_key, "append_to_response": "credits", "language": "en-US"}
+    response = _tmdb_call("movie_details", get_tmdb_session().get, url, params=params)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_discover_page(genre_id, page=1, years=None):
+    """
+    Fetches one page of a genre's movies from TMDb's discover endpoint, most popular first.
+
+    :param genre_id: TMDb genre ID.
+    :param page: Page number (TMDb serves up to 500).
+    :param years: Optional (first, last) release years.
+    :return: (movie ids on the page, total number of pages)
+    """
+    url = f"{tmdb_base_url}/discover/movie"
+    params = {"api_key": tmdb_api_key, "with_genres": genre_id, "sort_by": "popularity.desc",
+              "include_adult": "false", "page": page}
+    if years is not None:
+        params["primary_release_date.gte"] = f"{years[0]}-01-01"
+        params["primary_release_date.lte"] = f"{years[1]}-12-31"
+    response = _tmdb_call("discover", get_tmdb_session().get, url, params=params)
+    response.raise_for_status()
+    data = response.json()
+    return [movie["id"] for movie in data.get("results", [])], data.get("total_pages") or 0
+
+
+def fetch_changed_ids(start_date, end_date):
+    """
+    Lists the movies TMDb changed between two dates, from its change feed.
+
+    :param start_date: First day (datetime.date), at most 14 days before end_date.
+    :param end_date: Last day (datetime.date).
+    :return: Sorted ids of the changed movies, adult titles left out.
+    """
+    url = f"{tmdb_base_url}/movie/changes"
+    ids, page, total_pages = set(), 1, 1
+    while page <= total_pages:
+        params = {"api_key": tmdb_api_key, "start_date": start_date.isoformat(), "end_date": end_date.isoformat(),
+                  "page": page}
+        response = _tmdb_call("changes", get_tmdb_session().get, url, params=params)
+        response.raise_for_status()
+        data = response.json()
+        ids.update(item["id"] for item in data.get("results", []) if not item.get("adult"))
+        total_pages = data.get("total_pages") or 1
+        page += 1
+    return sorted(ids)
+
+
+def _tmdb_details(movie_id):
+    data = fetch_details_json(movie_id)
+    if data is None:
+        return None
+    credits = data.get("credits") or {}
+    director = next(({"id": member["id"], "name": member["name"]}
+                     for member in credits.get("crew", []) if member.get("job") == "Director"), None)
+    countries = data.get("production_countries") or []
+    return {
+        "id": data["id"],
+        "title": data["title"],
+        "release_year": data["release_date"].split("-")[0] if data.get("release_date") else None,
+        "overview": data.get("overview"),
+        "poster_path": data.get("poster_path"),
+        "runtime": data.get("runtime"),
+        "genres": [genre["name"] for genre in data.get("genres", [])],
+        "country": countries[0]["name"] if countries else None,
+        "director": director,
+        "cast": [{"id": actor["id"], "name": actor["name"], "character": actor.get("character")}
+                 for actor in credits.get("cast", [])[:DETAILS_CAST_SIZE]],
+        "crew": [{"id": member["id"], "name": member["name"], "job": member["job"]}
+                 for member in credits.get("crew", [])],
+        # Movies outside the local database cannot have ratings
+        "ratings": [],
+        "source": "tmdb",
+    }
+
+
+# Memoised like tmdbv3api's requests, and only when its cache is enabled
+_cached_tmdb_details = MemoryCache(_tmdb_details, tmdb_memory_cache_config['max_entries'],
+                                   tmdb_memory_cache_config['ttl'])
+CACHE_REQUESTS.set_function(("movie_details", "hit"), lambda: _cached_tmdb_details.cache_info().hits)
+CACHE_REQUESTS.set_function(("movie_details", "miss"), lambda: _cached_tmdb_details.cache_info().misses)
 
 # main function
 if __name__ == "__main__":
@@ -212,6 +539,7 @@ if __name__ == "__main__":
     tmdb_handler.test_connection()
     tmdb_handler.get_movie_details('181812')
 
+    # For bulk ingestion run backfill.py, which is parallel and resumable
     # # Example of fetching movies by genre and storing them in the database
     # genres = ["Action", "Comedy", "Drama", "Adventure"]
     # for genre in genres:
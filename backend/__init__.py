@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Backend modules import each other by flat name (app.py is run from this directory),
+# so keep that working when they are imported as the 'backend' package, e.g. from tests/.
+_backend_dir = os.path.dirname(os.path.abspath(__file__))
+if _backend_dir not in sys.path:
+    sys.path.append(_backend_dir)
@@ -1,19 +1,28 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import (
     JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt)
 import os
 
 from dotenv import load_dotenv
-from marshmallow import ValidationError
 
+import http_caching
+import json_provider
+import lifecycle
+import metrics
+import mood_snapshot
+import profiling
+import replicas
+import tracing
+import warmer
 from auth import AuthHandler
-from config import db_config
-from schemas import RegisterRequestSchema, LoginRequestSchema, AuthResponseSchema
-from recomendation_engine import recommend_movies
-from mood_to_genres import get_genres_for_mood
+from config import catalog_config, db_config, db_replica_config, lazy_startup
+from mood_to_genres import get_genres_for_mood, parse_mood_weights
 from database_handler import DatabaseHandler
-from API_handler import fetch_movie_info
+from tmdb_scheduler import TMDbBusyError
+
+# schemas (marshmallow), recomendation_engine and API_handler (requests, tmdbv3api) are
+# imported inside the routes that use them, keeping the import of this module fast
 
 
 def create_app(test_config=None):
@@ -44,9 +53,68 @@ def create_app(test_config=None):
 
     jwt = JWTManager(app)
 
+    # orjson/msgspec-backed jsonify (JSON_BACKEND setting)
+    json_provider.init_app(app)
+    # Request timings; registered first so its after_request hook runs last, and so sees the
+    # final status (e.g. a 304 from http_caching) and includes the compression time
+    metrics.init_app(app)
+    # 304s and gzip/brotli compression; runs after every other after_request hook but the metrics one
+    http_caching.init_app(app)
+
+    # Per-request tracing; a no-op unless TRACE_SAMPLE_RATE is above zero
+    tracing.configure(**app.config.get('TRACING', {}))
+    tracing.init_app(app)
+    # Header-gated request profiler and optional background sampler (PROFILE_* settings)
+    profiling.init_app(app, app.config.get('PROFILING'))
+
+    # Per-mood recommendations precomputed into a shared memory-mapped file (MOOD_SNAPSHOT_* settings)
+    mood_snapshot.init_app(app, app.config.get('MOOD_SNAPSHOT'))
+
+    # Refreshes the TMDb disk cache for popular moods and searches before expiry (CACHE_WARMER_* settings)
+    warmer.init_app(app, app.config.get('CACHE_WARMER'))
+
     # Initialize the AuthHandler with the database configuration
     # AuthHandler manages user authentication, registration, and token revocation
     auth_handler = AuthHandler(db_config)
+    # Reachable by the worker lifecycle hooks (see lifecycle.py and gunicorn.conf.py)
+    app.extensions['cinemood'] = {'db_handler': db_handler, 'auth_handler': auth_handler}
+
+    # In-memory copy of the movie tables (CATALOG_SNAPSHOT); loaded before fork or on first read
+    if app.config.get('CATALOG_SNAPSHOT', catalog_config['enabled']):
+        import catalog
+        if catalog.available():
+            db_handler.catalog = catalog.CatalogSnapshot(db_handler)
+        else:
+            app.logger.warning("CATALOG_SNAPSHOT is on but numpy is not installed; reading the catalog from MySQL")
+
+    # Read replicas for the read-heavy user and rating queries (DB_REPLICA* settings)
+    replica_config = app.config.get('DB_REPLICAS', db_replica_config)
+    if db_handler.storage.name == 'mysql':
+        db_handler.replicas = replicas.ReplicaSet.from_config(replica_config, db_config)
+    elif replica_config['replicas']:
+        app.logger.warning("DB_REPLICAS only applies to DB_BACKEND=mysql; reading everything from SQLite")
+    if db_handler.replicas is not None:
+        # A replica may lag by up to max_lag seconds, so recent writes stay on the primary at least that long
+        db_handler.read_your_writes = max(replica_config['read_your_writes'], replica_config['max_lag'])
+
+    # Connections and TMDb clients are created on first use unless LAZY_STARTUP is off,
+    # in which case they are set up now and configuration errors surface at startup
+    if not app.config.get('LAZY_STARTUP', lazy_startup):
+        lifecycle.warm_up(db_handler, auth_handler)
+
+    def tmdb_busy(error):
+        # The TMDb rate limit is saturated: ask the client to retry instead of failing the request
+        app.logger.warning(f"TMDb call refused: {error.reason} ({error.priority})")
+        response = jsonify({"error": str(error)})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+
+    def tmdb_unavailable(error):
+        # TMDb is down or its circuit is open: fail fast and tell the client when to retry
+        app.logger.warning(f"TMDb unavailable: {error}")
+        response = jsonify({"error": "Movie data is temporarily unavailable, try again later."})
+        response.headers["Retry-After"] = str(max(1, int(getattr(error, "retry_in", 1))))
+        return response, 503
 
     # Set to store revoked JWT tokens (for logout functionality)
     # When a user logs out, their token's JTI (JWT ID) is added to this set to prevent further use
@@ -73,6 +141,13 @@ def create_app(test_config=None):
         """
         return "CineMood API is running."
 
+    @app.route('/metrics')
+    def get_metrics():
+        """
+        Exposes request, TMDb, database and cache metrics in the Prometheus text format.
+        """
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
     @app.route('/register', methods=['POST'])
     def register():
         """
@@ -83,6 +158,9 @@ def create_app(test_config=None):
 
         :return: JSON response with user information and access token or error message.
         """
+        from marshmallow import ValidationError
+        from schemas import RegisterRequestSchema, AuthResponseSchema
+
         data = request.get_json()
         app.logger.debug(f"Received data: {data}")
 
@@ -132,6 +210,8 @@ def create_app(test_config=None):
 
         :return: JSON response with user information and access token or error message.
         """
+        from schemas import LoginRequestSchema, AuthResponseSchema
+
         data = request.get_json()
         schema = LoginRequestSchema()
 
@@ -210,6 +290,8 @@ def create_app(test_config=None):
 
         :return: JSON response with guest user information and access token.
         """
+        from schemas import AuthResponseSchema
+
         try:
             # Log in as guest using AuthHandler
             guest_info = auth_handler.login_guest()
@@ -233,50 +315,127 @@ def create_app(test_config=None):
             # Return an error message if guest login fails
             return jsonify({"error": str(e)}), 400
 
-    @app.route('/recommendations', methods=['POST'])
+    @app.route('/recommendations', methods=['GET', 'POST'])
     def get_recommendations():
         """
         Recommend movies based on mood.
+
+        The mood comes from the JSON body (POST) or the 'mood' query parameter (GET; the
+        response then carries an ETag and answers If-None-Match with 304).
+        A weighted mix of moods is given as an object, e.g. {"mood": {"happy": 0.7,
+        "nostalgic": 0.3}}, or as ?mood=happy:0.7,nostalgic:0.3; the results then blend
+        the moods' genres in proportion to the weights.
+        Optional query parameter 'fields' (e.g. ?fields=id,title,poster_path) limits the
+        keys returned for each movie.
+        When a mood snapshot is loaded, single moods are served from it and the response
+        carries its version in an X-CineMood-Snapshot header.
+        While TMDb is unavailable the last recommendations for the mood, or movies from the
+        local catalog, are returned with an X-CineMood-Degraded header.
         """
-        data = request.get_json()  # Get JSON payload from the request
-        mood = data.get("mood", "")
+        from recomendation_engine import fallback_recommendations, recommend_blend, recommend_movies
+        from API_handler import is_tmdb_outage, request_cache_period, upstream_cache_enabled
+        from movie import CARD_FIELDS, to_dicts
+
+        if request.method == 'GET':
+            mood = request.args.get("mood", "")
+        else:
+            data = request.get_json()  # Get JSON payload from the request
+            mood = data.get("mood", "")
+        fields = json_provider.parse_fields(request.args.get("fields"))
 
         try:
-            if isinstance(mood, str):
+            if isinstance(mood, dict) or (isinstance(mood, str) and (":" in mood or "," in mood)):
+                mood = parse_mood_weights(mood)
+                # Canonical form, so equal mixes share an ETag however they were written
+                mood_key = ",".join(f"{m}:{w:.4f}" for m, w in sorted(mood.items()))
+            elif isinstance(mood, str):
                 mood = mood.lower()  # Ensure the mood is lowercase
+                mood_key = mood
             else:
                 raise ValueError("Mood must be a string.")
 
-            # Fetch genres for the given mood
-            genres = get_genres_for_mood(mood)
-            print(f"Genres for mood '{mood}': {genres}")  # Debug print
-
+            # Single moods are sliced from the snapshot when one is loaded; its version
+            # then identifies the results
+            snapshot = mood_snapshot.current()
+            if not (isinstance(mood, str) and snapshot is not None and mood in snapshot):
+                snapshot = None
+
+            # With the TMDb request cache on, recommendations only change when the cached
+            # TMDb data does: when a response is stored (the "tmdb" stamp) or may have
+            # expired (the cache's TTL period), so the ETag can be checked before computing anything
+            etag = None
+            if snapshot is not None:
+                etag = http_caching.make_etag("recommendations", mood_key, fields, f"snapshot-{snapshot.version}")
+            elif upstream_cache_enabled():
+                etag = http_caching.make_etag("recommendations", mood_key, fields, http_caching.versions.stamp("tmdb"),
+                                              request_cache_period())
+                not_modified = http_caching.not_modified(etag)
+                if not_modified is not None:
+                    return not_modified
 
             user_id = 1  # Temporary user ID for testing
-            recommendations = recommend_movies(user_id, mood, 120)
+            if isinstance(mood, dict):
+                app.logger.debug(f"Blending moods {mood}")
+                recommendations = recommend_blend(user_id, mood, 120)
+            elif snapshot is not None:
+                recommendations = snapshot.movies(mood, 120)
+            else:
+                # Fetch genres for the given mood
+                genres = get_genres_for_mood(mood)
+                app.logger.debug(f"Genres for mood '{mood}': {genres}")
+                recommendations = recommend_movies(user_id, mood, 120)
             #print(f"Recommendations: {recommendations}")  # Debug print
-            return jsonify(recommendations), 200
+            if isinstance(recommendations, list):
+                recommendations = to_dicts(recommendations, CARD_FIELDS, fields)
+            response = http_caching.cacheable(jsonify(recommendations), etag)
+            if snapshot is not None:
+                response.headers["X-CineMood-Snapshot"] = str(snapshot.version)
+            return response, 200
+        except TMDbBusyError as e:
+            return tmdb_busy(e)
         except Exception as e:
-            print(f"Error: {e}")
+            if is_tmdb_outage(e):
+                movies, source = fallback_recommendations(mood, 120, db_handler)
+                if source == "none":
+                    return tmdb_unavailable(e)
+                metrics.DEGRADED_RESPONSES.inc(("/recommendations", source))
+                response = jsonify(to_dicts(movies, CARD_FIELDS, fields))
+                # Stale or partial: served as-is but never cached or validated
+                response.headers["X-CineMood-Degraded"] = source
+                response.headers["Cache-Control"] = "no-store"
+                return response, 200
+            app.logger.error(f"Error: {e}")
             return jsonify({"error": str(e)}), 400
 
     @app.route('/movie_history', methods=['GET'])
     def get_user_movie_history():
         """
         Retrieve the movie watch history for a user.
+
+        Optional query parameter 'fields' limits the keys returned for each movie.
+        The ETag follows the number of watched movies, so unchanged histories get a 304.
         """
         user_id = request.args.get("user_id", type=int)
+        fields = json_provider.parse_fields(request.args.get("fields"))
         if not user_id:
             return jsonify({"error": "User ID is required"}), 400
 
         try:
+            etag = None
+            watched_count = db_handler.get_watched_count(user_id)
+            if watched_count is not None:
+                etag = http_caching.make_etag("movie_history", user_id, fields, watched_count)
+                not_modified = http_caching.not_modified(etag, private=True)
+                if not_modified is not None:
+                    return not_modified
+
             history = db_handler.get_watched_movies(user_id)
             if not history:
                 return jsonify({"message": "No watched movies found."}), 404
 
-            return jsonify(history), 200
+            return http_caching.cacheable(jsonify(json_provider.project(history, fields)), etag, private=True), 200
         except Exception as e:
-            print(f"Error: {e}")
+            app.logger.error(f"Error: {e}")
             return jsonify({"error": str(e)}), 400
 
     @app.route('/add_to_movie_history', methods=['POST'])
@@ -298,7 +457,7 @@ def create_app(test_config=None):
             else:
                 return jsonify({"message": "Failed to add movie to history"}), 400
         except Exception as e:
-            print(f"Error: {e}")
+            app.logger.error(f"Error: {e}")
             return jsonify({"error": str(e)}), 400
 
     @app.route('/search', methods=['GET'])
@@ -306,8 +465,15 @@ def create_app(test_config=None):
         """
         Search for movie information by title.
         If not found in the local database, fetch from TMDb.
+
+        Optional query parameter 'fields' limits the keys returned for each movie.
+        Responses carry an ETag and If-None-Match is answered with 304.
         """
+        from API_handler import fetch_movie_info, is_tmdb_outage
+        from movie import SEARCH_FIELDS, to_dicts
+
         title = request.args.get("title")
+        fields = json_provider.parse_fields(request.args.get("fields"))
         if not title:
             return jsonify({"error": "Movie title is required"}), 400
 
@@ -316,12 +482,83 @@ def create_app(test_config=None):
             if not movie:
                 return jsonify({"message": "Movie not found"}), 404
 
-            return jsonify(movie), 200
+            if isinstance(movie, list):
+                # TMDb results are Movie records
+                movie = to_dicts(movie, SEARCH_FIELDS, fields)
+            else:
+                movie = json_provider.project(movie, fields)
+            # Results may come from the database or TMDb, so the ETag is a hash of the body
+            return http_caching.cacheable(jsonify(movie)), 200
+        except TMDbBusyError as e:
+            return tmdb_busy(e)
         except Exception as e:
-            print(f"Error: {e}")
+            if is_tmdb_outage(e):
+                return tmdb_unavailable(e)
+            app.logger.error(f"Error: {e}")
             return jsonify({"error": str(e)}), 400
 
 
+    @app.route('/movies/batch', methods=['POST'])
+    def get_movies_batch():
+        """
+        Looks up several movies at once, e.g. every card of a recommendations grid.
+
+        Expects a JSON payload with 'ids' (list of movie ids) and an optional 'user_id'.
+        Returns 'movies', the local data of each id found (in the order asked), with
+        'watched', 'rating' and 'recommended' for the user when one is given, and 'missing',
+        the ids not in the local database. The whole batch takes a constant number of queries.
+        Optional query parameter 'fields' limits the keys returned for each movie.
+        """
+        from marshmallow import ValidationError
+        from schemas import MovieBatchRequestSchema
+
+        try:
+            data = MovieBatchRequestSchema().load(request.get_json(silent=True) or {})
+        except ValidationError as err:
+            return jsonify({"errors": err.messages}), 400
+        fields = json_provider.parse_fields(request.args.get("fields"))
+        # Duplicates are looked up once
+        movie_ids = list(dict.fromkeys(data["ids"]))
+
+        found = db_handler.get_movies_by_ids(movie_ids)
+        statuses = {}
+        if data["user_id"] is not None:
+            statuses = db_handler.get_movie_statuses(data["user_id"], [i for i in movie_ids if i in found])
+            if statuses is None:
+                return jsonify({"error": "Could not read the movie statuses"}), 400
+
+        movies = [dict(found[movie_id], **statuses.get(movie_id, {})) for movie_id in movie_ids if movie_id in found]
+        return jsonify({
+            "movies": json_provider.project(movies, fields),
+            "missing": [movie_id for movie_id in movie_ids if movie_id not in found],
+        }), 200
+
+    @app.route('/movie/<int:movie_id>', methods=['GET'])
+    def get_movie_details(movie_id):
+        """
+        Everything the movie details page shows in one response: details, cast and crew,
+        and the ratings of CineMood users. Served from the local database when the movie
+        is in it, otherwise from TMDb (one cached request).
+
+        Optional query parameter 'fields' limits the keys returned.
+        Responses carry an ETag and If-None-Match is answered with 304.
+        """
+        from API_handler import fetch_movie_details, is_tmdb_outage
+
+        fields = json_provider.parse_fields(request.args.get("fields"))
+        try:
+            details = fetch_movie_details(movie_id, db_handler)
+            if not details:
+                return jsonify({"message": "Movie not found"}), 404
+            return http_caching.cacheable(jsonify(json_provider.project(details, fields))), 200
+        except TMDbBusyError as e:
+            return tmdb_busy(e)
+        except Exception as e:
+            if is_tmdb_outage(e):
+                return tmdb_unavailable(e)
+            app.logger.error(f"Error: {e}")
+            return jsonify({"error": str(e)}), 400
+
 
     return app
 
@@ -1,3 +1,5 @@
+import logging
+import weakref
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -7,6 +9,32 @@ import mysql.connector
 from flask_jwt_extended import decode_token
 from mysql.connector import errorcode
 
+import tracing
+from lifecycle import after_fork
+from metrics import DB_POOL_SIZE
+from storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Live handlers, so /metrics can report how many connections are open
+_handlers = weakref.WeakSet()
+DB_POOL_SIZE.set_function(
+    ("AuthHandler",),
+    lambda: sum(1 for h in list(_handlers) if getattr(h, '_conn', None) is not None))
+
+# Connections inherited from the parent process. They stay referenced so the child never
+# shuts down a socket the parent may still be using.
+_inherited_connections = []
+
+
+@after_fork
+def _reset_after_fork():
+    # Each forked worker opens its own connection on first use
+    for handler in list(_handlers):
+        if handler._conn is not None:
+            _inherited_connections.append(handler._conn)
+        handler._conn = None
+
 
 class AuthHandler:
     """
@@ -18,24 +46,46 @@ class AuthHandler:
     # Duration of account lockout after reaching max failed attempts
     LOCKOUT_DURATION = timedelta(minutes=15)  # Lockout duration after max failed attempts
 
-    def __init__(self, config):
+    def __init__(self, config, *, storage=None):
         """
-        Initializes the connection to the MySQL database and creates the users table if it doesn't exist.
+        Stores the MySQL configuration. The connection is opened, and the users table created,
+        on first use of conn, so constructing the handler does not wait for the database.
 
         :param config: Dictionary containing MySQL connection configuration.
+        :param storage: storage.MySQLStorage or storage.SQLiteStorage to connect with; by default
+                        the one selected by DB_BACKEND, which uses config for MySQL.
         """
         if not isinstance(config, dict):
             raise TypeError("config must be a dictionary")
+        self.config = config
+        self.storage = storage or get_storage(config)
+        self._conn = None
+        # Initialize an in-memory set to store revoked tokens
+        self.revoked_tokens = set()
+        _handlers.add(self)
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self.connect()
+        return self._conn
+
+    def _cursor(self):
+        # A cursor per statement, opened on the calling thread: a storage.SQLiteConnection
+        # gives each thread its own connection, which a long-lived cursor would not follow
+        return tracing.TracedCursor(self.conn.cursor(dictionary=True), "AuthHandler")
+
+    def connect(self):
+        """
+        Initializes the connection to the database and creates the users table if it doesn't exist.
+        """
         try:
-            # Establish connection to the MySQL database using provided configuration
-            self.conn = mysql.connector.connect(**config)
-            # Create a cursor for executing queries, with results as dictionaries
-            self.cursor = self.conn.cursor(dictionary=True)
+            # Establish connection to the MySQL database (or SQLite file) using provided configuration
+            self._conn = self.storage.connect()
             # Ensure the users table exists
             self.create_users_table()
-            # Initialize an in-memory set to store revoked tokens
-            self.revoked_tokens = set()
         except mysql.connector.Error as err:
+            self._conn = None
             # Handle common connection errors
             if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
                 raise Exception("Incorrect MySQL username or password.")
@@ -58,9 +108,10 @@ class AuthHandler:
             lockout_time DATETIME NULL
         )
         """
+        cursor = self._cursor()
         try:
             # Execute the table creation query
-            self.cursor.execute(create_table_query)
+            cursor.execute(create_table_query)
             # Commit the changes to the database
             self.conn.commit()
         except mysql.connector.Error as err:
@@ -69,6 +120,8 @@ class AuthHandler:
                 pass
             else:
                 raise Exception(str(err))
+        finally:
+            cursor.close()
 
     def register_user(self, username, password):
         """
@@ -91,16 +144,19 @@ class AuthHandler:
         # Hash the password using bcrypt
         hashed_password = self.hash_password(password).decode('utf-8')
 
+        cursor = self._cursor()
         try:
             # Insert the new user into the database
             insert_query = "INSERT INTO users (username, password) VALUES (%s, %s)"
-            self.cursor.execute(insert_query, (username, hashed_password))
+            cursor.execute(insert_query, (username, hashed_password))
             self.conn.commit()
         except mysql.connector.IntegrityError:
             # Handle case where username is already taken (violates UNIQUE constraint)
             raise Exception("Username is already taken. Please choose another one.")
         except mysql.connector.Error as err:
             raise Exception(f"MySQL Error: {err}")
+        finally:
+            cursor.close()
 
     def login_guest(self):
         """
@@ -171,9 +227,9 @@ class AuthHandler:
             jti = decoded_token['jti']
             # Add the jti to the revoked tokens set
             self.revoked_tokens.add(jti)
-            print("User has been logged out and the token has been revoked.")
+            logger.debug("User has been logged out and the token has been revoked.")
         except Exception as e:
-            print(f"Error during logout: {e}")
+            logger.error(f"Error during logout: {e}")
             raise Exception("Invalid token. Logout failed.")
 
     def is_token_revoked(self, jti: str) -> bool:
@@ -193,7 +249,8 @@ class AuthHandler:
         :return: The hashed password as bytes.
         """
         # Generate a salt and hash the password
-        return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+        with tracing.span("bcrypt.hashpw"):
+            return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
 
     def verify_password(self, password: str, hashed: bytes) -> bool:
         """
@@ -204,7 +261,8 @@ class AuthHandler:
         :return: True if the password is correct, False otherwise.
         """
         # Compare the provided password with the stored hashed password
-        return bcrypt.checkpw(password.encode(), hashed)
+        with tracing.span("bcrypt.checkpw"):
+            return bcrypt.checkpw(password.encode(), hashed)
 
     def get_user(self, username: str) -> Optional[dict]:
         """
@@ -214,9 +272,13 @@ class AuthHandler:
         :return: A dictionary with user data or None if user does not exist.
         """
         select_query = "SELECT * FROM users WHERE username = %s"
-        self.cursor.execute(select_query, (username,))
-        # Fetch one user record
-        return self.cursor.fetchone()
+        cursor = self._cursor()
+        try:
+            cursor.execute(select_query, (username,))
+            # Fetch one user record
+            return cursor.fetchone()
+        finally:
+            cursor.close()
 
     def increment_failed_attempts(self, user: dict):
         """
@@ -227,8 +289,12 @@ class AuthHandler:
         # Increment the failed_attempts count
         new_attempts = user['failed_attempts'] + 1
         update_query = "UPDATE users SET failed_attempts = %s WHERE username = %s"
-        self.cursor.execute(update_query, (new_attempts, user['username']))
-        self.conn.commit()
+        cursor = self._cursor()
+        try:
+            cursor.execute(update_query, (new_attempts, user['username']))
+            self.conn.commit()
+        finally:
+            cursor.close()
 
     def reset_failed_attempts(self, username: str):
         """
@@ -237,8 +303,12 @@ class AuthHandler:
         :param username: The username.
         """
         update_query = "UPDATE users SET failed_attempts = 0, lockout_time = NULL WHERE username = %s"
-        self.cursor.execute(update_query, (username,))
-        self.conn.commit()
+        cursor = self._cursor()
+        try:
+            cursor.execute(update_query, (username,))
+            self.conn.commit()
+        finally:
+            cursor.close()
 
     def lock_account(self, username: str):
         """
@@ -249,8 +319,12 @@ class AuthHandler:
         # Calculate the lockout time as current time plus the lockout duration
         lockout_time = datetime.now() + self.LOCKOUT_DURATION
         update_query = "UPDATE users SET lockout_time = %s WHERE username = %s"
-        self.cursor.execute(update_query, (lockout_time, username))
-        self.conn.commit()
+        cursor = self._cursor()
+        try:
+            cursor.execute(update_query, (lockout_time, username))
+            self.conn.commit()
+        finally:
+            cursor.close()
 
     def is_locked_out(self, user: dict) -> bool:
         """
@@ -301,18 +375,15 @@ class AuthHandler:
 
     def close_connection(self):
         """
-        Closes the database cursor and connection.
+        Closes the database connection.
         """
-        if hasattr(self, 'cursor') and self.cursor:
-            try:
-                self.cursor.close()
-            except Exception:
-                pass  # Suppress any exception during cursor close
-        if hasattr(self, 'conn') and self.conn:
+        # Uses the private attribute so closing never opens a connection
+        if getattr(self, '_conn', None):
             try:
-                self.conn.close()
+                self._conn.close()
             except Exception:
                 pass  # Suppress any exception during connection close
+            self._conn = None
 
     def __del__(self):
         """
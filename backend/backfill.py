@@ -0,0 +1,241 @@
+"""
+Parallel, resumable backfill of the movie catalog from TMDb.
+
+The work is split into partitions, one page of TMDb's discover results per genre and
+range of release years. A pool of workers fetches the partitions and their movies
+(details and credits in one request each) at BACKFILL priority, behind user requests.
+The movies of a partition are written in one transaction together with a checkpoint row
+for the partition in sync_state, so a crashed or interrupted run skips the partitions it
+finished when started again. A movie listed by several partitions is fetched once per
+run, and movies already in the catalog are not fetched again unless --refresh is given.
+
+Only the workers talk to TMDb; database reads and writes stay on the main thread, as a
+DatabaseHandler has a single connection.
+
+    python backfill.py --genres action,comedy --years 1980-2019 --pages 10 --workers 8
+
+Progress is logged every few seconds: partitions done, movies written per second and
+TMDb calls per movie written.
+"""
+import contextvars
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date
+
+from config import backfill_config
+from ingestion import Interner
+from metrics import TMDB_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Last discover page TMDb serves
+MAX_PAGE = 500
+# Checkpoint names are '<run>:<genre>:<years>:<page>' and must fit sync_state.name
+MAX_RUN_NAME = 20
+
+DISCOVER = "discover"
+DETAILS = "details"
+
+
+def plan(genre_ids, first_year, last_year, span=10, pages=5):
+    """
+    :return: List of (genre id, (first year, last year), page) partitions, the first pages
+             of every genre and year range before the later ones.
+    """
+    ranges = [(year, min(year + span - 1, last_year)) for year in range(first_year, last_year + 1, span)]
+    return [(genre_id, years, page) for page in range(1, pages + 1) for genre_id in genre_ids for years in ranges]
+
+
+def _tmdb_calls():
+    return sum(TMDB_REQUESTS.collect().values())
+
+
+class BackfillStats:
+    """
+    Progress of a backfill run.
+    """
+
+    def __init__(self, total):
+        self.total = total      # partitions planned
+        self.resumed = 0        # partitions finished by an earlier run
+        self.done = 0           # partitions finished by this run
+        self.failed = 0
+        self.movies = 0         # movies written
+        self.duplicates = 0     # ids already seen in another partition of this run
+        self.known = 0          # ids already in the catalog
+        self.missing = 0        # ids TMDb does not know any more
+        self.started = time.perf_counter()
+        self._calls_at_start = _tmdb_calls()
+
+    @property
+    def calls(self):
+        return _tmdb_calls() - self._calls_at_start
+
+    def __str__(self):
+        elapsed = time.perf_counter() - self.started
+        return (f"{self.resumed + self.done}/{self.total} partitions ({self.failed} failed), "
+                f"{self.movies} movies in {elapsed:.1f} s ({self.movies / max(elapsed, 1e-9):.1f}/s), "
+                f"{self.calls / max(self.movies, 1):.2f} TMDb calls per movie, "
+                f"{self.duplicates} duplicate and {self.known} known ids skipped")
+
+
+class Backfill:
+    """
+    Fetches the movies of discover partitions into the catalog.
+    """
+
+    def __init__(self, db_handler, run="backfill", workers=4, refresh=False, report_interval=10.0):
+        """
+        :param db_handler: DatabaseHandler the movies and checkpoints are written with.
+        :param run: Name of the run; its checkpoints are kept under it, so another name starts over.
+        :param workers: Partitions fetched at once.
+        :param refresh: Also refetch movies already in the catalog.
+        :param report_interval: Seconds between progress log lines.
+        """
+        if not run or len(run) > MAX_RUN_NAME or ":" in run:
+            raise ValueError(f"Run name must have 1 to {MAX_RUN_NAME} characters and no ':'")
+        self.db_handler = db_handler
+        self.run_name = run
+        self.workers = workers
+        self.refresh = refresh
+        self.report_interval = report_interval
+        self._seen = set()
+        self._total_pages = {}
+        self._interner = Interner()
+
+    def key(self, partition):
+        genre_id, (first_year, last_year), page = partition
+        return f"{self.run_name}:{genre_id}:{first_year}-{last_year}:{page}"
+
+    def run(self, partitions):
+        """
+        Fetches and writes every partition not finished yet. A partition that fails is
+        logged and left for the next run; a TMDb outage stops the run.
+
+        :return: BackfillStats of the run.
+        :raise RuntimeError: If the database cannot be read or written.
+        """
+        from API_handler import fetch_discover_page, is_tmdb_outage
+        from ingestion import fetch_records
+        from tmdb_scheduler import BACKFILL, priority
+
+        finished = self.db_handler.get_sync_states(f"{self.run_name}:")
+        if finished is None:
+            raise RuntimeError("Could not read the backfill checkpoints")
+        stats = BackfillStats(len(partitions))
+        queue = deque(p for p in partitions if self.key(p) not in finished)
+        stats.resumed = len(partitions) - len(queue)
+        if stats.resumed:
+            logger.info(f"Resuming: {stats.resumed} of {len(partitions)} partitions already done")
+
+        pending = {}  # future -> (partition, stage, ids claimed by the partition)
+        reported = time.monotonic()
+        with priority(BACKFILL), ThreadPoolExecutor(self.workers, thread_name_prefix="backfill") as executor:
+            def submit(func, *args):
+                # A copy of this context per task, so the workers run at BACKFILL priority
+                return executor.submit(contextvars.copy_context().run, func, *args)
+
+            def fill():
+                # Twice as many tasks as workers: enough to keep them busy, few enough that
+                # the page counts of the first pages spare calls for pages that do not exist
+                while queue and len(pending) < 2 * self.workers:
+                    partition = queue.popleft()
+                    genre_id, years, page = partition
+                    total_pages = self._total_pages.get((genre_id, years))
+                    if total_pages is not None and page > total_pages:
+                        self._finish(partition, [], stats)
+                    else:
+                        pending[submit(fetch_discover_page, genre_id, page, years)] = (partition, DISCOVER, [])
+
+            fill()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    partition, stage, claimed = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        stats.failed += 1
+                        self._seen.difference_update(claimed)
+                        logger.warning(f"Partition {self.key(partition)} failed: {e}")
+                        if is_tmdb_outage(e):
+                            logger.error("TMDb is unreachable; stopping, the next run resumes from here")
+                            queue.clear()
+                        continue
+                    if stage == DISCOVER:
+                        ids, total_pages = result
+                        self._total_pages[partition[:2]] = min(total_pages, MAX_PAGE)
+                        claimed = self._claim(ids, stats)
+                        if claimed:
+                            pending[submit(fetch_records, claimed, 1)] = (partition, DETAILS, claimed)
+                        else:
+                            self._finish(partition, [], stats)
+                    else:
+                        records, missing = result
+                        stats.missing += len(missing)
+                        self._finish(partition, records, stats)
+                fill()
+                if time.monotonic() - reported >= self.report_interval:
+                    logger.info(f"Backfill: {stats}")
+                    reported = time.monotonic()
+        logger.info(f"Backfill done: {stats}")
+        return stats
+
+    def _claim(self, ids, stats):
+        # Ids this run has not fetched yet and, unless refreshing, the catalog lacks
+        fresh = [movie_id for movie_id in dict.fromkeys(ids) if movie_id not in self._seen]
+        stats.duplicates += len(ids) - len(fresh)
+        self._seen.update(fresh)
+        if fresh and not self.refresh:
+            known = self.db_handler.get_existing_movie_ids(fresh)
+            if known is None:
+                raise RuntimeError("Could not read the catalog's movie ids")
+            stats.known += len(known)
+            fresh = [movie_id for movie_id in fresh if movie_id not in known]
+        return fresh
+
+    def _finish(self, partition, records, stats):
+        checkpoint = (self.key(partition), json.dumps({"movies": len(records)}))
+        if self.db_handler.upsert_movies(records, state=checkpoint, interner=self._interner) is None:
+            raise RuntimeError(f"Could not write partition {checkpoint[0]}")
+        stats.done += 1
+        stats.movies += len(records)
+
+
+def _years(value):
+    first, _, last = value.partition("-")
+    return int(first), int(last or first)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database_handler import DatabaseHandler
+    from mood_to_genres import get_genre_mapping
+
+    logging.basicConfig(level=logging.INFO)
+    genre_map = get_genre_mapping()
+    parser = argparse.ArgumentParser(description="Backfill the movie catalog from TMDb's discover results.")
+    parser.add_argument("--genres", default=",".join(genre_map),
+                        help="Comma-separated genre names or TMDb ids; defaults to every genre.")
+    parser.add_argument("--years", type=_years, default=(1950, date.today().year),
+                        help="Release years, e.g. 1980-2019; defaults to 1950 to this year.")
+    parser.add_argument("--span", type=int, default=backfill_config['year_span'], help="Years per partition.")
+    parser.add_argument("--pages", type=int, default=backfill_config['pages'],
+                        help="Discover pages (20 movies each) per genre and year range.")
+    parser.add_argument("--workers", type=int, default=backfill_config['workers'])
+    parser.add_argument("--run", default="backfill", help="Checkpoint name; a new name starts over.")
+    parser.add_argument("--refresh", action="store_true", help="Also refetch movies already in the catalog.")
+    args = parser.parse_args()
+
+    genre_ids = list(dict.fromkeys(int(g) if g.strip().isdigit() else genre_map[g.strip().lower()]
+                                   for g in args.genres.split(",")))
+    db_handler = DatabaseHandler()
+    if db_handler.connection is None:
+        raise SystemExit("Cannot connect to the database")
+    backfill = Backfill(db_handler, args.run, args.workers, args.refresh)
+    stats = backfill.run(plan(genre_ids, *args.years, span=args.span, pages=min(args.pages, MAX_PAGE)))
+    print(f"Backfill: {stats}")
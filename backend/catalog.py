@@ -0,0 +1,343 @@
+import logging
+import sys
+import threading
+import time
+from datetime import timedelta
+
+from mysql.connector import Error
+
+from config import catalog_config
+from lifecycle import on_preload
+from mood_to_genres import get_genre_mapping, get_mood_genre_ids
+from movie import Movie
+
+try:
+    import numpy as np
+except ImportError:  # optional; without it the snapshot stays off and every read queries MySQL
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# A genre bitmask is one uint64 per movie
+MAX_GENRES = 64
+# Ids per IN (...) query when re-reading changed movies
+CHUNK_SIZE = 1000
+
+
+def available():
+    return np is not None
+
+
+class CatalogColumns:
+    """
+    Immutable, column-oriented copy of the movie catalog: one NumPy array per column of the
+    movie table, a bitmask of genres per movie, interned titles, and hash indexes from id
+    and from title to row. A refresh builds a new instance, so readers never see a
+    half-applied update.
+    """
+
+    def __init__(self, ids, titles, years, director_ids, country_ids, genre_masks, genre_bits,
+                 directors, countries):
+        self.ids = ids                    # int64
+        self.titles = titles              # list of interned str
+        self.years = years                # int16, 0 for NULL
+        self.director_ids = director_ids  # int64, 0 for NULL
+        self.country_ids = country_ids    # <U2, '' for NULL
+        self.genre_masks = genre_masks    # uint64, bit genre_bits[genre_id] set per genre
+        self.genre_bits = genre_bits      # genre id -> bit position
+        self.directors = directors        # director id -> name
+        self.countries = countries        # country code -> name
+        self.row_by_id = {int(movie_id): row for row, movie_id in enumerate(ids)}
+        # MySQL compares titles case-insensitively; the first row wins, like fetchone()
+        self.row_by_title = {}
+        for row, title in enumerate(titles):
+            self.row_by_title.setdefault(title.casefold(), row)
+        self._genre_by_bit = {bit: genre_id for genre_id, bit in genre_bits.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def movie_row(self, row):
+        """
+        :return: Dictionary shaped like a row of SELECT * FROM movie.
+        """
+        return {
+            "id": int(self.ids[row]),
+            "title": self.titles[row],
+            "release_year": int(self.years[row]) or None,
+            "director_id": int(self.director_ids[row]) or None,
+            "country_id": str(self.country_ids[row]) or None,
+        }
+
+    def find_title(self, title):
+        """
+        :return: Row of the movie with this title, or None.
+        """
+        return self.row_by_title.get(title.casefold())
+
+    def genre_mask(self, genre_ids):
+        """
+        :return: Bitmask with the bits of the given genres; genres the catalog does not know are ignored.
+        """
+        mask = 0
+        for genre_id in genre_ids:
+            bit = self.genre_bits.get(genre_id)
+            if bit is not None:
+                mask |= 1 << bit
+        return np.uint64(mask)
+
+    def filter(self, include_genre_ids=(), exclude_genre_ids=()):
+        """
+        Selects movies by genre with vectorised bitmask tests.
+
+        :param include_genre_ids: Movies must have at least one of these genres (all movies if empty).
+        :param exclude_genre_ids: Movies must have none of these genres.
+        :return: Array of row numbers.
+        """
+        keep = np.ones(len(self.ids), dtype=bool)
+        if include_genre_ids:
+            keep &= (self.genre_masks & self.genre_mask(include_genre_ids)) != 0
+        if exclude_genre_ids:
+            keep &= (self.genre_masks & self.genre_mask(exclude_genre_ids)) == 0
+        return np.flatnonzero(keep)
+
+    def genre_ids(self, row):
+        mask = int(self.genre_masks[row])
+        return [genre_id for bit, genre_id in self._genre_by_bit.items() if mask >> bit & 1]
+
+    def movies(self, rows):
+        """
+        :return: List of Movie records for the given rows.
+        """
+        return [Movie(genre_ids=self.genre_ids(row), **self.movie_row(row)) for row in rows]
+
+
+class CatalogSnapshot:
+    """
+    In-process snapshot of the movie, movie_genre, director and country tables, for reads
+    that would otherwise be a MySQL round trip each.
+
+    The snapshot is loaded on first use. Every insert, update or delete of a movie or of a
+    movie genre adds a row to catalog_changes (see the triggers in
+    sql/cinemood_database_creation.sql); at most once per refresh_interval seconds a read
+    checks that table and re-reads only the movies changed since the last check.
+
+    Rows older than change_retention seconds before the latest change seen are deleted
+    after each refresh, so the table does not grow without bound. A snapshot that falls
+    further behind than that misses deleted changes and does a full load() instead.
+    """
+
+    def __init__(self, db_handler, refresh_interval=None, change_retention=None):
+        """
+        :param db_handler: DatabaseHandler whose connection is used for loading.
+        :param refresh_interval: Seconds between checks for changes; defaults to CATALOG_REFRESH_INTERVAL.
+        :param change_retention: Seconds of catalog_changes to keep; defaults to CATALOG_CHANGE_RETENTION.
+        """
+        if np is None:
+            raise RuntimeError("The catalog snapshot needs numpy, which is not installed.")
+        self.db_handler = db_handler
+        self.refresh_interval = catalog_config['refresh_interval'] if refresh_interval is None else refresh_interval
+        self.change_retention = catalog_config['change_retention'] if change_retention is None else change_retention
+        self.columns = None
+        self.last_change_id = 0
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        Returns the snapshot, loading it or applying pending changes first when a check is
+        due. While one thread refreshes, other threads keep reading the previous columns.
+
+        :return: CatalogColumns, or None if the snapshot could not be loaded.
+        """
+        due = time.monotonic() - self._checked_at >= self.refresh_interval
+        # Only the first load makes readers wait
+        if due and self._lock.acquire(blocking=self.columns is None):
+            try:
+                if self.columns is None:
+                    self.load()
+                else:
+                    self.refresh()
+            except Error as e:
+                logger.error(f"Error loading catalog snapshot: {e}")
+            finally:
+                self._checked_at = time.monotonic()
+                self._lock.release()
+        return self.columns
+
+    def invalidate(self):
+        """
+        Makes the next read check for changes, e.g. after this process wrote to the catalog.
+        """
+        self._checked_at = float("-inf")
+
+    def _query(self, query, params=()):
+        connection = self.db_handler.connection
+        if not (connection and connection.is_connected()):
+            raise Error("No DB connection")
+        cursor = self.db_handler._cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _latest_change_id(self):
+        return self._query("SELECT COALESCE(MAX(id), 0) FROM catalog_changes")[0][0]
+
+    def load(self):
+        """
+        Reads the whole catalog.
+        """
+        start = time.perf_counter()
+        # Read first: changes made while loading are applied again by the next refresh
+        last_change_id = self._latest_change_id()
+        movies = self._query("SELECT id, title, release_year, director_id, country_id FROM movie")
+        genres = self._query("SELECT movie_id, genre_id FROM movie_genre")
+        self.columns = self._build(movies, genres, *self._reference_tables())
+        self.last_change_id = last_change_id
+        logger.info(f"Catalog snapshot loaded: {len(self.columns)} movies in "
+                    f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def refresh(self):
+        """
+        Applies the changes recorded since the last load or refresh.
+        """
+        changes = self._query("SELECT id, movie_id FROM catalog_changes WHERE id > %s", (self.last_change_id,))
+        if not changes:
+            return
+        # A gap after the last change seen is either unused ids, or changes deleted by another
+        # process's _prune_changes; in that case the change seen last is gone too
+        if (min(change_id for change_id, _ in changes) > self.last_change_id + 1
+                and not self._query("SELECT id FROM catalog_changes WHERE id = %s", (self.last_change_id,))):
+            logger.info("Catalog snapshot is older than the catalog_changes kept; loading it again")
+            self.load()
+            return
+        last_change_id = max(change_id for change_id, _ in changes)
+        changed_ids = sorted({movie_id for _, movie_id in changes if movie_id is not None})
+        # Rows without a movie id record changes to the director table
+        if any(movie_id is None for _, movie_id in changes):
+            directors, countries = self._reference_tables()
+        else:
+            directors, countries = self.columns.directors, self.columns.countries
+
+        movies, genres = [], []
+        for i in range(0, len(changed_ids), CHUNK_SIZE):
+            chunk = changed_ids[i:i + CHUNK_SIZE]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            movies += self._query(f"SELECT id, title, release_year, director_id, country_id FROM movie "
+                                  f"WHERE id IN ({placeholders})", chunk)
+            genres += self._query(f"SELECT movie_id, genre_id FROM movie_genre WHERE movie_id IN ({placeholders})",
+                                  chunk)
+
+        # Unchanged rows are copied over; changed movies are replaced by what the database has now,
+        # which drops deleted ones
+        old = self.columns
+        kept = np.flatnonzero(~np.isin(old.ids, np.array(changed_ids, dtype=np.int64)))
+        fresh = self._build(movies, genres, directors, countries, old.genre_bits)
+        self.columns = CatalogColumns(
+            ids=np.concatenate([old.ids[kept], fresh.ids]),
+            titles=[old.titles[row] for row in kept] + fresh.titles,
+            years=np.concatenate([old.years[kept], fresh.years]),
+            director_ids=np.concatenate([old.director_ids[kept], fresh.director_ids]),
+            country_ids=np.concatenate([old.country_ids[kept], fresh.country_ids]),
+            genre_masks=np.concatenate([old.genre_masks[kept], fresh.genre_masks]),
+            genre_bits=fresh.genre_bits,
+            directors=directors,
+            countries=countries,
+        )
+        self.last_change_id = last_change_id
+        logger.debug(f"Catalog snapshot refreshed: {len(changed_ids)} movies changed")
+        self._prune_changes()
+
+    def _prune_changes(self):
+        """
+        Deletes the changes recorded more than change_retention seconds before the last one
+        applied. The cutoff comes from the database's own timestamps, so the clocks and time
+        zones of the backend and the database server do not matter.
+        """
+        if not self.change_retention:
+            return
+        try:
+            rows = self._query("SELECT changed_at FROM catalog_changes WHERE id = %s", (self.last_change_id,))
+            if not rows or rows[0][0] is None:
+                return
+            cutoff = rows[0][0] - timedelta(seconds=self.change_retention)
+            cursor = self.db_handler._cursor()
+            try:
+                cursor.execute("DELETE FROM catalog_changes WHERE id < %s AND changed_at < %s",
+                               (self.last_change_id, cutoff))
+                self.db_handler.connection.commit()
+            finally:
+                cursor.close()
+        except Error as e:
+            # The snapshot is up to date either way; the next refresh tries again
+            logger.warning(f"Error deleting old catalog changes: {e}")
+
+    def _reference_tables(self):
+        directors = {row[0]: row[1] for row in self._query("SELECT id, d_name FROM director")}
+        countries = {row[0]: row[1] for row in self._query("SELECT id, country FROM country")}
+        return directors, countries
+
+    @staticmethod
+    def _build(movies, genres, directors, countries, genre_bits=None):
+        """
+        Builds columns from movie rows (id, title, release_year, director_id, country_id)
+        and movie_genre rows (movie_id, genre_id).
+        """
+        genre_bits = dict(genre_bits or {})
+        if not genre_bits:
+            # TMDb genres first, so masks built from the mood maps always fit
+            for genre_id in sorted(set(get_genre_mapping().values())):
+                genre_bits[genre_id] = len(genre_bits)
+
+        row_by_id = {movie[0]: row for row, movie in enumerate(movies)}
+        masks = np.zeros(len(movies), dtype=np.uint64)
+        for movie_id, genre_id in genres:
+            row = row_by_id.get(movie_id)
+            if row is None:
+                continue
+            if genre_id not in genre_bits:
+                if len(genre_bits) >= MAX_GENRES:
+                    logger.warning(f"Genre {genre_id} left out of the catalog snapshot: more than {MAX_GENRES} genres")
+                    continue
+                genre_bits[genre_id] = len(genre_bits)
+            masks[row] |= np.uint64(1 << genre_bits[genre_id])
+
+        return CatalogColumns(
+            ids=np.fromiter((m[0] for m in movies), dtype=np.int64, count=len(movies)),
+            titles=[sys.intern(m[1]) for m in movies],
+            years=np.fromiter((m[2] or 0 for m in movies), dtype=np.int16, count=len(movies)),
+            director_ids=np.fromiter((m[3] or 0 for m in movies), dtype=np.int64, count=len(movies)),
+            country_ids=np.array([m[4] or "" for m in movies], dtype="<U2"),
+            genre_masks=masks,
+            genre_bits=genre_bits,
+            directors=directors,
+            countries=countries,
+        )
+
+    def candidates(self, mood, limit=None):
+        """
+        Movies of the catalog matching a mood: at least one of its genres and none of its
+        excluded genres.
+
+        :param mood: The user's mood.
+        :param limit: Maximum number of movies.
+        :return: List of Movie records, or None if the snapshot is not available.
+        """
+        columns = self.current()
+        if columns is None:
+            return None
+        include, exclude = get_mood_genre_ids(mood)
+        if not include:
+            return []
+        rows = columns.filter(include, exclude)
+        return columns.movies(rows[:limit])
+
+
+@on_preload
+def _load_before_fork(app):
+    # Workers share the loaded arrays copy-on-write instead of each reading the catalog
+    db_handler = app.extensions.get("cinemood", {}).get("db_handler")
+    if db_handler is not None and db_handler.catalog is not None:
+        db_handler.catalog.current()
@@ -0,0 +1,184 @@
+"""
+Incremental catalog sync from TMDb's change feed.
+
+TMDb lists the movies changed on each day (/movie/changes, up to 14 days per request).
+The sync reads the feed from its last checkpoint up to today, refetches the changed
+movies that are in the catalog (details and credits in one request each) and writes them
+with their director, cast and genres, one transaction per batch. The checkpoint is saved
+in the same transaction as each batch, so an interrupted run resumes after the last
+batch it wrote.
+
+Run it from cron:
+
+    python catalog_sync.py                      # from the checkpoint (or yesterday) to today
+    python catalog_sync.py --since 2024-05-01   # from a given day
+    python catalog_sync.py --all                # also add changed movies the catalog lacks
+
+TMDb calls run at BACKFILL priority, behind user requests and prefetching, and refresh
+the disk cache entries of the movies they fetch.
+"""
+import json
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from config import catalog_sync_config
+from ingestion import Interner
+
+logger = logging.getLogger(__name__)
+
+# sync_state row holding the checkpoint
+CHECKPOINT = "catalog_sync"
+# Longest date range TMDb's change feed accepts, in days
+MAX_WINDOW_DAYS = 14
+
+
+class SyncStats:
+    """
+    What a sync run did.
+    """
+
+    def __init__(self):
+        self.changed = 0   # ids in the change feed
+        self.skipped = 0   # changed movies not in the catalog
+        self.written = 0   # movies upserted
+        self.missing = 0   # ids TMDb no longer knows
+        self.started = time.perf_counter()
+
+    def __str__(self):
+        return (f"{self.changed} changed, {self.written} written, {self.skipped} not in the catalog, "
+                f"{self.missing} gone from TMDb in {time.perf_counter() - self.started:.1f} s")
+
+
+def windows(since, until):
+    """
+    Splits a date range into the ranges the change feed accepts. Consecutive ranges share
+    their boundary day, as a day's changes may have grown since it was last read.
+
+    :return: List of (start, end) dates.
+    """
+    ranges = []
+    start = since
+    while True:
+        end = min(start + timedelta(days=MAX_WINDOW_DAYS - 1), until)
+        ranges.append((start, end))
+        if end >= until:
+            return ranges
+        start = end
+
+
+class CatalogSync:
+    """
+    Brings the movie tables up to date with TMDb's change feed.
+    """
+
+    def __init__(self, db_handler, batch_size=100, workers=4, only_known=True):
+        """
+        :param db_handler: DatabaseHandler the movies and the checkpoint are written with.
+        :param batch_size: Movies fetched and written per transaction.
+        :param workers: Movies fetched from TMDb at once.
+        :param only_known: Only refetch changed movies that are already in the catalog.
+        """
+        self.db_handler = db_handler
+        self.batch_size = batch_size
+        self.workers = workers
+        self.only_known = only_known
+        self._interner = Interner()
+
+    def load_checkpoint(self):
+        """
+        :return: Dictionary with the 'since' and 'until' dates of the last range synced and
+                 'last_id', the last id written if that range is unfinished (else None);
+                 None before the first run.
+        """
+        value = self.db_handler.get_sync_state(CHECKPOINT)
+        if not value:
+            return None
+        data = json.loads(value)
+        return {"since": date.fromisoformat(data["since"]), "until": date.fromisoformat(data["until"]),
+                "last_id": data.get("last_id")}
+
+    def _save(self, records, start, end, last_id):
+        checkpoint = json.dumps({"since": start.isoformat(), "until": end.isoformat(), "last_id": last_id})
+        if self.db_handler.upsert_movies(records, (CHECKPOINT, checkpoint), self._interner) is None:
+            raise RuntimeError(f"Could not write the changes of {start} to {end}; the checkpoint is unchanged")
+
+    def run(self, since=None, until=None):
+        """
+        Syncs the changes from `since` (by default the end of the last synced range, or
+        yesterday on the first run) to `until` (by default today, UTC). An unfinished range
+        from an interrupted run is finished first.
+
+        :return: SyncStats of the run.
+        """
+        from disk_cache import refreshing
+        from tmdb_scheduler import BACKFILL, priority
+
+        until = until or datetime.now(timezone.utc).date()
+        checkpoint = self.load_checkpoint()
+        resume = None
+        if since is None:
+            if checkpoint is None:
+                since = until - timedelta(days=1)
+            else:
+                since = checkpoint["until"]
+                if checkpoint["last_id"] is not None:
+                    resume = checkpoint
+        if since > until:
+            raise ValueError(f"Start date {since} is after end date {until}")
+
+        stats = SyncStats()
+        # An infinite lead makes every fetch skip the disk cache and store the new response
+        with priority(BACKFILL), refreshing(float("inf")):
+            if resume is not None:
+                logger.info(f"Resuming the sync of {resume['since']} to {resume['until']} "
+                            f"after movie {resume['last_id']}")
+                self._sync_range(resume["since"], resume["until"], resume["last_id"], stats)
+            for start, end in windows(since, until):
+                self._sync_range(start, end, None, stats)
+        logger.info(f"Catalog sync done: {stats}")
+        return stats
+
+    def _sync_range(self, start, end, after, stats):
+        from API_handler import fetch_changed_ids
+        from ingestion import fetch_records
+
+        # Sorted, so the last id written tells where to resume
+        ids = [movie_id for movie_id in fetch_changed_ids(start, end) if after is None or movie_id > after]
+        stats.changed += len(ids)
+        for i in range(0, len(ids), self.batch_size):
+            batch = ids[i:i + self.batch_size]
+            wanted = batch
+            if self.only_known:
+                known = self.db_handler.get_existing_movie_ids(batch)
+                if known is None:
+                    raise RuntimeError("Could not read the catalog's movie ids")
+                wanted = [movie_id for movie_id in batch if movie_id in known]
+                stats.skipped += len(batch) - len(wanted)
+            records, missing = fetch_records(wanted, self.workers)
+            self._save(records, start, end, batch[-1])
+            stats.written += len(records)
+            stats.missing += len(missing)
+            logger.info(f"Changes of {start} to {end}: {i + len(batch)}/{len(ids)} ids done, {stats}")
+        self._save([], start, end, None)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database_handler import DatabaseHandler
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Sync changed movies from TMDb into the catalog.")
+    parser.add_argument("--since", type=date.fromisoformat, help="First day (YYYY-MM-DD); defaults to the checkpoint.")
+    parser.add_argument("--until", type=date.fromisoformat, help="Last day (YYYY-MM-DD); defaults to today.")
+    parser.add_argument("--all", action="store_true", help="Also add changed movies that are not in the catalog.")
+    parser.add_argument("--batch-size", type=int, default=catalog_sync_config['batch_size'])
+    parser.add_argument("--workers", type=int, default=catalog_sync_config['workers'])
+    args = parser.parse_args()
+
+    db_handler = DatabaseHandler()
+    if db_handler.connection is None:
+        raise SystemExit("Cannot connect to the database")
+    sync = CatalogSync(db_handler, args.batch_size, args.workers, only_known=not args.all)
+    print(f"Catalog sync: {sync.run(args.since, args.until)}")
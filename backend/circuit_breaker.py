@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from lifecycle import after_fork
+from metrics import CIRCUIT_REJECTED, CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Values of the state gauge on /metrics
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of calling a dependency whose circuit is open.
+    """
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is unavailable, retrying in {retry_in:.0f}s.")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while so requests fail fast instead of
+    tying up workers.
+
+    Closed: calls go through and their outcomes are kept for `window` seconds. Once at
+    least `min_calls` outcomes are in the window and the share of failures reaches
+    `failure_rate`, the circuit opens. Open: calls are refused for `open_seconds`.
+    Half-open: up to `probes` calls go through at once; the first success closes the
+    circuit again, a failure reopens it.
+    """
+
+    def __init__(self, name, failure_rate=0.5, window=30.0, min_calls=10, open_seconds=30.0, probes=1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.window = window
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self._reset()
+        CIRCUIT_STATE.set_function((name,), lambda: STATE_VALUES[self.state])
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._outcomes = deque()  # (monotonic time, succeeded)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_running = 0
+
+    def _transition(self, state):
+        if state != self.state:
+            logger.warning(f"Circuit {self.name}: {self.state} -> {state}")
+            self.state = state
+
+    def _trim(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            _, succeeded = self._outcomes.popleft()
+            if not succeeded:
+                self._failures -= 1
+
+    def before_call(self):
+        """
+        Checks whether a call may go through.
+
+        :return: True if the call is a half-open probe.
+        :raise CircuitOpenError: If the circuit is open.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            now = time.monotonic()
+            if self.state == OPEN:
+                retry_in = self._opened_at + self.open_seconds - now
+                if retry_in > 0:
+                    CIRCUIT_REJECTED.inc((self.name,))
+                    raise CircuitOpenError(self.name, retry_in)
+                self._transition(HALF_OPEN)
+            if self._probes_running >= self.probes:
+                CIRCUIT_REJECTED.inc((self.name,))
+                raise CircuitOpenError(self.name, 0)
+            self._probes_running += 1
+            return True
+
+    def record(self, succeeded, probe=False):
+        """
+        Records the outcome of a call let through by before_call.
+
+        :param succeeded: False if the dependency failed; None if the call never reached it.
+        :param probe: The value returned by before_call.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if probe:
+                self._probes_running -= 1
+                if self.state != HALF_OPEN or succeeded is None:
+                    return
+                if succeeded:
+                    self._outcomes.clear()
+                    self._failures = 0
+                    self._transition(CLOSED)
+                else:
+                    self._opened_at = now
+                    self._transition(OPEN)
+                return
+            if self.state != CLOSED or succeeded is None:
+                return
+            self._outcomes.append((now, succeeded))
+            if not succeeded:
+                self._failures += 1
+            self._trim(now)
+            if len(self._outcomes) >= self.min_calls and self._failures >= self.failure_rate * len(self._outcomes):
+                self._opened_at = now
+                self._transition(OPEN)
+
+    @property
+    def is_open(self):
+        """
+        :return: True while calls are being refused (the open period has not elapsed).
+        """
+        return self.state == OPEN and time.monotonic() < self._opened_at + self.open_seconds
+
+
+_breakers = []
+
+
+def create_breaker(name, config):
+    """
+    :param name: Dependency name, used in logs, errors and metrics.
+    :param config: Dictionary with the CircuitBreaker settings (see config.tmdb_circuit_config).
+    """
+    breaker = CircuitBreaker(name, **config)
+    _breakers.append(breaker)
+    return breaker
+
+
+@after_fork
+def _reset_after_fork():
+    # Each worker judges the dependency from its own calls
+    for breaker in _breakers:
+        breaker._reset()
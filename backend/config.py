@@ -12,8 +12,178 @@ db_config = {
     'database': os.getenv('DB_NAME'),
     'raise_on_warnings': True,
 }
+storage_config = {
+    # 'mysql' uses the server of db_config; 'sqlite' an embedded database file (WAL mode) for
+    # single-node deployments, tests and benchmarks
+    'backend': os.getenv('DB_BACKEND', 'mysql').lower(),
+    'sqlite_path': os.getenv('DB_SQLITE_PATH', 'cinemood.db'),
+    # Seconds a SQLite write waits for another connection's write to finish
+    'sqlite_busy_timeout': float(os.getenv('DB_SQLITE_BUSY_TIMEOUT', '5')),
+}
+db_replica_config = {
+    # Comma-separated read replicas ('host' or 'host:port'); they use the credentials of db_config
+    'replicas': os.getenv('DB_REPLICAS', ''),
+    # Connections kept per replica and per worker process
+    'pool_size': int(os.getenv('DB_REPLICA_POOL_SIZE', '4')),
+    # Replicas further behind their source than this, in seconds, are not read from
+    'max_lag': float(os.getenv('DB_REPLICA_MAX_LAG', '5')),
+    # Seconds between lag checks of each replica
+    'lag_check_interval': float(os.getenv('DB_REPLICA_LAG_CHECK', '5')),
+    # Seconds after a write during which the user's or movie's reads stay on the primary
+    'read_your_writes': float(os.getenv('DB_READ_YOUR_WRITES', '5')),
+    'connect_timeout': int(os.getenv('DB_REPLICA_CONNECT_TIMEOUT', '2')),
+}
 api_config = {
     'api_key': os.getenv('API_KEY'),
     'api_version': os.getenv('API_VERSION')
 }
-tmdb_api_key = os.getenv('TMDB_API_KEY')
\ No newline at end of file
+tmdb_api_key = os.getenv('TMDB_API_KEY')
+# Overridable so benchmarks and tests can point the backend at a local TMDb stub
+tmdb_base_url = os.getenv('TMDB_BASE_URL', 'https://api.themoviedb.org/3')
+
+# Defer DB connections, TMDb clients and heavy imports to first use (LAZY_STARTUP=false sets them up in create_app)
+lazy_startup = os.getenv('LAZY_STARTUP', 'true').lower() == 'true'
+
+# JSON library for responses: 'auto' (orjson, then msgspec, then stdlib), 'orjson', 'msgspec' or 'stdlib'
+json_backend = os.getenv('JSON_BACKEND', 'auto')
+
+http_cache_config = {
+    # Responses smaller than this are sent uncompressed
+    'min_size': int(os.getenv('COMPRESS_MIN_SIZE', '1024')),
+    'gzip_level': int(os.getenv('COMPRESS_GZIP_LEVEL', '6')),
+    # Only used when the optional brotli package is installed
+    'brotli_quality': int(os.getenv('COMPRESS_BROTLI_QUALITY', '4')),
+    # Seconds shared responses may be reused without revalidation; 0 always revalidates
+    'max_age': int(os.getenv('HTTP_CACHE_MAX_AGE', '0')),
+}
+
+tmdb_scheduler_config = {
+    # TMDb requests per second for the host; under gunicorn each worker gets an equal share
+    # of the rate and burst (see gunicorn.conf.py). 0 disables rate limiting
+    'rate': float(os.getenv('TMDB_RATE_LIMIT', '40')),
+    'burst': int(os.getenv('TMDB_BURST', '20')),
+    # Waiting requests allowed per priority before new ones are refused
+    'max_queue': int(os.getenv('TMDB_MAX_QUEUE', '100')),
+    # Longest wait for a token per priority, in seconds
+    'timeouts': {
+        'interactive': float(os.getenv('TMDB_TIMEOUT_INTERACTIVE', '2')),
+        'prefetch': float(os.getenv('TMDB_TIMEOUT_PREFETCH', '10')),
+        'backfill': float(os.getenv('TMDB_TIMEOUT_BACKFILL', '300')),
+    },
+    # Tokens kept for interactive requests while prefetch/backfill requests run
+    'reserve': int(os.getenv('TMDB_INTERACTIVE_RESERVE', '5')),
+}
+
+tmdb_circuit_config = {
+    # The circuit opens when this share of the calls in the window failed...
+    'failure_rate': float(os.getenv('TMDB_CIRCUIT_FAILURE_RATE', '0.5')),
+    'window': float(os.getenv('TMDB_CIRCUIT_WINDOW', '30')),
+    # ...and the window holds at least this many calls
+    'min_calls': int(os.getenv('TMDB_CIRCUIT_MIN_CALLS', '10')),
+    # Seconds TMDb is not called before a probe request is let through
+    'open_seconds': float(os.getenv('TMDB_CIRCUIT_OPEN_SECONDS', '30')),
+    'probes': int(os.getenv('TMDB_CIRCUIT_PROBES', '1')),
+}
+# Seconds to wait for TMDb to connect and to answer before the call counts as failed
+tmdb_request_timeout = float(os.getenv('TMDB_REQUEST_TIMEOUT', '5'))
+
+tmdb_hedging_config = {
+    # Send a second copy of interactive TMDb GETs slower than the tracked percentile
+    'enabled': os.getenv('TMDB_HEDGING', 'false').lower() == 'true',
+    # Largest share of calls that may be hedged
+    'budget': float(os.getenv('TMDB_HEDGE_BUDGET', '0.05')),
+    'percentile': float(os.getenv('TMDB_HEDGE_PERCENTILE', '95')),
+    # Shortest wait before hedging, in seconds
+    'min_delay': float(os.getenv('TMDB_HEDGE_MIN_DELAY', '0.01')),
+}
+
+tmdb_disk_cache_config = {
+    # SQLite file keeping TMDb responses across restarts, shared by the workers of a host; empty disables it
+    'path': os.getenv('TMDB_DISK_CACHE', ''),
+    'max_bytes': int(float(os.getenv('TMDB_DISK_CACHE_MAX_MB', '256')) * 1024 * 1024),
+    # Seconds responses are kept, per endpoint
+    'ttls': {
+        'discover': float(os.getenv('TMDB_DISK_CACHE_TTL_DISCOVER', '3600')),
+        'search': float(os.getenv('TMDB_DISK_CACHE_TTL_SEARCH', '3600')),
+        'movie_details': float(os.getenv('TMDB_DISK_CACHE_TTL_DETAILS', '86400')),
+        'credits': float(os.getenv('TMDB_DISK_CACHE_TTL_DETAILS', '86400')),
+    },
+}
+
+tmdb_memory_cache_config = {
+    # In-process copies of TMDb responses, in front of the disk cache: most kept per worker,
+    # and seconds each is kept before it is read again from the disk cache or TMDb
+    'max_entries': int(os.getenv('TMDB_MEMORY_CACHE_SIZE', '1024')),
+    'ttl': float(os.getenv('TMDB_MEMORY_CACHE_TTL', '300')),
+}
+
+warmer_config = {
+    # Refresh the disk cache entries of the most requested moods and search terms before they expire
+    'enabled': os.getenv('CACHE_WARMER', 'false').lower() == 'true',
+    'interval': float(os.getenv('CACHE_WARMER_INTERVAL', '60')),
+    # Seconds before expiry from which an entry is refreshed
+    'lead': float(os.getenv('CACHE_WARMER_LEAD', '300')),
+    # Hottest moods and search terms looked at per cycle
+    'top': int(os.getenv('CACHE_WARMER_TOP', '20')),
+    # Most TMDb calls per cycle
+    'max_refreshes': int(os.getenv('CACHE_WARMER_MAX_REFRESHES', '50')),
+    # Seconds after which a request counts half as much towards popularity
+    'half_life': float(os.getenv('CACHE_WARMER_HALF_LIFE', '900')),
+}
+
+catalog_config = {
+    # Keep an in-memory copy of the movie tables for title/id lookups and genre filtering (needs numpy)
+    'enabled': os.getenv('CATALOG_SNAPSHOT', 'false').lower() == 'true',
+    # Seconds between checks of catalog_changes for movies to re-read
+    'refresh_interval': float(os.getenv('CATALOG_REFRESH_INTERVAL', '30')),
+    # Seconds of catalog_changes kept before the latest change a snapshot has seen; older rows are deleted (0 keeps all)
+    'change_retention': float(os.getenv('CATALOG_CHANGE_RETENTION', '86400')),
+}
+
+mood_snapshot_config = {
+    # Snapshot file of precomputed recommendations per mood, mapped by every worker ('' disables it)
+    'path': os.getenv('MOOD_SNAPSHOT', ''),
+    # Movies ranked and kept per mood
+    'size': int(os.getenv('MOOD_SNAPSHOT_SIZE', '500')),
+    # Seconds between background rebuilds; 0 leaves building to `python mood_snapshot.py`
+    'refresh_interval': float(os.getenv('MOOD_SNAPSHOT_REFRESH', '3600')),
+    # Seconds between checks of the file for a newer snapshot
+    'check_interval': float(os.getenv('MOOD_SNAPSHOT_CHECK_INTERVAL', '5')),
+}
+
+catalog_sync_config = {
+    # Changed movies fetched and written per transaction by `python catalog_sync.py`
+    'batch_size': int(os.getenv('CATALOG_SYNC_BATCH', '100')),
+    # Movies fetched from TMDb at once (the scheduler still applies the rate limit)
+    'workers': int(os.getenv('CATALOG_SYNC_WORKERS', '4')),
+}
+
+backfill_config = {
+    # Defaults of `python backfill.py`: partitions fetched at once...
+    'workers': int(os.getenv('BACKFILL_WORKERS', '4')),
+    # ...discover pages per genre and year range...
+    'pages': int(os.getenv('BACKFILL_PAGES', '5')),
+    # ...and release years per partition
+    'year_span': int(os.getenv('BACKFILL_YEAR_SPAN', '10')),
+}
+
+tracing_config = {
+    # Fraction of requests that are traced (0 disables tracing, 1 traces everything)
+    'sample_rate': float(os.getenv('TRACE_SAMPLE_RATE', '0')),
+    # 'log' writes spans as JSON lines, 'otlp' posts them to an OpenTelemetry collector
+    'exporter': os.getenv('TRACE_EXPORTER', 'log'),
+    'otlp_endpoint': os.getenv('TRACE_OTLP_ENDPOINT'),
+}
+
+profiling_config = {
+    # Per-request profiling: requests sent with the X-CineMood-Profile header are sampled
+    'enabled': os.getenv('PROFILE_ENABLED', 'false').lower() == 'true',
+    # When set, the header value must match it
+    'token': os.getenv('PROFILE_TOKEN'),
+    'output_dir': os.getenv('PROFILE_DIR', 'profiles'),
+    'sample_interval': float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.001')),
+    # Always-on background sampler of all threads; 0 disables it
+    'background_interval': float(os.getenv('PROFILE_BACKGROUND_INTERVAL', '0')),
+    'background_window': float(os.getenv('PROFILE_BACKGROUND_WINDOW', '60')),
+    'background_keep': int(os.getenv('PROFILE_BACKGROUND_KEEP', '10')),
+}
@@ -1,50 +1,181 @@
 
-import mysql.connector
+import logging
+import sys
+import time
+import weakref
+from contextlib import contextmanager
+
 from mysql.connector import Error
 
 from config import db_config
+from lifecycle import after_fork
+from metrics import DB_POOL_IN_USE, DB_POOL_SIZE, DB_READS
+from storage import get_storage
+from tracing import TracedCursor
+
+logger = logging.getLogger(__name__)
+
+# Live handlers, so /metrics can report how many connections are open
+_handlers = weakref.WeakSet()
+DB_POOL_SIZE.set_function(
+    ("DatabaseHandler",),
+    lambda: sum(1 for h in list(_handlers) if h._connection is not None))
+
+
+def _release_cursor():
+    DB_POOL_IN_USE.dec(("DatabaseHandler",))
+
+
+# Connections inherited from the parent process. They stay referenced so the child never
+# shuts down a socket the parent may still be using.
+_inherited_connections = []
+
+
+@after_fork
+def _reset_after_fork():
+    # Each forked worker opens its own connection on first use
+    for handler in list(_handlers):
+        if handler._connection is not None:
+            _inherited_connections.append(handler._connection)
+        handler._connection = None
+        handler._connect_attempted = False
+
 
 class DatabaseHandler:
-#    def __init__(self, db_config):
-    def __init__(self):
-        #self.db_config = db_config
+    def __init__(self, *, storage=None):
+        """
+        :param storage: storage.MySQLStorage or storage.SQLiteStorage the connection is opened
+                        with; by default the one selected by DB_BACKEND.
+        """
+        self.storage = storage or get_storage(db_config, ("host", "user", "password", "database"))
+        # The connection is opened on first use of self.connection, so creating a handler
+        # at startup does not wait for the database
+        self._connection = None
+        self._connect_attempted = False
+        # Optional in-process copy of the movie tables (catalog.CatalogSnapshot), set by create_app
+        self.catalog = None
+        # Optional read replicas (replicas.ReplicaSet), set by create_app
+        self.replicas = None
+        # Seconds after a write during which reads of the same user or movie stay on the primary
+        self.read_your_writes = 5.0
+        self._recent_writes = {}  # ('user' or 'movie', id) -> time.monotonic() of the last write
+        _handlers.add(self)
+
+    @property
+    def connection(self):
+        if not self._connect_attempted:
+            self.connect()
+        return self._connection
+
+    @connection.setter
+    def connection(self, value):
+        self._connection = value
+        self._connect_attempted = True
+
+    def connect(self):
+        """
+        Opens the DB connection. Called automatically on first use; call it directly to
+        connect eagerly. A failed attempt leaves the connection as None and is not retried.
+
+        :return: The connection, or None if connecting failed.
+        """
+        self._connect_attempted = True
         try:
-            self.connection = mysql.connector.connect(
-                host=db_config["host"],
-                user=db_config["user"],
-                password=db_config["password"],
-                database=db_config["database"]
-            )
-            if self.connection.is_connected():
-                print("DB connected successfully")
+            self._connection = self.storage.connect()
+            if self._connection.is_connected():
+                logger.debug("DB connected successfully")
         except Error as e:
-            print(f"Error connecting DB: {e}")
-            self.connection = None
+            logger.error(f"Error connecting DB: {e}")
+            self._connection = None
+        return self._connection
 
     def close_connection(self):
-        # Closes connection if active
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("Connection closed")
+        # Closes connection if active; never opens one just to close it.
+        # The next use of self.connection opens a new one.
+        if self._connection and self._connection.is_connected():
+            self._connection.close()
+            logger.debug("Connection closed")
+        self._connection = None
+        self._connect_attempted = False
+        if self.replicas is not None:
+            self.replicas.close()
+
+    def _cursor(self, connection=None, **kwargs):
+        # Cursors are traced so every statement shows up as a span of the current request,
+        # and timed under the name of the calling method. Reads routed to a replica pass its connection.
+        cursor = (connection or self.connection).cursor(**kwargs)
+        DB_POOL_IN_USE.inc(("DatabaseHandler",))
+        return TracedCursor(cursor, "DatabaseHandler", method=sys._getframe(1).f_code.co_name,
+                            on_close=_release_cursor)
+
+    def _wrote(self, *keys):
+        # Marks keys as just written, so _read_connection keeps their reads on the primary
+        if self.replicas is None:
+            return
+        now = time.monotonic()
+        if len(self._recent_writes) >= 10000:
+            self._recent_writes = {key: at for key, at in list(self._recent_writes.items())
+                                   if now - at < self.read_your_writes}
+        for key in keys:
+            self._recent_writes[key] = now
+
+    @contextmanager
+    def _read_connection(self, *keys):
+        """
+        Picks the connection for a read: a healthy replica, or the primary when there are
+        no replicas, none is healthy, or one of the keys was written by this process in the
+        last `read_your_writes` seconds.
+
+        :param keys: ('user' or 'movie', id) pairs the read depends on.
+        :return: Context manager yielding the connection, or None when not even the primary is connected.
+        """
+        if self.replicas is None:
+            yield self.connection
+            return
+        now = time.monotonic()
+        if any(now - self._recent_writes.get(key, float("-inf")) < self.read_your_writes for key in keys):
+            DB_READS.inc(("primary", "read_your_writes"))
+            yield self.connection
+            return
+        with self.replicas.connection() as connection:
+            if connection is None:
+                DB_READS.inc(("primary", "no_replica"))
+                connection = self.connection
+            else:
+                DB_READS.inc(("replica", "healthy"))
+            yield connection
+
+    def _catalog_changed(self):
+        # Our own writes show up in the snapshot on the next read instead of after the refresh interval
+        if self.catalog is not None:
+            self.catalog.invalidate()
+
+    def _catalog_columns(self):
+        # The catalog snapshot when enabled and loaded, otherwise None (read from MySQL)
+        if self.catalog is None:
+            return None
+        return self.catalog.current()
 
     def test_connection(self):
         if self.connection and self.connection.is_connected():
             return True
         else:
-            print("Failed connection")
+            logger.warning("Failed connection")
             return False
 
-    def check_record(self, table, column, value):
+    def check_record(self, table, column, value, connection=None):
         """
         Checks if a record exists in the DB
 
         :param table: Name of the table
         :param column: Name of the column
         :param value: Value to check
+        :param connection: Connection to read from; the primary by default
         :return: id if exists, None if not exists
         """
-        if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+        connection = connection or self.connection
+        if connection and connection.is_connected():
+            cursor = self._cursor(connection)
             try:
                 query = f"SELECT id FROM {table} WHERE {column} = %s"
                 cursor.execute(query, (value,))
@@ -54,12 +185,12 @@ class DatabaseHandler:
                 else:
                     return None
             except Error as e:
-                print(f"Error checking record: {e}")
+                logger.error(f"Error checking record: {e}")
                 return None
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return None
     # Manage data
     def add_director(self, director_id, director_name):
@@ -75,25 +206,26 @@ class DatabaseHandler:
         # Check if the record already exists
         existing_id = self.check_record("director", "id", director_id)
         if existing_id:
-            print(f"Director {director_name} already exists in DB.")
+            logger.debug(f"Director {director_name} already exists in DB.")
             return existing_id
 
         # If not, inserts a new director
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             try:
                 insert_query = "INSERT INTO director (id, d_name) VALUES (%s, %s)"
                 cursor.execute(insert_query, (director_id, director_name))
                 self.connection.commit()
-                print(f"Director {director_name} added to DB")
+                self._catalog_changed()
+                logger.debug(f"Director {director_name} added to DB")
                 return director_id
             except Error as e:
-                print(f"Error adding director: {e}")
+                logger.error(f"Error adding director: {e}")
                 return None
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return None
 
     def add_actor(self, actor_id, actor_name):
@@ -108,25 +240,25 @@ class DatabaseHandler:
         # Check if the record already exists
         existing_id = self.check_record("actor", "a_name", actor_id)
         if existing_id:
-            print(f"Actor {actor_name} already exists in DB.")
+            logger.debug(f"Actor {actor_name} already exists in DB.")
             return existing_id
 
         # If not, inserts a new director
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             try:
                 insert_query = "INSERT INTO actor (id, a_name) VALUES (%s, %s)"
                 cursor.execute(insert_query, (actor_id, actor_name))
                 self.connection.commit()
-                print(f"Actor {actor_name} added to DB")
+                logger.debug(f"Actor {actor_name} added to DB")
                 return actor_id
             except Error as e:
-                print(f"Error adding actor: {e}")
+                logger.error(f"Error adding actor: {e}")
                 return None
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return None
 
     def add_genre(self, genre_id, genre):
@@ -141,25 +273,25 @@ class DatabaseHandler:
         # Check if the record already exists
         existing_id = self.check_record("genre", "genre", genre_id)
         if existing_id:
-            print(f"Genre {genre} already exists in DB.")
+            logger.debug(f"Genre {genre} already exists in DB.")
             return existing_id
 
         # If not, inserts a new director
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             try:
                 insert_query = "INSERT INTO genre (id, genre) VALUES (%s, %s)"
                 cursor.execute(insert_query, (genre_id, genre))
                 self.connection.commit()
-                print(f"Genre {genre} added to DB")
+                logger.debug(f"Genre {genre} added to DB")
                 return genre_id
             except Error as e:
-                print(f"Error adding actor: {e}")
+                logger.error(f"Error adding actor: {e}")
                 return None
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return None
     def add_mood(self, mood):
         """
@@ -172,46 +304,47 @@ class DatabaseHandler:
         # Check if mood exists
         existing_id = self.check_record("mood", "mood", mood)
         if existing_id:
-            print(f"Mood {mood} already exists")
+            logger.debug(f"Mood {mood} already exists")
             return existing_id
 
         # if not, adds a new mood
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             try:
                 insert_query = "INSERT INTO mood (mood) VALUES (%s)"
                 cursor.execute(insert_query, (mood,))
                 self.connection.commit()
                 mood_id = cursor.lastrowid
-                print(f"{mood} added with {mood_id} id")
+                logger.debug(f"{mood} added with {mood_id} id")
                 return mood_id
             except Error as e:
-                print(f"Error adding mood: {e}")
+                logger.error(f"Error adding mood: {e}")
                 return None
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return None
 
     # Manage movie data
     def add_movie(self, movie_data):
         """
-        Adds a movie to the movie table in the DB.
+        Adds a movie to the movie table in the DB. Its director and country must exist already;
+        upsert_movies stores a movie together with its director, cast and genres.
 
-        :param movie_data: dictionary with the movie information
+        :param movie_data: Movie record or dictionary with the movie information
         :return: movie id if it's added, None if there's an error
         """
         # Checks if director and country exist
         if not self.check_record("director", "id", movie_data["director_id"]):
-            print(f"Director with id {movie_data['director_id']} does not exist")
+            logger.warning(f"Movie {movie_data['id']} not added: director {movie_data['director_id']} does not exist")
             return None
         if not self.check_record("country", "id", movie_data["country_id"]):
-            print(f"Country with id{movie_data['country_id']} does not exist")
+            logger.warning(f"Movie {movie_data['id']} not added: country {movie_data['country_id']} does not exist")
             return None
 
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             try:
                 insert_query = """
                     INSERT INTO movie (id, title, release_year, director_id, country_id)
@@ -222,15 +355,16 @@ class DatabaseHandler:
                     movie_data["director_id"], movie_data["country_id"]
                 ))
                 self.connection.commit()
-                print(f"{movie_data['title']} successfully added")
+                self._catalog_changed()
+                logger.debug(f"{movie_data['title']} successfully added")
                 return movie_data["id"]
             except Error as e:
-                print(f"Error adding movie: {e}")
+                logger.error(f"Error adding movie: {e}")
                 return None
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return None
 
     def add_cast(self, actor_id, movie_id):
@@ -243,14 +377,14 @@ class DatabaseHandler:
         """
         # Checking if actor and movie exist
         if not self.check_record("actor", "id", actor_id):
-            print(f"Actor {actor_id} does not exist")
+            logger.debug(f"Actor {actor_id} does not exist")
             return False
         if not self.check_record("movie", "id", movie_id):
-            print(f"Movie {movie_id} does not exist")
+            logger.debug(f"Movie {movie_id} does not exist")
             return False
 
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             try:
                 # Check if relation already exists
                 query = "SELECT * FROM cast WHERE actor_id = %s AND movie_id = %s"
@@ -258,22 +392,22 @@ class DatabaseHandler:
                 result = cursor.fetchone()
 
                 if result:
-                    print(f"Relation between actor {actor_id} and movie {movie_id} already exists")
+                    logger.debug(f"Relation between actor {actor_id} and movie {movie_id} already exists")
                     return False
 
                 else:
                     insert_query = "INSERT INTO cast (actor_id, movie_id) VALUES (%s, %s)"
                     cursor.execute(insert_query, (actor_id, movie_id))
                     self.connection.commit()
-                    print(f"Actor {actor_id} added to movie {movie_id}")
+                    logger.debug(f"Actor {actor_id} added to movie {movie_id}")
                     return True
             except Error as e:
-                print(f"Error adding actor: {e}")
+                logger.error(f"Error adding actor: {e}")
                 return False
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return False
 
     def add_movie_genre(self, movie_id, genre_id):
@@ -286,14 +420,14 @@ class DatabaseHandler:
         """
         # Checking if movie and genre exist
         if not self.check_record("genre", "id", genre_id):
-            print(f"Genre {genre_id} does not exist")
+            logger.debug(f"Genre {genre_id} does not exist")
             return False
         if not self.check_record("movie", "id", movie_id):
-            print(f"Movie {movie_id} does not exist")
+            logger.debug(f"Movie {movie_id} does not exist")
             return False
 
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             try:
                 # Check if relation already exists
                 query = "SELECT * FROM movie_genre WHERE movie_id = %s AND genre_id = %s"
@@ -301,61 +435,225 @@ class DatabaseHandler:
                 result = cursor.fetchone()
 
                 if result:
-                    print(f"Relation between genre {genre_id} and movie {movie_id} already exists")
+                    logger.debug(f"Relation between genre {genre_id} and movie {movie_id} already exists")
                     return False
 
                 else:
                     insert_query = "INSERT INTO movie_genre (movie_id, genre_id) VALUES (%s, %s)"
                     cursor.execute(insert_query, (movie_id, genre_id))
                     self.connection.commit()
-                    print(f"Genre {genre_id} added to movie {movie_id}")
+                    self._catalog_changed()
+                    logger.debug(f"Genre {genre_id} added to movie {movie_id}")
                     return True
             except Error as e:
-                print(f"Error adding relation: {e}")
+                logger.error(f"Error adding relation: {e}")
                 return False
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return False
 
-    def get_movie_by_title(self, title):
+    def upsert_movies(self, movies, state=None, interner=None):
         """
-        Gets a movie by its title
+        Inserts or updates several movies with their director, cast and genres, in one
+        transaction and in dependency order: people and genres, then the movies, then the
+        relations. The genres and cast stored for each movie are replaced by the given ones.
+
+        :param movies: list of dictionaries from ingestion.parse_movie: 'movie' (id, title, release_year,
+                       director_id, country_id), 'director' ((id, name) or None), 'cast' and 'genres'
+                       (lists of (id, name))
+        :param state: optional (name, value) saved to sync_state in the same transaction, e.g. a sync checkpoint
+        :param interner: optional ingestion.Interner kept for a whole run: directors, actors and genres
+                         it already knows are not written again
+        :return: number of movies written, None if there is an error (nothing is written then)
+        """
+        from ingestion import Interner
 
-        :param title: Title of the movie
-        :return: Dictionary with movie data. None if there is no movie
+        if self.connection and self.connection.is_connected():
+            interner = interner if interner is not None else Interner()
+            cursor = self._cursor()
+            try:
+                if movies:
+                    if interner.countries is None:
+                        cursor.execute("SELECT id FROM country")
+                        interner.countries = {row[0] for row in cursor.fetchall()}
+                    if interner.genres is None:
+                        cursor.execute("SELECT id, genre FROM genre")
+                        interner.genres = {name: genre_id for genre_id, name in cursor.fetchall()}
+
+                    directors = Interner.unknown(interner.directors, (m["director"] for m in movies if m["director"]))
+                    actors = Interner.unknown(interner.actors, (actor for m in movies for actor in m["cast"]))
+                    # A genre stored under another id keeps it (the name is unique)
+                    genres = sorted({genre for m in movies for genre in m["genres"] if genre[1] not in interner.genres})
+                    genre_ids = dict(interner.genres, **{name: genre_id for genre_id, name in genres})
+                    if directors:
+                        cursor.executemany("INSERT INTO director (id, d_name) VALUES (%s, %s) "
+                                           "ON DUPLICATE KEY UPDATE d_name = VALUES(d_name)", directors)
+                    if actors:
+                        cursor.executemany("INSERT INTO actor (id, a_name) VALUES (%s, %s) "
+                                           "ON DUPLICATE KEY UPDATE a_name = VALUES(a_name)", actors)
+                    if genres:
+                        cursor.executemany("INSERT IGNORE INTO genre (id, genre) VALUES (%s, %s)", genres)
+                    # Countries are a fixed list; a code missing from it is stored as NULL
+                    cursor.executemany(
+                        "INSERT INTO movie (id, title, release_year, director_id, country_id) VALUES (%s, %s, %s, %s, %s) "
+                        "ON DUPLICATE KEY UPDATE title = VALUES(title), release_year = VALUES(release_year), "
+                        "director_id = VALUES(director_id), country_id = VALUES(country_id)",
+                        [(m["movie"]["id"], m["movie"]["title"], m["movie"]["release_year"], m["movie"]["director_id"],
+                          m["movie"]["country_id"] if m["movie"]["country_id"] in interner.countries else None)
+                         for m in movies])
+
+                    movie_ids = [m["movie"]["id"] for m in movies]
+                    placeholders = ", ".join(["%s"] * len(movie_ids))
+                    cursor.execute(f"DELETE FROM movie_genre WHERE movie_id IN ({placeholders})", tuple(movie_ids))
+                    cursor.execute(f"DELETE FROM `cast` WHERE movie_id IN ({placeholders})", tuple(movie_ids))
+                    movie_genres = sorted({(m["movie"]["id"], genre_ids[name])
+                                           for m in movies for _, name in m["genres"]})
+                    if movie_genres:
+                        cursor.executemany("INSERT INTO movie_genre (movie_id, genre_id) VALUES (%s, %s)", movie_genres)
+                    cast = sorted({(actor_id, m["movie"]["id"]) for m in movies for actor_id, _ in m["cast"]})
+                    if cast:
+                        cursor.executemany("INSERT INTO `cast` (actor_id, movie_id) VALUES (%s, %s)", cast)
+
+                if state is not None:
+                    cursor.execute("INSERT INTO sync_state (name, value) VALUES (%s, %s) "
+                                   "ON DUPLICATE KEY UPDATE value = VALUES(value)", state)
+                self.connection.commit()
+                if movies:
+                    # Only what is committed is remembered
+                    interner.directors.update(directors)
+                    interner.actors.update(actors)
+                    interner.genres = genre_ids
+                    self._catalog_changed()
+                logger.debug(f"{len(movies)} movies upserted")
+                return len(movies)
+            except Error as e:
+                self.connection.rollback()
+                logger.error(f"Error upserting movies: {e}")
+                return None
+            finally:
+                cursor.close()
+        else:
+            logger.warning("No DB connection")
+            return None
+
+    def get_existing_movie_ids(self, movie_ids):
         """
+        Checks which of several movies are in the database, with one query
+
+        :param movie_ids: list of movie ids
+        :return: set of the ids found, None if there is an error
+        """
+        if not movie_ids:
+            return set()
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor(dictionary=True)
+            cursor = self._cursor()
             try:
-                query = "SELECT * FROM movie WHERE title = %s"
-                cursor.execute(query, (title,))
-                result = cursor.fetchone()
+                cursor.execute(f"SELECT id FROM movie WHERE id IN ({', '.join(['%s'] * len(movie_ids))})",
+                               tuple(movie_ids))
+                return {row[0] for row in cursor.fetchall()}
+            except Error as e:
+                logger.error(f"Error checking movie ids: {e}")
+                return None
+            finally:
+                cursor.close()
+        else:
+            logger.warning("No DB connection")
+            return None
 
-                if result:
-                    return result
-                else:
-                    print(f"{title} not found")
-                    return None
+    def get_sync_state(self, name):
+        """
+        Gets a value saved with upsert_movies, e.g. a sync checkpoint
+
+        :param name: state name
+        :return: the saved string, None if there is none or there is an error
+        """
+        if self.connection and self.connection.is_connected():
+            cursor = self._cursor()
+            try:
+                cursor.execute("SELECT value FROM sync_state WHERE name = %s", (name,))
+                row = cursor.fetchone()
+                return row[0] if row else None
             except Error as e:
-                print(f"Error fetching movie: {e}")
+                logger.error(f"Error reading sync state: {e}")
                 return None
             finally:
                 cursor.close()
+        else:
+            logger.warning("No DB connection")
+            return None
+
+    def get_sync_states(self, prefix):
+        """
+        Gets every value saved with upsert_movies under names starting with a prefix
 
+        :param prefix: start of the state names
+        :return: dictionary name -> value, None if there is an error
+        """
+        if self.connection and self.connection.is_connected():
+            cursor = self._cursor()
+            try:
+                cursor.execute("SELECT name, value FROM sync_state WHERE SUBSTR(name, 1, %s) = %s",
+                               (len(prefix), prefix))
+                return dict(cursor.fetchall())
+            except Error as e:
+                logger.error(f"Error reading sync state: {e}")
+                return None
+            finally:
+                cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return None
 
+    def get_movie_by_title(self, title):
+        """
+        Gets a movie by its title
+
+        :param title: Title of the movie
+        :return: Dictionary with movie data. None if there is no movie
+        """
+        columns = self._catalog_columns()
+        if columns is not None:
+            row = columns.find_title(title)
+            return None if row is None else columns.movie_row(row)
+
+        with self._read_connection() as connection:
+            if connection and connection.is_connected():
+                cursor = self._cursor(connection, dictionary=True)
+                try:
+                    query = "SELECT * FROM movie WHERE title = %s"
+                    cursor.execute(query, (title,))
+                    result = cursor.fetchone()
+
+                    if result:
+                        return result
+                    else:
+                        logger.debug(f"{title} not found")
+                        return None
+                except Error as e:
+                    logger.error(f"Error fetching movie: {e}")
+                    return None
+                finally:
+                    cursor.close()
+
+            else:
+                logger.warning("No DB connection")
+                return None
+
     def get_movie_id(self, title):
         """
         Gets a movie id by its title
         :param title: title of the movie
         :return: movie id. None if movie does not exist
         """
+        columns = self._catalog_columns()
+        if columns is not None:
+            row = columns.find_title(title)
+            return None if row is None else int(columns.ids[row])
+
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             try:
                 query = "SELECT id FROM movie WHERE title = %s"
                 cursor.execute(query, (title,))
@@ -364,16 +662,190 @@ class DatabaseHandler:
                 if result:
                     return result[0]
                 else:
-                    print(f"{title} not found")
+                    logger.debug(f"{title} not found")
                     return None
             except Error as e:
-                print(f"Error fetching movie: {e}")
+                logger.error(f"Error fetching movie: {e}")
                 return None
             finally:
                 cursor.close()
 
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
+            return None
+
+    def get_movies_by_genres(self, include_genre_ids, exclude_genre_ids=(), limit=100):
+        """
+        Gets movies of the local catalog by genre
+
+        :param include_genre_ids: the movies have at least one of these genres
+        :param exclude_genre_ids: the movies have none of these genres
+        :param limit: maximum number of movies
+        :return: list of dictionaries with the movie data and its 'genre_ids'. Empty list if there is an error
+        """
+        if not include_genre_ids:
+            return []
+        columns = self._catalog_columns()
+        if columns is not None:
+            rows = columns.filter(include_genre_ids, exclude_genre_ids)[:limit]
+            return [dict(columns.movie_row(row), genre_ids=columns.genre_ids(row)) for row in rows]
+
+        if self.connection and self.connection.is_connected():
+            cursor = self._cursor(dictionary=True)
+            try:
+                include = ", ".join(["%s"] * len(include_genre_ids))
+                query = f"""
+                    SELECT m.id, m.title, m.release_year, m.director_id, m.country_id,
+                           GROUP_CONCAT(mg.genre_id) AS genre_ids
+                    FROM movie m JOIN movie_genre mg ON mg.movie_id = m.id
+                    GROUP BY m.id
+                    HAVING SUM(mg.genre_id IN ({include})) > 0
+                """
+                params = list(include_genre_ids)
+                if exclude_genre_ids:
+                    query += f" AND SUM(mg.genre_id IN ({', '.join(['%s'] * len(exclude_genre_ids))})) = 0"
+                    params += list(exclude_genre_ids)
+                cursor.execute(query + " LIMIT %s", (*params, limit))
+                movies = cursor.fetchall()
+                for movie in movies:
+                    movie["genre_ids"] = [int(genre_id) for genre_id in movie["genre_ids"].split(",")]
+                return movies
+            except Error as e:
+                logger.error(f"Error fetching movies by genre: {e}")
+                return []
+            finally:
+                cursor.close()
+        else:
+            logger.warning("No DB connection")
+            return []
+
+    def get_movie_details(self, movie_id):
+        """
+        Gets a movie with its director, country, genres and cast
+
+        :param movie_id: movie id
+        :return: Dictionary with the movie data, 'director_name', 'country', 'genres' (names) and
+                 'cast' (list of dictionaries with id and name). None if the movie is not in the DB
+        """
+        if self.connection and self.connection.is_connected():
+            cursor = self._cursor(dictionary=True)
+            try:
+                query = """
+                    SELECT m.id, m.title, m.release_year, m.director_id, d.d_name AS director_name,
+                           m.country_id, c.country
+                    FROM movie AS m
+                    LEFT JOIN director AS d ON m.director_id = d.id
+                    LEFT JOIN country AS c ON m.country_id = c.id
+                    WHERE m.id = %s
+                """
+                cursor.execute(query, (movie_id,))
+                movie = cursor.fetchone()
+                if not movie:
+                    logger.debug(f"Movie {movie_id} not found")
+                    return None
+
+                cursor.execute("""
+                    SELECT g.genre FROM movie_genre AS mg JOIN genre AS g ON mg.genre_id = g.id
+                    WHERE mg.movie_id = %s
+                """, (movie_id,))
+                movie["genres"] = [row["genre"] for row in cursor.fetchall()]
+                cursor.execute("""
+                    SELECT a.id, a.a_name AS name FROM cast AS ca JOIN actor AS a ON ca.actor_id = a.id
+                    WHERE ca.movie_id = %s
+                """, (movie_id,))
+                movie["cast"] = cursor.fetchall()
+                return movie
+            except Error as e:
+                logger.error(f"Error fetching movie details: {e}")
+                return None
+            finally:
+                cursor.close()
+        else:
+            logger.warning("No DB connection")
+            return None
+
+    def get_movies_by_ids(self, movie_ids):
+        """
+        Gets several movies at once, with one query
+
+        :param movie_ids: list of movie ids
+        :return: Dictionary movie id -> movie data with its 'genre_ids'; ids not in the DB are left out.
+                 Empty dictionary if there is an error
+        """
+        if not movie_ids:
+            return {}
+        columns = self._catalog_columns()
+        if columns is not None:
+            rows = (columns.row_by_id.get(movie_id) for movie_id in movie_ids)
+            return {int(columns.ids[row]): dict(columns.movie_row(row), genre_ids=columns.genre_ids(row))
+                    for row in rows if row is not None}
+
+        if self.connection and self.connection.is_connected():
+            cursor = self._cursor(dictionary=True)
+            try:
+                query = f"""
+                    SELECT m.id, m.title, m.release_year, m.director_id, m.country_id,
+                           GROUP_CONCAT(mg.genre_id) AS genre_ids
+                    FROM movie m LEFT JOIN movie_genre mg ON mg.movie_id = m.id
+                    WHERE m.id IN ({", ".join(["%s"] * len(movie_ids))})
+                    GROUP BY m.id
+                """
+                cursor.execute(query, tuple(movie_ids))
+                movies = {}
+                for movie in cursor.fetchall():
+                    genre_ids = movie["genre_ids"]
+                    movie["genre_ids"] = [int(genre_id) for genre_id in genre_ids.split(",")] if genre_ids else []
+                    movies[movie["id"]] = movie
+                return movies
+            except Error as e:
+                logger.error(f"Error fetching movies by id: {e}")
+                return {}
+            finally:
+                cursor.close()
+        else:
+            logger.warning("No DB connection")
+            return {}
+
+    def get_movie_statuses(self, user_id, movie_ids):
+        """
+        Gets for several movies at once whether a user watched, rated or was recommended
+        each of them, with one query per table
+
+        :param user_id: user id
+        :param movie_ids: list of movie ids
+        :return: Dictionary movie id -> {'watched': bool, 'rating': int or None, 'recommended': bool}
+                 for every given id. None if there is an error
+        """
+        statuses = {movie_id: {"watched": False, "rating": None, "recommended": False} for movie_id in movie_ids}
+        if not movie_ids:
+            return statuses
+
+        if self.connection and self.connection.is_connected():
+            cursor = self._cursor()
+            try:
+                # An unknown user matches no rows, so there is no check_record preflight
+                placeholders = ", ".join(["%s"] * len(movie_ids))
+                params = (user_id, *movie_ids)
+                cursor.execute(f"SELECT movie_id FROM watched WHERE user_id = %s AND movie_id IN ({placeholders})",
+                               params)
+                for (movie_id,) in cursor.fetchall():
+                    statuses[movie_id]["watched"] = True
+                cursor.execute(f"SELECT movie_id, rating FROM rating WHERE user_id = %s AND movie_id IN ({placeholders})",
+                               params)
+                for movie_id, rating in cursor.fetchall():
+                    statuses[movie_id]["rating"] = rating
+                cursor.execute(f"SELECT movie_id FROM recommendations WHERE user_id = %s "
+                               f"AND movie_id IN ({placeholders})", params)
+                for (movie_id,) in cursor.fetchall():
+                    statuses[movie_id]["recommended"] = True
+                return statuses
+            except Error as e:
+                logger.error(f"Error fetching movie statuses: {e}")
+                return None
+            finally:
+                cursor.close()
+        else:
+            logger.warning("No DB connection")
             return None
 
     # Manage user data
@@ -387,14 +859,14 @@ class DatabaseHandler:
         """
         # Checking if user and movie exist
         if not self.check_record("users", "id", user_id):
-            print(f"User {user_id} does not exist")
+            logger.debug(f"User {user_id} does not exist")
             return False
         if not self.check_record("movie", "id", movie_id):
-            print(f"Movie {movie_id} does not exist")
+            logger.debug(f"Movie {movie_id} does not exist")
             return False
 
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             try:
                 # Check if relation already exists
                 query = "SELECT * FROM watched WHERE user_id = %s AND movie_id = %s"
@@ -402,21 +874,22 @@ class DatabaseHandler:
                 result = cursor.fetchone()
 
                 if result:
-                    print(f"Movie {movie_id} is already in the user {user_id} watched list")
+                    logger.debug(f"Movie {movie_id} is already in the user {user_id} watched list")
                     return False
                 else:
                     insert_query = "INSERT INTO watched (user_id, movie_id) VALUES (%s, %s)"
                     cursor.execute(insert_query, (user_id, movie_id))
                     self.connection.commit()
-                    print(f"Movie {movie_id} watched by {user_id}")
+                    self._wrote(("user", user_id))
+                    logger.debug(f"Movie {movie_id} watched by {user_id}")
                     return True
             except Error as e:
-                print(f"Error marking watched movie: {e}")
+                logger.error(f"Error marking watched movie: {e}")
                 return False
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return False
 
     def get_watched_movies(self, user_id):
@@ -426,36 +899,60 @@ class DatabaseHandler:
         :param user_id: user id
         :return: List of dictionaries with all the movies watched. None if there are no watched movies
         """
-        # Check if user exists
-        if not self.check_record("users", "id", user_id):
-            print(f"User {user_id} does not exist")
-            return None
+        with self._read_connection(("user", user_id)) as connection:
+            # Check if user exists
+            if not self.check_record("users", "id", user_id, connection):
+                logger.debug(f"User {user_id} does not exist")
+                return None
 
-        if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor(dictionary=True)
-            try:
-                query = """
-                    SELECT m.id, m.title, m.release_year
-                    FROM watched AS w
-                    JOIN movie AS m ON w.movie_id = m.id
-                    WHERE w.user_id = %s
-                """
-                cursor.execute(query, (user_id,))
-                result = cursor.fetchall()
+            if connection and connection.is_connected():
+                cursor = self._cursor(connection, dictionary=True)
+                try:
+                    query = """
+                        SELECT m.id, m.title, m.release_year
+                        FROM watched AS w
+                        JOIN movie AS m ON w.movie_id = m.id
+                        WHERE w.user_id = %s
+                    """
+                    cursor.execute(query, (user_id,))
+                    result = cursor.fetchall()
+
+                    if result:
+                        return result
+                    else:
+                        logger.debug(f"User {user_id} has no watched movies")
+                        return None
+                except Error as e:
+                    logger.error(f"Error getting watched movies: {e}")
+                    return None
+                finally:
+                    cursor.close()
+            else:
+                logger.warning("No DB connection")
+                return None
 
-                if result:
-                    return result
-                else:
-                    print(f"User {user_id} has no watched movies")
+    def get_watched_count(self, user_id):
+        """
+        Counts the movies watched by a user. Watched entries are only ever added, so the
+        count changes whenever the history does and serves as its version.
+
+        :param user_id: user id
+        :return: Number of watched movies. None if it could not be read
+        """
+        with self._read_connection(("user", user_id)) as connection:
+            if connection and connection.is_connected():
+                cursor = self._cursor(connection)
+                try:
+                    cursor.execute("SELECT COUNT(*) FROM watched WHERE user_id = %s", (user_id,))
+                    return cursor.fetchone()[0]
+                except Error as e:
+                    logger.error(f"Error counting watched movies: {e}")
                     return None
-            except Error as e:
-                print(f"Error getting watched movies: {e}")
+                finally:
+                    cursor.close()
+            else:
+                logger.warning("No DB connection")
                 return None
-            finally:
-                cursor.close()
-        else:
-            print("No DB connection")
-            return None
 
     def add_rating(self, user_id, movie_id, rating, review=None):
         """
@@ -469,26 +966,26 @@ class DatabaseHandler:
         """
         # Check if parameters exists in the DB
         if not self.check_record("users", "id", user_id):
-            print(f"User {user_id} does not exist")
+            logger.debug(f"User {user_id} does not exist")
             return False
         if not self.check_record("movie", "id", movie_id):
-            print(f"Movie {movie_id} does not exist")
+            logger.debug(f"Movie {movie_id} does not exist")
             return False
         # Check ratings constraint
         if not 1 <= rating <= 5:
-            print("Rating must be between 1 and 5")
+            logger.debug("Rating must be between 1 and 5")
             return False
 
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             try:
                 # Check if the user already reviewed this movie
-                query = "SELECT * FROM rating WHERE user_id = %s AND movie = %s"
+                query = "SELECT * FROM rating WHERE user_id = %s AND movie_id = %s"
                 cursor.execute(query, (user_id, movie_id))
                 result = cursor.fetchone()
 
                 if result:
-                    print(f"User {user_id} already reviewed movie {movie_id}")
+                    logger.debug(f"User {user_id} already reviewed movie {movie_id}")
                     return False
                 else:
                     insert_query="""
@@ -497,15 +994,16 @@ class DatabaseHandler:
                     """
                     cursor.execute(insert_query, (user_id, movie_id, rating, review))
                     self.connection.commit()
-                    print("Rating added")
+                    self._wrote(("user", user_id), ("movie", movie_id))
+                    logger.debug("Rating added")
                     return True
             except Error as e:
-                print(f"Error adding rating: {e}")
+                logger.error(f"Error adding rating: {e}")
                 return False
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return False
 
     def get_movie_ratings(self, movie_id):
@@ -515,36 +1013,37 @@ class DatabaseHandler:
         :param movie_id: movie id
         :return: list of dictionaries with the ratings. None if there are no ratings
         """
-        # Check if movie exists
-        if not self.check_record("movie", "id", movie_id):
-            print(f"Movie {movie_id} does not exist")
-            return None
-
-        if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor(dictionary=True)
-            try:
-                query = """
-                    SELECT r.user_id, r.rating, r.review, u.username
-                    FROM rating AS r
-                    JOIN users AS u ON r.user_id = u.id
-                    WHERE r.movie = %s
-                """
-                cursor.execute(query, (movie_id,))
-                result = cursor.fetchall()
+        with self._read_connection(("movie", movie_id)) as connection:
+            # Check if movie exists
+            if not self.check_record("movie", "id", movie_id, connection):
+                logger.debug(f"Movie {movie_id} does not exist")
+                return None
 
-                if result:
-                    return result
-                else:
-                    print(f"Movie {movie_id} has no califications")
+            if connection and connection.is_connected():
+                cursor = self._cursor(connection, dictionary=True)
+                try:
+                    query = """
+                        SELECT r.user_id, r.rating, r.review, u.username
+                        FROM rating AS r
+                        JOIN users AS u ON r.user_id = u.id
+                        WHERE r.movie_id = %s
+                    """
+                    cursor.execute(query, (movie_id,))
+                    result = cursor.fetchall()
+
+                    if result:
+                        return result
+                    else:
+                        logger.debug(f"Movie {movie_id} has no califications")
+                        return None
+                except Error as e:
+                    logger.error(f"Error retrieving reviews: {e}")
                     return None
-            except Error as e:
-                print(f"Error retrieving reviews: {e}")
+                finally:
+                    cursor.close()
+            else:
+                logger.warning("No DB connection")
                 return None
-            finally:
-                cursor.close()
-        else:
-            print("No DB connection")
-            return None
     def add_recommendation(self, user_id, movie_id):
         """
         Saves the movie recommendation for an user
@@ -555,14 +1054,14 @@ class DatabaseHandler:
         """
         # Check if user and movie exist
         if not self.check_record("users", "id", user_id):
-            print(f"User {user_id} does not exist")
+            logger.debug(f"User {user_id} does not exist")
             return False
         if not self.check_record("movie", "id", movie_id):
-            print(f"Movie {movie_id} does not exist")
+            logger.debug(f"Movie {movie_id} does not exist")
             return False
 
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             try:
                 # Check if recommendation was already made
                 query = "SELECT * FROM recommendations WHERE user_id = %s AND movie_id = %s"
@@ -570,21 +1069,22 @@ class DatabaseHandler:
                 result = cursor.fetchone()
 
                 if result:
-                    print(f"Movie {movie_id} was already recommended to user {user_id}")
+                    logger.debug(f"Movie {movie_id} was already recommended to user {user_id}")
                     return False
 
                 insert_query = "INSERT INTO recommendations (user_id, movie_id) VALUES (%s, %s)"
                 cursor.execute(insert_query, (user_id, movie_id))
                 self.connection.commit()
-                print(f"Movie {movie_id} recommended to user {user_id}.")
+                self._wrote(("user", user_id))
+                logger.debug(f"Movie {movie_id} recommended to user {user_id}.")
                 return True
             except Error as e:
-                print(f"Error adding recommendation: {e}")
+                logger.error(f"Error adding recommendation: {e}")
                 return False
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return False
 
     def get_recommendation(self, user_id):
@@ -594,36 +1094,37 @@ class DatabaseHandler:
         :param user_id: user id
         :return: List of dictionaries with the recommended movies. None if there are no recommendations
         """
-        # Check if user exists
-        if not self.check_record("users", "id", user_id):
-            print(f"User {user_id} does not exist")
-            return None
-
-        if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor(dictionary=True)
-            try:
-                query = """
-                    SELECT m.id, m.title, m.release_year
-                    FROM recommendations AS r
-                    JOIN movie AS m ON r.movie_id = m.id
-                    WHERE r.user_id = %s
-                """
-                cursor.execute(query, (user_id,))
-                result = cursor.fetchall()
+        with self._read_connection(("user", user_id)) as connection:
+            # Check if user exists
+            if not self.check_record("users", "id", user_id, connection):
+                logger.debug(f"User {user_id} does not exist")
+                return None
 
-                if result:
-                    return result
-                else:
-                    print(f"User {user_id} has no recommendations")
+            if connection and connection.is_connected():
+                cursor = self._cursor(connection, dictionary=True)
+                try:
+                    query = """
+                        SELECT m.id, m.title, m.release_year
+                        FROM recommendations AS r
+                        JOIN movie AS m ON r.movie_id = m.id
+                        WHERE r.user_id = %s
+                    """
+                    cursor.execute(query, (user_id,))
+                    result = cursor.fetchall()
+
+                    if result:
+                        return result
+                    else:
+                        logger.debug(f"User {user_id} has no recommendations")
+                        return None
+                except Error as e:
+                    logger.error(f"Error retrieving recommendations: {e}")
                     return None
-            except Error as e:
-                print(f"Error retrieving recommendations: {e}")
+                finally:
+                    cursor.close()
+            else:
+                logger.warning("No DB connection")
                 return None
-            finally:
-                cursor.close()
-        else:
-            print("No DB connection")
-            return None
 
 
     def check_watched(self, user_id, movie_id):
@@ -636,12 +1137,12 @@ class DatabaseHandler:
         """
         # Check if user exists
         if not self.check_record("users", "id", user_id):
-            print(f"User {user_id} does not exist")
+            logger.debug(f"User {user_id} does not exist")
             return False
 
         if self.connection and self.connection.is_connected():
-            cursor = self.connection.cursor()
-            print(f"Checking watched status for user_id: {user_id} and movie_id: {movie_id}")
+            cursor = self._cursor()
+            logger.debug(f"Checking watched status for user_id: {user_id} and movie_id: {movie_id}")
 
             try:
                 query = """
@@ -653,12 +1154,12 @@ class DatabaseHandler:
                 return cursor.fetchone() is not None
 
             except Error as e:
-                print(f"Error retrieving recommendations: {e}")
+                logger.error(f"Error retrieving recommendations: {e}")
                 return None
             finally:
                 cursor.close()
         else:
-            print("No DB connection")
+            logger.warning("No DB connection")
             return None
           
           
@@ -0,0 +1,343 @@
+import contextvars
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from lifecycle import after_fork
+from metrics import CACHE_WARMER_LOOKUPS, CACHE_WARMER_REFRESHES, TMDB_DISK_CACHE_EVICTIONS, cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# TMDb endpoints whose responses are kept, by path relative to the API root
+ENDPOINTS = (
+    ("discover", re.compile(r"/discover/movie")),
+    ("search", re.compile(r"/search/movie")),
+    ("movie_details", re.compile(r"/movie/\d+")),
+    ("credits", re.compile(r"/movie/\d+/credits")),
+)
+# Query parameters left out of the key: credentials, not part of what is asked for
+IGNORED_PARAMS = frozenset({"api_key"})
+# Writes between checks of the total size
+EVICT_EVERY = 100
+# Endpoints whose user lookups are reported as warm or cold (see warmer.py)
+WARMED_ENDPOINTS = frozenset({"discover", "search"})
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key        TEXT PRIMARY KEY,
+    endpoint   TEXT NOT NULL,
+    stored_at  REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    size       INTEGER NOT NULL,
+    headers    TEXT NOT NULL,
+    body       BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at);
+"""
+
+
+def classify(url):
+    """
+    :return: (endpoint name, cache key) of a TMDb URL, or (None, None) if its responses are not kept.
+    """
+    parts = urlsplit(url)
+    path = parts.path
+    # The path starts with the API version (/3); match on what follows
+    match = re.match(r"/\d+(/.*)", path)
+    relative = match.group(1) if match else path
+    for endpoint, pattern in ENDPOINTS:
+        if pattern.fullmatch(relative):
+            params = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                            if k not in IGNORED_PARAMS)
+            return endpoint, f"{relative}?{urlencode(params)}"
+    return None, None
+
+
+class DiskCache:
+    """
+    TMDb responses kept in a SQLite database on local disk, so they survive restarts and
+    are shared by all worker processes on the host.
+
+    The database runs in WAL mode: readers never block the writer, and a crash loses at
+    most the last writes, never the file. Every entry expires after its endpoint's TTL,
+    and once the file holds more than `max_bytes` of responses the oldest are deleted.
+    Errors from SQLite are logged and the request goes to TMDb as if nothing was cached.
+    """
+
+    def __init__(self, path, max_bytes, ttls):
+        """
+        :param path: Database file; created with its directory if missing.
+        :param max_bytes: Largest total size of the stored bodies.
+        :param ttls: Dictionary endpoint name -> seconds its responses are kept.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._reset()
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _reset(self):
+        # sqlite3 connections belong to one thread and must not cross fork
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, endpoint, key, fresh_for=0.0):
+        """
+        :param fresh_for: Only return an entry that stays fresh at least this many more
+                          seconds. Such lookups refresh the cache and are left out of its hit ratio.
+        :return: (headers dictionary, body bytes) of a fresh entry, or None.
+        """
+        try:
+            row = self._connection().execute(
+                "SELECT headers, body FROM responses WHERE key = ? AND expires_at > ?", (key, time.time() + fresh_for)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"TMDb disk cache read failed: {e}")
+            row = None
+        if not fresh_for:
+            cache_lookup("tmdb_disk", row is not None)
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, endpoint, key, headers, body):
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, stored_at, expires_at, size, headers, body) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint, now, now + self.ttls[endpoint], len(body), json.dumps(headers), body))
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self.evict(now)
+        except sqlite3.Error as e:
+            logger.warning(f"TMDb disk cache write failed: {e}")
+
+    def evict(self, now=None):
+        """
+        Deletes expired entries, then the oldest ones until the bodies fit in max_bytes.
+        """
+        now = time.time() if now is None else now
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            expired = connection.execute("DELETE FROM responses WHERE expires_at <= ?", (now,)).rowcount
+            # Newest first: everything stored before the point where the running total passes the limit goes
+            cutoff = connection.execute(
+                "SELECT stored_at FROM (SELECT stored_at, SUM(size) OVER (ORDER BY stored_at DESC) AS total "
+                "FROM responses) WHERE total > ? LIMIT 1", (self.max_bytes,)).fetchone()
+            evicted = 0
+            if cutoff is not None:
+                evicted = connection.execute("DELETE FROM responses WHERE stored_at <= ?", cutoff).rowcount
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        TMDB_DISK_CACHE_EVICTIONS.inc(("expired",), expired)
+        TMDB_DISK_CACHE_EVICTIONS.inc(("size",), evicted)
+        if evicted:
+            logger.info(f"TMDb disk cache over {self.max_bytes} bytes: {evicted} oldest responses removed")
+
+    def clear(self):
+        self._connection().execute("DELETE FROM responses")
+
+
+class RefreshStats:
+    """
+    What the requests made inside refreshing() did.
+    """
+
+    def __init__(self):
+        self.sent = 0   # responses fetched from TMDb and stored
+        self.fresh = 0  # entries still fresh for the lead time, left alone
+        self.urls = []  # URLs of the responses stored
+
+
+_refresh = contextvars.ContextVar("tmdb_disk_cache_refresh", default=None)
+
+
+@contextmanager
+def refreshing(lead):
+    """
+    Makes the TMDb requests in the block refresh the disk cache instead of reading it:
+    an entry that stays fresh for another `lead` seconds is returned as usual, any other
+    response is fetched from TMDb and stored with a new TTL.
+
+    :param lead: Seconds before expiry from which entries are refreshed.
+    :return: RefreshStats for the block.
+    """
+    stats = RefreshStats()
+    token = _refresh.set((lead, stats))
+    try:
+        yield stats
+    finally:
+        _refresh.reset(token)
+
+
+class DiskCachedSession:
+    """
+    Wraps a session (normally the hedged, scheduled TMDb session) so successful GETs of
+    the endpoints in ENDPOINTS are answered from a DiskCache. Hits never reach the rate
+    limiter or TMDb.
+    """
+
+    def __init__(self, session, cache):
+        self.session = session
+        self.cache = cache
+
+    def request(self, method, url, **kwargs):
+        if method != "GET":
+            return self.session.request(method, url, **kwargs)
+        params = kwargs.get("params")
+        full_url = f"{url}{'&' if '?' in url else '?'}{urlencode(params)}" if params else url
+        endpoint, key = classify(full_url)
+        if endpoint is None or self.cache.ttls.get(endpoint, 0) <= 0:
+            return self.session.request(method, url, **kwargs)
+
+        refresh = _refresh.get()
+        if refresh is None:
+            cached = self.cache.get(endpoint, key)
+            if endpoint in WARMED_ENDPOINTS:
+                CACHE_WARMER_LOOKUPS.inc((endpoint, "cold" if cached is None else "warm"))
+        else:
+            lead, stats = refresh
+            cached = self.cache.get(endpoint, key, fresh_for=lead)
+            if cached is not None:
+                stats.fresh += 1
+                CACHE_WARMER_REFRESHES.inc(("fresh",))
+        if cached is not None:
+            return _response(full_url, *cached)
+
+        response = self.session.request(method, url, **kwargs)
+        if response.status_code == 200:
+            self.cache.put(endpoint, key, {"Content-Type": response.headers.get("Content-Type", "application/json")},
+                           response.content)
+            if refresh is not None:
+                refresh[1].urls.append(url)
+        if refresh is not None:
+            refresh[1].sent += 1
+            CACHE_WARMER_REFRESHES.inc(("refreshed",))
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+
+def _response(url, headers, body):
+    import requests
+    from requests.structures import CaseInsensitiveDict
+
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = body
+    response.encoding = "utf-8"
+    return response
+
+
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
+class MemoryCache:
+    """
+    In-process memo of a function's results, kept in front of the disk cache: at most
+    `maxsize` results (least recently used dropped first), each for `ttl` seconds, so a
+    worker picks up what the disk cache refreshes or other workers store once its own copy
+    expires. Like functools.lru_cache it has cache_info() and cache_clear().
+    """
+
+    def __init__(self, func, maxsize, ttl):
+        """
+        :param func: Function memoised; its arguments must be hashable.
+        :param maxsize: Most results kept; 0 disables the memo.
+        :param ttl: Seconds a result is kept; 0 disables the memo.
+        """
+        self.func = func
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # arguments -> (time.monotonic() of expiry, result)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        _memory_caches.append(self)
+
+    def __call__(self, *args):
+        with self._lock:
+            entry = self._entries.get(args)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(args)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+        result = self.func(*args)
+        if self.maxsize > 0 and self.ttl > 0:
+            with self._lock:
+                self._entries[args] = (time.monotonic() + self.ttl, result)
+                self._entries.move_to_end(args)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return result
+
+    def discard(self, *args):
+        """
+        Drops the result for these arguments, so the next call runs the function.
+        """
+        with self._lock:
+            self._entries.pop(args, None)
+
+    def cache_info(self):
+        return CacheInfo(self._hits, self._misses, self.maxsize, len(self._entries))
+
+    def cache_clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._misses = 0
+
+
+_caches = []
+_memory_caches = []
+
+
+def create_cache(config):
+    """
+    :param config: Dictionary with path, max_bytes and ttls (see config.tmdb_disk_cache_config).
+    :return: A DiskCache, or None when no path is configured or the file cannot be opened.
+    """
+    if not config['path']:
+        return None
+    try:
+        cache = DiskCache(config['path'], config['max_bytes'], config['ttls'])
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"TMDb disk cache disabled, cannot open {config['path']}: {e}")
+        return None
+    _caches.append(cache)
+    return cache
+
+
+@after_fork
+def _reset_after_fork():
+    for cache in _caches:
+        cache._reset()
+    for memory_cache in _memory_caches:
+        memory_cache._lock = threading.Lock()
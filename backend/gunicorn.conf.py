@@ -0,0 +1,39 @@
+"""
+gunicorn settings for the CineMood backend. Run from the backend directory:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is imported once in the master (preload_app) so modules, mood maps and the TMDb
+client are built before fork and shared copy-on-write by the workers. Sockets are never
+shared: wsgi.py closes the master's connections, the after-fork handlers in
+database_handler/auth/tracing/profiling reset inherited state, and post_worker_init below
+lets each worker connect on its own.
+
+Every setting can be overridden on the command line or with GUNICORN_CMD_ARGS.
+Note that revoked tokens (logout) are kept in memory per worker.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# One request at a time per worker: DatabaseHandler and AuthHandler each hold a single
+# connection, which mysql.connector does not allow threads to share. Scale with WEB_CONCURRENCY.
+worker_class = "sync"
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = 5000
+max_requests_jitter = 500
+accesslog = "-"
+
+
+def post_worker_init(worker):
+    import lifecycle
+    import tmdb_scheduler
+
+    # TMDB_RATE_LIMIT and TMDB_BURST are for the host: each worker sends its share
+    tmdb_scheduler.share_limits(worker.cfg.workers)
+    lifecycle.init_worker(worker.wsgi)
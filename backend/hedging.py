@@ -0,0 +1,208 @@
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import tmdb_scheduler
+from lifecycle import after_fork
+from metrics import TMDB_HEDGE_DELAY_SECONDS, TMDB_HEDGES
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the last `window` calls and a percentile of them. The percentile
+    is recomputed every `every` samples rather than on every call.
+    """
+
+    def __init__(self, window=1000, percentile=95.0, every=50):
+        self.percentile = percentile
+        self.every = every
+        self._samples = deque(maxlen=window)
+        self._added = 0
+        self._value = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._added += 1
+            if self._value is None or self._added % self.every == 0:
+                ordered = sorted(self._samples)
+                self._value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))]
+
+    @property
+    def value(self):
+        """
+        :return: The tracked percentile in seconds, or None before the first sample.
+        """
+        return self._value
+
+
+class HedgeBudget:
+    """
+    Caps hedges to a share of the calls: every call earns `ratio` of a hedge, every hedge
+    spends one, and at most `burst` hedges can be saved up.
+    """
+
+    def __init__(self, ratio, burst=10):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def spend(self):
+        """
+        :return: True if a hedge may be sent.
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class HedgingPolicy:
+    """
+    When to send a second copy of a slow request: once it has taken longer than the
+    tracked percentile of its endpoint's latency (at least `min_delay`), after
+    `min_samples` calls to the endpoint, while the budget allows.
+    """
+
+    def __init__(self, enabled=False, budget=0.05, percentile=95.0, min_delay=0.01, min_samples=20,
+                 window=1000):
+        """
+        :param enabled: Hedge at all; when False calls go straight to the session.
+        :param budget: Largest share of calls that may be hedged.
+        :param percentile: Latency percentile after which a call is hedged.
+        :param min_delay: Shortest wait before hedging, in seconds.
+        :param min_samples: Calls to an endpoint before its calls are hedged.
+        :param window: Latest calls per endpoint the percentile is taken over.
+        """
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.budget = HedgeBudget(budget)
+        self._trackers = {}
+        self._lock = threading.Lock()
+
+    def tracker(self, endpoint):
+        tracker = self._trackers.get(endpoint)
+        if tracker is None:
+            with self._lock:
+                tracker = self._trackers.setdefault(endpoint, LatencyTracker(self.window, self.percentile))
+                TMDB_HEDGE_DELAY_SECONDS.set_function((endpoint,), lambda: tracker.value or 0.0)
+        return tracker
+
+    def delay(self, endpoint):
+        """
+        :return: Seconds to wait before hedging a call to the endpoint, or None if it is not hedged yet.
+        """
+        tracker = self.tracker(endpoint)
+        if len(tracker) < self.min_samples or tracker.value is None:
+            return None
+        return max(self.min_delay, tracker.value)
+
+
+def endpoint_of(url):
+    """
+    :return: Path of a TMDb URL with ids collapsed, e.g. /3/movie/{id}/credits.
+    """
+    # The leading /3 is the API version, not an id
+    return re.sub(r"(?<!^)/\d+", "/{id}", urlsplit(url).path)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="tmdb-hedge")
+    return _executor
+
+
+class HedgedSession:
+    """
+    Wraps a session (normally the scheduled TMDb session) so slow interactive GETs are
+    sent twice and the first response wins. Hedges go through the wrapped session, so
+    they take a rate limit token and count for the circuit breaker like any other call;
+    the slower copy is left to finish in the background.
+    """
+
+    def __init__(self, session, policy):
+        self.session = session
+        self.policy = policy
+
+    def request(self, method, url, **kwargs):
+        # Only idempotent reads a user is waiting for are worth a second request
+        if (not self.policy.enabled or method != "GET"
+                or tmdb_scheduler.current_priority() != tmdb_scheduler.INTERACTIVE):
+            return self.session.request(method, url, **kwargs)
+
+        endpoint = endpoint_of(url)
+        tracker = self.policy.tracker(endpoint)
+        self.policy.budget.earn()
+        delay = self.policy.delay(endpoint)
+
+        def attempt():
+            start = time.perf_counter()
+            response = self.session.request(method, url, **kwargs)
+            tracker.add(time.perf_counter() - start)
+            return response
+
+        if delay is None:
+            return attempt()
+
+        executor = _get_executor()
+        # Copy the context so attempts keep the caller's priority and trace
+        primary = executor.submit(contextvars.copy_context().run, attempt)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        if not self.policy.budget.spend():
+            TMDB_HEDGES.inc(("budget_exhausted",))
+            return primary.result()
+
+        TMDB_HEDGES.inc(("sent",))
+        logger.debug(f"Hedging {endpoint} after {delay * 1000:.0f} ms")
+        hedge = executor.submit(contextvars.copy_context().run, attempt)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        TMDB_HEDGES.inc(("won",))
+                    return future.result()
+            # A failed copy only matters if the other one fails too
+            if not pending:
+                return primary.result()
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+
+@after_fork
+def _reset_after_fork():
+    # Pool threads do not survive fork; each worker starts its own
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
@@ -0,0 +1,185 @@
+import gzip
+import hashlib
+import logging
+import threading
+import uuid
+
+from flask import current_app, request
+
+from config import http_cache_config
+from lifecycle import after_fork
+
+try:
+    import brotli
+except ImportError:  # optional; without it responses are only gzip-compressed
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_MIMETYPES = frozenset({
+    "application/json", "text/plain", "text/html", "text/css", "application/javascript",
+})
+# A compressed body is a different representation, so it gets its own strong ETag
+ETAG_SUFFIXES = {"br": "-br", "gzip": "-gz"}
+
+
+class VersionStamps:
+    """
+    Named counters that identify the state of in-process data (e.g. everything derived from
+    the TMDb request cache). Code that changes such data bumps its counter, which changes
+    every ETag built from it.
+
+    Stamps include a random per-process epoch: counters of different workers are unrelated,
+    so an ETag issued by one worker never matches in another.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self.reset_epoch()
+
+    def reset_epoch(self):
+        self.epoch = uuid.uuid4().hex[:12]
+
+    def get(self, name):
+        return self._versions.get(name, 0)
+
+    def bump(self, name):
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+    def stamp(self, *names):
+        """
+        :return: String identifying the current version of all the named counters.
+        """
+        return f"{self.epoch}:" + ",".join(f"{name}={self.get(name)}" for name in names)
+
+
+versions = VersionStamps()
+
+
+@after_fork
+def _new_epoch_after_fork():
+    versions.reset_epoch()
+
+
+def make_etag(*parts):
+    """
+    Builds a strong ETag value from the parts that determine a response (route, arguments,
+    version stamps), without looking at the body.
+    """
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=12).hexdigest()
+
+
+def _matching_tag(etag):
+    # The client may hold the plain or a compressed representation of the same content
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return None
+    for candidate in (etag, *(etag + suffix for suffix in ETAG_SUFFIXES.values())):
+        if if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def _not_modified_response(tag, cache_control=None):
+    response = current_app.response_class(status=304)
+    response.set_etag(tag)
+    if cache_control:
+        response.headers["Cache-Control"] = cache_control
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def not_modified(etag, private=False):
+    """
+    Checks If-None-Match before doing any work for a request.
+
+    :param etag: ETag the response would get (see make_etag).
+    :param private: True for per-user responses.
+    :return: A 304 response if the client already has this version, otherwise None.
+    """
+    tag = _matching_tag(etag)
+    if tag is None:
+        return None
+    return _not_modified_response(tag, cache_control(private))
+
+
+def cache_control(private=False):
+    """
+    :return: Cache-Control value: revalidate with the ETag on every use, unless
+             HTTP_CACHE_MAX_AGE allows shared responses to be reused for a while.
+    """
+    max_age = http_cache_config['max_age']
+    if private or not max_age:
+        return "private, no-cache" if private else "no-cache"
+    return f"public, max-age={max_age}"
+
+
+def cacheable(response, etag=None, private=False):
+    """
+    Sets the ETag and Cache-Control headers of a response. Without an etag the ETag is a
+    hash of the body.
+
+    :return: The response.
+    """
+    if etag is None:
+        response.add_etag()
+    else:
+        response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control(private)
+    return response
+
+
+def choose_encoding(accept_encodings):
+    """
+    :param accept_encodings: The request's parsed Accept-Encoding header.
+    :return: 'br', 'gzip' or None.
+    """
+    if brotli is not None and accept_encodings.quality("br") > 0:
+        return "br"
+    if accept_encodings.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=http_cache_config['brotli_quality'])
+    # mtime=0 keeps the output, and so any ETag derived from it, stable
+    return gzip.compress(data, compresslevel=http_cache_config['gzip_level'], mtime=0)
+
+
+def _finish_response(response):
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+        return response
+
+    etag, weak = response.get_etag()
+    if etag and not weak and request.method in ("GET", "HEAD"):
+        tag = _matching_tag(etag)
+        if tag is not None:
+            return _not_modified_response(tag, response.headers.get("Cache-Control"))
+
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or "Content-Encoding" in response.headers:
+        return response
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < http_cache_config['min_size']:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    if etag and not weak:
+        response.set_etag(etag + ETAG_SUFFIXES[encoding])
+    return response
+
+
+def init_app(app):
+    """
+    Adds 304 handling for responses with an ETag and gzip/brotli compression of JSON and
+    text bodies of at least COMPRESS_MIN_SIZE bytes, negotiated by Accept-Encoding.
+    """
+    app.after_request(_finish_response)
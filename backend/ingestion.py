@@ -0,0 +1,96 @@
+"""
+Turns TMDb movie details into rows of the local movie tables.
+
+Shared by the ingestion jobs: a movie is fetched with its credits in one request
+(fetch_details_json) and parsed into the movie row plus its director, genres and cast,
+which DatabaseHandler.upsert_movies writes together, in dependency order. An Interner
+kept for a whole run remembers the directors, actors and genres already written, so
+each is inserted once per run however many movies share it.
+"""
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Billed cast members kept per movie; the details page shows the first ten
+CAST_SIZE = 20
+# Range of the MySQL YEAR column
+YEAR_RANGE = (1901, 2155)
+NAME_LENGTH = 255
+
+
+def parse_movie(data):
+    """
+    :param data: TMDb movie details with credits appended.
+    :return: Dictionary with 'movie' (id, title, release_year, director_id, country_id),
+             'director' ((id, name) or None), 'genres' and 'cast' (lists of (id, name)).
+    """
+    credits = data.get("credits") or {}
+    director = next(((member["id"], member["name"][:NAME_LENGTH]) for member in credits.get("crew", [])
+                     if member.get("job") == "Director"), None)
+    release_date = data.get("release_date") or ""
+    release_year = int(release_date[:4]) if release_date[:4].isdigit() else None
+    if release_year is not None and not YEAR_RANGE[0] <= release_year <= YEAR_RANGE[1]:
+        release_year = None
+    countries = data.get("production_countries") or []
+    cast = list(dict.fromkeys((actor["id"], actor["name"][:NAME_LENGTH])
+                              for actor in sorted(credits.get("cast", []), key=lambda a: a.get("order", 0))))
+    return {
+        "movie": {
+            "id": data["id"],
+            "title": data["title"][:NAME_LENGTH],
+            "release_year": release_year,
+            "director_id": director[0] if director else None,
+            "country_id": countries[0]["iso_3166_1"] if countries else None,
+        },
+        "director": director,
+        "genres": [(genre["id"], genre["name"]) for genre in data.get("genres", [])],
+        "cast": cast[:CAST_SIZE],
+    }
+
+
+class Interner:
+    """
+    In-memory maps of the rows of the small tables a run has written or read. Only
+    DatabaseHandler.upsert_movies reads and updates them, after its transaction commits.
+    """
+
+    def __init__(self):
+        self.directors = {}    # id -> name
+        self.actors = {}       # id -> name
+        self.genres = None     # name -> id, read from the genre table on first use
+        self.countries = None  # country codes, read from the country table on first use
+
+    @staticmethod
+    def unknown(known, people):
+        """
+        :return: The (id, name) pairs not in `known` with that name, sorted.
+        """
+        return sorted({person for person in people if known.get(person[0]) != person[1]})
+
+
+def fetch_records(movie_ids, workers=4):
+    """
+    Fetches and parses several movies, `workers` at a time. The calls run at the caller's
+    scheduler priority.
+
+    :param movie_ids: TMDb movie ids.
+    :param workers: Requests in flight at once.
+    :return: (parsed movies in the order of movie_ids, ids TMDb does not know)
+    """
+    from API_handler import fetch_details_json
+
+    def fetch(movie_id):
+        return movie_id, fetch_details_json(movie_id)
+
+    if workers <= 1:
+        results = [fetch(movie_id) for movie_id in movie_ids]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tmdb-ingest") as executor:
+            # Each task gets a copy of the caller's context, so the priority carries over
+            futures = [executor.submit(contextvars.copy_context().run, fetch, movie_id) for movie_id in movie_ids]
+            results = [future.result() for future in futures]
+    records = [parse_movie(data) for _, data in results if data is not None]
+    missing = [movie_id for movie_id, data in results if data is None]
+    return records, missing
@@ -0,0 +1,141 @@
+import logging
+
+from flask.json.provider import DefaultJSONProvider
+
+from config import json_backend
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("orjson", "msgspec", "stdlib")
+
+
+def _load_backend(name):
+    """
+    Imports an optional JSON library.
+
+    :return: The module, or None if it is not installed.
+    """
+    try:
+        if name == "orjson":
+            import orjson
+            return orjson
+        if name == "msgspec":
+            import msgspec.json
+            return msgspec.json
+    except ImportError:
+        return None
+    return None
+
+
+def resolve_backend(name="auto"):
+    """
+    Picks the JSON library: 'auto' takes the first installed one of orjson, msgspec and the
+    standard library. Naming a library that is not installed is an error.
+
+    :param name: 'auto', 'orjson', 'msgspec' or 'stdlib'.
+    :return: Name of the backend that will be used.
+    """
+    if name == "auto":
+        return next(b for b in BACKENDS if b == "stdlib" or _load_backend(b) is not None)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend: {name}")
+    if name != "stdlib" and _load_backend(name) is None:
+        raise ValueError(f"JSON backend '{name}' is not installed.")
+    return name
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson or msgspec when installed, and falls back
+    to Flask's stdlib-based provider otherwise. Responses are built straight from the
+    encoded bytes.
+
+    Types the libraries do not handle natively (Decimal, UUID, ...) go through Flask's
+    default hook, so the output matches jsonify. With orjson, dates are passed through to
+    that hook too (RFC 822 strings, as in Flask); msgspec always writes them as ISO 8601.
+    """
+
+    # Clients do not depend on key order, and sorting is a large share of encoding time
+    sort_keys = False
+
+    def __init__(self, app, backend=None):
+        super().__init__(app)
+        self.backend = resolve_backend(backend or app.config.get('JSON_BACKEND', json_backend))
+        module = _load_backend(self.backend)
+        if self.backend == "orjson":
+            self._options = (module.OPT_NON_STR_KEYS | module.OPT_PASSTHROUGH_DATETIME
+                             | module.OPT_PASSTHROUGH_DATACLASS)
+            self._dumps_bytes = lambda obj: module.dumps(obj, default=self.default, option=self._options)
+            self._loads = module.loads
+        elif self.backend == "msgspec":
+            encoder = module.Encoder(enc_hook=self.default)
+            decoder = module.Decoder()
+            self._dumps_bytes = encoder.encode
+            self._loads = decoder.decode
+        else:
+            self._dumps_bytes = None
+            self._loads = None
+        logger.debug(f"JSON backend: {self.backend}")
+
+    def _use_fast_path(self, kwargs):
+        # Options such as indent or cls only exist in the stdlib encoder
+        return self._dumps_bytes is not None and not kwargs and not self.sort_keys
+
+    def dumps(self, obj, **kwargs):
+        if self._use_fast_path(kwargs):
+            return self._dumps_bytes(obj).decode("utf-8")
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self._loads is not None and not kwargs:
+            return self._loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        if pretty or not self._use_fast_path({}):
+            # Pretty-printed output in debug mode, as with Flask's provider
+            return super().response(obj)
+        return self._app.response_class(self._dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+def parse_fields(value):
+    """
+    Parses a ?fields=a,b,c query parameter.
+
+    :param value: Raw parameter value, or None.
+    :return: Tuple of field names, or None when every field is wanted.
+    """
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    return fields or None
+
+
+def project(data, fields):
+    """
+    Keeps only the given keys of a dict or of every dict in a list. Unknown names are
+    ignored and non-dict values are returned unchanged.
+
+    :param data: Dict or list of dicts to project.
+    :param fields: Field names from parse_fields; None keeps everything.
+    """
+    if fields is None:
+        return data
+    if isinstance(data, dict):
+        return {f: data[f] for f in fields if f in data}
+    if not isinstance(data, list):
+        return data
+    # Copying dicts costs more than encoding the extra keys, so skip it when nothing would be dropped
+    wanted = frozenset(fields)
+    if all(item.keys() <= wanted for item in data if isinstance(item, dict)):
+        return data
+    return [{f: item[f] for f in fields if f in item} if isinstance(item, dict) else item for item in data]
+
+
+def init_app(app):
+    """
+    Installs FastJSONProvider on the app.
+    """
+    app.json = FastJSONProvider(app)
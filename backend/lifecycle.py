@@ -0,0 +1,133 @@
+import gc
+import logging
+import os
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Hooks run by preload() in the master process and by init_worker() in every worker
+_preload_hooks = []
+_worker_init_hooks = []
+# True while an app is created for preload(), see preloading()
+_preloading = False
+
+
+def after_fork(func):
+    """
+    Decorator registering func to run in the child right after os.fork(), for resetting
+    per-process state such as sockets and background threads. It runs inside fork, so it
+    must not do I/O. A no-op where fork is not available (Windows).
+    """
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=func)
+    return func
+
+
+def on_preload(func):
+    """
+    Decorator registering func(app) to build shared, read-only state before workers fork.
+    """
+    _preload_hooks.append(func)
+    return func
+
+
+def on_worker_init(func):
+    """
+    Decorator registering func(app) to run in each worker once it has forked.
+    """
+    _worker_init_hooks.append(func)
+    return func
+
+
+@contextmanager
+def preloading():
+    """
+    Context for creating an app that preload() will prepare in a pre-forking master
+    (see wsgi.py). Background threads are then left to the workers' init_worker hooks
+    instead of starting in the master, where they would keep running next to the workers.
+    """
+    global _preloading
+    _preloading = True
+    try:
+        yield
+    finally:
+        _preloading = False
+
+
+def is_preloading():
+    """
+    :return: True inside preloading(), when init_app functions must not start background threads.
+    """
+    return _preloading
+
+
+def warm_up(db_handler, auth_handler):
+    """
+    Does the work that is otherwise deferred to the first request: imports the heavy
+    modules, opens the database connections and configures the TMDb client.
+
+    :param db_handler: DatabaseHandler used by the routes.
+    :param auth_handler: AuthHandler used by the routes.
+    """
+    import_shared_state()
+    db_handler.connect()
+    auth_handler.connect()
+
+
+def import_shared_state():
+    """
+    Imports the heavy modules and builds the process-wide, read-only state: the compiled
+    mood maps and the configured TMDb client. Opens no sockets.
+    """
+    import schemas  # noqa: F401
+    import recomendation_engine  # noqa: F401
+    from API_handler import get_movie_api
+    from mood_to_genres import compile_mood_maps
+
+    compile_mood_maps()
+    get_movie_api()
+
+
+def close_connections(app):
+    """
+    Closes the database connections of the app's handlers. They reopen on next use.
+    """
+    handlers = app.extensions.get("cinemood", {})
+    for name in ("db_handler", "auth_handler"):
+        handler = handlers.get(name)
+        if handler is not None:
+            handler.close_connection()
+
+
+def preload(app):
+    """
+    Prepares an app in a pre-forking master (gunicorn --preload): builds the shared state
+    and runs the preload hooks, so workers inherit it copy-on-write, then closes every
+    connection so no socket is shared between workers.
+
+    :param app: Flask application returned by create_app.
+    """
+    import_shared_state()
+    for hook in _preload_hooks:
+        hook(app)
+    close_connections(app)
+    # Keep the garbage collector from touching (and so copying) the preloaded objects in workers
+    gc.freeze()
+    logger.info("Application preloaded in process %s", os.getpid())
+
+
+def init_worker(app):
+    """
+    Runs in each worker after fork: reconnects eagerly when LAZY_STARTUP is off and runs
+    the worker init hooks.
+
+    :param app: Flask application returned by create_app.
+    """
+    from config import lazy_startup
+
+    handlers = app.extensions.get("cinemood", {})
+    if not app.config.get('LAZY_STARTUP', lazy_startup) and handlers:
+        warm_up(handlers["db_handler"], handlers["auth_handler"])
+    for hook in _worker_init_hooks:
+        hook(app)
+    logger.info("Worker %s initialized", os.getpid())
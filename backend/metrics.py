@@ -0,0 +1,348 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, from sub-millisecond SQL up to slow upstream calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _ShardedMetric:
+    """
+    Base for metrics whose hot path touches only thread-private state.
+
+    Every thread writes into its own shard (a plain dict keyed by label values), so an
+    increment never takes a lock. The registry lock is only taken once per thread, when
+    its shard is created, and when /metrics folds the shards together. Shards of threads
+    that have exited are merged into a retired shard so per-request threads don't pile up.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []  # (thread, shard) pairs
+        self._retired = {}
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _merge_into(self, target, labels, value):
+        raise NotImplementedError
+
+    def collect(self):
+        """
+        :return: Dictionary mapping label values to the aggregated value across threads.
+        """
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    for labels, value in list(shard.items()):
+                        self._merge_into(self._retired, labels, value)
+            self._shards = live
+            merged = {}
+            for labels, value in self._retired.items():
+                self._merge_into(merged, labels, value)
+            for _, shard in live:
+                for labels, value in list(shard.items()):
+                    self._merge_into(merged, labels, value)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            for _, shard in self._shards:
+                shard.clear()
+            self._retired = {}
+
+    def _label_text(self, labels, extra=None):
+        pairs = list(zip(self.labelnames, labels))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self):
+        raise NotImplementedError
+
+
+class Counter(_ShardedMetric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def inc(self, labels=(), amount=1):
+        """
+        :param labels: Tuple of label values, in the order of labelnames.
+        :param amount: Increment, must be non-negative.
+        """
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def set_function(self, labels, func):
+        """
+        Adds func() to the value for these labels whenever metrics are collected, for
+        values that are already tracked elsewhere (e.g. functools cache statistics).
+        """
+        self._functions[labels] = func
+
+    def remove_function(self, labels):
+        self._functions.pop(labels, None)
+
+    def _merge_into(self, target, labels, value):
+        target[labels] = target.get(labels, 0) + value
+
+    def collect(self):
+        merged = super().collect()
+        for labels, func in list(self._functions.items()):
+            try:
+                merged[labels] = merged.get(labels, 0) + func()
+            except Exception:
+                pass
+        return merged
+
+    def render(self):
+        return [f"{self.name}{self._label_text(labels)} {_number(value)}"
+                for labels, value in sorted(self.collect().items())]
+
+
+class Gauge(Counter):
+    """
+    Gauge built from per-thread deltas, or from callbacks evaluated at scrape time.
+    """
+    kind = "gauge"
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram(_ShardedMetric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        """
+        :param labels: Tuple of label values, in the order of labelnames.
+        :param value: Observed value (seconds for latency histograms).
+        """
+        shard = self._shard()
+        slots = shard.get(labels)
+        if slots is None:
+            # One slot per bucket plus +Inf, then the running sum
+            slots = shard[labels] = [0] * (len(self.buckets) + 2)
+        slots[bisect_left(self.buckets, value)] += 1
+        slots[-1] += value
+
+    def time(self, labels):
+        """
+        Context manager observing the duration of its block.
+        """
+        return _Timer(self, labels)
+
+    def _merge_into(self, target, labels, value):
+        slots = target.get(labels)
+        if slots is None:
+            target[labels] = list(value)
+        else:
+            for i, v in enumerate(value):
+                slots[i] += v
+
+    def render(self):
+        lines = []
+        for labels, slots in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), slots):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(bound)
+                lines.append(f"{self.name}_bucket{self._label_text(labels, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {_number(slots[-1])}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(self._labels, time.perf_counter() - self._start)
+        return False
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# ======================================================================
+# Registry
+# ======================================================================
+
+_registry = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render():
+    """
+    :return: All registered metrics in the Prometheus text exposition format (0.0.4).
+    """
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUEST_SECONDS = _register(Histogram(
+    "cinemood_http_request_duration_seconds", "Request latency per route.",
+    ("method", "route", "status")))
+
+TMDB_REQUESTS = _register(Counter(
+    "cinemood_tmdb_requests_total", "TMDb calls per endpoint and outcome.",
+    ("endpoint", "outcome")))
+
+TMDB_REQUEST_SECONDS = _register(Histogram(
+    "cinemood_tmdb_request_duration_seconds", "TMDb call latency per endpoint.",
+    ("endpoint",)))
+
+TMDB_QUEUE_WAIT_SECONDS = _register(Histogram(
+    "cinemood_tmdb_queue_wait_seconds", "Time TMDb calls waited for a rate limit token, per priority.",
+    ("priority",)))
+
+TMDB_QUEUE_LENGTH = _register(Gauge(
+    "cinemood_tmdb_queue_length", "TMDb calls waiting for a rate limit token, per priority.",
+    ("priority",)))
+
+TMDB_QUEUE_REJECTED = _register(Counter(
+    "cinemood_tmdb_queue_rejected_total", "TMDb calls refused by the scheduler per priority and reason.",
+    ("priority", "reason")))
+
+TMDB_THROTTLED = _register(Counter(
+    "cinemood_tmdb_throttled_total", "429 responses received from TMDb."))
+
+TMDB_HEDGES = _register(Counter(
+    "cinemood_tmdb_hedges_total", "Slow TMDb calls hedged (sent), won by the hedge, or not hedged for lack of budget.",
+    ("result",)))
+
+TMDB_HEDGE_DELAY_SECONDS = _register(Gauge(
+    "cinemood_tmdb_hedge_delay_seconds", "Latency percentile after which TMDb calls are hedged, per endpoint.",
+    ("endpoint",)))
+
+TMDB_DISK_CACHE_EVICTIONS = _register(Counter(
+    "cinemood_tmdb_disk_cache_evictions_total", "TMDb responses removed from the disk cache, per reason (expired, size).",
+    ("reason",)))
+
+CACHE_WARMER_LOOKUPS = _register(Counter(
+    "cinemood_cache_warmer_lookups_total",
+    "User lookups of the TMDb disk cache per endpoint: warm (answered from it) or cold (sent to TMDb).",
+    ("endpoint", "result")))
+
+CACHE_WARMER_REFRESHES = _register(Counter(
+    "cinemood_cache_warmer_refreshes_total",
+    "Cache warmer work per result: refreshed, fresh (not due yet), busy (no rate budget) or failed.",
+    ("result",)))
+
+MOOD_SNAPSHOT_VERSION = _register(Gauge(
+    "cinemood_mood_snapshot_version", "Version of the mood snapshot this process serves (0 when none)."))
+
+CIRCUIT_STATE = _register(Gauge(
+    "cinemood_circuit_state", "Circuit breaker state per dependency (0 closed, 1 half-open, 2 open).",
+    ("dependency",)))
+
+CIRCUIT_REJECTED = _register(Counter(
+    "cinemood_circuit_rejected_total", "Calls refused because the dependency's circuit was open.",
+    ("dependency",)))
+
+DEGRADED_RESPONSES = _register(Counter(
+    "cinemood_degraded_responses_total", "Responses served from fallback data per route and source.",
+    ("route", "source")))
+
+DB_QUERY_SECONDS = _register(Histogram(
+    "cinemood_db_query_duration_seconds", "SQL statement latency per handler method.",
+    ("component", "method")))
+
+CACHE_REQUESTS = _register(Counter(
+    "cinemood_cache_requests_total", "Cache lookups per cache and result (hit or miss).",
+    ("cache", "result")))
+
+DB_POOL_SIZE = _register(Gauge(
+    "cinemood_db_pool_size", "Open database connections per component.",
+    ("component",)))
+
+DB_POOL_IN_USE = _register(Gauge(
+    "cinemood_db_pool_in_use", "Database cursors currently checked out per component.",
+    ("component",)))
+
+DB_READS = _register(Counter(
+    "cinemood_db_reads_total", "Routed reads per target (replica or primary) and reason.",
+    ("target", "reason")))
+
+DB_REPLICA_LAG_SECONDS = _register(Gauge(
+    "cinemood_db_replica_lag_seconds", "Last measured replication lag per replica; -1 when unknown or broken.",
+    ("replica",)))
+
+
+def cache_lookup(cache, hit):
+    """
+    Records one lookup against a named cache.
+
+    :param cache: Cache name, e.g. 'tmdb_disk'.
+    :param hit: True for a hit, False for a miss.
+    """
+    CACHE_REQUESTS.inc((cache, "hit" if hit else "miss"))
+
+
+def init_app(app):
+    """
+    Times every request of the Flask app into HTTP_REQUEST_SECONDS.
+
+    :param app: Flask application.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+            HTTP_REQUEST_SECONDS.observe((request.method, rule, str(response.status_code)),
+                                         time.perf_counter() - start)
+        return response
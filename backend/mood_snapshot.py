@@ -0,0 +1,343 @@
+"""
+Precomputed recommendations per mood, shared by all worker processes through one
+memory-mapped file.
+
+The mood space is small, so instead of ranking candidates from TMDb on every request a
+builder ranks them for every mood at once and writes the lists to a snapshot file. Each
+worker maps the file read-only; the pages live once in the OS page cache however many
+workers read them, and a request only decodes the movies it returns.
+
+A new snapshot is written to a temporary file and renamed over the old one, so readers
+see either the old or the new file, never a partial one. Readers notice the new file
+within MOOD_SNAPSHOT_CHECK_INTERVAL seconds and switch to it; requests still reading the
+old mapping finish on it.
+
+The builder runs in the background of every process (one at a time, through a lock file)
+when MOOD_SNAPSHOT_REFRESH is above zero, or from cron:
+
+    python mood_snapshot.py
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from config import mood_snapshot_config
+from lifecycle import after_fork, is_preloading, on_worker_init
+from metrics import MOOD_SNAPSHOT_VERSION
+from mood_to_genres import mood_to_genre_mapping
+from movie import CARD_FIELDS, Movie
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process, nothing to coordinate
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# File layout, all little-endian:
+#   header     magic, snapshot version, build time (epoch seconds), number of moods
+#   mood table per mood: name, offset of its movie table, number of movies
+#   per mood   movie table of count + 1 uint32 offsets (relative to the table), then one
+#              JSON array per movie with the CARD_FIELDS values in order
+MAGIC = b"CMS1"
+HEADER = struct.Struct("<4sIdI")
+MOOD_ENTRY = struct.Struct("<16sQI")
+
+
+def encode(ranked, version, built_at=None):
+    """
+    :param ranked: Dictionary mood -> list of Movie records, best first.
+    :param version: Snapshot version number.
+    :param built_at: Build time in epoch seconds; defaults to now.
+    :return: Snapshot file contents.
+    """
+    built_at = time.time() if built_at is None else built_at
+    table_end = HEADER.size + MOOD_ENTRY.size * len(ranked)
+    entries, blocks = [], []
+    offset = table_end
+    for mood, movies in ranked.items():
+        records = [json.dumps([getattr(movie, field) for field in CARD_FIELDS],
+                              separators=(",", ":")).encode("utf-8") for movie in movies]
+        positions = [4 * (len(records) + 1)]
+        for record in records:
+            positions.append(positions[-1] + len(record))
+        block = struct.pack(f"<{len(positions)}I", *positions) + b"".join(records)
+        entries.append(MOOD_ENTRY.pack(mood.encode("utf-8"), offset, len(records)))
+        blocks.append(block)
+        offset += len(block)
+    return HEADER.pack(MAGIC, version, built_at, len(ranked)) + b"".join(entries) + b"".join(blocks)
+
+
+def read_version(path):
+    """
+    :return: Version of the snapshot at path, or 0 if there is none or it cannot be read.
+    """
+    try:
+        with open(path, "rb") as f:
+            magic, version, _, _ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return 0
+    return version if magic == MAGIC else 0
+
+
+def publish(path, ranked):
+    """
+    Writes a snapshot with the next version number and atomically puts it in place of
+    the current one.
+
+    :param path: Snapshot file.
+    :param ranked: Dictionary mood -> list of Movie records, best first.
+    :return: The new version.
+    """
+    version = read_version(path) + 1
+    data = encode(ranked, version)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Same directory, so the rename cannot cross file systems
+    fd, temporary = tempfile.mkstemp(prefix=".mood-snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return version
+
+
+class MoodSnapshot:
+    """
+    Read-only view of a snapshot file mapped into memory.
+    """
+
+    def __init__(self, path):
+        """
+        :raise ValueError: If the file is not a snapshot.
+        :raise OSError: If it cannot be opened.
+        """
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.version, self.built_at, count = HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a mood snapshot")
+            self._moods = {}
+            for i in range(count):
+                name, offset, size = MOOD_ENTRY.unpack_from(self._map, HEADER.size + i * MOOD_ENTRY.size)
+                self._moods[name.rstrip(b"\0").decode("utf-8")] = (offset, size)
+        except (struct.error, UnicodeDecodeError) as e:
+            raise ValueError(f"{path} is not a valid mood snapshot: {e}") from None
+
+    def __contains__(self, mood):
+        return mood in self._moods
+
+    def moods(self):
+        return list(self._moods)
+
+    def count(self, mood):
+        return self._moods[mood][1]
+
+    def movies(self, mood, limit=None):
+        """
+        Decodes the first `limit` movies of a mood; the rest of the mapping is not touched.
+
+        :return: List of Movie records, best first.
+        """
+        offset, size = self._moods[mood]
+        size = size if limit is None else min(size, max(limit, 0))
+        positions = struct.unpack_from(f"<{size + 1}I", self._map, offset)
+        return [Movie(**dict(zip(CARD_FIELDS, json.loads(self._map[offset + start:offset + end]))))
+                for start, end in zip(positions, positions[1:])]
+
+
+class SnapshotReader:
+    """
+    Keeps the newest snapshot at a path mapped, checking for a replaced file at most every
+    `check_interval` seconds.
+    """
+
+    def __init__(self, path, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._identity = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        :return: The MoodSnapshot, or None while there is no readable snapshot.
+        """
+        if time.monotonic() - self._checked_at >= self.check_interval and self._lock.acquire(blocking=False):
+            try:
+                self._check()
+            finally:
+                self._checked_at = time.monotonic()
+                self._lock.release()
+        return self._snapshot
+
+    def _check(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity == self._identity:
+            return
+        try:
+            snapshot = MoodSnapshot(self.path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Cannot read mood snapshot {self.path}: {e}")
+            return
+        # A plain reference swap: requests holding the previous snapshot keep using it
+        self._snapshot = snapshot
+        self._identity = identity
+        logger.info(f"Mood snapshot version {snapshot.version} loaded ({len(snapshot.moods())} moods)")
+
+
+def build(path, size):
+    """
+    Ranks the candidates of every mood from TMDb and publishes them as a new snapshot.
+    The TMDb calls run at PREFETCH priority, behind requests users are waiting for.
+
+    :param path: Snapshot file.
+    :param size: Movies kept per mood.
+    :return: The new version.
+    """
+    from recomendation_engine import rank_movies
+    from tmdb_scheduler import PREFETCH, priority
+
+    start = time.perf_counter()
+    with priority(PREFETCH):
+        ranked = {mood: rank_movies(mood, size) for mood in mood_to_genre_mapping}
+    version = publish(path, ranked)
+    logger.info(f"Mood snapshot version {version} built in {time.perf_counter() - start:.1f} s: "
+                f"{sum(len(movies) for movies in ranked.values())} movies")
+    return version
+
+
+class SnapshotBuilder:
+    """
+    Rebuilds the snapshot once it is `interval` seconds old. Every process may run a
+    builder; a lock file next to the snapshot lets one of them build at a time, and the
+    others see the fresh file and skip.
+    """
+
+    def __init__(self, path, size, interval):
+        self.path = path
+        self.size = size
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mood-snapshot-builder", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _age(self):
+        try:
+            return time.time() - os.stat(self.path).st_mtime
+        except OSError:
+            return float("inf")
+
+    def build_if_due(self):
+        """
+        :return: True if this call built a snapshot.
+        """
+        if self._age() < self.interval:
+            return False
+        with open(f"{self.path}.lock", "a") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            # Another process may have finished a build while we waited for the lock
+            if self._age() < self.interval:
+                return False
+            build(self.path, self.size)
+            return True
+
+    def _run(self):
+        while True:
+            try:
+                self.build_if_due()
+            except Exception as e:
+                # The previous snapshot stays in place; try again at the next check
+                logger.error(f"Mood snapshot build failed: {e}")
+            if self._stop.wait(min(self.interval, 60.0)):
+                return
+
+
+_reader = None
+_builder = None
+_settings = None
+
+
+def current():
+    """
+    :return: The current MoodSnapshot, or None when snapshots are off or none is built yet.
+    """
+    return _reader.current() if _reader is not None else None
+
+
+def _start_builder():
+    global _builder
+    if _settings and _settings['path'] and _settings['refresh_interval'] > 0 and _builder is None:
+        _builder = SnapshotBuilder(_settings['path'], _settings['size'], _settings['refresh_interval']).start()
+
+
+def init_app(app, config=None):
+    """
+    Serves /recommendations from the snapshot file when MOOD_SNAPSHOT is set, and starts
+    the background builder when MOOD_SNAPSHOT_REFRESH is above zero; in a preloading
+    master the workers start it instead.
+
+    :param app: Flask application.
+    :param config: Overrides for mood_snapshot_config.
+    """
+    global _reader, _settings
+    _settings = dict(mood_snapshot_config, **(config or {}))
+    if not _settings['path']:
+        _reader = None
+        return
+    _reader = SnapshotReader(_settings['path'], _settings['check_interval'])
+    MOOD_SNAPSHOT_VERSION.set_function((), lambda: getattr(current(), "version", 0))
+    if not is_preloading():
+        _start_builder()
+
+
+@after_fork
+def _reset_after_fork():
+    # A builder thread started before fork stays in the parent; the worker starts its own in init_worker
+    global _builder
+    _builder = None
+
+
+@on_worker_init
+def _start_in_worker(app):
+    _start_builder()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the per-mood recommendation snapshot.")
+    parser.add_argument("--path", default=mood_snapshot_config['path'] or "mood_snapshot.bin")
+    parser.add_argument("--size", type=int, default=mood_snapshot_config['size'], help="Movies kept per mood.")
+    args = parser.parse_args()
+    print(f"Mood snapshot version {build(args.path, args.size)} written to {args.path}")
@@ -55,28 +55,130 @@ def get_genres_for_mood(mood):
     return mood_to_genre_mapping.get(mood.lower(), [])
 
 
+def parse_mood_weights(value):
+    """
+    Reads a weighted mood vector, e.g. {"happy": 0.7, "nostalgic": 0.3} or the string
+    "happy:0.7,nostalgic:0.3" (a mood without a weight counts 1).
+
+    :param value: Dictionary mood -> weight, or string in the format above.
+    :return: Dictionary of known moods -> weights summing to 1, heaviest first.
+    :raise ValueError: If a weight is not a non-negative number or no known mood has weight.
+    """
+    if isinstance(value, str):
+        pairs = []
+        for part in filter(None, (p.strip() for p in value.split(","))):
+            mood, _, weight = part.partition(":")
+            pairs.append((mood, weight or 1))
+    elif isinstance(value, dict):
+        pairs = list(value.items())
+    else:
+        raise ValueError("Mood must be a string or an object of mood weights.")
+
+    weights = {}
+    for mood, weight in pairs:
+        if isinstance(weight, bool):
+            raise ValueError(f"Invalid weight for mood '{mood}'.")
+        try:
+            weight = float(weight)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid weight for mood '{mood}'.") from None
+        if not weight >= 0:
+            raise ValueError(f"Invalid weight for mood '{mood}'.")
+        mood = str(mood).strip().lower()
+        if mood in mood_to_genre_mapping and weight > 0:
+            weights[mood] = weights.get(mood, 0.0) + weight
+
+    total = sum(weights.values())
+    if not total:
+        raise ValueError("No known mood with a positive weight.")
+    return {mood: weight / total for mood, weight in sorted(weights.items(), key=lambda item: -item[1])}
+
+
+def get_blended_genre_weights(mood_weights):
+    """
+    Splits the weight of each mood evenly over its genres, leaving out genres whose
+    movies the mood's own filter would drop.
+
+    :param mood_weights: Dictionary from parse_mood_weights.
+    :return: Dictionary (mood, TMDb genre ID) -> weight, heaviest first. The genre IDs in
+             it are the only ones a blended recommendation needs to fetch.
+    """
+    genre_map = get_genre_mapping()
+    shares = {}
+    for mood, weight in mood_weights.items():
+        # Genre names can share an ID (classic, musical and music), so a genre can also be one the mood excludes
+        excluded = get_excluded_genre_ids(mood)
+        genre_ids = list(dict.fromkeys(genre_map[genre] for genre in get_genres_for_mood(mood)
+                                       if genre in genre_map and genre_map[genre] not in excluded))
+        for genre_id in genre_ids:
+            shares[(mood, genre_id)] = weight / len(genre_ids)
+    return dict(sorted(shares.items(), key=lambda item: -item[1]))
+
+
 def filter_movies_by_mood(movies, mood):
     """
     Filters the list of movies based on the genres to exclude for a given mood.
 
-    :param movies: List of movies with genre IDs and other details.
+    :param movies: List of Movie records with genre IDs.
     :param mood: The user's mood to filter movies by.
     :return: Filtered list of movies.
     """
-    # Map genre names to genre IDs
-    genre_map = get_genre_mapping()  # Assume this returns {genre_name: genre_id}
-
     # Get excluded genre IDs for the mood
-    excluded_genres = set(genre_map.get(genre.lower()) for genre in mood_isnot_genre_mapping.get(mood, []))
+    excluded_genres = get_excluded_genre_ids(mood)
 
     # Filter out movies with any excluded genres
     filtered_movies = [
         movie for movie in movies
-        if not excluded_genres.intersection(set(movie['genre_ids']))
+        if excluded_genres.isdisjoint(movie.genre_ids)
     ]
 
     return filtered_movies
 
+
+# mood -> frozenset of excluded TMDb genre IDs, filled by get_excluded_genre_ids
+_excluded_genre_ids = {}
+
+
+def get_excluded_genre_ids(mood):
+    """
+    Returns the TMDb genre IDs excluded for a mood. Computed once per known mood and cached.
+
+    :param mood: The user's mood.
+    :return: Frozenset of genre IDs.
+    """
+    excluded = _excluded_genre_ids.get(mood)
+    if excluded is None:
+        # Map genre names to genre IDs
+        genre_map = get_genre_mapping()
+        excluded = frozenset(genre_map.get(genre.lower()) for genre in mood_isnot_genre_mapping.get(mood, []))
+        # Moods come from requests; only known ones are cached so the dict stays bounded
+        if mood in mood_isnot_genre_mapping:
+            _excluded_genre_ids[mood] = excluded
+    return excluded
+
+
+def get_mood_genre_ids(mood):
+    """
+    Returns the TMDb genre IDs that suit a mood and those it excludes.
+
+    :param mood: The user's mood.
+    :return: Tuple (list of included genre IDs, list of excluded genre IDs).
+    """
+    genre_map = get_genre_mapping()
+    include = [genre_map[genre] for genre in get_genres_for_mood(mood) if genre in genre_map]
+    exclude = [genre_map[genre] for genre in mood_isnot_genre_mapping.get(mood, []) if genre in genre_map]
+    return include, exclude
+
+
+def compile_mood_maps():
+    """
+    Fills the excluded genre ID cache for every known mood. Run before forking workers so
+    the maps are built once and shared copy-on-write.
+    """
+    for mood in mood_isnot_genre_mapping:
+        get_excluded_genre_ids(mood)
+
+
 def get_genre_mapping():
     """
     Returns a dictionary of TMDb genres and their IDs.
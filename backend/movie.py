@@ -0,0 +1,69 @@
+from dataclasses import dataclass
+
+# Keys of the JSON objects returned by each endpoint, in output order
+CARD_FIELDS = ("id", "title", "release_year", "overview", "genre_ids", "poster_path")
+SEARCH_FIELDS = ("id", "title", "release_year", "overview", "genres", "popularity")
+DETAILS_FIELDS = ("id", "title", "release_year", "director_id", "country_id")
+
+
+@dataclass(slots=True)
+class Movie:
+    """
+    One movie as it moves through fetching, mood filtering and recommendation.
+
+    A slotted record takes a fraction of the memory of a dict with the same keys, which
+    adds up over candidate pools of thousands of movies. Records become dicts only when a
+    response is serialized (see to_dicts). Fields an endpoint does not use stay None.
+    """
+    id: int
+    title: str
+    release_year: str = None
+    overview: str = None
+    genre_ids: list = None
+    poster_path: str = None
+    genres: list = None
+    popularity: float = None
+    director_id: int = None
+    country_id: str = None
+
+    @classmethod
+    def from_discover(cls, result):
+        """
+        :param result: One entry of a TMDb /discover/movie response.
+        """
+        return cls(
+            id=result['id'],
+            title=result['title'],
+            release_year=result['release_date'].split('-')[0],
+            overview=result['overview'],
+            genre_ids=result['genre_ids'],
+            poster_path=result['poster_path'],
+        )
+
+    def __getitem__(self, key):
+        # Read-only dict-style access for code written against the former per-movie dicts
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def to_dict(self, fields=CARD_FIELDS):
+        """
+        :param fields: Attribute names to include, in output order.
+        :return: Dictionary with those attributes.
+        """
+        return {field: getattr(self, field) for field in fields}
+
+
+def to_dicts(movies, shape=CARD_FIELDS, fields=None):
+    """
+    Converts records for a JSON response.
+
+    :param movies: Iterable of Movie records.
+    :param shape: Keys the endpoint returns.
+    :param fields: Optional subset requested by the client (parsed ?fields=); names
+                   outside the shape are ignored.
+    :return: List of dictionaries.
+    """
+    keys = shape if fields is None else tuple(f for f in fields if f in shape)
+    return [movie.to_dict(keys) for movie in movies]
@@ -0,0 +1,256 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from config import profiling_config
+from lifecycle import after_fork
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-CineMood-Profile"
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, root=None):
+    """
+    Turns a frame into a collapsed stack line ("outer;...;inner") as read by flamegraph.pl
+    and speedscope.
+
+    :param frame: Innermost frame.
+    :param root: Optional label prepended as the outermost frame (e.g. the thread name).
+    """
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    if root:
+        labels.append(root)
+    return ";".join(reversed(labels))
+
+
+def write_collapsed(stacks, path):
+    """
+    Writes a Counter of collapsed stacks to a file, one "stack count" line each.
+    The file is written under a temporary name and renamed so readers never see half a file.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp_path, path)
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of one thread (or of every thread) from a background thread.
+
+    :param interval: Seconds between samples.
+    :param thread_id: Ident of the thread to sample; None samples all other threads.
+    """
+
+    def __init__(self, interval, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.stacks
+
+    def drain(self):
+        """
+        :return: The stacks collected so far, resetting the collection.
+        """
+        with self._lock:
+            stacks, self.stacks = self.stacks, Counter()
+        return stacks
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frame = frames.get(self.thread_id)
+                if frame is None:
+                    continue
+                with self._lock:
+                    self.stacks[collapse_stack(frame)] += 1
+                    self.samples += 1
+                continue
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            with self._lock:
+                for ident, frame in frames.items():
+                    if ident != own_id:
+                        self.stacks[collapse_stack(frame, names.get(ident, str(ident)))] += 1
+                self.samples += 1
+
+
+class RollingSampler:
+    """
+    Always-on, low-frequency sampler of every thread. Every `window` seconds the collected
+    stacks are written to a new background-<timestamp>.folded file and only the newest
+    `keep` files are kept.
+    """
+
+    def __init__(self, output_dir, interval=0.1, window=60.0, keep=10):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.window = window
+        self.keep = keep
+        self._sampler = StackSampler(interval)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._sampler.start()
+        self._thread = threading.Thread(target=self._run, name="rolling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.stop()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def flush(self):
+        stacks = self._sampler.drain()
+        if not stacks:
+            return None
+        path = os.path.join(self.output_dir, f"background-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.folded")
+        write_collapsed(stacks, path)
+        self._prune()
+        return path
+
+    def _run(self):
+        while not self._stop.wait(self.window):
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning(f"Could not write background profile: {e}")
+
+    def _prune(self):
+        # Only this process's files, so every worker keeps its own `keep` newest
+        suffix = f"-{os.getpid()}.folded"
+        files = sorted(f for f in os.listdir(self.output_dir) if f.startswith("background-") and f.endswith(suffix))
+        for name in files[:-self.keep] if self.keep else []:
+            try:
+                os.remove(os.path.join(self.output_dir, name))
+            except OSError:
+                pass
+
+
+_rolling_sampler = None
+
+
+def start_rolling_sampler(output_dir=None, interval=None, window=None, keep=None):
+    """
+    Starts the process-wide background sampler once. Missing arguments fall back to
+    profiling_config.
+
+    :return: The RollingSampler, or None if background profiling is disabled.
+    """
+    global _rolling_sampler
+    interval = profiling_config['background_interval'] if interval is None else interval
+    if not interval:
+        return None
+    if _rolling_sampler is None:
+        _rolling_sampler = RollingSampler(
+            output_dir or profiling_config['output_dir'], interval,
+            profiling_config['background_window'] if window is None else window,
+            profiling_config['background_keep'] if keep is None else keep).start()
+    return _rolling_sampler
+
+
+@after_fork
+def _restart_rolling_sampler_after_fork():
+    # The sampler threads stay behind in the parent; give each worker its own sampler
+    global _rolling_sampler
+    parent = _rolling_sampler
+    if parent is not None:
+        _rolling_sampler = None
+        start_rolling_sampler(parent.output_dir, parent.interval, parent.window, parent.keep)
+
+
+def stop_rolling_sampler():
+    global _rolling_sampler
+    if _rolling_sampler is not None:
+        _rolling_sampler.stop()
+        _rolling_sampler = None
+
+
+def init_app(app, config=None):
+    """
+    Adds per-request profiling to the Flask app. A request carrying the X-CineMood-Profile
+    header (matching PROFILE_TOKEN when one is set) is sampled while it runs and its
+    collapsed stacks are saved to the output directory; the file name is returned in the
+    same response header.
+
+    Nothing is registered when profiling is disabled, so unprofiled deployments pay nothing.
+
+    :param app: Flask application.
+    :param config: Overrides for profiling_config.
+    """
+    settings = dict(profiling_config, **(config or {}))
+    start_rolling_sampler(settings['output_dir'], settings['background_interval'],
+                          settings['background_window'], settings['background_keep'])
+    if not settings['enabled']:
+        return
+
+    from flask import g, request
+
+    output_dir = settings['output_dir']
+    token = settings['token']
+    os.makedirs(output_dir, exist_ok=True)
+
+    @app.before_request
+    def _start_request_profile():
+        requested = request.headers.get(PROFILE_HEADER)
+        if requested is None or (token and requested != token):
+            return
+        g._profiler = StackSampler(settings['sample_interval'], threading.get_ident()).start()
+
+    @app.after_request
+    def _save_request_profile(response):
+        sampler = g.pop("_profiler", None)
+        if sampler is None:
+            return response
+        stacks = sampler.stop()
+        route = request.url_rule.rule if request.url_rule else request.path
+        slug = "".join(c if c.isalnum() else "_" for c in route).strip("_") or "root"
+        name = f"request-{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{slug}-{time.time_ns() % 10**6}.folded"
+        try:
+            write_collapsed(stacks, os.path.join(output_dir, name))
+            response.headers[PROFILE_HEADER] = name
+        except OSError as e:
+            logger.warning(f"Could not write request profile: {e}")
+        return response
+
+    @app.teardown_request
+    def _discard_request_profile(exc):
+        # Only left over when the request failed before after_request ran
+        sampler = g.pop("_profiler", None)
+        if sampler is not None:
+            sampler.stop()
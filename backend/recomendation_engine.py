@@ -1,15 +1,42 @@
-from mood_to_genres import get_genres_for_mood
-from API_handler import fetch_movies_by_genre
+import mood_snapshot
+import warmer
+from mood_to_genres import get_blended_genre_weights, get_excluded_genre_ids, get_genres_for_mood, get_mood_genre_ids
+from API_handler import fetch_genre_movies, fetch_movies_by_genre
+from movie import Movie
+
+# mood -> the last recommendations computed from TMDb, served while TMDb is unavailable.
+# Only moods with genres get here, so the dict stays small.
+_last_good = {}
 
 
 def recommend_movies(user_id, mood, limit=12):
     """
-    Recommends movies based on user's mood by fetching data from TMDb.
+    Recommends movies based on user's mood: a slice of the mood snapshot when one is
+    loaded (see mood_snapshot.py), otherwise ranked from TMDb.
 
     :param user_id: ID of the user.
     :param mood: Current mood of the user.
     :param limit: Number of recommendations to fetch.
-    :return: List of recommended movies.
+    :return: List of recommended Movie records.
+    """
+    snapshot = mood_snapshot.current()
+    if snapshot is not None and mood in snapshot:
+        return snapshot.movies(mood, limit)
+
+    warmer.record("mood", mood)
+    recommendations = rank_movies(mood, limit)
+    if isinstance(recommendations, list) and recommendations:
+        _last_good[mood] = recommendations
+    return recommendations
+
+
+def rank_movies(mood, limit=12):
+    """
+    Ranks movies for a mood from TMDb, without the snapshot.
+
+    :param mood: Current mood of the user.
+    :param limit: Number of recommendations to fetch.
+    :return: List of Movie records, best first, or a dictionary with an error for an unknown mood.
     """
     genres = get_genres_for_mood(mood)
     if not genres:
@@ -23,9 +50,9 @@ def recommend_movies(user_id, mood, limit=12):
         genre_movies = fetch_movies_by_genre(genre, mood, limit=per_genre_limit)
 
         for movie in genre_movies:
-            if movie['title'] not in fetched_movies:
+            if movie.title not in fetched_movies:
                 recommendations.append(movie)
-                fetched_movies.add(movie['title'])
+                fetched_movies.add(movie.title)
 
         limit -= len(recommendations)
         if limit <= 0:
@@ -35,10 +62,116 @@ def recommend_movies(user_id, mood, limit=12):
         for genre in genres:
             additional_movies = fetch_movies_by_genre(genre, mood, limit=limit)
             for movie in additional_movies:
-                if movie['title'] not in fetched_movies:
+                if movie.title not in fetched_movies:
                     recommendations.append(movie)
-                    fetched_movies.add(movie['title'])
+                    fetched_movies.add(movie.title)
                     if len(recommendations) >= limit:
                         break
 
     return recommendations
+
+
+def recommend_blend(user_id, mood_weights, limit=12):
+    """
+    Recommends movies for a mix of moods, e.g. {"happy": 0.7, "nostalgic": 0.3}.
+
+    Each mood's weight is split over its genres, every genre needed by any of the moods
+    is fetched from TMDb once, and each (mood, genre) pair gets a share of the `limit`
+    slots proportional to its weight, filled with the genre's movies that pass the mood's
+    filter. Adding a mood costs no TMDb call for genres already in the mix.
+
+    :param user_id: ID of the user.
+    :param mood_weights: Dictionary from mood_to_genres.parse_mood_weights.
+    :param limit: Number of recommendations to return.
+    :return: List of recommended Movie records, the heaviest parts of the mix first.
+    """
+    for mood in mood_weights:
+        warmer.record("mood", mood)
+    weights = get_blended_genre_weights(mood_weights)
+    if not weights:
+        return {"error": f"No genres found for moods: {', '.join(mood_weights)}"}
+
+    # One TMDb call per distinct genre, shared by all moods that use it
+    pools = {}
+    for _, genre_id in weights:
+        if genre_id not in pools:
+            pools[genre_id] = fetch_genre_movies(genre_id)
+
+    candidates = {}
+    for mood, genre_id in weights:
+        excluded = get_excluded_genre_ids(mood)
+        candidates[(mood, genre_id)] = iter([m for m in pools[genre_id] if excluded.isdisjoint(m.genre_ids)])
+
+    # Slots go to the moods first, then to each mood's genres, so the moods keep their shares
+    quotas = {}
+    for mood, mood_slots in _allocate(mood_weights, limit).items():
+        units = {unit: weight for unit, weight in weights.items() if unit[0] == mood}
+        if units:
+            quotas.update(_allocate({unit: w / mood_weights[mood] for unit, w in units.items()}, mood_slots))
+    recommendations = []
+    seen = set()
+
+    def take(unit):
+        for movie in candidates[unit]:
+            if movie.id not in seen:
+                seen.add(movie.id)
+                recommendations.append(movie)
+                return True
+        return False
+
+    # Interleave the parts (Sainte-Laguë order) so the top of the list is mixed too
+    used = dict.fromkeys(quotas, 0)
+    while True:
+        open_units = [unit for unit in quotas if used[unit] < quotas[unit]]
+        if not open_units:
+            break
+        unit = max(open_units, key=lambda u: quotas[u] / (2 * used[u] + 1))
+        if take(unit):
+            used[unit] += 1
+        else:
+            quotas[unit] = used[unit]  # Genre exhausted for this mood
+
+    # Slots a part could not fill go to the others, heaviest first
+    for unit in weights:
+        while len(recommendations) < limit and take(unit):
+            pass
+
+    return recommendations
+
+
+def _allocate(weights, limit):
+    """
+    Splits `limit` slots proportionally to the weights, by largest remainder.
+
+    :return: Dictionary key -> number of slots.
+    """
+    exact = {key: weight * limit for key, weight in weights.items()}
+    quotas = {key: int(value) for key, value in exact.items()}
+    spare = limit - sum(quotas.values())
+    for key in sorted(exact, key=lambda k: quotas[k] - exact[k])[:spare]:
+        quotas[key] += 1
+    return quotas
+
+
+def fallback_recommendations(mood, limit=12, db_handler=None):
+    """
+    Recommends movies without calling TMDb, for when it is unavailable: the last
+    recommendations computed for the mood, or else movies of the local catalog with the
+    mood's genres.
+
+    :param mood: Current mood of the user, or a dictionary of mood weights (the heaviest is used).
+    :param limit: Number of recommendations to return.
+    :param db_handler: Optional DatabaseHandler for the local catalog.
+    :return: Tuple (list of Movie records, source), source being 'last_good', 'local' or 'none'.
+    """
+    if isinstance(mood, dict):
+        mood = next(iter(mood))
+    movies = _last_good.get(mood)
+    if movies:
+        return movies[:limit], "last_good"
+    if db_handler is not None:
+        include, exclude = get_mood_genre_ids(mood)
+        rows = db_handler.get_movies_by_genres(include, exclude, limit)
+        if rows:
+            return [Movie(**row) for row in rows], "local"
+    return [], "none"
@@ -0,0 +1,301 @@
+"""
+Read replicas for DatabaseHandler.
+
+Each replica has a small pool of MySQL connections. Before handing one out the replica's
+replication lag is checked (at most every few seconds): a replica more than `max_lag`
+seconds behind its source, with replication stopped, or that cannot be reached is left
+out until a later check finds it healthy again. Healthy replicas take turns; when none is
+healthy the caller reads from the primary.
+
+Replica connections run in autocommit mode, so every read sees the latest replicated rows
+instead of the snapshot of the transaction its connection opened earlier.
+"""
+import logging
+import queue
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+
+from lifecycle import after_fork
+from metrics import DB_POOL_IN_USE, DB_POOL_SIZE, DB_REPLICA_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Live replica sets, so forked workers drop the connections they inherited
+_replica_sets = weakref.WeakSet()
+# Connections inherited from the parent process, kept referenced so the child never closes them
+_inherited_connections = []
+
+
+@after_fork
+def _reset_after_fork():
+    for replica_set in list(_replica_sets):
+        for replica in replica_set.replicas:
+            _inherited_connections.extend(replica.pool.detach())
+
+
+def parse_replicas(value, default_port=3306):
+    """
+    :param value: Comma-separated 'host' or 'host:port' entries, e.g. 'db-r1,db-r2:3307'.
+    :return: List of (host, port).
+    """
+    replicas = []
+    for entry in (value or "").split(","):
+        host, _, port = entry.strip().partition(":")
+        if host:
+            replicas.append((host, int(port) if port else int(default_port)))
+    return replicas
+
+
+def replica_lag(connection):
+    """
+    Reads how far a replica is behind its source.
+
+    :param connection: Connection to the replica.
+    :return: Seconds behind the source; 0 for a server that replicates from nothing, None
+             when replication is stopped or broken.
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Error:
+            # MySQL before 8.0.22 and MariaDB before 10.5.1
+            cursor.execute("SHOW SLAVE STATUS")
+        status = cursor.fetchone()
+    finally:
+        cursor.close()
+    if status is None:
+        return 0
+    lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+    return None if lag is None else float(lag)
+
+
+class ConnectionPool:
+    """
+    At most `size` connections to one server. Idle connections are reused most recently
+    used first; a connection is opened when none is idle and the pool has room.
+    """
+
+    def __init__(self, connect, size, name):
+        """
+        :param connect: Function opening a new connection.
+        :param size: Most connections open at once.
+        :param name: Component label of the pool in /metrics.
+        """
+        self._connect = connect
+        self._size = size
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._open = 0
+        self._lock = threading.Lock()
+        self.name = name
+        DB_POOL_SIZE.set_function((name,), lambda: self._open)
+
+    def acquire(self, timeout):
+        """
+        :param timeout: Seconds to wait for a free connection.
+        :return: An open connection, or None if the pool stayed full.
+        :raise mysql.connector.Error: If a new connection cannot be opened.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            return None
+        try:
+            while True:
+                try:
+                    connection = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if connection.is_connected():
+                    DB_POOL_IN_USE.inc((self.name,))
+                    return connection
+                self._discard(connection)
+            connection = self._connect()
+            with self._lock:
+                self._open += 1
+        except BaseException:
+            self._slots.release()
+            raise
+        DB_POOL_IN_USE.inc((self.name,))
+        return connection
+
+    def release(self, connection, broken=False):
+        """
+        Returns a connection taken with acquire(). A broken connection is closed instead.
+        """
+        DB_POOL_IN_USE.dec((self.name,))
+        if broken or not connection.is_connected():
+            self._discard(connection, close=True)
+        else:
+            self._idle.put(connection)
+        self._slots.release()
+
+    def detach(self):
+        """
+        Starts the pool over in a forked child: forgets the parent's connections without
+        closing them and frees the slots held by the parent's threads.
+
+        :return: The idle connections forgotten.
+        """
+        connections = self._drain()
+        self._slots = threading.BoundedSemaphore(self._size)
+        self._lock = threading.Lock()
+        self._open = 0
+        return connections
+
+    def close(self):
+        """
+        Closes the idle connections. Connections in use go back to the pool when released.
+        """
+        for connection in self._drain():
+            self._discard(connection, close=True)
+
+    def _drain(self):
+        connections = []
+        while True:
+            try:
+                connections.append(self._idle.get_nowait())
+            except queue.Empty:
+                return connections
+
+    def _discard(self, connection, close=False):
+        with self._lock:
+            self._open = max(self._open - 1, 0)
+        if close:
+            try:
+                connection.close()
+            except Error:
+                pass
+
+
+class Replica:
+    """
+    One read replica: its connection pool and its last measured lag.
+    """
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.lag = None          # seconds behind the source; None when unknown or broken
+        self.checked = None      # time.monotonic() of the last lag check
+        self._check_lock = threading.Lock()
+        DB_REPLICA_LAG_SECONDS.set_function((name,), lambda: -1 if self.lag is None else self.lag)
+
+
+class ReplicaSet:
+    """
+    Hands out connections to healthy replicas in turn.
+    """
+
+    def __init__(self, replicas, max_lag=5.0, check_interval=5.0, timeout=0.05, lag=replica_lag):
+        """
+        :param replicas: List of (name, ConnectionPool) per replica.
+        :param max_lag: Most seconds a replica may be behind its source to be read from.
+        :param check_interval: Seconds a lag measurement is trusted.
+        :param timeout: Seconds to wait for a free connection of a replica before trying the next.
+        :param lag: Function measuring a replica's lag from one of its connections, see replica_lag.
+        """
+        self.replicas = [Replica(name, pool) for name, pool in replicas]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self._lag = lag
+        self._next = 0
+        _replica_sets.add(self)
+
+    @classmethod
+    def from_config(cls, config, db_config):
+        """
+        :param config: db_replica_config-style dictionary.
+        :param db_config: Primary settings; replicas use its user, password and database.
+        :return: ReplicaSet, or None when no replicas are configured.
+        """
+        hosts = parse_replicas(config.get('replicas'), db_config.get('port') or 3306)
+        if not hosts:
+            return None
+
+        def connector(host, port):
+            def connect():
+                return mysql.connector.connect(host=host, port=port, user=db_config["user"],
+                                               password=db_config["password"], database=db_config["database"],
+                                               autocommit=True, connection_timeout=config.get('connect_timeout', 2))
+            return connect
+
+        pools = [(f"{host}:{port}", ConnectionPool(connector(host, port), config['pool_size'], f"replica {host}:{port}"))
+                 for host, port in hosts]
+        return cls(pools, config['max_lag'], config['lag_check_interval'])
+
+    def healthy(self, replica):
+        """
+        :return: True if the replica's last measured lag is within max_lag.
+        """
+        return replica.lag is not None and replica.lag <= self.max_lag
+
+    @contextmanager
+    def connection(self):
+        """
+        Yields a connection to a healthy replica, or None when no replica is healthy or
+        free, in which case the caller reads from the primary.
+        """
+        count = len(self.replicas)
+        start = self._next
+        self._next = (start + 1) % count
+        for i in range(count):
+            replica = self.replicas[(start + i) % count]
+            connection = self._acquire(replica)
+            if connection is None:
+                continue
+            broken = False
+            try:
+                yield connection
+            except Error:
+                broken = True
+                raise
+            finally:
+                replica.pool.release(connection, broken)
+            return
+        yield None
+
+    def close(self):
+        for replica in self.replicas:
+            replica.pool.close()
+
+    def _acquire(self, replica):
+        # A connection to the replica if it is healthy, measuring its lag first when due
+        due = replica.checked is None or time.monotonic() - replica.checked >= self.check_interval
+        if not due and not self.healthy(replica):
+            return None
+        try:
+            connection = replica.pool.acquire(self.timeout)
+        except Error as e:
+            self._mark(replica, None)
+            logger.warning(f"Replica {replica.name} is unreachable: {e}")
+            return None
+        if connection is None:
+            return None
+        # One request measures at a time; the others go by the last measurement
+        if due and replica._check_lock.acquire(blocking=False):
+            try:
+                self._mark(replica, self._lag(connection))
+            except Error as e:
+                self._mark(replica, None)
+                logger.warning(f"Could not read the lag of replica {replica.name}: {e}")
+            finally:
+                replica._check_lock.release()
+            if replica.lag is None:
+                logger.warning(f"Replica {replica.name} is not replicating; not reading from it")
+            elif replica.lag > self.max_lag:
+                logger.warning(f"Replica {replica.name} is {replica.lag:.0f} s behind; not reading from it")
+        if self.healthy(replica):
+            return connection
+        replica.pool.release(connection)
+        return None
+
+    @staticmethod
+    def _mark(replica, lag):
+        replica.lag = lag
+        replica.checked = time.monotonic()
@@ -85,3 +85,28 @@ class AuthResponseSchema(Schema):
         error_messages={"required": "Access token is required in the response."}
     )
 
+
+# Largest number of ids a batch request may ask for (a full recommendations grid is 120)
+MAX_BATCH_IDS = 200
+
+
+class MovieBatchRequestSchema(Schema):
+    """
+    Schema for validating batch movie lookups.
+
+    Fields:
+        ids (list of int):
+            - Required.
+            - Between 1 and MAX_BATCH_IDS movie ids.
+        user_id (int):
+            - Optional.
+            - When given, the watched/rated/recommended status of each movie for this user is included.
+    """
+    ids = fields.List(
+        fields.Int(strict=True),
+        required=True,
+        validate=validate.Length(min=1, max=MAX_BATCH_IDS,
+                                 error=f"Between 1 and {MAX_BATCH_IDS} movie ids are required."),
+        error_messages={"required": "Movie ids are required."}
+    )
+    user_id = fields.Int(strict=True, load_default=None)
@@ -0,0 +1,306 @@
+"""
+Storage backends for DatabaseHandler and AuthHandler.
+
+A storage opens connections that behave like mysql.connector's: cursors take %s
+placeholders and cursor(dictionary=True), and failures raise mysql.connector.Error, so
+the handlers run the same queries, with the same error handling, on either backend.
+
+- MySQLStorage connects to the MySQL server of db_config (the default).
+- SQLiteStorage keeps the database in a local file, in WAL mode so readers never wait for
+  the writer. The schema comes from sql/cinemood_database_creation.sql, translated to
+  SQLite when the file is created. It suits single-node deployments, the tests and the
+  benchmarks: queries run in-process, with no network hop.
+
+DB_BACKEND selects the backend (see storage_config).
+"""
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+import mysql.connector
+
+from config import db_config, storage_config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "sql", "cinemood_database_creation.sql")
+
+# DATETIME columns come back as datetime objects, as with MySQL
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+
+
+def schema_statements(path=SCHEMA_FILE):
+    """
+    :return: CREATE/INSERT statements of the CineMood schema, without comments and the
+             CREATE DATABASE/USE lines, so they can be replayed into any database.
+    """
+    with open(path, encoding="utf-8") as f:
+        lines = []
+        for line in f.read().splitlines():
+            # '#' starts a comment unless it is inside a string
+            comment = next((i for i, char in enumerate(line) if char == "#" and line[:i].count("'") % 2 == 0), None)
+            lines.append(line if comment is None else line[:comment])
+    statements = []
+    for chunk in "\n".join(lines).split(";"):
+        statement = chunk.strip()
+        if statement.startswith("/*"):
+            statement = statement[statement.find("*/") + 2:].strip()
+        if not statement or statement.upper().startswith(("CREATE DATABASE", "USE ", "DROP DATABASE")):
+            continue
+        statements.append(statement)
+    return statements
+
+
+@functools.lru_cache(maxsize=512)
+def to_sqlite(statement):
+    """
+    Rewrites the MySQL dialect used by the handlers and the schema into SQLite's:
+    placeholders, INSERT IGNORE, ON DUPLICATE KEY UPDATE, AUTO_INCREMENT keys, ON UPDATE
+    timestamps and single-statement triggers.
+
+    :param statement: MySQL statement.
+    :return: Equivalent SQLite statement.
+    """
+    statement = statement.replace("%s", "?")
+    statement = re.sub(r"\bINSERT\s+IGNORE\b", "INSERT OR IGNORE", statement, flags=re.I)
+    duplicate = re.search(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", statement, re.I)
+    if duplicate:
+        # VALUES(column) is the row that was to be inserted, SQLite's excluded.column
+        update = re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", statement[duplicate.end():], flags=re.I)
+        statement = statement[:duplicate.start()] + "ON CONFLICT DO UPDATE SET" + update
+    statement = re.sub(r"\b(?:BIG)?INT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", "INTEGER PRIMARY KEY AUTOINCREMENT",
+                       statement, flags=re.I)
+    statement = re.sub(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP\b", "", statement, flags=re.I)
+    trigger = re.match(r"(CREATE\s+TRIGGER\b.*?\bFOR\s+EACH\s+ROW)\s+(?!BEGIN\b)(.*)", statement, re.I | re.S)
+    if trigger:
+        statement = f"{trigger.group(1)} BEGIN {trigger.group(2).strip()}; END"
+    return statement
+
+
+def _mysql_error(error):
+    # The handlers catch mysql.connector's errors; constraint violations keep their own type
+    if isinstance(error, sqlite3.IntegrityError):
+        return mysql.connector.IntegrityError(msg=str(error))
+    return mysql.connector.DatabaseError(msg=str(error))
+
+
+class SQLiteCursor:
+    """
+    mysql.connector-style cursor over a sqlite3 cursor.
+    """
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def execute(self, operation, params=()):
+        self._run(self._cursor.execute, to_sqlite(operation), tuple(params or ()))
+
+    def executemany(self, operation, seq_params):
+        self._run(self._cursor.executemany, to_sqlite(operation), [tuple(params) for params in seq_params])
+
+    def _run(self, func, operation, params):
+        connection = self._cursor.connection
+        began = not connection.in_transaction
+        try:
+            func(operation, params)
+        except sqlite3.Error as e:
+            # A failed statement that began the transaction would keep it, and the write
+            # lock, open until the thread's next commit; nothing else is lost by ending it
+            if began and connection.in_transaction:
+                connection.rollback()
+            raise _mysql_error(e) from e
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """
+    mysql.connector-style connection over sqlite3 connections. Each thread using it gets
+    its own sqlite3 connection, and so its own transaction: like with a MySQL connection
+    without autocommit, a thread's writes take effect on its commit(), and neither that
+    commit nor a rollback touches the unfinished writes of another thread.
+    """
+
+    def __init__(self, connect, connection):
+        """
+        :param connect: Function opening a new sqlite3 connection.
+        :param connection: sqlite3 connection already opened by the current thread.
+        """
+        self._connect = connect
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Thread -> its sqlite3 connection, so close() and finished threads can close them
+        self._connections = {}
+        self._open = True
+        self._register(connection)
+
+    def _register(self, connection):
+        thread = threading.current_thread()
+        with self._lock:
+            # Connections of finished threads roll back whatever they left uncommitted
+            for other in [other for other in self._connections if not other.is_alive()]:
+                self._connections.pop(other).close()
+            self._connections[thread] = connection
+        self._local.connection = connection
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            try:
+                connection = self._connect()
+            except sqlite3.Error as e:
+                raise _mysql_error(e) from e
+            self._register(connection)
+        return connection
+
+    def is_connected(self):
+        return self._open
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._connection().cursor(), dictionary)
+
+    def commit(self):
+        try:
+            self._connection().commit()
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def rollback(self):
+        try:
+            self._connection().rollback()
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def close(self):
+        self._open = False
+        with self._lock:
+            connections, self._connections = list(self._connections.values()), {}
+        for connection in connections:
+            connection.close()
+
+
+class MySQLStorage:
+    """
+    Connections to a MySQL server.
+    """
+    name = "mysql"
+
+    def __init__(self, config, keys=None):
+        """
+        :param config: mysql.connector.connect() arguments; read on every connect, so later
+                       changes (e.g. the benchmarks' disposable database) apply.
+        :param keys: Only pass these keys of config.
+        """
+        self.config = config
+        self.keys = keys
+
+    def connect(self):
+        """
+        :return: A new mysql.connector connection.
+        :raise mysql.connector.Error: If the server cannot be reached.
+        """
+        keys = self.keys or self.config.keys()
+        return mysql.connector.connect(**{key: self.config[key] for key in keys})
+
+
+class SQLiteStorage:
+    """
+    An embedded database file with the CineMood schema, created on first connect.
+    """
+    name = "sqlite"
+
+    def __init__(self, path, busy_timeout=5.0):
+        """
+        :param path: Database file.
+        :param busy_timeout: Seconds a write waits for the write of another connection.
+        """
+        self.path = path
+        self.busy_timeout = busy_timeout
+
+    def connect(self):
+        """
+        :return: A new SQLiteConnection; each thread using it opens its own sqlite3 connection.
+        :raise mysql.connector.Error: If the file cannot be opened or the schema created.
+        """
+        try:
+            connection = self._open_connection()
+            self._create_schema(connection)
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+        return SQLiteConnection(self._open_connection, connection)
+
+    def _open_connection(self):
+        # Closed from the thread that closes the SQLiteConnection, hence check_same_thread=False
+        connection = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        # MySQL's InnoDB tables enforce the foreign keys
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    @staticmethod
+    def _create_schema(connection):
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movie'").fetchone():
+            return
+        # IMMEDIATE takes the write lock, so workers starting together create the schema once
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if not connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movie'").fetchone():
+                for statement in schema_statements():
+                    connection.execute(to_sqlite(statement))
+                logger.info("Created the CineMood schema")
+            connection.commit()
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+
+
+def get_storage(mysql_config=db_config, keys=None, config=None):
+    """
+    :param mysql_config: Connection settings used when the backend is MySQL.
+    :param keys: Only pass these keys of mysql_config to mysql.connector.connect().
+    :param config: storage_config-style dictionary; storage_config by default.
+    :return: The storage selected by the 'backend' setting, SQLiteStorage or MySQLStorage.
+    :raise ValueError: For an unknown backend.
+    """
+    config = config or storage_config
+    if config['backend'] == 'sqlite':
+        return SQLiteStorage(config['sqlite_path'], config['sqlite_busy_timeout'])
+    if config['backend'] != 'mysql':
+        raise ValueError(f"Unknown DB_BACKEND {config['backend']!r}; use 'mysql' or 'sqlite'")
+    return MySQLStorage(mysql_config, keys)
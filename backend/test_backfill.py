@@ -0,0 +1,108 @@
+import json
+import threading
+import unittest
+from collections import Counter
+from unittest.mock import MagicMock, patch
+
+import API_handler
+from backfill import Backfill, plan
+from database_handler import DatabaseHandler
+from test_catalog_sync import SQLiteConnection, details
+from tmdb_scheduler import BACKFILL, current_priority
+
+
+class FakeDiscover:
+    """
+    Two discover pages per genre and years; every page lists three ids shared by all
+    genres and one of its own. Records the calls.
+    """
+
+    def __init__(self, gone=(), failing=()):
+        self.gone = set(gone)
+        self.failing = set(failing)  # (genre id, page) whose discover call fails
+        self.calls = Counter()
+        self.main_thread = threading.get_ident()
+
+    def get(self, url, params=None, **kwargs):
+        assert current_priority() == BACKFILL
+        assert threading.get_ident() != self.main_thread
+        if url.endswith("/discover/movie"):
+            genre_id, page = params["with_genres"], params["page"]
+            self.calls["discover", genre_id, page] += 1
+            if (genre_id, page) in self.failing:
+                raise ValueError("bad page")
+            assert params["primary_release_date.gte"] == "1990-01-01"
+            assert params["primary_release_date.lte"] == "1999-12-31"
+            ids = [1000 * page + i for i in range(3)] + [genre_id * 100 + page] if page <= 2 else []
+            return self._response({"results": [{"id": movie_id} for movie_id in ids], "total_pages": 2})
+        movie_id = int(url.rsplit("/", 1)[1])
+        self.calls["details", movie_id] += 1
+        if movie_id in self.gone:
+            return self._response({}, 404)
+        return self._response(details(movie_id))
+
+    @staticmethod
+    def _response(body, status=200):
+        return MagicMock(status_code=status, json=MagicMock(return_value=body), raise_for_status=MagicMock())
+
+
+class TestBackfill(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = SQLiteConnection()
+        self.db_handler = DatabaseHandler()
+        self.db_handler.connection = self.connection
+        self.partitions = plan([35, 18], 1990, 1999, span=10, pages=3)
+
+    def run_backfill(self, tmdb, workers=3, **kwargs):
+        with patch.object(API_handler, "get_tmdb_session", return_value=tmdb):
+            return Backfill(self.db_handler, workers=workers, **kwargs).run(self.partitions)
+
+    def checkpoints(self):
+        return {name: json.loads(value) for name, value in self.db_handler.get_sync_states("backfill:").items()}
+
+    def test_plan(self):
+        self.assertEqual(plan([35], 1990, 2014, span=10, pages=2),
+                         [(35, (1990, 1999), 1), (35, (2000, 2009), 1), (35, (2010, 2014), 1),
+                          (35, (1990, 1999), 2), (35, (2000, 2009), 2), (35, (2010, 2014), 2)])
+        with self.assertRaises(ValueError):
+            Backfill(self.db_handler, run="a:b")
+
+    def test_partitions_are_fetched_once_and_ids_deduplicated(self):
+        tmdb = FakeDiscover(gone=[1001])
+        stats = self.run_backfill(tmdb, workers=1)
+        # The third pages do not exist, which the first pages tell: no call for them
+        self.assertEqual(sorted(key[1:] for key in tmdb.calls if key[0] == "discover"),
+                         [(18, 1), (18, 2), (35, 1), (35, 2)])
+        detail_calls = [key[1] for key in tmdb.calls if key[0] == "details"]
+        self.assertEqual(sorted(detail_calls), [1000, 1001, 1002, 1801, 1802, 2000, 2001, 2002, 3501, 3502])
+        self.assertTrue(all(tmdb.calls["details", movie_id] == 1 for movie_id in detail_calls))
+        # Every shared id is listed by both genres
+        self.assertEqual((stats.movies, stats.missing, stats.duplicates, stats.done), (9, 1, 6, 6))
+        self.assertEqual(stats.calls, 14)
+        self.assertEqual(self.connection.rows("SELECT COUNT(*) FROM movie"), [(11,)])
+        self.assertEqual(len(self.checkpoints()), 6)
+        self.assertEqual(self.checkpoints()["backfill:35:1990-1999:3"], {"movies": 0})
+
+    def test_failed_partition_is_retried_by_the_next_run(self):
+        stats = self.run_backfill(FakeDiscover(failing=[(18, 2)]))
+        self.assertEqual((stats.done, stats.failed), (5, 1))
+        self.assertNotIn("backfill:18:1990-1999:2", self.checkpoints())
+
+        tmdb = FakeDiscover()
+        stats = self.run_backfill(tmdb)
+        self.assertEqual((stats.resumed, stats.done, stats.failed), (5, 1, 0))
+        # Only the failed page is fetched again, and only its movie not written by the first run
+        self.assertEqual(set(tmdb.calls), {("discover", 18, 2), ("details", 1802)})
+        self.assertEqual(len(self.checkpoints()), 6)
+
+    def test_refresh_refetches_known_movies(self):
+        self.run_backfill(FakeDiscover())
+        tmdb = FakeDiscover()
+        stats = self.run_backfill(tmdb, run="again", refresh=True)
+        self.assertEqual(stats.movies, 10)
+        self.assertEqual(sum(1 for key in tmdb.calls if key[0] == "details"), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
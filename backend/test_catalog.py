@@ -0,0 +1,148 @@
+import sqlite3
+import unittest
+
+import catalog
+from database_handler import DatabaseHandler
+
+SCHEMA = """
+CREATE TABLE director (id INTEGER PRIMARY KEY, d_name TEXT);
+CREATE TABLE country (id TEXT PRIMARY KEY, country TEXT);
+CREATE TABLE movie (id INTEGER PRIMARY KEY, title TEXT, release_year INTEGER, director_id INTEGER, country_id TEXT);
+CREATE TABLE movie_genre (movie_id INTEGER, genre_id INTEGER);
+CREATE TABLE catalog_changes (id INTEGER PRIMARY KEY AUTOINCREMENT, movie_id INTEGER,
+                              changed_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+INSERT INTO director VALUES (1, 'Pete Docter');
+INSERT INTO country VALUES ('US', 'United States');
+INSERT INTO movie VALUES (14160, 'Up', 2009, 1, 'US');
+INSERT INTO movie VALUES (13, 'Forrest Gump', 1994, NULL, NULL);
+INSERT INTO movie_genre VALUES (14160, 16), (14160, 35), (13, 35), (13, 18);
+"""
+
+
+class SQLiteConnection:
+    # Just enough of a mysql.connector connection for the snapshot queries
+    def __init__(self):
+        self.db = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+        self.db.executescript(SCHEMA)
+
+    def is_connected(self):
+        return True
+
+    def commit(self):
+        self.db.commit()
+
+    def cursor(self, **kwargs):
+        return SQLiteCursor(self.db.cursor())
+
+    def close(self):
+        self.db.close()
+
+
+class SQLiteCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        self._cursor.execute(query.replace("%s", "?"), params)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+
+@unittest.skipUnless(catalog.available(), "numpy is not installed")
+class TestCatalogSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = SQLiteConnection()
+        self.db_handler = DatabaseHandler()
+        self.db_handler.connection = self.connection
+        self.snapshot = catalog.CatalogSnapshot(self.db_handler, refresh_interval=3600)
+        self.db_handler.catalog = self.snapshot
+
+    def tearDown(self):
+        self.connection.close()
+
+    def change(self, *statements):
+        for statement in statements:
+            self.connection.db.execute(statement)
+        self.snapshot.invalidate()
+
+    def test_lookups_without_queries(self):
+        self.snapshot.current()
+        self.connection.db.execute("DELETE FROM movie")  # not recorded, so not seen until reloaded
+        self.assertEqual(self.db_handler.get_movie_by_title("up"), {
+            "id": 14160, "title": "Up", "release_year": 2009, "director_id": 1, "country_id": "US"})
+        self.assertEqual(self.db_handler.get_movie_id("Forrest Gump"), 13)
+        self.assertIsNone(self.db_handler.get_movie_id("Unknown"))
+        self.assertEqual(list(self.db_handler.get_movies_by_ids([13, 999])), [13])
+        self.assertEqual(self.snapshot.current().directors, {1: "Pete Docter"})
+
+    def test_null_columns(self):
+        self.assertEqual(self.db_handler.get_movie_by_title("Forrest Gump"), {
+            "id": 13, "title": "Forrest Gump", "release_year": 1994, "director_id": None, "country_id": None})
+
+    def test_filter_by_genre(self):
+        columns = self.snapshot.current()
+        self.assertEqual(sorted(columns.ids[columns.filter(include_genre_ids=[35])]), [13, 14160])
+        self.assertEqual(list(columns.ids[columns.filter([35], exclude_genre_ids=[18])]), [14160])
+
+    def test_candidates_for_mood(self):
+        # happy: comedy or animation, but no drama
+        movies = self.snapshot.candidates("happy")
+        self.assertEqual([movie.title for movie in movies], ["Up"])
+        self.assertEqual(sorted(movies[0].genre_ids), [16, 35])
+
+    def test_refresh_applies_recorded_changes(self):
+        self.snapshot.current()
+        self.change("INSERT INTO movie VALUES (862, 'Toy Story', 1995, NULL, 'US')",
+                    "INSERT INTO movie_genre VALUES (862, 16)",
+                    "INSERT INTO catalog_changes (movie_id) VALUES (862)",
+                    "UPDATE movie SET title = 'Up!' WHERE id = 14160",
+                    "INSERT INTO catalog_changes (movie_id) VALUES (14160)",
+                    "DELETE FROM movie WHERE id = 13",
+                    "INSERT INTO catalog_changes (movie_id) VALUES (13)")
+        self.assertEqual(self.db_handler.get_movie_id("toy story"), 862)
+        self.assertEqual(self.db_handler.get_movie_id("Up!"), 14160)
+        self.assertIsNone(self.db_handler.get_movie_id("Up"))
+        self.assertIsNone(self.db_handler.get_movie_id("Forrest Gump"))
+        self.assertEqual(self.snapshot.last_change_id, 3)
+        columns = self.snapshot.current()
+        self.assertEqual(sorted(columns.ids[columns.filter(include_genre_ids=[16])]), [862, 14160])
+
+    def test_changes_wait_for_refresh_interval(self):
+        self.snapshot.current()
+        self.connection.db.execute("INSERT INTO movie VALUES (862, 'Toy Story', 1995, NULL, NULL)")
+        self.connection.db.execute("INSERT INTO catalog_changes (movie_id) VALUES (862)")
+        self.assertIsNone(self.db_handler.get_movie_id("Toy Story"))
+        self.snapshot.invalidate()
+        self.assertEqual(self.db_handler.get_movie_id("Toy Story"), 862)
+
+    def test_old_changes_are_deleted(self):
+        self.snapshot.current()
+        self.change("INSERT INTO catalog_changes (movie_id, changed_at) VALUES (13, '2024-01-01 00:00:00')",
+                    "INSERT INTO catalog_changes (movie_id, changed_at) VALUES (13, '2024-01-01 12:00:00')",
+                    "INSERT INTO catalog_changes (movie_id, changed_at) VALUES (14160, '2024-01-02 06:00:00')")
+        self.snapshot.change_retention = 86400
+        self.snapshot.current()
+        # Only the change more than a day before the last one applied is gone
+        ids = [row[0] for row in self.connection.db.execute("SELECT id FROM catalog_changes")]
+        self.assertEqual(ids, [2, 3])
+
+    def test_snapshot_behind_deleted_changes_loads_again(self):
+        self.snapshot.current()
+        self.change("INSERT INTO movie VALUES (862, 'Toy Story', 1995, NULL, 'US')",
+                    "INSERT INTO catalog_changes (movie_id) VALUES (862)",
+                    "INSERT INTO movie VALUES (12, 'Finding Nemo', 2003, NULL, 'US')",
+                    "INSERT INTO catalog_changes (movie_id) VALUES (12)",
+                    # Another process pruned the first change, which this snapshot had not seen
+                    "DELETE FROM catalog_changes WHERE id = 1")
+        self.assertEqual(self.db_handler.get_movie_id("Toy Story"), 862)
+        self.assertEqual(self.db_handler.get_movie_id("Finding Nemo"), 12)
+        self.assertEqual(self.snapshot.last_change_id, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+import json
+import re
+import sqlite3
+import unittest
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import API_handler
+from catalog_sync import CHECKPOINT, CatalogSync, windows
+from database_handler import DatabaseHandler
+from ingestion import parse_movie
+from tmdb_scheduler import BACKFILL, current_priority
+
+SCHEMA = """
+CREATE TABLE country (id TEXT PRIMARY KEY, country TEXT);
+CREATE TABLE director (id INTEGER PRIMARY KEY, d_name TEXT NOT NULL);
+CREATE TABLE actor (id INTEGER PRIMARY KEY, a_name TEXT NOT NULL);
+CREATE TABLE genre (id INTEGER PRIMARY KEY, genre TEXT NOT NULL UNIQUE);
+CREATE TABLE movie (id INTEGER PRIMARY KEY, title TEXT NOT NULL, release_year INTEGER, director_id INTEGER,
+                    country_id TEXT);
+CREATE TABLE movie_genre (movie_id INTEGER, genre_id INTEGER, PRIMARY KEY (movie_id, genre_id));
+CREATE TABLE `cast` (actor_id INTEGER, movie_id INTEGER, PRIMARY KEY (actor_id, movie_id));
+CREATE TABLE sync_state (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+INSERT INTO country VALUES ('US', 'United States'), ('FR', 'France');
+INSERT INTO genre VALUES (35, 'Comedy');
+INSERT INTO movie VALUES (1, 'Old title', 1990, NULL, NULL), (3, 'Three', 2000, NULL, NULL);
+INSERT INTO movie_genre VALUES (1, 18);
+"""
+
+
+class SQLiteConnection:
+    # Enough of a mysql.connector connection for the upserts: MySQL's upsert syntax is
+    # rewritten to SQLite's
+    def __init__(self):
+        self.db = sqlite3.connect(":memory:")
+        self.db.executescript(SCHEMA)
+        self.fail_on = None
+        self.statements = []  # (query, rows) of every executemany
+
+    def is_connected(self):
+        return True
+
+    def cursor(self, **kwargs):
+        return SQLiteCursor(self)
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def rows(self, query):
+        return self.db.execute(query).fetchall()
+
+
+class SQLiteCursor:
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection.db.cursor()
+
+    @staticmethod
+    def _translate(query):
+        query = query.replace("%s", "?").replace("INSERT IGNORE", "INSERT OR IGNORE")
+        query = query.replace("ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET")
+        return re.sub(r"VALUES\((\w+)\)", r"excluded.\1", query)
+
+    def _check(self, query):
+        if self._connection.fail_on and self._connection.fail_on in query:
+            from mysql.connector import Error
+            raise Error("injected failure")
+
+    def execute(self, query, params=()):
+        self._check(query)
+        self._cursor.execute(self._translate(query), params)
+
+    def executemany(self, query, rows):
+        self._check(query)
+        self._connection.statements.append((query, list(rows)))
+        self._cursor.executemany(self._translate(query), rows)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def close(self):
+        self._cursor.close()
+
+
+def details(movie_id, title=None):
+    return {
+        "id": movie_id, "title": title or f"Movie {movie_id}", "release_date": "2001-02-03",
+        "genres": [{"id": 35, "name": "Comedy"}, {"id": 18, "name": "Drama"}],
+        "production_countries": [{"iso_3166_1": "US" if movie_id % 2 else "XX", "name": "Somewhere"}],
+        "credits": {
+            "cast": [{"id": 500 + movie_id, "name": "Lead", "order": 0}, {"id": 900, "name": "Everyone", "order": 1}],
+            "crew": [{"id": 700 + movie_id, "name": f"Director {movie_id}", "job": "Director"}],
+        },
+    }
+
+
+class FakeTMDb:
+    """
+    Answers the change feed (two ids a page) and movie details; records what was asked.
+    """
+
+    def __init__(self, changes, gone=()):
+        self.changes = changes  # ISO day -> changed ids
+        self.gone = set(gone)
+        self.fetched = []
+        self.ranges = []
+
+    def get(self, url, params=None, **kwargs):
+        assert current_priority() == BACKFILL
+        if url.endswith("/movie/changes"):
+            start, end = date.fromisoformat(params["start_date"]), date.fromisoformat(params["end_date"])
+            if params["page"] == 1:
+                self.ranges.append((start, end))
+            ids = sorted({movie_id for day, day_ids in self.changes.items()
+                          if start <= date.fromisoformat(day) <= end for movie_id in day_ids})
+            page = ids[(params["page"] - 1) * 2:params["page"] * 2]
+            results = [{"id": movie_id, "adult": movie_id == 666} for movie_id in page]
+            return self._response({"results": results, "page": params["page"], "total_pages": (len(ids) + 1) // 2})
+        movie_id = int(url.rsplit("/", 1)[1])
+        assert params["append_to_response"] == "credits"
+        self.fetched.append(movie_id)
+        if movie_id in self.gone:
+            return self._response({}, 404)
+        return self._response(details(movie_id))
+
+    @staticmethod
+    def _response(body, status=200):
+        return MagicMock(status_code=status, json=MagicMock(return_value=body), raise_for_status=MagicMock())
+
+
+class TestCatalogSync(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = SQLiteConnection()
+        self.db_handler = DatabaseHandler()
+        self.db_handler.connection = self.connection
+
+    def run_sync(self, tmdb, since=None, until=date(2024, 5, 3), **kwargs):
+        with patch.object(API_handler, "get_tmdb_session", return_value=tmdb):
+            return CatalogSync(self.db_handler, **dict(dict(batch_size=2, workers=2, only_known=False),
+                                                       **kwargs)).run(since, until)
+
+    def checkpoint(self):
+        return json.loads(self.db_handler.get_sync_state(CHECKPOINT))
+
+    def test_parse_movie(self):
+        record = parse_movie(details(7, title="x" * 300))
+        self.assertEqual(record["movie"], {"id": 7, "title": "x" * 255, "release_year": 2001, "director_id": 707,
+                                           "country_id": "US"})
+        self.assertEqual(record["director"], (707, "Director 7"))
+        self.assertEqual(record["genres"], [(35, "Comedy"), (18, "Drama")])
+        self.assertEqual(record["cast"], [(507, "Lead"), (900, "Everyone")])
+        self.assertIsNone(parse_movie(dict(details(7), release_date=""))["movie"]["release_year"])
+
+    def test_changed_movies_are_upserted_with_their_relations(self):
+        tmdb = FakeTMDb({"2024-05-02": [1, 2, 666], "2024-05-03": [3, 4]}, gone=[4])
+        stats = self.run_sync(tmdb, since=date(2024, 5, 2))
+        self.assertEqual((stats.changed, stats.written, stats.missing), (4, 3, 1))
+        self.assertEqual(sorted(tmdb.fetched), [1, 2, 3, 4])  # the adult title is left out
+
+        self.assertEqual(self.connection.rows("SELECT * FROM movie ORDER BY id"),
+                         [(1, "Movie 1", 2001, 701, "US"), (2, "Movie 2", 2001, 702, None),
+                          (3, "Movie 3", 2001, 703, "US")])
+        # Genres and cast are replaced; shared people and genres are stored once
+        self.assertEqual(self.connection.rows("SELECT * FROM movie_genre WHERE movie_id = 1"), [(1, 18), (1, 35)])
+        self.assertEqual(self.connection.rows("SELECT COUNT(*) FROM actor"), [(4,)])
+        self.assertEqual(self.connection.rows("SELECT * FROM `cast` WHERE movie_id = 2 ORDER BY actor_id"),
+                         [(502, 2), (900, 2)])
+        self.assertEqual(self.connection.rows("SELECT * FROM genre ORDER BY id"), [(18, "Drama"), (35, "Comedy")])
+        self.assertEqual(self.checkpoint(), {"since": "2024-05-02", "until": "2024-05-03", "last_id": None})
+
+    def test_only_movies_in_the_catalog_are_refetched(self):
+        tmdb = FakeTMDb({"2024-05-03": [1, 2, 3, 4]})
+        stats = self.run_sync(tmdb, since=date(2024, 5, 3), only_known=True)
+        self.assertEqual(sorted(tmdb.fetched), [1, 3])
+        self.assertEqual((stats.written, stats.skipped), (2, 2))
+        self.assertEqual(self.connection.rows("SELECT COUNT(*) FROM movie"), [(2,)])
+
+    def test_failed_batch_keeps_the_checkpoint_and_the_next_run_resumes(self):
+        tmdb = FakeTMDb({"2024-05-02": [1, 2, 3, 4, 5]})
+        calls = {"count": 0}
+        upsert = DatabaseHandler.upsert_movies
+
+        def fail_second_batch(handler, movies, *args):
+            calls["count"] += 1
+            self.connection.fail_on = "INSERT INTO movie " if calls["count"] == 2 else None
+            return upsert(handler, movies, *args)
+
+        with patch.object(DatabaseHandler, "upsert_movies", fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.run_sync(tmdb, since=date(2024, 5, 2))
+        self.connection.fail_on = None
+        # The failed batch was rolled back: only the first one and its checkpoint are stored
+        self.assertEqual(self.checkpoint(), {"since": "2024-05-02", "until": "2024-05-03", "last_id": 2})
+        self.assertEqual(self.connection.rows("SELECT id FROM movie ORDER BY id"), [(1,), (2,), (3,)])
+        self.assertEqual(self.connection.rows("SELECT title FROM movie WHERE id = 3"), [("Three",)])
+
+        tmdb.fetched.clear()
+        self.run_sync(tmdb, until=date(2024, 5, 4))
+        # The unfinished range is finished after its last written id, then the sync moves on
+        self.assertEqual(tmdb.ranges[-2:], [(date(2024, 5, 2), date(2024, 5, 3)), (date(2024, 5, 3), date(2024, 5, 4))])
+        self.assertEqual(sorted(tmdb.fetched), [3, 4, 5])
+        self.assertEqual(self.checkpoint(), {"since": "2024-05-03", "until": "2024-05-04", "last_id": None})
+
+    def test_long_ranges_are_split_for_the_change_feed(self):
+        self.assertEqual(windows(date(2024, 5, 1), date(2024, 5, 1)), [(date(2024, 5, 1), date(2024, 5, 1))])
+        self.assertEqual(windows(date(2024, 5, 1), date(2024, 5, 30)),
+                         [(date(2024, 5, 1), date(2024, 5, 14)), (date(2024, 5, 14), date(2024, 5, 27)),
+                          (date(2024, 5, 27), date(2024, 5, 30))])
+        tmdb = FakeTMDb({})
+        self.run_sync(tmdb, since=date(2024, 4, 1))
+        self.assertEqual(len(tmdb.ranges), 3)
+        self.assertEqual(self.checkpoint()["until"], "2024-05-03")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import recomendation_engine
+from app import create_app
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from movie import Movie
+from tmdb_scheduler import ScheduledSession, TMDbBusyError, TMDbScheduler
+
+
+def make_breaker(**kwargs):
+    settings = dict(failure_rate=0.5, window=60.0, min_calls=4, open_seconds=0.05, probes=1)
+    settings.update(kwargs)
+    return CircuitBreaker("test", **settings)
+
+
+def call(breaker, succeeded):
+    probe = breaker.before_call()
+    breaker.record(succeeded, probe)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_on_failure_rate(self):
+        breaker = make_breaker()
+        for succeeded in (True, False, True):
+            call(breaker, succeeded)
+        self.assertEqual(breaker.state, CLOSED)  # below min_calls
+        call(breaker, False)
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_old_failures_leave_the_window(self):
+        breaker = make_breaker(window=0.02)
+        for _ in range(3):
+            call(breaker, False)
+        time.sleep(0.03)
+        call(breaker, False)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        breaker = make_breaker(min_calls=1)
+        call(breaker, False)
+        time.sleep(0.06)
+        probe = breaker.before_call()
+        self.assertTrue(probe)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()  # only one probe at a time
+        breaker.record(False, probe)
+        self.assertEqual(breaker.state, OPEN)
+
+        time.sleep(0.06)
+        call(breaker, True)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_session_counts_5xx_and_errors_but_not_rate_limiting(self):
+        breaker = make_breaker(min_calls=2, failure_rate=1.0)
+        scheduler = TMDbScheduler(0, 1, 10, {})
+        session = MagicMock()
+        session.request.return_value = MagicMock(status_code=503, headers={})
+        scheduled = ScheduledSession(session, scheduler, breaker, timeout=3)
+        scheduled.get("http://tmdb/discover/movie")
+        session.request.assert_called_once_with("GET", "http://tmdb/discover/movie", timeout=3)
+
+        with patch.object(scheduler, "acquire", side_effect=TMDbBusyError("interactive", "deadline")):
+            with self.assertRaises(TMDbBusyError):
+                scheduled.get("http://tmdb/discover/movie")
+        self.assertEqual(breaker.state, CLOSED)
+
+        session.request.side_effect = ConnectionError("refused")
+        with self.assertRaises(ConnectionError):
+            scheduled.get("http://tmdb/discover/movie")
+        self.assertEqual(breaker.state, OPEN)
+
+
+class TestDegradedRecommendations(unittest.TestCase):
+
+    def setUp(self):
+        recomendation_engine._last_good.clear()
+        self.client = create_app({'TESTING': True}).test_client()
+
+    def tearDown(self):
+        recomendation_engine._last_good.clear()
+
+    def test_fallback_prefers_last_good_results(self):
+        recomendation_engine._last_good["happy"] = [Movie(id=1, title="Up"), Movie(id=2, title="Cars")]
+        db_handler = MagicMock()
+        self.assertEqual(recomendation_engine.fallback_recommendations("happy", 1, db_handler),
+                         ([Movie(id=1, title="Up")], "last_good"))
+        db_handler.get_movies_by_genres.assert_not_called()
+
+    def test_fallback_to_local_catalog(self):
+        db_handler = MagicMock()
+        db_handler.get_movies_by_genres.return_value = [
+            {"id": 3, "title": "Shrek", "release_year": 2001, "director_id": None, "country_id": "US",
+             "genre_ids": [16, 35]}]
+        movies, source = recomendation_engine.fallback_recommendations("happy", 5, db_handler)
+        self.assertEqual(source, "local")
+        self.assertEqual(movies[0].title, "Shrek")
+        include, exclude, limit = db_handler.get_movies_by_genres.call_args.args
+        self.assertIn(35, include)
+        self.assertIn(18, exclude)
+        self.assertEqual(limit, 5)
+
+    def test_route_serves_degraded_response_while_circuit_is_open(self):
+        recomendation_engine._last_good["happy"] = [Movie(id=1, title="Up", overview="Balloons.")]
+        with patch.object(recomendation_engine, "fetch_movies_by_genre", side_effect=CircuitOpenError("tmdb", 20)):
+            response = self.client.get("/recommendations?mood=happy&fields=id,title")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [{"id": 1, "title": "Up"}])
+        self.assertEqual(response.headers["X-CineMood-Degraded"], "last_good")
+        self.assertEqual(response.headers["Cache-Control"], "no-store")
+        self.assertIsNone(response.headers.get("ETag"))
+
+    def test_route_answers_503_without_fallback_data(self):
+        with patch.object(recomendation_engine, "fetch_movies_by_genre", side_effect=CircuitOpenError("tmdb", 20)), \
+                patch("database_handler.DatabaseHandler.get_movies_by_genres", return_value=[]):
+            response = self.client.get("/recommendations?mood=happy")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "20")
+
+
+if __name__ == '__main__':
+    unittest.main()
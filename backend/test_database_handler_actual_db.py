@@ -2,6 +2,8 @@ from database_handler import DatabaseHandler
 from config import db_config
 
 
+# Runs against the DB_BACKEND database: the MySQL server from .env, or with DB_BACKEND=sqlite
+# a local file, so it also runs where no server is available
 def test_database_handler():
     db_handler = DatabaseHandler()
 
@@ -11,8 +13,8 @@ def test_database_handler():
         director_id = 1234
         director_name = "Steven Spielberg"
         db_handler.add_director(director_id, director_name)
-        db_handler.check_record("director", "id", 1234)
-        db_handler.check_record("director", "id", 10)
+        assert db_handler.check_record("director", "id", 1234) == 1234
+        assert db_handler.check_record("director", "id", 10) is None
 
         actor_id = 100
         actor_name = "Tina Turner"
@@ -37,9 +39,11 @@ def test_database_handler():
         movie_id = db_handler.get_movie_id("Jurassic Park")
         db_handler.add_cast(actor_id, movie_id)
 
-        db_handler.add_genre(movie_id, genre_id)
+        db_handler.add_movie_genre(movie_id, genre_id)
         movie = db_handler.get_movie_by_title("Jurassic Park")
         print(movie)
+        assert movie["id"] == 5678 and movie["release_year"] == 1993
+        assert "Drama" in db_handler.get_movie_details(movie_id)["genres"]
 
         db_handler.close_connection()
     else:
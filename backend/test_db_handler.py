@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import MagicMock, patch
 from database_handler import DatabaseHandler
+from storage import MySQLStorage
 
 
 class TestDatabaseHandler(unittest.TestCase):
@@ -16,7 +17,9 @@ class TestDatabaseHandler(unittest.TestCase):
             "password": "test_password",
             "database": "test_db"
         }
-        self.db_handler = DatabaseHandler(self.db_config)
+        self.db_handler = DatabaseHandler(storage=MySQLStorage(self.db_config))
+        # Connects while mysql.connector.connect is patched
+        self.db_handler.connect()
 
     def test_add_director_existing(self):
         self.db_handler.check_record = MagicMock(return_value=1)
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from disk_cache import DiskCache, DiskCachedSession, MemoryCache, classify
+from metrics import CACHE_REQUESTS
+
+TTLS = {"discover": 60, "search": 60, "movie_details": 60, "credits": 0}
+DISCOVER_URL = "http://tmdb/3/discover/movie?api_key=secret&with_genres=35&&language=en"
+
+
+def make_response(status=200, body=b'{"results": []}'):
+    response = MagicMock(status_code=status, content=body, headers={"Content-Type": "application/json"})
+    return response
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache", "tmdb.sqlite3")
+        self.cache = DiskCache(self.path, 1024, TTLS)
+        CACHE_REQUESTS.reset()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_classify(self):
+        self.assertEqual(classify(DISCOVER_URL), ("discover", "/discover/movie?language=en&with_genres=35"))
+        self.assertEqual(classify("http://tmdb/3/movie/42?api_key=k")[0], "movie_details")
+        self.assertEqual(classify("http://tmdb/3/movie/42/credits")[0], "credits")
+        self.assertEqual(classify("http://tmdb/3/authentication"), (None, None))
+
+    def test_entries_are_shared_between_processes_and_expire(self):
+        self.cache.put("search", "k", {"Content-Type": "application/json"}, b"[1]")
+        # Another worker opens the same file
+        other = DiskCache(self.path, 1024, TTLS)
+        self.assertEqual(other.get("search", "k"), ({"Content-Type": "application/json"}, b"[1]"))
+
+        other.ttls = {"search": -1}
+        other.put("search", "k", {}, b"[2]")
+        self.assertIsNone(self.cache.get("search", "k"))
+        lookups = {labels: n for labels, n in CACHE_REQUESTS.collect().items() if labels[0] == "tmdb_disk"}
+        self.assertEqual(lookups, {("tmdb_disk", "hit"): 1, ("tmdb_disk", "miss"): 1})
+
+    def test_eviction_keeps_the_newest_responses_within_max_bytes(self):
+        for i in range(5):
+            self.cache.put("discover", f"k{i}", {}, b"x" * 400)
+            time.sleep(0.002)
+        self.cache.evict()
+        kept = [i for i in range(5) if self.cache.get("discover", f"k{i}")]
+        self.assertEqual(kept, [3, 4])
+
+    def test_session_serves_hits_without_calling_tmdb(self):
+        inner = MagicMock()
+        inner.request.return_value = make_response()
+        session = DiskCachedSession(inner, self.cache)
+
+        first = session.get(DISCOVER_URL)
+        second = session.get("http://tmdb/3/discover/movie?language=en&with_genres=35&api_key=other")
+        self.assertEqual(inner.request.call_count, 1)
+        self.assertIs(first, inner.request.return_value)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), {"results": []})
+        self.assertEqual(second.headers["content-type"], "application/json")
+
+    def test_session_skips_errors_and_uncached_endpoints(self):
+        inner = MagicMock()
+        inner.request.return_value = make_response(status=500)
+        session = DiskCachedSession(inner, self.cache)
+        session.get("http://tmdb/3/movie/1", params={"api_key": "k"})
+        session.get("http://tmdb/3/movie/1", params={"api_key": "k"})
+        session.get("http://tmdb/3/movie/1/credits")  # TTL 0
+        session.get("http://tmdb/3/movie/1/credits")
+        self.assertEqual(inner.request.call_count, 4)
+
+
+class TestMemoryCache(unittest.TestCase):
+
+    def test_results_are_bounded_and_expire(self):
+        func = MagicMock(side_effect=lambda url: f"response of {url}")
+        cache = MemoryCache(func, maxsize=2, ttl=0.05)
+        for url in ("a", "b", "a", "c", "a"):
+            cache(url)
+        # "b" was the least recently used when "c" came in
+        self.assertEqual([c.args for c in func.call_args_list], [("a",), ("b",), ("c",)])
+        self.assertEqual(cache.cache_info(), (2, 3, 2, 2))
+        cache("b")
+        self.assertEqual(func.call_count, 4)
+
+        time.sleep(0.06)
+        cache("a")
+        self.assertEqual(func.call_count, 5)
+        cache.discard("a")
+        cache("a")
+        self.assertEqual(func.call_count, 6)
+
+    def test_zero_ttl_disables_the_memo(self):
+        func = MagicMock(return_value=1)
+        cache = MemoryCache(func, maxsize=10, ttl=0)
+        cache("a")
+        cache("a")
+        self.assertEqual((func.call_count, cache.cache_info().currsize), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import threading
+import time
+import unittest
+
+from hedging import HedgeBudget, HedgedSession, HedgingPolicy, LatencyTracker, endpoint_of
+from metrics import TMDB_HEDGES
+from tmdb_scheduler import BACKFILL, priority
+
+URL = "http://tmdb/3/discover/movie?with_genres=35"
+
+
+class FakeSession:
+    """
+    Answers with the name of the call; the calls listed in `slow` take 0.3 s.
+    """
+
+    def __init__(self, slow=(), fail=()):
+        self.slow = slow
+        self.fail = fail
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(0.3 if call in self.slow else 0.001)
+        if call in self.fail:
+            raise ConnectionError("reset")
+        return f"response {call}"
+
+
+def make_session(fake, **kwargs):
+    settings = dict(enabled=True, budget=1.0, min_delay=0.01, min_samples=5)
+    settings.update(kwargs)
+    policy = HedgingPolicy(**settings)
+    tracker = policy.tracker(endpoint_of(URL))
+    for _ in range(5):
+        tracker.add(0.001)
+    return HedgedSession(fake, policy)
+
+
+class TestHedging(unittest.TestCase):
+
+    def setUp(self):
+        TMDB_HEDGES.reset()
+
+    def test_tracker_percentile(self):
+        tracker = LatencyTracker(window=100, percentile=95, every=1)
+        for ms in range(1, 101):
+            tracker.add(ms / 1000)
+        self.assertAlmostEqual(tracker.value, 0.096)
+        self.assertEqual(endpoint_of("http://tmdb/3/movie/42/credits?api_key=k"), "/3/movie/{id}/credits")
+
+    def test_budget_caps_the_share_of_hedges(self):
+        budget = HedgeBudget(0.1)
+        allowed = 0
+        for _ in range(100):
+            budget.earn()
+            allowed += budget.spend()
+        self.assertIn(allowed, (9, 10))  # 0.1 is not exact in floating point
+
+    def test_slow_call_is_hedged_and_hedge_wins(self):
+        fake = FakeSession(slow={1})
+        start = time.perf_counter()
+        self.assertEqual(make_session(fake).get(URL), "response 2")
+        self.assertLess(time.perf_counter() - start, 0.2)
+        self.assertEqual(TMDB_HEDGES.collect(), {("sent",): 1, ("won",): 1})
+
+    def test_fast_call_is_not_hedged(self):
+        fake = FakeSession()
+        self.assertEqual(make_session(fake, min_delay=0.1).get(URL), "response 1")
+        time.sleep(0.01)
+        self.assertEqual(fake.calls, 1)
+
+    def test_no_hedge_without_budget_samples_or_interactive_priority(self):
+        self.assertEqual(make_session(FakeSession(slow={1}), budget=0.0).get(URL), "response 1")
+        self.assertEqual(TMDB_HEDGES.collect(), {("budget_exhausted",): 1})
+
+        fake = FakeSession(slow={1})
+        self.assertEqual(make_session(fake, min_samples=50).get(URL), "response 1")
+        with priority(BACKFILL):
+            make_session(fake).get(URL)
+        self.assertEqual(fake.calls, 2)
+
+    def test_failed_hedge_falls_back_to_primary(self):
+        fake = FakeSession(slow={1}, fail={2})
+        self.assertEqual(make_session(fake).get(URL), "response 1")
+
+
+if __name__ == '__main__':
+    unittest.main()
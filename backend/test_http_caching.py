@@ -0,0 +1,155 @@
+import gzip
+import unittest
+from unittest.mock import MagicMock, patch
+
+from flask import Flask, jsonify
+
+import API_handler
+import http_caching
+from app import create_app
+from movie import Movie
+
+BIG = {"movies": [{"id": i, "overview": "a quiet story about the sea " * 4} for i in range(50)]}
+
+
+def make_app():
+    app = Flask(__name__)
+    http_caching.init_app(app)
+
+    @app.route("/big")
+    def big():
+        return http_caching.cacheable(jsonify(BIG))
+
+    @app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    @app.route("/versioned")
+    def versioned():
+        etag = http_caching.make_etag("versioned", http_caching.versions.stamp("test"))
+        return http_caching.not_modified(etag) or http_caching.cacheable(jsonify(BIG), etag)
+
+    return app
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.client = make_app().test_client()
+
+    def test_gzip_when_accepted_and_large_enough(self):
+        response = self.client.get("/big", headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual(int(response.headers["Content-Length"]), len(response.data))
+        self.assertEqual(gzip.decompress(response.data), self.client.get("/big").data)
+
+    def test_no_compression_without_accept_encoding_or_below_threshold(self):
+        self.assertNotIn("Content-Encoding", self.client.get("/big").headers)
+        self.assertNotIn("Content-Encoding", self.client.get("/big", headers={"Accept-Encoding": "gzip;q=0"}).headers)
+        self.assertNotIn("Content-Encoding", self.client.get("/small", headers={"Accept-Encoding": "gzip"}).headers)
+
+    @unittest.skipIf(http_caching.brotli is None, "brotli not installed")
+    def test_brotli_preferred(self):
+        response = self.client.get("/big", headers={"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+
+
+class TestConditionalRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = make_app().test_client()
+
+    def test_body_etag_answers_304_for_plain_and_compressed_tags(self):
+        plain = self.client.get("/big")
+        compressed = self.client.get("/big", headers={"Accept-Encoding": "gzip"})
+        self.assertNotEqual(plain.headers["ETag"], compressed.headers["ETag"])
+        self.assertEqual(plain.headers["Cache-Control"], "no-cache")
+
+        for etag in (plain.headers["ETag"], compressed.headers["ETag"]):
+            response = self.client.get("/big", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+            self.assertEqual(response.headers["ETag"], etag)
+
+        self.assertEqual(self.client.get("/big", headers={"If-None-Match": '"other"'}).status_code, 200)
+
+    def test_version_stamp_changes_etag(self):
+        etag = self.client.get("/versioned").headers["ETag"]
+        self.assertEqual(self.client.get("/versioned", headers={"If-None-Match": etag}).status_code, 304)
+        http_caching.versions.bump("test")
+        response = self.client.get("/versioned", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+
+class TestMovieHistoryETag(unittest.TestCase):
+
+    def setUp(self):
+        app = create_app({'TESTING': True, 'JWT_SECRET_KEY': 'test'})
+        self.db_handler = app.extensions['cinemood']['db_handler']
+        self.db_handler.get_watched_count = MagicMock(return_value=2)
+        self.db_handler.get_watched_movies = MagicMock(return_value=[{"id": 1, "title": "A", "release_year": 2000}])
+        self.client = app.test_client()
+
+    def test_unchanged_history_is_not_queried_again(self):
+        first = self.client.get("/movie_history?user_id=7")
+        self.assertEqual(first.headers["Cache-Control"], "private, no-cache")
+
+        second = self.client.get("/movie_history?user_id=7", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(self.db_handler.get_watched_movies.call_count, 1)
+
+        self.db_handler.get_watched_count.return_value = 3
+        third = self.client.get("/movie_history?user_id=7", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(third.status_code, 200)
+
+
+class TestRecommendationsETag(unittest.TestCase):
+
+    URL = "http://tmdb/3/discover/movie?api_key=k&with_genres=35&language=en"
+
+    def setUp(self):
+        self.client = create_app({'TESTING': True}).test_client()
+        self.session = MagicMock()
+        API_handler._request_cache.discard("GET", self.URL, None)
+
+    def recommend(self, user_id, mood, limit):
+        # Stands in for the discover requests tmdbv3api sends through the in-process cache
+        API_handler._request_cache("GET", self.URL, None)
+        return [Movie(id=1, title="Up", release_year="2009")]
+
+    def get(self, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.client.get("/recommendations?mood=happy", headers=headers)
+
+    def test_refreshed_tmdb_data_changes_the_etag(self):
+        with patch.object(API_handler, "get_tmdb_session", return_value=self.session), \
+                patch("recomendation_engine.recommend_movies", side_effect=self.recommend):
+            self.get()
+            etag = self.get().headers["ETag"]
+            self.assertEqual(self.get(etag).status_code, 304)
+            self.assertEqual(self.session.request.call_count, 1)
+
+            # The in-process copy expires and another client's request fetches it again
+            API_handler._request_cache.discard("GET", self.URL, None)
+            self.get()
+            self.assertEqual(self.session.request.call_count, 2)
+            response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_etag_changes_once_the_cache_ttl_has_passed(self):
+        with patch.object(API_handler, "get_tmdb_session", return_value=self.session), \
+                patch("recomendation_engine.recommend_movies", side_effect=self.recommend), \
+                patch.object(API_handler, "request_cache_period", return_value=1):
+            self.get()
+            etag = self.get().headers["ETag"]
+            self.assertEqual(self.get(etag).status_code, 304)
+        with patch("recomendation_engine.recommend_movies", side_effect=self.recommend), \
+                patch.object(API_handler, "request_cache_period", return_value=2):
+            # Recomputed, so expired responses are fetched again
+            self.assertEqual(self.get(etag).status_code, 200)
+
+if __name__ == "__main__":
+    unittest.main()
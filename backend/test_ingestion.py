@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import patch
+
+import API_handler
+from database_handler import DatabaseHandler
+from ingestion import Interner, parse_movie
+from test_catalog_sync import SQLiteConnection, details
+
+
+def rows_written(connection, table):
+    return [rows for query, rows in connection.statements if f"INTO {table} " in query]
+
+
+class TestInterning(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = SQLiteConnection()
+        self.db_handler = DatabaseHandler()
+        self.db_handler.connection = self.connection
+
+    def test_shared_rows_are_written_once_per_run(self):
+        interner = Interner()
+        for movie_id in (10, 11, 12):
+            self.assertEqual(self.db_handler.upsert_movies([parse_movie(details(movie_id))], interner=interner), 1)
+        # Actor 900 plays in every movie; Comedy was already stored and Drama is new
+        self.assertEqual(rows_written(self.connection, "actor"), [[(510, "Lead"), (900, "Everyone")],
+                                                                  [(511, "Lead")], [(512, "Lead")]])
+        self.assertEqual(rows_written(self.connection, "genre"), [[(18, "Drama")]])
+        self.assertEqual(len(rows_written(self.connection, "director")), 3)
+        self.assertEqual(self.connection.rows("SELECT COUNT(*) FROM `cast`"), [(6,)])
+        self.assertEqual(self.connection.rows("SELECT genre_id FROM movie_genre WHERE movie_id = 12"), [(18,), (35,)])
+
+        # A renamed actor is written again
+        renamed = details(13)
+        renamed["credits"]["cast"][1]["name"] = "Everyone Else"
+        self.db_handler.upsert_movies([parse_movie(renamed)], interner=interner)
+        self.assertEqual(rows_written(self.connection, "actor")[-1], [(513, "Lead"), (900, "Everyone Else")])
+        self.assertEqual(self.connection.rows("SELECT a_name FROM actor WHERE id = 900"), [("Everyone Else",)])
+
+    def test_genre_stored_under_another_id_keeps_it(self):
+        self.connection.db.execute("INSERT INTO genre VALUES (1, 'Drama')")
+        self.db_handler.upsert_movies([parse_movie(details(10))])
+        self.assertEqual(self.connection.rows("SELECT genre_id FROM movie_genre WHERE movie_id = 10"), [(1,), (35,)])
+        self.assertEqual(rows_written(self.connection, "genre"), [])
+
+    def test_rolled_back_rows_are_not_remembered(self):
+        interner = Interner()
+        self.connection.fail_on = "INTO movie "
+        self.assertIsNone(self.db_handler.upsert_movies([parse_movie(details(10))], interner=interner))
+        self.assertEqual((interner.directors, interner.actors), ({}, {}))
+        self.connection.fail_on = None
+        self.db_handler.upsert_movies([parse_movie(details(10))], interner=interner)
+        self.assertEqual(self.connection.rows("SELECT d_name FROM director"), [("Director 10",)])
+
+    def test_genre_ingestion_stores_complete_movies(self):
+        with patch("database_handler.DatabaseHandler.connection", self.connection), \
+                patch.dict(API_handler.api_config, {"api_key": "key"}), \
+                patch.object(API_handler, "fetch_discover_page", return_value=([10, 11], 1)) as discover, \
+                patch.object(API_handler, "fetch_details_json", side_effect=details):
+            handler = API_handler.TMDbAPIHandler()
+            handler.get_movies_by_genre("Comedy", page=2)
+            movie = handler.get_movie_details(11)
+        discover.assert_called_once_with(35, 2)
+        self.assertEqual(self.connection.rows("SELECT id, director_id FROM movie WHERE id >= 10"), [(10, 710), (11, 711)])
+        self.assertEqual(self.connection.rows("SELECT COUNT(*) FROM `cast` WHERE movie_id IN (10, 11)"), [(4,)])
+        self.assertEqual((movie.release_year, movie.director_id, movie.country_id), ("2001", 711, "US"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+from json_provider import FastJSONProvider, parse_fields, project
+
+MOVIES = [
+    {"id": 1, "title": "Żółw — 1", "release_year": "2001", "overview": "x" * 500,
+     "genre_ids": [35, 12], "poster_path": "/a.jpg"},
+    {"id": 2, "title": "B", "release_year": "1999", "overview": None, "genre_ids": [], "poster_path": None},
+]
+
+
+def make_app(backend):
+    app = Flask(__name__)
+    app.config['JSON_BACKEND'] = backend
+    json_provider.init_app(app)
+    return app
+
+
+def installed_backends():
+    return [b for b in json_provider.BACKENDS if b == "stdlib" or json_provider._load_backend(b)]
+
+
+class TestFastJSONProvider(unittest.TestCase):
+
+    def test_matches_default_provider(self):
+        reference = DefaultJSONProvider(Flask(__name__))
+        reference.sort_keys = False
+        payload = {"movies": MOVIES, "when": date(2024, 1, 2), "at": datetime(2024, 1, 2, 3, 4, 5),
+                   "price": Decimal("1.50"), 7: "int key"}
+        expected = json.loads(reference.dumps(payload))
+        for backend in installed_backends():
+            if backend == "msgspec":
+                continue  # writes dates as ISO 8601
+            with self.subTest(backend=backend):
+                app = make_app(backend)
+                with app.app_context():
+                    body = jsonify(payload).get_data()
+                self.assertEqual(json.loads(body), expected)
+                self.assertEqual(app.json.loads(body), expected)
+
+    def test_request_bodies_are_decoded(self):
+        for backend in installed_backends():
+            with self.subTest(backend=backend):
+                app = make_app(backend)
+
+                @app.route("/echo", methods=["POST"])
+                def echo():
+                    from flask import request
+                    return jsonify(request.get_json())
+
+                response = app.test_client().post("/echo", json={"mood": "happy", "n": [1, 2]})
+                self.assertEqual(response.get_json(), {"mood": "happy", "n": [1, 2]})
+                self.assertEqual(response.mimetype, "application/json")
+
+    def test_auto_falls_back_to_stdlib(self):
+        original = json_provider._load_backend
+        json_provider._load_backend = lambda name: None
+        try:
+            self.assertEqual(json_provider.resolve_backend("auto"), "stdlib")
+            with self.assertRaises(ValueError):
+                json_provider.resolve_backend("orjson")
+        finally:
+            json_provider._load_backend = original
+        with self.assertRaises(ValueError):
+            json_provider.resolve_backend("yaml")
+
+    def test_unknown_types_raise(self):
+        app = make_app("auto")
+        with app.app_context(), self.assertRaises(TypeError):
+            app.json.dumps({"x": object()})
+
+
+class TestProjection(unittest.TestCase):
+
+    def test_parse_fields(self):
+        self.assertIsNone(parse_fields(None))
+        self.assertIsNone(parse_fields(" , "))
+        self.assertEqual(parse_fields("id, title,id,,poster_path"), ("id", "title", "poster_path"))
+
+    def test_project(self):
+        fields = ("id", "title", "missing")
+        self.assertEqual(project(MOVIES, fields), [{"id": 1, "title": "Żółw — 1"}, {"id": 2, "title": "B"}])
+        self.assertEqual(project(MOVIES[0], ("poster_path",)), {"poster_path": "/a.jpg"})
+        self.assertIs(project(MOVIES, None), MOVIES)
+        # Nothing to drop: the list is returned as is
+        self.assertIs(project(MOVIES, tuple(MOVIES[0]) + ("extra",)), MOVIES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import gc
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import auth
+import database_handler
+import lifecycle
+import mood_snapshot
+import mood_to_genres
+import warmer
+from app import create_app
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "needs os.fork")
+class TestAfterFork(unittest.TestCase):
+
+    def run_in_child(self, check):
+        """
+        Forks, runs check() in the child and returns its exit status (0 when it passed).
+        """
+        pid = os.fork()
+        if pid == 0:
+            try:
+                ok = check()
+            except BaseException:
+                ok = False
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        return os.waitstatus_to_exitcode(status)
+
+    def test_connections_are_not_shared_with_children(self):
+        db_handler = database_handler.DatabaseHandler()
+        inherited = MagicMock()
+        db_handler.connection = inherited
+        auth_handler = auth.AuthHandler({})
+        auth_handler._conn = MagicMock()
+
+        def check():
+            return (db_handler._connection is None and not db_handler._connect_attempted
+                    and auth_handler._conn is None
+                    and inherited in database_handler._inherited_connections)
+
+        self.assertEqual(self.run_in_child(check), 0)
+        # The parent keeps its connection and nothing was closed from the child
+        self.assertIs(db_handler._connection, inherited)
+        inherited.close.assert_not_called()
+
+
+class TestPreload(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'JWT_SECRET_KEY': 'test', 'LAZY_STARTUP': True})
+        self.handlers = self.app.extensions['cinemood']
+
+    def tearDown(self):
+        gc.unfreeze()
+
+    def test_preload_builds_shared_state_and_closes_connections(self):
+        connection = MagicMock()
+        self.handlers['db_handler'].connection = connection
+        mood_to_genres._excluded_genre_ids.clear()
+
+        lifecycle.preload(self.app)
+
+        connection.close.assert_called_once()
+        self.assertIsNone(self.handlers['db_handler']._connection)
+        self.assertEqual(set(mood_to_genres._excluded_genre_ids), set(mood_to_genres.mood_isnot_genre_mapping))
+
+    @staticmethod
+    def stop_background():
+        for module, name in ((mood_snapshot, "_builder"), (warmer, "_warmer")):
+            thread = getattr(module, name)
+            if thread is not None:
+                thread.stop()
+                setattr(module, name, None)
+
+    def test_background_threads_start_in_workers_only(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        config = {'TESTING': True, 'JWT_SECRET_KEY': 'test', 'LAZY_STARTUP': True,
+                  'MOOD_SNAPSHOT': {'path': os.path.join(directory, "moods.bin"), 'refresh_interval': 3600},
+                  'CACHE_WARMER': {'enabled': True}}
+        background = ("mood-snapshot-builder", "cache-warmer")
+        with patch.dict(warmer.tmdb_disk_cache_config, {'path': os.path.join(directory, "tmdb.db")}), \
+                patch.object(mood_snapshot.SnapshotBuilder, "build_if_due"):
+            self.addCleanup(self.stop_background)
+            with lifecycle.preloading():
+                app = create_app(config)
+            lifecycle.preload(app)
+            self.assertEqual([t.name for t in threading.enumerate() if t.name in background], [])
+
+            lifecycle.init_worker(app)
+            self.assertEqual(sorted(t.name for t in threading.enumerate() if t.name in background),
+                             sorted(background))
+
+    def test_init_worker_connects_only_when_not_lazy(self):
+        with patch.object(lifecycle, "warm_up") as warm_up:
+            lifecycle.init_worker(self.app)
+            warm_up.assert_not_called()
+
+            self.app.config['LAZY_STARTUP'] = False
+            lifecycle.init_worker(self.app)
+            warm_up.assert_called_once_with(self.handlers['db_handler'], self.handlers['auth_handler'])
+
+
+if __name__ == "__main__":
+    unittest.main()
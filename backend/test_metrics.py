@@ -0,0 +1,86 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+import metrics
+from app import create_app
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter_aggregates_across_threads(self):
+        counter = metrics.Counter("test_total", "Test counter.", ("endpoint",))
+
+        def work():
+            for _ in range(1000):
+                counter.inc(("discover",))
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        counter.inc(("search",), 2)
+
+        self.assertEqual(counter.collect(), {("discover",): 8000, ("search",): 2})
+        # Shards of finished threads are folded away but their counts are kept
+        self.assertEqual(len(counter._shards), 1)
+        self.assertEqual(counter.collect()[("discover",)], 8000)
+
+    def test_histogram_buckets_and_render(self):
+        histogram = metrics.Histogram("test_seconds", "Test histogram.", ("route",), buckets=(0.1, 1.0))
+        histogram.observe(("/search",), 0.05)
+        histogram.observe(("/search",), 0.1)
+        histogram.observe(("/search",), 3.0)
+
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{route="/search",le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="/search",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="/search",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{route="/search"} 3', lines)
+
+    def test_gauge_functions(self):
+        gauge = metrics.Gauge("test_in_use", "Test gauge.", ("component",))
+        gauge.inc(("db",))
+        gauge.inc(("db",))
+        gauge.dec(("db",))
+        gauge.set_function(("pool",), lambda: 4)
+        self.assertEqual(gauge.collect(), {("db",): 1, ("pool",): 4})
+
+    def test_init_app_times_routes(self):
+        # Other test modules call the app's own /movie/<id> route
+        metrics.HTTP_REQUEST_SECONDS.reset()
+        app = Flask(__name__)
+        metrics.init_app(app)
+
+        @app.route("/movie/<int:movie_id>")
+        def movie(movie_id):
+            return "ok"
+
+        app.test_client().get("/movie/3")
+        app.test_client().get("/movie/4")
+
+        text = metrics.render()
+        self.assertIn('cinemood_http_request_duration_seconds_count{method="GET",'
+                      'route="/movie/<int:movie_id>",status="200"} 2', text)
+        self.assertIn("# TYPE cinemood_tmdb_requests_total counter", text)
+
+    def test_conditional_get_is_counted_as_304(self):
+        metrics.HTTP_REQUEST_SECONDS.reset()
+        client = create_app({'TESTING': True}).test_client()
+        with patch("API_handler.fetch_movie_details", return_value={"id": 3, "title": "Up"}):
+            first = client.get("/movie/3")
+            # The body ETag is matched by http_caching after the view returned a 200
+            second = client.get("/movie/3", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(second.status_code, 304)
+
+        text = metrics.render()
+        route = 'method="GET",route="/movie/<int:movie_id>"'
+        self.assertIn(f'cinemood_http_request_duration_seconds_count{{{route},status="200"}} 1', text)
+        self.assertIn(f'cinemood_http_request_duration_seconds_count{{{route},status="304"}} 1', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from collections import Counter
+from unittest.mock import patch
+
+import recomendation_engine
+from app import create_app
+from mood_to_genres import get_blended_genre_weights, get_genre_mapping, parse_mood_weights
+from movie import Movie
+
+GENRES = get_genre_mapping()
+
+
+def genre_pool(genre_id):
+    """
+    Ten movies of the genre only, with ids unique to it.
+    """
+    return [Movie(id=genre_id * 100 + i, title=f"{genre_id}-{i}", genre_ids=[genre_id]) for i in range(10)]
+
+
+class TestMoodBlend(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = Counter()
+
+        def fetch(genre_id):
+            self.calls[genre_id] += 1
+            return genre_pool(genre_id)
+
+        self.fetch = patch.object(recomendation_engine, "fetch_genre_movies", side_effect=fetch)
+        self.fetch.start()
+
+    def tearDown(self):
+        self.fetch.stop()
+
+    def test_parse_mood_weights(self):
+        self.assertEqual(parse_mood_weights("Happy:3, nostalgic:1"), {"happy": 0.75, "nostalgic": 0.25})
+        self.assertEqual(parse_mood_weights({"sad": 2, "bored": 5}), {"sad": 1.0})  # unknown moods are dropped
+        self.assertEqual(parse_mood_weights("happy,sad"), {"happy": 0.5, "sad": 0.5})
+        for value in ("happy:abc", {"happy": -1}, {"happy": True}, "bored:1", {"happy": 0}, ["happy"]):
+            with self.assertRaises(ValueError):
+                parse_mood_weights(value)
+
+    def test_blend_weights_split_over_genres(self):
+        weights = get_blended_genre_weights({"happy": 0.5, "relaxed": 0.5})
+        self.assertAlmostEqual(sum(weights.values()), 1.0)
+        self.assertAlmostEqual(weights[("happy", GENRES["comedy"])], 0.1)
+        # Relaxed excludes family, and music through the ID it shares with musical
+        self.assertAlmostEqual(weights[("relaxed", GENRES["documentary"])], 0.25)
+        self.assertNotIn(("relaxed", GENRES["family"]), weights)
+        self.assertNotIn(("relaxed", GENRES["music"]), weights)
+
+    def test_each_genre_fetched_once(self):
+        movies = recomendation_engine.recommend_blend(1, {"happy": 0.5, "relaxed": 0.3, "chill": 0.2}, 20)
+        # happy and chill share animation and family
+        needed = {genre_id for _, genre_id in get_blended_genre_weights({"happy": 1, "relaxed": 1, "chill": 1})}
+        self.assertEqual(len(needed), 8)
+        self.assertEqual(set(self.calls), needed)
+        self.assertTrue(all(count == 1 for count in self.calls.values()))
+        self.assertEqual(len(movies), 20)
+        self.assertEqual(len({m.id for m in movies}), 20)
+
+    def test_slots_follow_the_weights(self):
+        movies = recomendation_engine.recommend_blend(1, {"happy": 0.7, "sad": 0.3}, 20)
+        happy_ids = {GENRES[g] for g in recomendation_engine.get_genres_for_mood("happy")}
+        happy = sum(1 for m in movies if m.genre_ids[0] in happy_ids)
+        self.assertEqual((happy, len(movies) - happy), (14, 6))
+        # The heaviest part comes first and the others are interleaved
+        self.assertIn(movies[0].genre_ids[0], happy_ids)
+        self.assertTrue(any(m.genre_ids[0] not in happy_ids for m in movies[:8]))
+
+    def test_short_parts_leave_their_slots_to_the_others(self):
+        movies = recomendation_engine.recommend_blend(1, {"nostalgic": 0.9, "excited": 0.1}, 30)
+        self.assertEqual(len(movies), 30)
+        # Musical shares its ID with music, which nostalgic excludes: only history is left
+        self.assertEqual(sum(1 for m in movies if m.genre_ids[0] == GENRES["history"]), 10)
+        self.assertNotIn(GENRES["musical"], self.calls)
+
+    def test_route_accepts_weighted_moods(self):
+        client = create_app({'TESTING': True}).test_client()
+        response = client.post("/recommendations?fields=id", json={"mood": {"happy": 0.7, "sad": 0.3}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()), 90)  # every movie of the nine genres
+        same = client.get("/recommendations?mood=sad:3,happy:7&fields=id")
+        self.assertEqual(same.get_json(), response.get_json())
+        self.assertEqual(client.get("/recommendations?mood=happy:x").status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
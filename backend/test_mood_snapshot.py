@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import mood_snapshot
+import recomendation_engine
+from app import create_app
+from mood_snapshot import MoodSnapshot, SnapshotBuilder, SnapshotReader, publish
+from mood_to_genres import mood_to_genre_mapping
+from movie import Movie
+
+
+def ranked(prefix="", count=30):
+    return {mood: [Movie(id=i, title=f"{prefix}{mood} {i}", release_year="2001", overview="Ünïcode",
+                         genre_ids=[35, i], poster_path=f"/{i}.jpg") for i in range(count)]
+            for mood in mood_to_genre_mapping}
+
+
+class TestMoodSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "moods.bin")
+
+    def tearDown(self):
+        mood_snapshot._reader = None
+        self.directory.cleanup()
+
+    def test_round_trip_and_slicing(self):
+        self.assertEqual(publish(self.path, ranked()), 1)
+        snapshot = MoodSnapshot(self.path)
+        self.assertEqual(snapshot.version, 1)
+        self.assertEqual(sorted(snapshot.moods()), sorted(mood_to_genre_mapping))
+        self.assertEqual(snapshot.count("happy"), 30)
+        self.assertEqual(snapshot.movies("happy", 3), ranked()["happy"][:3])
+        self.assertEqual(snapshot.movies("sad"), ranked()["sad"])
+        self.assertEqual(snapshot.movies("sad", 100), ranked()["sad"])
+        self.assertNotIn("bored", snapshot)
+
+    def test_reader_swaps_to_a_new_snapshot(self):
+        publish(self.path, ranked("old "))
+        reader = SnapshotReader(self.path, check_interval=0)
+        old = reader.current()
+        self.assertEqual(publish(self.path, ranked("new ")), 2)
+        new = reader.current()
+        self.assertEqual(new.version, 2)
+        self.assertEqual(new.movies("happy", 1)[0].title, "new happy 0")
+        # Requests that still hold the old mapping keep reading it
+        self.assertEqual(old.movies("happy", 1)[0].title, "old happy 0")
+
+        with open(f"{self.path}.tmp", "wb") as f:
+            f.write(b"garbage")
+        os.replace(f"{self.path}.tmp", self.path)
+        self.assertIs(reader.current(), new)  # an unreadable file leaves the last snapshot in place
+
+    def test_builder_builds_when_due_and_one_at_a_time(self):
+        builder = SnapshotBuilder(self.path, size=5, interval=3600)
+        with patch.object(recomendation_engine, "rank_movies", side_effect=lambda mood, size: ranked()[mood][:size]) \
+                as rank:
+            self.assertTrue(builder.build_if_due())
+            self.assertEqual(rank.call_count, len(mood_to_genre_mapping))
+            self.assertFalse(builder.build_if_due())  # fresh
+
+            builder.interval = 0
+            if mood_snapshot.fcntl is not None:
+                with open(f"{self.path}.lock", "a") as lock:
+                    mood_snapshot.fcntl.flock(lock, mood_snapshot.fcntl.LOCK_EX)
+                    # Opened separately, so the lock conflicts as it would between processes
+                    self.assertFalse(builder.build_if_due())
+            self.assertTrue(builder.build_if_due())
+        self.assertEqual(MoodSnapshot(self.path).version, 2)
+
+    def test_route_serves_the_snapshot_with_its_version(self):
+        publish(self.path, ranked())
+        app = create_app({'TESTING': True, 'MOOD_SNAPSHOT': {'path': self.path, 'refresh_interval': 0,
+                                                                'check_interval': 0}})
+        client = app.test_client()
+        with patch.object(recomendation_engine, "fetch_movies_by_genre", side_effect=AssertionError("TMDb called")):
+            response = client.get("/recommendations?mood=happy&fields=id,title")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["X-CineMood-Snapshot"], "1")
+            self.assertEqual(len(response.get_json()), 30)
+            self.assertEqual(response.get_json()[0], {"id": 0, "title": "happy 0"})
+
+            etag = response.headers["ETag"]
+            self.assertEqual(client.get("/recommendations?mood=happy&fields=id,title",
+                                        headers={"If-None-Match": etag}).status_code, 304)
+            publish(self.path, ranked())
+            response = client.get("/recommendations?mood=happy&fields=id,title", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["X-CineMood-Snapshot"], "2")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from mood_to_genres import filter_movies_by_mood
+from movie import CARD_FIELDS, SEARCH_FIELDS, Movie, to_dicts
+
+DISCOVER_RESULT = {
+    "id": 7, "title": "Up", "release_date": "2009-05-29", "overview": "Balloons.",
+    "genre_ids": [16, 35], "poster_path": "/up.jpg", "vote_average": 7.9,
+}
+
+
+class TestMovie(unittest.TestCase):
+
+    def test_from_discover(self):
+        movie = Movie.from_discover(DISCOVER_RESULT)
+        self.assertEqual(movie.release_year, "2009")
+        self.assertEqual(movie.to_dict(), {
+            "id": 7, "title": "Up", "release_year": "2009", "overview": "Balloons.",
+            "genre_ids": [16, 35], "poster_path": "/up.jpg",
+        })
+
+    def test_is_slotted(self):
+        movie = Movie(id=1, title="A")
+        self.assertFalse(hasattr(movie, "__dict__"))
+        with self.assertRaises(AttributeError):
+            movie.rating = 5
+
+    def test_dict_style_access(self):
+        movie = Movie(id=1, title="A", director_id=3)
+        self.assertEqual(movie["director_id"], 3)
+        with self.assertRaises(KeyError):
+            movie["rating"]
+
+    def test_to_dicts_keeps_requested_fields_of_the_shape(self):
+        movies = [Movie.from_discover(DISCOVER_RESULT)]
+        self.assertEqual(to_dicts(movies, CARD_FIELDS, ("title", "popularity", "id")), [{"title": "Up", "id": 7}])
+        self.assertEqual(list(to_dicts(movies, SEARCH_FIELDS)[0]), list(SEARCH_FIELDS))
+
+    def test_filter_movies_by_mood(self):
+        comedy = Movie(id=1, title="A", genre_ids=[35])
+        drama = Movie(id=2, title="B", genre_ids=[18])
+        self.assertEqual(filter_movies_by_mood([comedy, drama], "happy"), [comedy])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import sqlite3
+import unittest
+from unittest.mock import patch
+
+from app import create_app
+from database_handler import DatabaseHandler
+
+SCHEMA = """
+CREATE TABLE movie (id INTEGER PRIMARY KEY, title TEXT, release_year INTEGER, director_id INTEGER, country_id TEXT);
+CREATE TABLE movie_genre (movie_id INTEGER, genre_id INTEGER);
+CREATE TABLE watched (user_id INTEGER, movie_id INTEGER);
+CREATE TABLE rating (id INTEGER PRIMARY KEY, user_id INTEGER, movie_id INTEGER, rating INTEGER, review TEXT);
+CREATE TABLE recommendations (user_id INTEGER, movie_id INTEGER);
+INSERT INTO movie VALUES (14160, 'Up', 2009, 1, 'US'), (13, 'Forrest Gump', 1994, NULL, NULL), (20, 'Solaris', 1972, NULL, 'RU');
+INSERT INTO movie_genre VALUES (14160, 16), (14160, 35), (13, 35), (13, 18);
+INSERT INTO watched VALUES (1, 13), (2, 14160);
+INSERT INTO rating (user_id, movie_id, rating) VALUES (1, 13, 5);
+INSERT INTO recommendations VALUES (1, 14160), (1, 13);
+"""
+
+
+class SQLiteConnection:
+    # Just enough of a mysql.connector connection for the batch queries; counts statements
+    def __init__(self):
+        self.db = sqlite3.connect(":memory:")
+        self.db.executescript(SCHEMA)
+        self.statements = 0
+
+    def is_connected(self):
+        return True
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self, dictionary)
+
+
+class SQLiteCursor:
+    def __init__(self, connection, dictionary):
+        self._connection = connection
+        self._cursor = connection.db.cursor()
+        if dictionary:
+            self._cursor.row_factory = sqlite3.Row
+        self._dictionary = dictionary
+
+    def execute(self, query, params=()):
+        self._connection.statements += 1
+        self._cursor.execute(query.replace("%s", "?"), params)
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        return [dict(row) for row in rows] if self._dictionary else rows
+
+    def close(self):
+        self._cursor.close()
+
+
+class TestMovieBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = SQLiteConnection()
+        self.db_handler = DatabaseHandler()
+        self.db_handler.connection = self.connection
+
+    def test_movies_by_ids_in_one_query(self):
+        movies = self.db_handler.get_movies_by_ids([13, 20, 999])
+        self.assertEqual(sorted(movies), [13, 20])
+        self.assertEqual(sorted(movies[13]["genre_ids"]), [18, 35])
+        self.assertEqual(movies[20]["genre_ids"], [])
+        self.assertEqual(self.connection.statements, 1)
+
+    def test_statuses_in_one_query_per_table(self):
+        statuses = self.db_handler.get_movie_statuses(1, [13, 14160, 20])
+        self.assertEqual(statuses[13], {"watched": True, "rating": 5, "recommended": True})
+        self.assertEqual(statuses[14160], {"watched": False, "rating": None, "recommended": True})
+        self.assertEqual(statuses[20], {"watched": False, "rating": None, "recommended": False})
+        self.assertEqual(self.connection.statements, 3)
+
+    def test_route(self):
+        client = create_app({'TESTING': True}).test_client()
+        with patch("database_handler.DatabaseHandler.connection", self.connection):
+            response = client.post("/movies/batch?fields=id,title,watched",
+                                   json={"ids": [14160, 999, 13, 14160], "user_id": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {
+            "movies": [{"id": 14160, "title": "Up", "watched": True},
+                       {"id": 13, "title": "Forrest Gump", "watched": False}],
+            "missing": [999],
+        })
+        self.assertEqual(self.connection.statements, 4)
+
+    def test_route_validates_ids(self):
+        client = create_app({'TESTING': True}).test_client()
+        self.assertEqual(client.post("/movies/batch", json={"ids": []}).status_code, 400)
+        self.assertEqual(client.post("/movies/batch", json={"ids": ["13"]}).status_code, 400)
+        self.assertEqual(client.post("/movies/batch", json={"ids": list(range(201))}).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import API_handler
+from app import create_app
+from circuit_breaker import CircuitOpenError
+
+TMDB_DETAILS = {
+    "id": 603, "title": "The Matrix", "release_date": "1999-03-30", "overview": "Neo wakes up.",
+    "poster_path": "/matrix.jpg", "runtime": 136, "genres": [{"id": 28, "name": "Action"}],
+    "production_countries": [{"iso_3166_1": "US", "name": "United States of America"}],
+    "credits": {
+        "cast": [{"id": i, "name": f"Actor {i}", "character": f"Role {i}"} for i in range(12)],
+        "crew": [{"id": 100, "name": "Lana Wachowski", "job": "Director"},
+                 {"id": 101, "name": "Joel Silver", "job": "Producer"}],
+    },
+}
+LOCAL_MOVIE = {
+    "id": 603, "title": "The Matrix", "release_year": 1999, "director_id": 100, "director_name": "Lana Wachowski",
+    "country_id": "US", "country": "United States", "genres": ["Action"], "cast": [{"id": 1, "name": "Keanu Reeves"}],
+}
+
+
+def tmdb_session(status=200, body=TMDB_DETAILS):
+    session = MagicMock()
+    session.get.return_value = MagicMock(status_code=status, json=MagicMock(return_value=body))
+    return session
+
+
+class TestMovieDetails(unittest.TestCase):
+
+    def setUp(self):
+        API_handler._cached_tmdb_details.cache_clear()
+        self.client = create_app({'TESTING': True}).test_client()
+        self.db = patch.multiple("database_handler.DatabaseHandler", get_movie_details=MagicMock(return_value=None),
+                                 get_movie_ratings=MagicMock(return_value=None))
+        self.db.start()
+
+    def tearDown(self):
+        self.db.stop()
+        API_handler._cached_tmdb_details.cache_clear()
+
+    def test_tmdb_details_and_credits_in_one_cached_request(self):
+        session = tmdb_session()
+        with patch.object(API_handler, "get_tmdb_session", return_value=session):
+            first = self.client.get("/movie/603")
+            second = self.client.get("/movie/603?fields=title,director")
+        self.assertEqual(first.status_code, 200)
+        body = first.get_json()
+        self.assertEqual(body["source"], "tmdb")
+        self.assertEqual(body["release_year"], "1999")
+        self.assertEqual(body["country"], "United States of America")
+        self.assertEqual(len(body["cast"]), API_handler.DETAILS_CAST_SIZE)
+        self.assertEqual(body["director"], {"id": 100, "name": "Lana Wachowski"})
+        self.assertEqual(len(body["crew"]), 2)
+        self.assertEqual(body["ratings"], [])
+        self.assertEqual(second.get_json(), {"title": "The Matrix", "director": {"id": 100, "name": "Lana Wachowski"}})
+
+        session.get.assert_called_once()
+        self.assertEqual(session.get.call_args.kwargs["params"]["append_to_response"], "credits")
+
+    def test_local_movie_gets_what_the_database_lacks_from_tmdb(self):
+        ratings = [{"user_id": 1, "rating": 5, "review": "Great", "username": "neo"}]
+        details = dict(TMDB_DETAILS, credits={"cast": [{"id": 1, "name": "Keanu Reeves", "character": "Neo"}],
+                                              "crew": TMDB_DETAILS["credits"]["crew"]})
+        session = tmdb_session(body=details)
+        with patch("database_handler.DatabaseHandler.get_movie_details", return_value=dict(LOCAL_MOVIE)), \
+                patch("database_handler.DatabaseHandler.get_movie_ratings", return_value=ratings), \
+                patch.object(API_handler, "get_tmdb_session", return_value=session):
+            body = self.client.get("/movie/603").get_json()
+            self.client.get("/movie/603")
+        self.assertEqual(body["source"], "local")
+        self.assertEqual(body["release_year"], "1999")
+        self.assertEqual(body["country"], "United States")
+        self.assertEqual((body["overview"], body["poster_path"], body["runtime"]), ("Neo wakes up.", "/matrix.jpg", 136))
+        self.assertEqual(body["cast"], [{"id": 1, "name": "Keanu Reeves", "character": "Neo"}])
+        self.assertEqual([member["job"] for member in body["crew"]], ["Director", "Producer"])
+        self.assertEqual(body["ratings"], ratings)
+        # TMDb's details are cached
+        session.get.assert_called_once()
+
+    def test_local_movie_is_served_while_tmdb_is_down(self):
+        session = MagicMock()
+        session.get.side_effect = CircuitOpenError("tmdb", 10)
+        with patch("database_handler.DatabaseHandler.get_movie_details", return_value=dict(LOCAL_MOVIE)), \
+                patch.object(API_handler, "get_tmdb_session", return_value=session):
+            response = self.client.get("/movie/603")
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["cast"], [{"id": 1, "name": "Keanu Reeves", "character": None}])
+        self.assertEqual(body["crew"], [{"id": 100, "name": "Lana Wachowski", "job": "Director"}])
+        self.assertIsNone(body["poster_path"])
+
+    def test_unknown_movie_and_outage(self):
+        with patch.object(API_handler, "get_tmdb_session", return_value=tmdb_session(status=404, body={})):
+            self.assertEqual(self.client.get("/movie/1").status_code, 404)
+
+        session = MagicMock()
+        session.get.side_effect = CircuitOpenError("tmdb", 10)
+        with patch.object(API_handler, "get_tmdb_session", return_value=session):
+            response = self.client.get("/movie/2")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "10")
+
+
+if __name__ == '__main__':
+    unittest.main()
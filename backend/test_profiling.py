@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+
+from flask import Flask
+
+import profiling
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_sampler_collects_target_thread(self):
+        sampler = profiling.StackSampler(0.001, threading.get_ident()).start()
+        busy_wait(0.1)
+        stacks = sampler.stop()
+
+        self.assertGreater(sampler.samples, 10)
+        self.assertTrue(any("busy_wait" in stack for stack in stacks))
+
+    def test_write_collapsed(self):
+        path = os.path.join(self.output_dir, "out.folded")
+        profiling.write_collapsed(Counter({"a;b": 3, "a;c": 1}), path)
+        with open(path) as f:
+            self.assertEqual(f.read().splitlines(), ["a;b 3", "a;c 1"])
+
+    def test_only_requests_with_header_are_profiled(self):
+        app = Flask(__name__)
+        profiling.init_app(app, {"enabled": True, "token": "secret", "output_dir": self.output_dir,
+                                 "background_interval": 0})
+
+        @app.route("/slow")
+        def slow():
+            busy_wait(0.05)
+            return "ok"
+
+        client = app.test_client()
+        self.assertNotIn(profiling.PROFILE_HEADER, client.get("/slow").headers)
+        self.assertNotIn(profiling.PROFILE_HEADER,
+                         client.get("/slow", headers={profiling.PROFILE_HEADER: "wrong"}).headers)
+
+        response = client.get("/slow", headers={profiling.PROFILE_HEADER: "secret"})
+        name = response.headers[profiling.PROFILE_HEADER]
+        self.assertEqual(os.listdir(self.output_dir), [name])
+        with open(os.path.join(self.output_dir, name)) as f:
+            self.assertIn("slow", f.read())
+
+    def test_disabled_registers_no_hooks(self):
+        app = Flask(__name__)
+        profiling.init_app(app, {"enabled": False, "background_interval": 0})
+        self.assertEqual(app.before_request_funcs, {})
+
+    def test_rolling_sampler_keeps_newest_files(self):
+        sampler = profiling.RollingSampler(self.output_dir, interval=0.001, window=3600, keep=2)
+        sampler.start()
+        for i in range(3):
+            busy_wait(0.02)
+            path = sampler.flush()
+            os.rename(path, os.path.join(self.output_dir, f"background-{i}-{os.getpid()}.folded"))
+            sampler._prune()
+        sampler.stop()
+        self.assertLessEqual(len(os.listdir(self.output_dir)), 3)
+        self.assertNotIn(f"background-0-{os.getpid()}.folded", os.listdir(self.output_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,214 @@
+import sqlite3
+import unittest
+
+from mysql.connector import Error
+
+from database_handler import DatabaseHandler
+from metrics import DB_READS
+from replicas import ConnectionPool, ReplicaSet, parse_replicas
+
+SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT);
+CREATE TABLE movie (id INTEGER PRIMARY KEY, title TEXT, release_year INTEGER);
+CREATE TABLE watched (user_id INTEGER, movie_id INTEGER);
+CREATE TABLE rating (user_id INTEGER, movie_id INTEGER, rating INTEGER, review TEXT);
+CREATE TABLE recommendations (user_id INTEGER, movie_id INTEGER);
+INSERT INTO users VALUES (1, 'ana'), (2, 'ben');
+INSERT INTO movie VALUES (10, 'Ten', 2010), (11, 'Eleven', 2011), (12, 'Twelve', 2012);
+"""
+
+
+class Server:
+    """
+    SQLite stand-in for a MySQL server. replicate_to() copies its rows to a replica,
+    like replication catching up.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.down = False
+        self.opened = 0
+
+    def connect(self):
+        if self.down:
+            raise Error(f"Can't connect to {self.name}")
+        self.opened += 1
+        return ServerConnection(self)
+
+    def replicate_to(self, replica):
+        self.db.backup(replica.db)
+
+
+class ServerConnection:
+    def __init__(self, server):
+        self.server = server
+        self.open = True
+
+    def is_connected(self):
+        return self.open and not self.server.down
+
+    def cursor(self, dictionary=False, **kwargs):
+        return ServerCursor(self.server.db.cursor(), dictionary)
+
+    def commit(self):
+        self.server.db.commit()
+
+    def close(self):
+        self.open = False
+
+
+class ServerCursor:
+    def __init__(self, cursor, dictionary):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def execute(self, query, params=()):
+        self._cursor.execute(query.replace("%s", "?"), params)
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+def titles(rows):
+    return [row["title"] for row in rows or []]
+
+
+class TestReadRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.primary = Server("primary")
+        self.servers = [Server("replica-1"), Server("replica-2")]
+        self.lags = {server.name: 0 for server in self.servers}
+        self.db_handler = DatabaseHandler()
+        self.db_handler.connection = self.primary.connect()
+        self.db_handler.replicas = ReplicaSet(
+            [(server.name, ConnectionPool(server.connect, 2, server.name)) for server in self.servers],
+            max_lag=5, check_interval=0,
+            lag=lambda connection: self.lags[connection.server.name])
+
+    def watch(self, server, user_id, movie_id):
+        server.db.execute("INSERT INTO watched VALUES (?, ?)", (user_id, movie_id))
+
+    def test_reads_go_to_the_replicas_in_turn(self):
+        self.watch(self.primary, 1, 10)
+        self.watch(self.servers[0], 1, 11)
+        self.watch(self.servers[1], 1, 12)
+        before = DB_READS.collect().get(("replica", "healthy"), 0)
+        seen = [titles(self.db_handler.get_watched_movies(1)) for _ in range(4)]
+        self.assertEqual(seen, [["Eleven"], ["Twelve"], ["Eleven"], ["Twelve"]])
+        self.assertEqual(DB_READS.collect()[("replica", "healthy")] - before, 4)
+        # Each replica reuses its one connection
+        self.assertEqual([server.opened for server in self.servers], [1, 1])
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        for server in self.servers:
+            self.primary.replicate_to(server)
+        self.assertIsNone(self.db_handler.get_watched_movies(1))
+        self.assertTrue(self.db_handler.add_watched_movie(1, 10))
+        # The replicas have not caught up, but the writer reads its write
+        self.assertEqual(titles(self.db_handler.get_watched_movies(1)), ["Ten"])
+        self.assertEqual(self.db_handler.get_watched_count(1), 1)
+        self.assertTrue(self.db_handler.add_rating(2, 11, 4))
+        self.assertEqual([r["rating"] for r in self.db_handler.get_movie_ratings(11)], [4])
+        # Once the window has passed, reads go back to the replicas
+        self.db_handler.read_your_writes = 0
+        self.assertIsNone(self.db_handler.get_watched_movies(1))
+
+    def test_lagging_replica_is_skipped_until_it_catches_up(self):
+        self.watch(self.primary, 1, 10)
+        self.watch(self.servers[0], 1, 11)
+        self.watch(self.servers[1], 1, 12)
+        self.lags["replica-1"] = 30
+        self.assertEqual([titles(self.db_handler.get_watched_movies(1)) for _ in range(3)], [["Twelve"]] * 3)
+        self.lags["replica-2"] = None  # replication stopped
+        self.assertEqual(titles(self.db_handler.get_watched_movies(1)), ["Ten"])
+        self.lags["replica-1"] = 1
+        self.assertEqual(titles(self.db_handler.get_watched_movies(1)), ["Eleven"])
+
+    def test_lag_is_trusted_for_the_check_interval(self):
+        replicas = self.db_handler.replicas
+        replicas.check_interval = 60
+        self.lags["replica-1"] = self.lags["replica-2"] = 30
+        self.db_handler.get_watched_count(1)
+        self.db_handler.get_watched_count(1)
+        # Both replicas were measured behind; they are not asked again within the interval
+        self.lags["replica-1"] = self.lags["replica-2"] = 0
+        self.assertEqual([replica.lag for replica in replicas.replicas], [30, 30])
+        with replicas.connection() as connection:
+            self.assertIsNone(connection)
+
+    def test_unreachable_replicas_fall_back_to_the_primary(self):
+        self.watch(self.primary, 1, 10)
+        for server in self.servers:
+            server.down = True
+        before = DB_READS.collect().get(("primary", "no_replica"), 0)
+        self.assertEqual(titles(self.db_handler.get_recommendation(1) or []), [])
+        self.assertEqual(titles(self.db_handler.get_watched_movies(1)), ["Ten"])
+        self.assertEqual(DB_READS.collect()[("primary", "no_replica")] - before, 2)
+        self.assertEqual([replica.lag for replica in self.db_handler.replicas.replicas], [None, None])
+
+    def test_no_replicas_reads_the_primary(self):
+        self.db_handler.replicas = None
+        self.watch(self.primary, 1, 10)
+        self.assertEqual(titles(self.db_handler.get_watched_movies(1)), ["Ten"])
+        self.assertEqual(self.db_handler.get_movie_by_title("Ten")["id"], 10)
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_pool_is_bounded_and_reuses_connections(self):
+        server = Server("replica")
+        pool = ConnectionPool(server.connect, 1, "test replica")
+        first = pool.acquire(timeout=0)
+        self.assertIsNone(pool.acquire(timeout=0.01))
+        pool.release(first)
+        self.assertIs(pool.acquire(timeout=0), first)
+        # A broken connection is closed and replaced
+        pool.release(first, broken=True)
+        self.assertFalse(first.open)
+        second = pool.acquire(timeout=0)
+        self.assertIsNot(second, first)
+        self.assertEqual(server.opened, 2)
+
+    def test_failed_connect_frees_the_slot(self):
+        server = Server("replica")
+        server.down = True
+        pool = ConnectionPool(server.connect, 1, "test replica")
+        with self.assertRaises(Error):
+            pool.acquire(timeout=0)
+        server.down = False
+        self.assertIsNotNone(pool.acquire(timeout=0))
+
+    def test_detach_starts_over(self):
+        server = Server("replica")
+        pool = ConnectionPool(server.connect, 1, "test replica")
+        held = pool.acquire(timeout=0)
+        pool.detach()
+        # The slot held before the fork is free in the child
+        self.assertIsNot(pool.acquire(timeout=0), held)
+        self.assertTrue(held.open)
+
+
+class TestParseReplicas(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_replicas("db-r1, db-r2:3307,", "3306"), [("db-r1", 3306), ("db-r2", 3307)])
+        self.assertEqual(parse_replicas(""), [])
+        self.assertIsNone(ReplicaSet.from_config({'replicas': ""}, {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+import unittest
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Imports the app in a clean interpreter, with connecting to MySQL turned into an error
+CHILD_SCRIPT = """
+import sys
+import mysql.connector
+
+def refuse(*args, **kwargs):
+    raise AssertionError("connected to MySQL during startup")
+
+mysql.connector.connect = refuse
+import app
+app.create_app({'TESTING': True, 'JWT_SECRET_KEY': 'test'})
+print(",".join(m for m in ("tmdbv3api", "requests", "marshmallow") if m in sys.modules))
+"""
+
+
+class TestLazyStartup(unittest.TestCase):
+
+    def run_child(self, lazy):
+        env = dict(os.environ, LAZY_STARTUP=lazy)
+        return subprocess.run([sys.executable, "-c", CHILD_SCRIPT], cwd=BACKEND_DIR, env=env,
+                              capture_output=True, text=True, timeout=60)
+
+    def test_create_app_defers_heavy_imports_and_connections(self):
+        child = self.run_child("true")
+        self.assertEqual(child.returncode, 0, child.stderr)
+        self.assertEqual(child.stdout.strip(), "")
+
+    def test_eager_startup_connects(self):
+        child = self.run_child("false")
+        self.assertNotEqual(child.returncode, 0)
+        self.assertIn("connected to MySQL during startup", child.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+
+import mysql.connector
+
+from auth import AuthHandler
+from database_handler import DatabaseHandler
+from ingestion import parse_movie
+from storage import MySQLStorage, SQLiteStorage, get_storage, to_sqlite
+from test_catalog_sync import details
+
+
+class TestTranslation(unittest.TestCase):
+
+    def test_mysql_dialect(self):
+        self.assertEqual(to_sqlite("INSERT IGNORE INTO genre (id, genre) VALUES (%s, %s)"),
+                         "INSERT OR IGNORE INTO genre (id, genre) VALUES (?, ?)")
+        self.assertEqual(to_sqlite("INSERT INTO actor (id, a_name) VALUES (%s, %s) "
+                                   "ON DUPLICATE KEY UPDATE a_name = VALUES(a_name)"),
+                         "INSERT INTO actor (id, a_name) VALUES (?, ?) ON CONFLICT DO UPDATE SET a_name = excluded.a_name")
+        self.assertEqual(to_sqlite("CREATE TABLE t (id BIGINT AUTO_INCREMENT PRIMARY KEY, "
+                                   "at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP)"),
+                         "CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, at DATETIME DEFAULT CURRENT_TIMESTAMP)")
+        self.assertEqual(to_sqlite("CREATE TRIGGER x AFTER DELETE ON movie FOR EACH ROW DELETE FROM y"),
+                         "CREATE TRIGGER x AFTER DELETE ON movie FOR EACH ROW BEGIN DELETE FROM y; END")
+
+    def test_backend_selection(self):
+        storage = get_storage(config={'backend': 'sqlite', 'sqlite_path': 'x.db', 'sqlite_busy_timeout': 1})
+        self.assertEqual((storage.name, storage.path), ("sqlite", "x.db"))
+        config = {'host': 'db', 'user': 'u', 'password': 'p', 'database': 'd', 'raise_on_warnings': True}
+        storage = get_storage(config, ("host", "database"), config={'backend': 'mysql'})
+        self.assertIsInstance(storage, MySQLStorage)
+        self.assertEqual((storage.config, storage.keys), (config, ("host", "database")))
+        with self.assertRaises(ValueError):
+            get_storage(config={'backend': 'oracle'})
+
+
+class TestSQLiteStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = SQLiteStorage(os.path.join(self.directory, "cine_mood.db"))
+        self.db_handler = DatabaseHandler(storage=self.storage)
+
+    def tearDown(self):
+        self.db_handler.close_connection()
+        shutil.rmtree(self.directory)
+
+    def test_schema_is_created_in_wal_mode(self):
+        connection = self.db_handler.connection
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA journal_mode")
+        self.assertEqual(cursor.fetchone(), ("wal",))
+        cursor.execute("SELECT country FROM country WHERE id = %s", ("FR",))
+        self.assertEqual(cursor.fetchone(), ("France",))
+        # A second connection finds the schema and does not create it again
+        other = self.storage.connect()
+        other_cursor = other.cursor()
+        other_cursor.execute("SELECT COUNT(*) FROM mood")
+        self.assertEqual(other_cursor.fetchone(), (8,))
+        other.close()
+
+    def test_database_handler_queries(self):
+        handler = self.db_handler
+        self.assertEqual(handler.add_director(1234, "Steven Spielberg"), 1234)
+        self.assertEqual(handler.add_genre(12, "Adventure"), 12)
+        self.assertTrue(handler.add_movie({"id": 5678, "title": "Jurassic Park", "release_year": 1993,
+                                           "director_id": 1234, "country_id": "US"}))
+        handler.add_movie_genre(5678, 12)
+        self.assertEqual(handler.get_movie_id("Jurassic Park"), 5678)
+        self.assertEqual(handler.get_movie_by_title("Jurassic Park")["release_year"], 1993)
+        self.assertEqual(handler.upsert_movies([parse_movie(details(10))]), 1)
+        self.assertEqual(sorted(handler.get_movie_details(10)["genres"]), ["Comedy", "Drama"])
+        movies = handler.get_movies_by_genres([12, 35], exclude_genre_ids=[18])
+        self.assertEqual([(m["id"], m["genre_ids"]) for m in movies], [(5678, [12])])
+        self.assertEqual(sorted(handler.get_existing_movie_ids([10, 11, 5678])), [10, 5678])
+        # The catalog triggers log every change
+        cursor = handler.connection.cursor()
+        cursor.execute("SELECT COUNT(DISTINCT movie_id) FROM catalog_changes WHERE movie_id IS NOT NULL")
+        self.assertEqual(cursor.fetchone(), (2,))
+
+    def test_users_share_the_database_with_auth(self):
+        auth = AuthHandler({}, storage=self.storage)
+        auth.register_user("ana", "Secret@123")
+        with self.assertRaisesRegex(Exception, "already taken"):
+            auth.register_user("ana", "Secret@123")
+        self.assertEqual(auth.login_user("ana", "Secret@123")["username"], "ana")
+        auth.lock_account("ana")
+        user = auth.get_user("ana")
+        self.assertIsInstance(user["lockout_time"], datetime)
+        self.assertTrue(auth.is_locked_out(user))
+
+        user_id = self.db_handler.check_record("users", "username", "ana")
+        self.db_handler.add_director(1, "Someone")
+        self.assertTrue(self.db_handler.add_movie({"id": 1, "title": "One", "release_year": 2000,
+                                                   "director_id": 1, "country_id": "US"}))
+        self.assertTrue(self.db_handler.add_watched_movie(user_id, 1))
+        self.assertTrue(self.db_handler.add_rating(user_id, 1, 5, "Great"))
+        self.assertTrue(self.db_handler.add_recommendation(user_id, 1))
+        self.assertEqual(self.db_handler.get_watched_count(user_id), 1)
+        self.assertEqual(self.db_handler.get_movie_ratings(1), [{"user_id": user_id, "rating": 5, "review": "Great",
+                                                                "username": "ana"}])
+        self.assertEqual(self.db_handler.get_movie_statuses(user_id, [1]),
+                         {1: {"watched": True, "rating": 5, "recommended": True}})
+        auth.close_connection()
+
+    def test_errors_are_mysql_errors(self):
+        cursor = self.db_handler.connection.cursor()
+        with self.assertRaises(mysql.connector.IntegrityError):
+            cursor.execute("INSERT INTO country (id, country) VALUES (%s, %s)", ("FR", "Again"))
+        # Foreign keys are enforced, as by MySQL's InnoDB tables
+        with self.assertRaises(mysql.connector.IntegrityError):
+            cursor.execute("INSERT INTO movie (id, title, director_id) VALUES (%s, %s, %s)", (1, "Orphan", 99))
+        with self.assertRaises(mysql.connector.Error):
+            cursor.execute("SELECT * FROM nowhere")
+
+    def test_threads_have_their_own_transactions(self):
+        connection = self.db_handler.connection
+        written, decided = threading.Event(), threading.Event()
+
+        def other_request():
+            connection.cursor().execute("INSERT INTO genre (id, genre) VALUES (%s, %s)", (1, "Other"))
+            written.set()
+            decided.wait(1)
+            connection.rollback()
+
+        thread = threading.Thread(target=other_request)
+        thread.start()
+        written.wait(1)
+        # This thread's write waits for the other's write lock, which the rollback releases
+        decided.set()
+        self.assertEqual(self.db_handler.add_director(7, "Mine"), 7)
+        thread.join()
+        # The commit of add_director did not commit the other thread's insert
+        self.assertEqual(self.db_handler.check_record("director", "id", 7), 7)
+        self.assertIsNone(self.db_handler.check_record("genre", "id", 1))
+
+    def test_failed_statement_releases_the_write_lock(self):
+        auth = AuthHandler({}, storage=self.storage)
+        auth.register_user("ana", "Secret@123")
+        with self.assertRaisesRegex(Exception, "already taken"):
+            auth.register_user("ana", "Secret@123")
+        # The failed insert left no transaction open, so other connections can write at once
+        self.storage.busy_timeout = 0
+        self.assertEqual(self.db_handler.add_director(1, "Someone"), 1)
+        auth.close_connection()
+
+    def test_logins_from_several_threads(self):
+        auth = AuthHandler({}, storage=self.storage)
+        auth.register_user("ana", "Secret@123")
+        # Connects on this thread, like a worker at startup, before the requests' threads use it
+        auth.get_user("ana")
+        results, errors = [], []
+
+        def request():
+            try:
+                for _ in range(3):
+                    results.append(auth.login_user("ana", "Secret@123")["username"])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=request) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(results, ["ana"] * 12)
+        # Later threads find the connections of the finished ones closed, not their own
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+        self.assertEqual((errors, len(results)), ([], 15))
+        auth.close_connection()
+
+    def test_readers_do_not_wait_for_a_writer(self):
+        self.db_handler.add_director(1, "First")
+        writer = self.storage.connect()
+        writer.cursor().execute("INSERT INTO director (id, d_name) VALUES (%s, %s)", (2, "Second"))
+        # The write is not committed: another connection reads the last committed state at once
+        result = []
+        thread = threading.Thread(target=lambda: result.append(DatabaseHandler(storage=self.storage).check_record(
+            "director", "id", 2)))
+        thread.start()
+        thread.join(timeout=1)
+        self.assertEqual(result, [None])
+        writer.commit()
+        self.assertEqual(self.db_handler.check_record("director", "id", 2), 2)
+        writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import tmdb_scheduler
+from metrics import TMDB_QUEUE_REJECTED, TMDB_THROTTLED
+from tmdb_scheduler import BACKFILL, INTERACTIVE, ScheduledSession, TMDbBusyError, TMDbScheduler, priority
+
+TIMEOUTS = {"interactive": 1.0, "prefetch": 1.0, "backfill": 1.0}
+
+
+def make_scheduler(rate=100.0, burst=1, max_queue=10, reserve=0):
+    return TMDbScheduler(rate, burst, max_queue, dict(TIMEOUTS), reserve)
+
+
+class TestTMDbScheduler(unittest.TestCase):
+
+    def setUp(self):
+        TMDB_QUEUE_REJECTED.reset()
+        TMDB_THROTTLED.reset()
+
+    def test_disabled_when_rate_is_zero(self):
+        scheduler = make_scheduler(rate=0, max_queue=0)
+        self.assertEqual(scheduler.acquire(), 0.0)
+
+    def test_burst_then_rate(self):
+        scheduler = make_scheduler(rate=50.0, burst=2)
+        self.assertLess(scheduler.acquire(), 0.005)
+        self.assertLess(scheduler.acquire(), 0.005)
+        self.assertGreater(scheduler.acquire(), 0.01)
+
+    def test_limits_are_shared_between_processes(self):
+        scheduler = make_scheduler(rate=40.0, burst=20, reserve=5)
+        scheduler.share(9)
+        self.assertAlmostEqual(scheduler.rate * 9, 40.0)
+        self.assertEqual((scheduler.burst, scheduler.reserve), (2, 1))
+        scheduler.share(1)
+        self.assertEqual((scheduler.rate, scheduler.burst, scheduler.reserve), (40.0, 20, 5))
+
+    def test_full_queue_is_refused(self):
+        scheduler = make_scheduler(max_queue=0)
+        with self.assertRaises(TMDbBusyError) as raised:
+            scheduler.acquire()
+        self.assertEqual(raised.exception.reason, "queue_full")
+        self.assertEqual(TMDB_QUEUE_REJECTED.collect(), {(INTERACTIVE, "queue_full"): 1})
+
+    def test_deadline(self):
+        scheduler = make_scheduler(rate=1.0)
+        scheduler.acquire()
+        with priority(INTERACTIVE, timeout=0.05), self.assertRaises(TMDbBusyError) as raised:
+            scheduler.acquire()
+        self.assertEqual(raised.exception.reason, "deadline")
+        self.assertEqual(scheduler.queue_length(INTERACTIVE), 0)
+
+    def test_interactive_overtakes_waiting_backfill(self):
+        scheduler = make_scheduler(rate=20.0)
+        scheduler.acquire()
+        order = []
+
+        def call(name):
+            with priority(name):
+                scheduler.acquire()
+            order.append(name)
+
+        backfill = threading.Thread(target=call, args=(BACKFILL,))
+        backfill.start()
+        time.sleep(0.01)
+        interactive = threading.Thread(target=call, args=(INTERACTIVE,))
+        interactive.start()
+        backfill.join()
+        interactive.join()
+        self.assertEqual(order, [INTERACTIVE, BACKFILL])
+
+    def test_reserve_is_left_for_interactive_calls(self):
+        scheduler = make_scheduler(rate=0.001, burst=3, reserve=2)
+        with priority(BACKFILL, timeout=0.02):
+            scheduler.acquire()
+            with self.assertRaises(TMDbBusyError):
+                scheduler.acquire()
+        self.assertLess(scheduler.acquire(), 0.005)
+        self.assertLess(scheduler.acquire(), 0.005)
+
+    def test_throttled_pauses_requests(self):
+        scheduler = make_scheduler(rate=100.0, burst=5)
+        scheduler.throttled(0.1)
+        self.assertGreater(scheduler.acquire(), 0.08)
+        self.assertEqual(TMDB_THROTTLED.collect(), {(): 1})
+
+    def test_session_reports_429(self):
+        scheduler = make_scheduler(rate=100.0, burst=5)
+        session = MagicMock()
+        session.request.return_value = MagicMock(status_code=429, headers={"Retry-After": "2"})
+        ScheduledSession(session, scheduler).get("http://tmdb/movie/1", params={"api_key": "k"})
+        session.request.assert_called_once_with("GET", "http://tmdb/movie/1", params={"api_key": "k"})
+        self.assertLess(scheduler._bucket.tokens, -100)
+
+    def test_priority_defaults_to_interactive(self):
+        self.assertEqual(tmdb_scheduler.current_priority(), INTERACTIVE)
+        with priority(BACKFILL):
+            self.assertEqual(tmdb_scheduler.current_priority(), BACKFILL)
+        with self.assertRaises(ValueError):
+            with priority("urgent"):
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
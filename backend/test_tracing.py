@@ -0,0 +1,117 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import MagicMock
+
+import tracing
+
+
+class ListExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append(list(spans))
+
+    def shutdown(self):
+        pass
+
+
+class CollectorStub(BaseHTTPRequestHandler):
+    """
+    Minimal OTLP/HTTP collector that keeps every posted payload.
+    """
+    received = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        CollectorStub.received.append((self.path, json.loads(body)))
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = ListExporter()
+        tracing.configure(sample_rate=1.0, exporter=self.exporter)
+
+    def tearDown(self):
+        tracing.configure(sample_rate=0.0, exporter="none")
+
+    def test_nested_spans_share_trace(self):
+        with tracing.span("root") as root:
+            with tracing.span("child", {"k": "v"}) as child:
+                pass
+
+        self.assertEqual(len(self.exporter.traces), 1)
+        names = [s.name for s in self.exporter.traces[0]]
+        self.assertEqual(names, ["child", "root"])
+        self.assertEqual(child.trace_id, root.trace_id)
+        self.assertEqual(child.parent_id, root.span_id)
+        self.assertEqual(child.attributes, {"k": "v"})
+
+    def test_unsampled_trace_exports_nothing(self):
+        tracing.configure(sample_rate=0.0, exporter=self.exporter)
+        with tracing.span("root"):
+            with tracing.span("child"):
+                self.assertIsNone(tracing.current_span())
+        self.assertEqual(self.exporter.traces, [])
+
+    def test_error_is_recorded(self):
+        with self.assertRaises(ValueError):
+            with tracing.span("root"):
+                raise ValueError("boom")
+        self.assertEqual(self.exporter.traces[0][0].error, "ValueError: boom")
+
+    def test_traced_cursor_records_statement(self):
+        raw_cursor = MagicMock()
+        cursor = tracing.TracedCursor(raw_cursor, "DatabaseHandler")
+        with tracing.span("root"):
+            cursor.execute("SELECT id FROM movie WHERE title = %s", ("Up",))
+
+        raw_cursor.execute.assert_called_with("SELECT id FROM movie WHERE title = %s", ("Up",))
+        sql_span = self.exporter.traces[0][0]
+        self.assertEqual(sql_span.name, "sql SELECT")
+        self.assertEqual(sql_span.attributes["db.component"], "DatabaseHandler")
+
+    def test_parse_traceparent(self):
+        header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+        self.assertEqual(tracing.parse_traceparent(header),
+                         ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True))
+        self.assertEqual(tracing.parse_traceparent("garbage"), (None, None, None))
+
+    def test_otlp_exporter_posts_to_collector(self):
+        CollectorStub.received = []
+        server = HTTPServer(("127.0.0.1", 0), CollectorStub)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            exporter = tracing.OTLPHttpExporter(f"http://127.0.0.1:{server.server_port}",
+                                                flush_interval=0.05)
+            tracing.configure(sample_rate=1.0, exporter=exporter)
+            with tracing.span("GET /search", {"http.status_code": 200}):
+                with tracing.span("tmdb.search"):
+                    pass
+            exporter.shutdown()
+        finally:
+            server.shutdown()
+
+        self.assertEqual(len(CollectorStub.received), 1)
+        path, payload = CollectorStub.received[0]
+        self.assertEqual(path, "/v1/traces")
+        spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        self.assertEqual({s["name"] for s in spans}, {"GET /search", "tmdb.search"})
+        child = next(s for s in spans if s["name"] == "tmdb.search")
+        root = next(s for s in spans if s["name"] == "GET /search")
+        self.assertEqual(child["parentSpanId"], root["spanId"])
+        self.assertEqual(root["attributes"][0]["value"], {"intValue": "200"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import API_handler
+import disk_cache
+import http_caching
+from disk_cache import DiskCache, DiskCachedSession, refreshing
+from metrics import CACHE_WARMER_LOOKUPS, CACHE_WARMER_REFRESHES
+from tmdb_scheduler import PREFETCH, TMDbBusyError, current_priority
+from warmer import MOOD, SEARCH, CacheWarmer, Popularity, refresh_key
+
+DISCOVER_URL = "http://tmdb/3/discover/movie?api_key=secret&with_genres=35&language=en"
+
+
+class TestPopularity(unittest.TestCase):
+
+    def test_recent_requests_count_more(self):
+        popularity = Popularity(half_life=10)
+        for _ in range(4):
+            popularity.record((MOOD, "happy"), now=0)
+        for _ in range(2):
+            popularity.record((MOOD, "sad"), now=30)
+        # happy decayed to 4 / 2**3 = 0.5 by t=30
+        self.assertEqual(popularity.hottest(5, now=30), [(MOOD, "sad"), (MOOD, "happy")])
+        self.assertEqual(popularity.hottest(1, now=30), [(MOOD, "sad")])
+
+    def test_key_count_is_bounded(self):
+        popularity = Popularity(max_keys=10)
+        for i in range(100):
+            popularity.record((SEARCH, f"title {i}"), now=i)
+        self.assertLessEqual(len(popularity.hottest(1000, now=100)), 20)
+        self.assertEqual(popularity.hottest(1, now=100), [(SEARCH, "title 99")])
+
+
+class TestRefresh(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(os.path.join(self.directory.name, "tmdb.sqlite3"), 1 << 20,
+                               {"discover": 600, "search": 600, "movie_details": 600, "credits": 600})
+        self.inner = MagicMock()
+        self.inner.request.return_value = MagicMock(status_code=200, content=b'{"results": []}',
+                                                    headers={"Content-Type": "application/json"})
+        self.session = DiskCachedSession(self.inner, self.cache)
+        CACHE_WARMER_LOOKUPS.reset()
+        CACHE_WARMER_REFRESHES.reset()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_user_lookups_are_warm_or_cold(self):
+        self.session.get(DISCOVER_URL)
+        self.session.get(DISCOVER_URL)
+        self.assertEqual(CACHE_WARMER_LOOKUPS.collect(), {("discover", "cold"): 1, ("discover", "warm"): 1})
+
+    def test_only_entries_close_to_expiry_are_refreshed(self):
+        self.session.get(DISCOVER_URL)
+        with refreshing(lead=60) as stats:
+            self.session.get(DISCOVER_URL)
+        self.assertEqual((stats.sent, stats.fresh), (0, 1))
+        self.assertEqual(self.inner.request.call_count, 1)
+
+        with refreshing(lead=3600) as stats:
+            self.session.get(DISCOVER_URL)
+        self.assertEqual((stats.sent, stats.fresh), (1, 0))
+        self.assertEqual(self.inner.request.call_count, 2)
+        self.assertEqual(CACHE_WARMER_REFRESHES.collect(), {("fresh",): 1, ("refreshed",): 1})
+        # Refreshes are not user lookups
+        self.assertEqual(CACHE_WARMER_LOOKUPS.collect(), {("discover", "cold"): 1})
+
+    def test_refresh_key_bypasses_the_in_process_cache(self):
+        with patch.object(API_handler, "fetch_genre_movies") as fetch, \
+                patch.object(API_handler, "search_movies") as search:
+            refresh_key((MOOD, "nostalgic"))
+            refresh_key((SEARCH, "Up"))
+        # classic and musical share a genre ID
+        self.assertEqual([c.args for c in fetch.call_args_list], [(10402,), (36,)])
+        self.assertTrue(all(c.kwargs == {"cached": False} for c in fetch.call_args_list))
+        search.assert_called_once_with("Up", cached=False)
+
+    def test_warmed_entry_is_served_afterwards(self):
+        def respond(body):
+            return MagicMock(status_code=200, content=body, headers={"Content-Type": "application/json"})
+
+        self.inner.request.return_value = respond(b'{"results": [1]}')
+        API_handler._request_cache.discard("GET", DISCOVER_URL, None)
+        with patch.object(API_handler, "get_tmdb_session", return_value=self.session):
+            # A user request fills the disk cache and this worker's in-process cache
+            self.assertEqual(API_handler._request_cache("GET", DISCOVER_URL, None).content, b'{"results": [1]}')
+
+            # The warmer refreshes the entry, like tmdbv3api's uncached calls
+            self.inner.request.return_value = respond(b'{"results": [2]}')
+            stamp = http_caching.versions.stamp("tmdb")
+            warmer = CacheWarmer(Popularity(), lead=3600,
+                                 refresh=lambda key: self.session.request("GET", DISCOVER_URL, data=None))
+            warmer.popularity.record((MOOD, "happy"))
+            self.assertEqual(warmer.run_once(), 1)
+
+            self.assertNotEqual(http_caching.versions.stamp("tmdb"), stamp)
+            self.assertEqual(API_handler._request_cache("GET", DISCOVER_URL, None).content, b'{"results": [2]}')
+        # Read from the disk cache, not TMDb
+        self.assertEqual(self.inner.request.call_count, 2)
+
+
+class TestCacheWarmer(unittest.TestCase):
+
+    def setUp(self):
+        CACHE_WARMER_REFRESHES.reset()
+        self.popularity = Popularity()
+        for mood in ("happy", "sad", "excited"):
+            self.popularity.record((MOOD, mood))
+
+    def test_cycle_runs_at_prefetch_priority_within_budget(self):
+        refreshed = []
+
+        def refresh(key):
+            # Stands in for a key whose refresh sent two TMDb requests
+            self.assertEqual(current_priority(), PREFETCH)
+            refreshed.append(key)
+            disk_cache._refresh.get()[1].sent += 2
+
+        warmer = CacheWarmer(self.popularity, top=10, max_refreshes=3, refresh=refresh)
+        self.assertEqual(warmer.run_once(), 4)
+        self.assertEqual(len(refreshed), 2)
+
+    def test_cycle_stops_when_the_rate_limiter_is_busy(self):
+        refresh = MagicMock(side_effect=TMDbBusyError(PREFETCH, "queue full"))
+        warmer = CacheWarmer(self.popularity, refresh=refresh)
+        self.assertEqual(warmer.run_once(), 0)
+        refresh.assert_called_once()
+        self.assertEqual(CACHE_WARMER_REFRESHES.collect(), {("busy",): 1})
+
+    def test_failed_key_does_not_stop_the_cycle(self):
+        refresh = MagicMock(side_effect=[ValueError("bad"), None, None])
+        warmer = CacheWarmer(self.popularity, refresh=refresh)
+        warmer.run_once()
+        self.assertEqual(refresh.call_count, 3)
+        self.assertEqual(CACHE_WARMER_REFRESHES.collect(), {("failed",): 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,287 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from lifecycle import after_fork
+from metrics import TMDB_QUEUE_LENGTH, TMDB_QUEUE_REJECTED, TMDB_QUEUE_WAIT_SECONDS, TMDB_THROTTLED
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"  # a user is waiting for the response
+PREFETCH = "prefetch"        # cache warming ahead of user requests
+BACKFILL = "backfill"        # bulk ingestion into the database
+PRIORITIES = (INTERACTIVE, PREFETCH, BACKFILL)
+
+# (priority, absolute deadline or None) of the TMDb calls made by the current thread or task
+_current = contextvars.ContextVar("tmdb_priority", default=(INTERACTIVE, None))
+
+
+class TMDbBusyError(RuntimeError):
+    """
+    Raised when a TMDb call cannot be scheduled: its priority queue is full, or no token
+    became available before its deadline.
+    """
+
+    def __init__(self, priority, reason):
+        super().__init__(f"TMDb is busy ({reason}), try again later.")
+        self.priority = priority
+        self.reason = reason
+
+
+@contextmanager
+def priority(name, timeout=None):
+    """
+    Runs the enclosed TMDb calls at the given priority.
+
+    :param name: INTERACTIVE, PREFETCH or BACKFILL.
+    :param timeout: Optional seconds from now after which calls still waiting for a token
+                    fail; by default each call waits at most its class's queue timeout.
+    """
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown TMDb priority: {name}")
+    deadline = None if timeout is None else time.monotonic() + timeout
+    token = _current.set((name, deadline))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current_priority():
+    return _current.get()[0]
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate` tokens per second up to `burst`. Not
+    thread safe; TMDbScheduler guards it with its lock.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, tokens):
+        """
+        :return: Seconds until the bucket holds `tokens` tokens (0 if it already does).
+        """
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def drain(self, seconds):
+        # A negative balance keeps the bucket empty for `seconds`
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class TMDbScheduler:
+    """
+    Admits TMDb requests at a fixed rate, in priority order.
+
+    Every request takes a token from one bucket. Waiting requests are served by priority,
+    first come first served within a priority, and lower priorities leave `reserve` tokens
+    in the bucket so an interactive request arriving during a backfill does not have to
+    wait for the refill. Each priority has a bounded queue and a maximum wait. A 429 from
+    TMDb empties the bucket for the Retry-After period.
+    """
+
+    def __init__(self, rate, burst, max_queue, timeouts, reserve=0):
+        """
+        :param rate: Requests per second; 0 or less disables rate limiting.
+        :param burst: Bucket size.
+        :param max_queue: Maximum number of waiting requests per priority.
+        :param timeouts: Dictionary priority -> maximum seconds a request waits for a token.
+        :param reserve: Tokens that only INTERACTIVE requests may use.
+        """
+        self.max_queue = max_queue
+        self.timeouts = timeouts
+        self._limits = (rate, burst, reserve)
+        self.share(1)
+
+    def share(self, processes):
+        """
+        Makes this process one of `processes` that send requests with the same settings:
+        it keeps its share of the rate, burst and reserve, so together they stay within them.
+
+        :param processes: Number of processes sharing the limits.
+        """
+        rate, burst, reserve = self._limits
+        processes = max(1, processes)
+        self.rate = rate / processes
+        self.burst = max(1, burst // processes)
+        self.reserve = min(-(-reserve // processes), self.burst - 1)
+        self._reset()
+
+    def _reset(self):
+        self._cond = threading.Condition()
+        self._bucket = TokenBucket(self.rate, self.burst)
+        self._queues = {name: deque() for name in PRIORITIES}
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def queue_length(self, name):
+        return len(self._queues[name])
+
+    def _is_next(self, ticket, name):
+        for other in PRIORITIES:
+            if other == name:
+                return self._queues[name][0] is ticket
+            if self._queues[other]:
+                return False
+        return False
+
+    def _reserve_for(self, name):
+        return 0 if name == INTERACTIVE else self.reserve
+
+    def acquire(self):
+        """
+        Waits for a token at the priority set with priority() (INTERACTIVE by default).
+
+        :return: Seconds spent waiting.
+        :raise TMDbBusyError: If the queue is full or the deadline passes first.
+        """
+        if not self.enabled:
+            return 0.0
+        name, deadline = _current.get()
+        start = time.monotonic()
+        if deadline is None:
+            deadline = start + self.timeouts[name]
+        ticket = object()
+        with self._cond:
+            queue = self._queues[name]
+            if len(queue) >= self.max_queue:
+                TMDB_QUEUE_REJECTED.inc((name, "queue_full"))
+                raise TMDbBusyError(name, "queue_full")
+            queue.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._bucket.refill(now)
+                    needed = 1 + self._reserve_for(name)
+                    is_next = self._is_next(ticket, name)
+                    if is_next and self._bucket.tokens >= needed:
+                        self._bucket.tokens -= 1
+                        waited = now - start
+                        TMDB_QUEUE_WAIT_SECONDS.observe((name,), waited)
+                        return waited
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        TMDB_QUEUE_REJECTED.inc((name, "deadline"))
+                        raise TMDbBusyError(name, "deadline")
+                    # The head of the queue sleeps until the refill; the others until it leaves
+                    self._cond.wait(min(remaining, self._bucket.time_until(needed)) if is_next else remaining)
+            finally:
+                queue.remove(ticket)
+                self._cond.notify_all()
+
+    def throttled(self, retry_after=None):
+        """
+        Records a 429 from TMDb: no request is admitted for retry_after seconds (one
+        second when TMDb does not say).
+        """
+        TMDB_THROTTLED.inc()
+        seconds = 1.0 if retry_after is None else max(0.0, float(retry_after))
+        logger.warning(f"TMDb rate limit hit, pausing requests for {seconds:.1f}s")
+        if not self.enabled:
+            return
+        with self._cond:
+            self._bucket.refill(time.monotonic())
+            self._bucket.drain(seconds)
+
+    def send(self, func, *args, **kwargs):
+        """
+        Calls func (an HTTP request returning a requests.Response) once a token is
+        available, and watches the response for 429.
+        """
+        self.acquire()
+        response = func(*args, **kwargs)
+        if getattr(response, "status_code", None) == 429:
+            retry_after = response.headers.get("Retry-After")
+            self.throttled(retry_after if retry_after and retry_after.isdigit() else None)
+        return response
+
+    def register_metrics(self):
+        for name in PRIORITIES:
+            TMDB_QUEUE_LENGTH.set_function((name,), lambda name=name: self.queue_length(name))
+
+
+class ScheduledSession:
+    """
+    Wraps a requests.Session so every request it sends goes through a TMDbScheduler and,
+    when given, a circuit breaker. Only what the TMDb clients use is exposed.
+    """
+
+    def __init__(self, session, scheduler, breaker=None, timeout=None):
+        """
+        :param session: requests.Session sending the requests.
+        :param scheduler: TMDbScheduler admitting them.
+        :param breaker: Optional circuit_breaker.CircuitBreaker; connection errors, timeouts and
+                        5xx responses count as failures.
+        :param timeout: Default requests timeout in seconds.
+        """
+        self.session = session
+        self.scheduler = scheduler
+        self.breaker = breaker
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        if self.timeout is not None:
+            kwargs.setdefault("timeout", self.timeout)
+        if self.breaker is None:
+            return self.scheduler.send(self.session.request, method, url, **kwargs)
+
+        probe = self.breaker.before_call()
+        succeeded = False
+        try:
+            response = self.scheduler.send(self.session.request, method, url, **kwargs)
+            succeeded = response.status_code < 500
+            return response
+        except TMDbBusyError:
+            # Refused by our own rate limit, which says nothing about TMDb
+            succeeded = None
+            raise
+        finally:
+            self.breaker.record(succeeded, probe)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+
+_schedulers = []
+
+
+def create_scheduler(config):
+    """
+    :param config: Dictionary with the TMDbScheduler arguments (see config.tmdb_scheduler_config).
+    :return: A scheduler whose queue lengths are reported on /metrics.
+    """
+    scheduler = TMDbScheduler(**config)
+    scheduler.register_metrics()
+    _schedulers.append(scheduler)
+    return scheduler
+
+
+def share_limits(processes):
+    """
+    Splits the limits of every scheduler between `processes` processes, e.g. the gunicorn
+    workers of a host, so TMDB_RATE_LIMIT and TMDB_BURST hold for all of them together.
+    """
+    for scheduler in _schedulers:
+        scheduler.share(processes)
+
+
+@after_fork
+def _reset_after_fork():
+    # Waiters and the lock belong to the parent; each worker limits its own requests
+    for scheduler in _schedulers:
+        scheduler._reset()
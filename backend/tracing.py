@@ -0,0 +1,492 @@
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+
+from config import tracing_config
+from lifecycle import after_fork
+from metrics import DB_QUERY_SECONDS
+
+logger = logging.getLogger("cinemood.tracing")
+
+# Span currently active in this thread/context. None means "no trace", _UNSAMPLED means
+# "inside a trace that was not sampled", so nested spans can bail out with a single lookup.
+_UNSAMPLED = object()
+_current_span = ContextVar("cinemood_current_span", default=None)
+
+
+class Span:
+    """
+    A single timed operation inside a trace.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "error", "_trace", "_token")
+
+    def __init__(self, name, trace_id, parent_id, attributes, trace):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.attributes = attributes if attributes is not None else {}
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._trace = trace
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_error(self, exc):
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    @property
+    def duration_ms(self):
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_error(exc)
+        _current_span.reset(self._token)
+        self.finish()
+        return False
+
+    def finish(self):
+        """
+        Closes the span. Closing the root span of a trace hands the whole trace to the exporter.
+        """
+        self.end_ns = time.time_ns()
+        self._trace.append(self)
+        if self.parent_id is None:
+            _tracer.export(self._trace)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """
+    Shared stand-in returned when the current trace is not sampled.
+    """
+    __slots__ = ("_token", "_unsampled_root")
+
+    def __init__(self, unsampled_root=False):
+        self._token = None
+        self._unsampled_root = unsampled_root
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_error(self, exc):
+        pass
+
+    def __enter__(self):
+        if self._unsampled_root:
+            self._token = _current_span.set(_UNSAMPLED)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+        return False
+
+    def finish(self):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+# ======================================================================
+# Exporters
+# ======================================================================
+
+class LogExporter:
+    """
+    Writes every finished span as one JSON line on the 'cinemood.tracing' logger.
+    """
+
+    def export(self, spans):
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        for s in spans:
+            logger.info(json.dumps(s.to_dict(), default=str))
+
+    def shutdown(self):
+        pass
+
+
+class OTLPHttpExporter:
+    """
+    Ships traces to an OpenTelemetry collector using OTLP/HTTP with the JSON encoding.
+
+    Traces are queued and posted in batches from a background thread so request threads
+    never wait on the collector. When the queue is full new traces are dropped.
+    """
+
+    def __init__(self, endpoint, service_name="cinemood-backend", max_queue=2048,
+                 batch_size=64, flush_interval=2.0, timeout=5.0):
+        """
+        :param endpoint: Collector base URL, e.g. http://localhost:4318
+        :param service_name: Value for the service.name resource attribute.
+        :param max_queue: Maximum number of traces waiting to be sent.
+        :param batch_size: Maximum number of traces per POST.
+        :param flush_interval: Seconds to wait for a batch to fill before sending.
+        :param timeout: HTTP timeout for each POST.
+        """
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.dropped = 0
+        self.max_queue = max_queue
+        self.start()
+
+    def start(self):
+        """
+        Starts the background sender with an empty queue. Called again in forked workers,
+        where the parent's thread does not exist.
+        """
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._worker.start()
+
+    def export(self, spans):
+        try:
+            self._queue.put_nowait(list(spans))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                self._post([s for trace in batch for s in trace])
+
+    def _post(self, spans):
+        body = json.dumps(self.encode(spans)).encode("utf-8")
+        req = urllib.request.Request(self.url, data=body, method="POST",
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                resp.read()
+        except Exception as e:
+            logger.warning(f"Failed to export {len(spans)} spans to {self.url}: {e}")
+
+    def encode(self, spans):
+        """
+        Builds an OTLP ExportTraceServiceRequest (JSON mapping) for the given spans.
+        """
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "cinemood"},
+                    "spans": [self._encode_span(s) for s in spans],
+                }],
+            }]
+        }
+
+    @staticmethod
+    def _encode_span(s):
+        encoded = {
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 2 if s.parent_id is None else 1,  # SERVER for roots, INTERNAL otherwise
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in s.attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            encoded["parentSpanId"] = s.parent_id
+        return encoded
+
+    def shutdown(self, timeout=5.0):
+        """
+        Flushes queued traces and stops the background thread.
+        """
+        self._stop.set()
+        self._worker.join(timeout)
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        wrapped = {"boolValue": value}
+    elif isinstance(value, int):
+        wrapped = {"intValue": str(value)}
+    elif isinstance(value, float):
+        wrapped = {"doubleValue": value}
+    else:
+        wrapped = {"stringValue": str(value)}
+    return {"key": key, "value": wrapped}
+
+
+# ======================================================================
+# Tracer
+# ======================================================================
+
+class Tracer:
+    """
+    Holds the sampling rate and the exporter used by every span in the process.
+    """
+
+    def __init__(self, sample_rate=0.0, exporter=None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    @property
+    def enabled(self):
+        return self.exporter is not None and self.sample_rate > 0
+
+    def should_sample(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def export(self, spans):
+        if self.exporter is None:
+            return
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            logger.warning(f"Trace export failed: {e}")
+
+
+_tracer = Tracer()
+
+
+def configure(sample_rate=None, exporter=None, otlp_endpoint=None):
+    """
+    (Re)configures the process-wide tracer. Missing arguments fall back to tracing_config.
+
+    :param sample_rate: Fraction of root spans (requests) to record, between 0 and 1.
+    :param exporter: 'log', 'otlp', 'none' or an object with export(spans)/shutdown().
+    :param otlp_endpoint: Collector URL for the 'otlp' exporter.
+    :return: The configured Tracer.
+    """
+    if sample_rate is None:
+        sample_rate = tracing_config['sample_rate']
+    if exporter is None:
+        exporter = tracing_config['exporter']
+    if otlp_endpoint is None:
+        otlp_endpoint = tracing_config['otlp_endpoint']
+
+    if isinstance(exporter, str):
+        if exporter == "log":
+            exporter = LogExporter()
+        elif exporter == "otlp":
+            if not otlp_endpoint:
+                raise ValueError("TRACE_OTLP_ENDPOINT is required for the 'otlp' exporter.")
+            exporter = OTLPHttpExporter(otlp_endpoint)
+        elif exporter in ("none", ""):
+            exporter = None
+        else:
+            raise ValueError(f"Unknown trace exporter: {exporter}")
+
+    if _tracer.exporter is not None and _tracer.exporter is not exporter:
+        _tracer.exporter.shutdown()
+    _tracer.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+    _tracer.exporter = exporter
+    return _tracer
+
+
+@after_fork
+def _restart_exporter_after_fork():
+    # Threads do not survive fork; each worker needs its own sender
+    if isinstance(_tracer.exporter, OTLPHttpExporter):
+        _tracer.exporter.start()
+
+
+def get_tracer():
+    return _tracer
+
+
+def current_span():
+    """
+    :return: The active sampled span, or None.
+    """
+    active = _current_span.get()
+    return None if active is _UNSAMPLED else active
+
+
+def span(name, attributes=None):
+    """
+    Starts a span as a child of the active one, to be used as a context manager.
+
+    Without an active trace a new root is started and the sampling decision is taken;
+    inside an unsampled trace a shared no-op span is returned.
+
+    :param name: Span name, e.g. 'tmdb.discover' or 'sql SELECT'.
+    :param attributes: Optional dictionary of span attributes.
+    """
+    parent = _current_span.get()
+    if parent is _UNSAMPLED:
+        return _NOOP_SPAN
+    if parent is None:
+        return start_trace(name, attributes)
+    return Span(name, parent.trace_id, parent.span_id, attributes, parent._trace)
+
+
+def start_trace(name, attributes=None, trace_id=None, parent_id=None, sampled=None):
+    """
+    Starts a root span, honouring an upstream sampling decision when one is given.
+
+    :param trace_id: Trace id propagated by the caller (W3C traceparent), if any.
+    :param parent_id: Remote parent span id, if any.
+    :param sampled: Upstream sampling decision; None lets the local sampler decide.
+    """
+    if not _tracer.enabled:
+        return _NoopSpan(unsampled_root=True)
+    if sampled is None:
+        sampled = _tracer.should_sample()
+    if not sampled:
+        return _NoopSpan(unsampled_root=True)
+    root = Span(name, trace_id or "%032x" % random.getrandbits(128), None, attributes, [])
+    if parent_id:
+        root.attributes["remote_parent_id"] = parent_id
+    return root
+
+
+def parse_traceparent(header):
+    """
+    Parses a W3C traceparent header.
+
+    :return: (trace_id, parent_id, sampled) or (None, None, None) if the header is invalid.
+    """
+    parts = header.split("-") if header else []
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None, None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None, None, None
+    return parts[1], parts[2], sampled
+
+
+# ======================================================================
+# Integrations
+# ======================================================================
+
+class TracedCursor:
+    """
+    Wraps a DB-API cursor so each executed statement becomes a span and is timed into
+    the per-method DB latency histogram.
+    """
+    __slots__ = ("_cursor", "_component", "_method", "_on_close")
+
+    def __init__(self, cursor, component, method=None, on_close=None):
+        """
+        :param cursor: The cursor to wrap.
+        :param component: Owner of the cursor, e.g. 'DatabaseHandler'.
+        :param method: Method label for metrics; resolved from the caller when omitted.
+        :param on_close: Optional callback run once when the cursor is closed.
+        """
+        self._cursor = cursor
+        self._component = component
+        self._method = method
+        self._on_close = on_close
+
+    def execute(self, operation, *args, **kwargs):
+        return self._run(self._cursor.execute, operation, args, kwargs, False)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._run(self._cursor.executemany, operation, args, kwargs, True)
+
+    def _run(self, func, operation, args, kwargs, many):
+        method = self._method or sys._getframe(2).f_code.co_name
+        start = time.perf_counter()
+        try:
+            if _current_span.get() in (None, _UNSAMPLED):
+                return func(operation, *args, **kwargs)
+            attributes = {"db.statement": " ".join(operation.split()),
+                          "db.component": self._component, "db.method": method}
+            if many:
+                attributes["db.many"] = True
+            with span("sql " + _statement_verb(operation), attributes):
+                return func(operation, *args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe((self._component, method), time.perf_counter() - start)
+
+    def close(self):
+        try:
+            return self._cursor.close()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+def _statement_verb(operation):
+    stripped = operation.lstrip()
+    return stripped[:stripped.find(" ")].upper() if " " in stripped else stripped.upper()
+
+
+def init_app(app):
+    """
+    Opens a root span around every request handled by the Flask app.
+    Does nothing when tracing is disabled, so the request path stays untouched.
+
+    :param app: Flask application.
+    """
+    if not _tracer.enabled:
+        return
+
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_span():
+        rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+        trace_id, parent_id, sampled = parse_traceparent(request.headers.get("traceparent"))
+        root = start_trace(f"{request.method} {rule}",
+                           {"http.method": request.method, "http.route": rule},
+                           trace_id=trace_id, parent_id=parent_id, sampled=sampled)
+        root.__enter__()
+        g._trace_root = root
+
+    @app.after_request
+    def _tag_response(response):
+        root = g.get("_trace_root")
+        if root is not None:
+            root.set_attribute("http.status_code", response.status_code)
+        return response
+
+    @app.teardown_request
+    def _finish_request_span(exc):
+        root = g.pop("_trace_root", None)
+        if root is not None:
+            root.__exit__(type(exc) if exc else None, exc, None)
@@ -0,0 +1,217 @@
+"""
+Background cache warmer for the TMDb disk cache.
+
+Requests record which moods and search terms users ask for. Every
+CACHE_WARMER_INTERVAL seconds the warmer takes the hottest of them and re-fetches their
+discover and search responses whose disk cache entries expire within CACHE_WARMER_LEAD
+seconds, so users keep hitting warm entries after TTL expiry and after deploys (the disk
+cache outlives the processes). Refreshes run at PREFETCH priority, behind user requests,
+and a cycle stops after CACHE_WARMER_MAX_REFRESHES TMDb calls or as soon as the rate
+limiter has no room for them.
+
+Every worker runs its own warmer over its own traffic; an entry refreshed by one worker
+is fresh for the others, which then leave it alone. A worker drops its in-process copies
+of the responses it refreshes; the other workers read the new ones once their copies
+expire (TMDB_MEMORY_CACHE_TTL).
+"""
+import logging
+import math
+import threading
+import time
+
+from config import tmdb_disk_cache_config, warmer_config
+from lifecycle import after_fork, is_preloading, on_worker_init
+from metrics import CACHE_WARMER_REFRESHES
+
+logger = logging.getLogger(__name__)
+
+MOOD = "mood"
+SEARCH = "search"
+
+
+class Popularity:
+    """
+    Request counts per key that decay with a half-life, so the hottest keys follow what
+    users ask for now. At most `max_keys` keys are kept; the coldest are dropped.
+    """
+
+    def __init__(self, half_life=900.0, max_keys=1000):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self._scores = {}  # key -> (score, time of last update)
+        self._lock = threading.Lock()
+
+    def _decayed(self, score, updated, now):
+        return score * math.pow(0.5, (now - updated) / self.half_life)
+
+    def record(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            score, updated = self._scores.get(key, (0.0, now))
+            self._scores[key] = (self._decayed(score, updated, now) + 1.0, now)
+            if len(self._scores) > 2 * self.max_keys:
+                self._prune(now)
+
+    def _prune(self, now):
+        ranked = sorted(self._scores.items(), key=lambda item: -self._decayed(*item[1], now))
+        self._scores = dict(ranked[:self.max_keys])
+
+    def hottest(self, count, now=None):
+        """
+        :return: Up to `count` keys, hottest first.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            scores = {key: self._decayed(score, updated, now) for key, (score, updated) in self._scores.items()}
+        return sorted(scores, key=lambda key: -scores[key])[:count]
+
+
+def refresh_key(key):
+    """
+    Sends the TMDb requests behind a (kind, value) key, skipping the in-process cache so
+    they reach the disk cache: the discover request of every genre of a mood, or the
+    search for a term.
+    """
+    from API_handler import fetch_genre_movies, search_movies
+    from mood_to_genres import get_genre_mapping, get_genres_for_mood
+
+    kind, value = key
+    if kind == MOOD:
+        genre_map = get_genre_mapping()
+        for genre_id in dict.fromkeys(genre_map[g] for g in get_genres_for_mood(value) if g in genre_map):
+            fetch_genre_movies(genre_id, cached=False)
+    elif kind == SEARCH:
+        search_movies(value, cached=False)
+
+
+class CacheWarmer:
+    """
+    Periodically refreshes the disk cache entries of the hottest keys before they expire.
+    """
+
+    def __init__(self, popularity, interval=60.0, lead=300.0, top=20, max_refreshes=50, refresh=refresh_key):
+        """
+        :param popularity: Popularity of (kind, value) keys.
+        :param interval: Seconds between cycles.
+        :param lead: Seconds before expiry from which an entry is refreshed.
+        :param top: Hottest keys looked at per cycle.
+        :param max_refreshes: Most TMDb calls per cycle.
+        :param refresh: Callable sending the requests of one key.
+        """
+        self.popularity = popularity
+        self.interval = interval
+        self.lead = lead
+        self.top = top
+        self.max_refreshes = max_refreshes
+        self.refresh = refresh
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run_once(self):
+        """
+        Refreshes what is due for the hottest keys, within the cycle's budget.
+
+        :return: Number of TMDb calls made.
+        """
+        from disk_cache import refreshing
+        from API_handler import forget_responses, is_tmdb_outage
+        from tmdb_scheduler import PREFETCH, TMDbBusyError, priority
+
+        sent = 0
+        for key in self.popularity.hottest(self.top):
+            if sent >= self.max_refreshes:
+                break
+            try:
+                with priority(PREFETCH), refreshing(self.lead) as stats:
+                    try:
+                        self.refresh(key)
+                    finally:
+                        sent += stats.sent
+                        # This worker's in-process copies would hide the refreshed entries
+                        forget_responses(stats.urls)
+            except TMDbBusyError:
+                # No rate budget left for prefetching; user requests come first
+                CACHE_WARMER_REFRESHES.inc(("busy",))
+                break
+            except Exception as e:
+                CACHE_WARMER_REFRESHES.inc(("failed",))
+                if is_tmdb_outage(e):
+                    break
+                logger.warning(f"Cache warmer could not refresh {key}: {e}")
+        if sent:
+            logger.debug(f"Cache warmer refreshed {sent} TMDb responses")
+        return sent
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Cache warmer cycle failed: {e}")
+
+
+_popularity = None
+_warmer = None
+_settings = None
+
+
+def record(kind, value):
+    """
+    Counts a user request for a mood (kind 'mood') or a search term (kind 'search').
+    A no-op while the warmer is off.
+    """
+    if _popularity is not None:
+        _popularity.record((kind, value))
+
+
+def _start_warmer():
+    global _warmer
+    if _popularity is not None and _warmer is None:
+        _warmer = CacheWarmer(_popularity, _settings['interval'], _settings['lead'], _settings['top'],
+                              _settings['max_refreshes']).start()
+
+
+def init_app(app, config=None):
+    """
+    Starts the warmer when CACHE_WARMER is on; in a preloading master the workers start
+    it instead. It only refreshes the disk cache, so it stays off without TMDB_DISK_CACHE.
+
+    :param app: Flask application.
+    :param config: Overrides for warmer_config.
+    """
+    global _popularity, _settings
+    _settings = dict(warmer_config, **(config or {}))
+    if not _settings['enabled']:
+        _popularity = None
+        return
+    if not tmdb_disk_cache_config['path']:
+        app.logger.warning("CACHE_WARMER is on but TMDB_DISK_CACHE is not set; nothing to warm")
+        _popularity = None
+        return
+    _popularity = Popularity(_settings['half_life'])
+    if not is_preloading():
+        _start_warmer()
+
+
+@after_fork
+def _reset_after_fork():
+    # A thread started before fork stays in the parent; each worker warms for its own traffic
+    global _warmer
+    _warmer = None
+    if _popularity is not None:
+        _popularity._lock = threading.Lock()
+
+
+@on_worker_init
+def _start_in_worker(app):
+    _start_warmer()
@@ -0,0 +1,15 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Runs in the master process when the app is preloaded (see gunicorn.conf.py), so no
+connection may stay open past this module; lifecycle.preload takes care of that. No
+background thread starts here either: each worker starts its own in post_worker_init.
+"""
+import lifecycle
+from app import create_app
+
+with lifecycle.preloading():
+    app = create_app()
+lifecycle.preload(app)
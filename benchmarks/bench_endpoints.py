@@ -0,0 +1,38 @@
+"""
+pytest-benchmark suite for the main endpoints, run in-process through the Flask test
+client against the TMDb stub and a disposable database.
+
+    pytest benchmarks/bench_endpoints.py --benchmark-autosave
+    pytest benchmarks/bench_endpoints.py --benchmark-compare --benchmark-compare-fail=median:10%
+
+Saved runs live in .benchmarks/ and can be compared run to run.
+"""
+import itertools
+import random
+
+import harness
+from tmdb_stub import WORDS
+
+
+def test_recommendations(benchmark, client):
+    moods = itertools.cycle(harness.MOODS)
+    response = benchmark(lambda: client.post("/recommendations", json={"mood": next(moods)}))
+    assert response.status_code == 200
+
+
+def test_search(benchmark, client):
+    rng = random.Random(1)
+    response = benchmark(lambda: client.get("/search", query_string={"title": rng.choice(WORDS)}))
+    assert response.status_code in (200, 404)
+
+
+def test_login(benchmark, client):
+    response = benchmark(lambda: client.post("/login", json=harness.BENCH_USER))
+    assert response.status_code == 200
+
+
+def test_add_to_movie_history(benchmark, client, user_id):
+    movie_ids = itertools.count(1)
+    response = benchmark(lambda: client.post("/add_to_movie_history",
+                                             json={"user_id": user_id, "movie_id": next(movie_ids)}))
+    assert response.status_code == 200
@@ -0,0 +1,112 @@
+"""
+Tail latency of TMDb calls with and without request hedging: runs fetch_movies_by_genre
+against a TMDb stub where a share of the responses is much slower than the rest, once with
+hedging off and once on, and compares the latency percentiles.
+
+    python benchmarks/bench_hedging.py --calls 2000 --concurrency 8 --tail-rate 0.03 --tail-latency 0.3
+
+tmdbv3api's request cache is disabled so every call reaches the stub, and the rate limit is
+off unless TMDB_RATE_LIMIT is set. No database is needed.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import harness
+from loadgen import percentile
+from tmdb_stub import TMDbStub
+
+GENRES = ["action", "comedy", "drama", "adventure", "animation", "romance", "thriller"]
+
+
+def run_calls(calls, concurrency, warmup):
+    """
+    Calls fetch_movies_by_genre `calls` times from `concurrency` threads, after `warmup`
+    unmeasured calls.
+
+    :return: Sorted latencies in seconds.
+    """
+    from API_handler import fetch_movies_by_genre
+
+    for i in range(warmup):
+        fetch_movies_by_genre(GENRES[i % len(GENRES)], "happy")
+
+    counter = iter(range(calls))
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        local = []
+        for i in counter:
+            start = time.perf_counter()
+            fetch_movies_by_genre(GENRES[i % len(GENRES)], "happy")
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencies)
+
+
+def summarise(latencies, hedges):
+    to_ms = lambda v: round(v * 1000, 3)
+    return {
+        "calls": len(latencies),
+        "p50_ms": to_ms(percentile(latencies, 50)),
+        "p95_ms": to_ms(percentile(latencies, 95)),
+        "p99_ms": to_ms(percentile(latencies, 99)),
+        "max_ms": to_ms(latencies[-1]),
+        "hedges": {labels[0]: int(value) for labels, value in hedges.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare TMDb tail latency with and without hedging.")
+    parser.add_argument("--calls", type=int, default=2000, help="Measured calls per mode.")
+    parser.add_argument("--warmup", type=int, default=100, help="Unmeasured calls per mode.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--tmdb-latency", type=float, default=0.01)
+    parser.add_argument("--tmdb-jitter", type=float, default=0.005)
+    parser.add_argument("--tail-rate", type=float, default=0.03, help="Share of stub responses that are slow.")
+    parser.add_argument("--tail-latency", type=float, default=0.3, help="Extra delay of slow responses (s).")
+    parser.add_argument("--budget", type=float, default=0.05, help="TMDB_HEDGE_BUDGET for the hedged run.")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    os.environ.setdefault("TMDB_RATE_LIMIT", "0")
+    os.environ["TMDB_HEDGE_BUDGET"] = str(args.budget)
+    with TMDbStub(args.tmdb_latency, args.tmdb_jitter, tail_rate=args.tail_rate,
+                  tail_latency=args.tail_latency) as stub:
+        harness.prepare_environment(stub.url, upstream_cache=False)
+        import API_handler
+        from metrics import TMDB_HEDGES
+
+        results = {}
+        for mode in ("off", "on"):
+            API_handler.hedging_policy.enabled = mode == "on"
+            TMDB_HEDGES.reset()
+            stub.requests.clear()
+            latencies = run_calls(args.calls, args.concurrency, args.warmup)
+            r = results[mode] = summarise(latencies, TMDB_HEDGES.collect())
+            r["upstream_requests"] = sum(stub.requests.values())
+            print(f"hedging {mode:>3}: p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  p99 {r['p99_ms']} ms  "
+                  f"max {r['max_ms']} ms  upstream {r['upstream_requests']}  hedges {r['hedges']}", flush=True)
+
+    off, on = results["off"]["p99_ms"], results["on"]["p99_ms"]
+    print(f"p99 {off} ms -> {on} ms ({(on - off) / off:+.0%})")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "settings": vars(args),
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Fixtures for the pytest-benchmark suite. Everything is session scoped: one TMDb stub,
+one disposable database and one app instance are shared by all benchmarks.
+"""
+import os
+
+import pytest
+
+import harness
+from tmdb_stub import TMDbStub
+
+
+@pytest.fixture(scope="session")
+def tmdb_stub():
+    latency = float(os.getenv("BENCH_TMDB_LATENCY", "0.02"))
+    jitter = float(os.getenv("BENCH_TMDB_JITTER", "0.01"))
+    with TMDbStub(latency, jitter) as stub:
+        harness.prepare_environment(stub.url)
+        yield stub
+
+
+@pytest.fixture(scope="session")
+def database(tmdb_stub):
+    try:
+        with harness.disposable_database(movies=int(os.getenv("BENCH_MOVIES", "20000"))) as name:
+            yield name
+    except Exception as e:
+        pytest.skip(f"No database available for benchmarks: {e}")
+
+
+@pytest.fixture(scope="session")
+def client(database):
+    from app import create_app
+
+    app = create_app({"TESTING": True})
+    client = app.test_client()
+    client.post("/register", json=harness.BENCH_USER)
+    return client
+
+
+@pytest.fixture(scope="session")
+def user_id(client):
+    return harness.bench_user_id()
@@ -0,0 +1,150 @@
+"""
+Shared setup for the benchmark suite: environment for the backend, a disposable
+database and an in-process HTTP server around create_app.
+
+The backend reads its configuration when config.py is imported, so call
+prepare_environment() before importing any backend module.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+SCHEMA_FILE = os.path.join(ROOT_DIR, "sql", "cinemood_database_creation.sql")
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+BENCH_USER = {"username": "bench_user", "password": "Bench@12345"}
+MOODS = ["happy", "sad", "excited", "relaxed", "nostalgic", "curious", "chill"]
+
+
+def prepare_environment(tmdb_url, upstream_cache=True):
+    """
+    Points the backend at the TMDb stub. Must run before the backend is imported.
+
+    :param tmdb_url: Base URL of the stub, e.g. http://127.0.0.1:8500/3
+    :param upstream_cache: Keep tmdbv3api's in-process request cache enabled.
+    """
+    if "config" in sys.modules:
+        raise RuntimeError("prepare_environment() must be called before importing the backend")
+    os.environ["TMDB_BASE_URL"] = tmdb_url
+    os.environ.setdefault("TMDB_API_KEY", "bench")
+    os.environ.setdefault("API_KEY", "bench")
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ["TMDB_CACHE_ENABLED"] = str(upstream_cache)
+
+
+def schema_statements():
+    """
+    :return: CREATE/INSERT statements of the CineMood schema, without the
+             CREATE DATABASE/USE lines so they can be replayed into any database.
+    """
+    from storage import schema_statements
+    return schema_statements(SCHEMA_FILE)
+
+
+@contextmanager
+def disposable_database(movies=20000):
+    """
+    Creates a throw-away copy of the CineMood schema on the configured MySQL server,
+    seeds it with synthetic movies and points config.db_config at it. The database is
+    dropped on exit. With DB_BACKEND=sqlite the copy is a temporary SQLite file instead,
+    and config.storage_config points at it.
+
+    :param movies: Number of movie rows to seed (ids 1..movies).
+    :return: Name of the database.
+    """
+    from config import storage_config
+
+    if storage_config["backend"] == "sqlite":
+        with _disposable_sqlite_database(movies) as name:
+            yield name
+        return
+
+    import mysql.connector
+    from config import db_config
+
+    name = f"cine_mood_bench_{uuid.uuid4().hex[:8]}"
+    server = {k: db_config[k] for k in ("host", "port", "user", "password") if db_config.get(k)}
+    conn = mysql.connector.connect(**server)
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE DATABASE {name}")
+    original = db_config["database"]
+    try:
+        cursor.execute(f"USE {name}")
+        for statement in schema_statements():
+            cursor.execute(statement)
+        cursor.executemany("INSERT INTO movie (id, title, release_year) VALUES (%s, %s, %s)", _movie_rows(movies))
+        conn.commit()
+        db_config["database"] = name
+        yield name
+    finally:
+        db_config["database"] = original
+        cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+        cursor.close()
+        conn.close()
+
+
+def _movie_rows(movies):
+    from tmdb_stub import synthetic_movie
+
+    rows = []
+    for movie_id in range(1, movies + 1):
+        movie = synthetic_movie(movie_id)
+        rows.append((movie_id, movie["title"], movie["release_date"][:4]))
+    return rows
+
+
+@contextmanager
+def _disposable_sqlite_database(movies):
+    # Same schema and seed in a SQLite file, queried in-process by the app
+    from config import storage_config
+    from storage import SQLiteStorage
+
+    directory = tempfile.mkdtemp(prefix="cine_mood_bench_")
+    path = os.path.join(directory, "cine_mood.db")
+    conn = SQLiteStorage(path).connect()
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO movie (id, title, release_year) VALUES (%s, %s, %s)", _movie_rows(movies))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    original = storage_config["sqlite_path"]
+    storage_config["sqlite_path"] = path
+    try:
+        yield path
+    finally:
+        storage_config["sqlite_path"] = original
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_user_id():
+    """
+    :return: Id of the benchmark user in the current database.
+    """
+    from database_handler import DatabaseHandler
+    return DatabaseHandler().check_record("users", "username", BENCH_USER["username"])
+
+
+@contextmanager
+def serve_app(app, host="127.0.0.1", port=0):
+    """
+    Serves a Flask app from a background thread with werkzeug's threaded server.
+
+    :return: Base URL of the running server.
+    """
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="bench-app", daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_port}"
+    finally:
+        server.shutdown()
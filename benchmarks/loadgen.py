@@ -0,0 +1,286 @@
+"""
+wrk-style load driver for the CineMood backend.
+
+`run` starts a TMDb stub, a disposable database and create_app behind a threaded HTTP
+server, then drives each endpoint with a fixed number of concurrent closed-loop clients
+for a fixed duration. Throughput and p50/p95/p99 latency are printed and written to a
+JSON file so runs can be compared with `compare`.
+
+    python benchmarks/loadgen.py run --duration 10 --concurrency 8 --tmdb-latency 0.05
+    python benchmarks/loadgen.py compare benchmarks/results/a.json benchmarks/results/b.json
+
+Use --target to drive an already running backend instead of the in-process one.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+import harness
+from tmdb_stub import TMDbStub, WORDS
+
+ENDPOINTS = ("recommendations", "search", "login", "add_to_movie_history")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def build_scenarios(user_id, movie_ids):
+    """
+    :return: Mapping of endpoint name to a function producing (method, path, json body).
+    """
+    next_movie = itertools.count()
+
+    def recommendations():
+        return "POST", "/recommendations", {"mood": random.choice(harness.MOODS)}
+
+    def search():
+        return "GET", f"/search?title={random.choice(WORDS)}", None
+
+    def login():
+        return "POST", "/login", harness.BENCH_USER
+
+    def add_to_movie_history():
+        movie_id = movie_ids[next(next_movie) % len(movie_ids)]
+        return "POST", "/add_to_movie_history", {"user_id": user_id, "movie_id": movie_id}
+
+    return {
+        "recommendations": recommendations,
+        "search": search,
+        "login": login,
+        "add_to_movie_history": add_to_movie_history,
+    }
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def drive(base_url, scenario, duration, concurrency, warmup=1.0):
+    """
+    Runs `concurrency` closed-loop clients against one scenario.
+
+    Only successful (2xx/3xx) responses count as requests: their latencies make the percentiles
+    and throughput. 4xx/5xx responses and failed connections are counted under errors.
+
+    :return: Dictionary with request count, throughput, latency percentiles (ms), status counts,
+             errors and error rate.
+    """
+    import requests
+
+    stop_at = [0.0]
+    measure_from = [0.0]
+    latencies = []
+    statuses = Counter()
+    errors = [0]
+    lock = threading.Lock()
+
+    def client():
+        session = requests.Session()
+        local_latencies = []
+        local_statuses = Counter()
+        local_errors = 0
+        while True:
+            method, path, body = scenario()
+            start = time.perf_counter()
+            if start >= stop_at[0]:
+                break
+            try:
+                response = session.request(method, base_url + path, json=body, timeout=30)
+                status = response.status_code
+            except requests.RequestException:
+                status = None
+            elapsed = time.perf_counter() - start
+            if start < measure_from[0]:
+                continue
+            if status is not None:
+                local_statuses[status] += 1
+            if status is None or status >= 400:
+                local_errors += 1
+            else:
+                local_latencies.append(elapsed)
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+            errors[0] += local_errors
+
+    now = time.perf_counter()
+    measure_from[0] = now + warmup
+    stop_at[0] = now + warmup + duration
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    to_ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / duration, 2),
+        "mean_ms": to_ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": to_ms(percentile(latencies, 50)),
+        "p95_ms": to_ms(percentile(latencies, 95)),
+        "p99_ms": to_ms(percentile(latencies, 99)),
+        "max_ms": to_ms(latencies[-1]) if latencies else None,
+        "status_counts": {str(k): v for k, v in sorted(statuses.items())},
+        "errors": errors[0],
+        "error_rate": round(errors[0] / (len(latencies) + errors[0]), 4) if latencies or errors[0] else 0.0,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=harness.ROOT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def _db_backend():
+    from config import storage_config
+    return storage_config["backend"]
+
+
+def run(args):
+    endpoints = args.endpoints.split(",")
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+    random.seed(args.seed)
+
+    with ExitStack() as stack:
+        if args.target:
+            base_url = args.target.rstrip("/")
+            user_id = args.user_id
+            movie_ids = list(range(1, args.movies + 1))
+        else:
+            stub = stack.enter_context(TMDbStub(args.tmdb_latency, args.tmdb_jitter))
+            harness.prepare_environment(stub.url, upstream_cache=not args.no_upstream_cache)
+            stack.enter_context(harness.disposable_database(args.movies))
+            from app import create_app
+            base_url = stack.enter_context(harness.serve_app(create_app()))
+            user_id = None
+            movie_ids = list(range(1, args.movies + 1))
+            random.shuffle(movie_ids)
+
+        import requests
+        requests.post(base_url + "/register", json=harness.BENCH_USER, timeout=30)
+        if user_id is None:
+            user_id = harness.bench_user_id()
+
+        scenarios = build_scenarios(user_id, movie_ids)
+        results = {}
+        for name in endpoints:
+            print(f"-> {name}: {args.concurrency} clients for {args.duration}s", flush=True)
+            results[name] = drive(base_url, scenarios[name], args.duration, args.concurrency, args.warmup)
+            r = results[name]
+            print(f"   {r['throughput_rps']} req/s  p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  "
+                  f"p99 {r['p99_ms']} ms  statuses {r['status_counts']}  errors {r['errors']}", flush=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "target": args.target or "in-process",
+            "db_backend": None if args.target else _db_backend(),
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "tmdb_latency_s": args.tmdb_latency,
+            "tmdb_jitter_s": args.tmdb_jitter,
+            "upstream_cache": not args.no_upstream_cache,
+            "seed": args.seed,
+        },
+        "endpoints": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load-{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['git_commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+def compare(args):
+    """
+    Prints the change of every metric between two result files and exits with status 1
+    when a latency grew, or throughput dropped, by more than the threshold, or when the
+    candidate has failed requests.
+    """
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["endpoints"]
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)["endpoints"]
+
+    regressions = []
+    print(f"{'endpoint':<22}{'metric':<16}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    for endpoint in sorted(set(baseline) & set(candidate)):
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            old, new = baseline[endpoint].get(metric), candidate[endpoint].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change < -args.threshold if metric == "throughput_rps" else change > args.threshold
+            flag = "  REGRESSION" if worse else ""
+            print(f"{endpoint:<22}{metric:<16}{old:>12}{new:>12}{change:>+10.1%}{flag}")
+            if worse:
+                regressions.append((endpoint, metric))
+        # Failed requests are left out of the latencies, so any of them makes the run suspect
+        errors = candidate[endpoint].get("errors") or 0
+        if errors:
+            rate = candidate[endpoint].get("error_rate")
+            print(f"{endpoint:<22}{'errors':<16}{baseline[endpoint].get('errors') or 0:>12}{errors:>12}"
+                  f"{'' if rate is None else f'{rate:.1%}':>10}  ERRORS")
+            regressions.append((endpoint, "errors"))
+    if regressions:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the CineMood backend.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run a load test and store the results as JSON.")
+    run_parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                            help=f"Comma separated subset of: {', '.join(ENDPOINTS)}")
+    run_parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds per endpoint.")
+    run_parser.add_argument("--warmup", type=float, default=1.0, help="Unmeasured seconds per endpoint.")
+    run_parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients.")
+    run_parser.add_argument("--tmdb-latency", type=float, default=0.05, help="Stub latency per call (s).")
+    run_parser.add_argument("--tmdb-jitter", type=float, default=0.02, help="Extra random stub latency (s).")
+    run_parser.add_argument("--no-upstream-cache", action="store_true",
+                            help="Disable tmdbv3api's request cache so every call reaches the stub.")
+    run_parser.add_argument("--movies", type=int, default=20000, help="Movies seeded into the database.")
+    run_parser.add_argument("--target", help="Base URL of a running backend instead of the in-process one.")
+    run_parser.add_argument("--user-id", type=int, help="User id for /add_to_movie_history with --target.")
+    run_parser.add_argument("--seed", type=int, default=1234)
+    run_parser.add_argument("--output", help="Result file (default: benchmarks/results/load-<time>-<commit>.json)")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = sub.add_parser("compare", help="Compare two result files.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="Relative change treated as a regression (default 0.10).")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Micro-benchmarks for the pure-Python hot paths of the backend.
+
+For each benchmark the CLI prints operations per second, time per operation and the
+memory allocated by one operation (traced with tracemalloc):
+
+    python benchmarks/micro.py
+    python benchmarks/micro.py --only filter --sizes 1000,100000 --json benchmarks/results/micro.json
+
+It then prints the memory held per recommendation candidate as a Movie record and as the
+equivalent dict (--only footprint prints just that table).
+
+Nothing here touches the network or the database; TMDb results are synthetic.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import harness  # noqa: F401  (puts backend/ on sys.path)
+from movie import Movie
+from tmdb_stub import GENRE_IDS, WORDS
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+# ======================================================================
+# Synthetic data
+# ======================================================================
+
+def synthetic_discover_results(count, seed=0, first_id=1):
+    """
+    Generates entries shaped like the results of TMDb /discover/movie.
+
+    :param count: Number of movies.
+    :param seed: Random seed, so runs are comparable.
+    :param first_id: Id of the first movie.
+    """
+    rng = random.Random(seed)
+    results = []
+    for movie_id in range(first_id, first_id + count):
+        results.append({
+            "id": movie_id,
+            "title": f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {movie_id}",
+            "release_date": f"{rng.randint(1950, 2024)}-01-01",
+            "overview": " ".join(rng.choices(WORDS, k=40)),
+            "genre_ids": rng.sample(GENRE_IDS, rng.randint(1, 3)),
+            "poster_path": f"/poster{movie_id}.jpg",
+        })
+    return results
+
+
+def synthetic_movies(count, seed=0, first_id=1):
+    """
+    Generates Movie records like the ones built by fetch_movies_by_genre.
+    """
+    return [Movie.from_discover(m) for m in synthetic_discover_results(count, seed, first_id)]
+
+
+def synthetic_genre_results(genres, per_genre, overlap=0.3, seed=0):
+    """
+    Builds per-genre result lists where a share of the movies appears under several genres,
+    as happens with real discover results.
+
+    :return: Dictionary genre name -> list of movies.
+    """
+    rng = random.Random(seed)
+    shared = synthetic_movies(int(per_genre * overlap), seed=seed, first_id=1)
+    results = {}
+    for i, genre in enumerate(genres):
+        own = synthetic_movies(per_genre - len(shared), seed=seed + i + 1, first_id=(i + 1) * 1_000_000)
+        movies = own + rng.sample(shared, len(shared))
+        rng.shuffle(movies)
+        results[genre] = movies
+    return results
+
+
+# ======================================================================
+# Benchmarks
+# ======================================================================
+
+def bench_filter_movies_by_mood(size):
+    from mood_to_genres import filter_movies_by_mood
+
+    movies = synthetic_movies(size)
+    moods = ["happy", "sad", "excited", "relaxed"]
+    state = {"i": 0}
+
+    def run():
+        state["i"] += 1
+        return filter_movies_by_mood(movies, moods[state["i"] % len(moods)])
+    return run
+
+
+def bench_recommend_movies_merge(size):
+    import recomendation_engine
+    from mood_to_genres import get_genres_for_mood
+
+    mood = "happy"
+    genres = get_genres_for_mood(mood)
+    per_genre = max(1, size // len(genres))
+    results = synthetic_genre_results(genres, per_genre)
+
+    def fake_fetch(genre_name, mood, limit=1000):
+        return results[genre_name][:limit]
+
+    # Left patched for the rest of the process, so only the merge loop is timed
+    patch.object(recomendation_engine, "fetch_movies_by_genre", fake_fetch).start()
+
+    def run():
+        return recomendation_engine.recommend_movies(1, mood, limit=size)
+    return run
+
+
+def bench_register_schema_load(size):
+    from schemas import RegisterRequestSchema
+
+    payloads = [{"username": f"user_{i}", "password": f"Secret#{i:06d}"} for i in range(size)]
+    schema = RegisterRequestSchema()
+
+    def run():
+        for payload in payloads:
+            schema.load(payload)
+    return run
+
+
+def bench_login_schema_load(size):
+    from schemas import LoginRequestSchema
+
+    payloads = [{"username": f"user_{i}", "password": f"Secret#{i:06d}"} for i in range(size)]
+    schema = LoginRequestSchema()
+
+    def run():
+        for payload in payloads:
+            schema.load(payload)
+    return run
+
+
+def bench_auth_response_dump(size):
+    from schemas import AuthResponseSchema
+
+    responses = [{"username": f"user_{i}", "is_guest": i % 2 == 0, "access_token": "x" * 300}
+                 for i in range(size)]
+    schema = AuthResponseSchema()
+
+    def run():
+        for response in responses:
+            schema.dump(response)
+    return run
+
+
+def _json_response_bench(size, backend, fields=None):
+    from flask import Flask
+    import json_provider
+    from movie import CARD_FIELDS, to_dicts
+
+    app = Flask(__name__)
+    app.config["JSON_BACKEND"] = backend
+    json_provider.init_app(app)
+    movies = synthetic_movies(size)
+    fields = json_provider.parse_fields(fields)
+
+    def run():
+        with app.app_context():
+            return app.json.response(to_dicts(movies, CARD_FIELDS, fields)).get_data()
+    return run
+
+
+def bench_recommendations_json_stdlib(size):
+    return _json_response_bench(size, "stdlib")
+
+
+def bench_recommendations_json_fast(size):
+    return _json_response_bench(size, "auto")
+
+
+def bench_recommendations_json_card_fields(size):
+    return _json_response_bench(size, "auto", "id,title,overview,poster_path,release_year")
+
+
+# name -> (factory, fixed input sizes or None to use --sizes)
+BENCHMARKS = {
+    "filter_movies_by_mood": (bench_filter_movies_by_mood, None),
+    "recommend_movies_merge": (bench_recommend_movies_merge, None),
+    "RegisterRequestSchema.load": (bench_register_schema_load, (1000,)),
+    "LoginRequestSchema.load": (bench_login_schema_load, (1000,)),
+    "AuthResponseSchema.dump": (bench_auth_response_dump, (1000,)),
+    # /recommendations returns up to 120 movies
+    "recommendations_json_stdlib": (bench_recommendations_json_stdlib, (120,)),
+    "recommendations_json_fast": (bench_recommendations_json_fast, (120,)),
+    "recommendations_json_card_fields": (bench_recommendations_json_card_fields, (120,)),
+}
+
+
+# ======================================================================
+# Measurement
+# ======================================================================
+
+def measure(func, min_time=0.5, repeat=3):
+    """
+    Times func like timeit: the loop count grows until one batch lasts min_time, then the
+    best of `repeat` batches is kept. Allocation is measured separately for one call.
+
+    :return: Dictionary with ops/sec, seconds per op and tracemalloc figures.
+    """
+    func()  # warm up caches and lazy imports
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    func()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    allocated = sum(s.size_diff for s in stats if s.size_diff > 0)
+    blocks = sum(s.count_diff for s in stats if s.count_diff > 0)
+
+    per_op = best / number
+    return {
+        "ops_per_sec": round(1.0 / per_op, 2) if per_op else None,
+        "sec_per_op": per_op,
+        "loops": number,
+        "retained_bytes": allocated,
+        "retained_blocks": blocks,
+        "peak_bytes": peak,
+    }
+
+
+def _as_dict(result):
+    # The per-movie dict fetch_movies_by_genre built before Movie records
+    return {
+        "id": result['id'],
+        "title": result['title'],
+        "release_year": result['release_date'].split('-')[0],
+        "overview": result['overview'],
+        "genre_ids": result['genre_ids'],
+        "poster_path": result['poster_path'],
+    }
+
+
+def candidate_footprint(size):
+    """
+    Measures the memory held by a pool of recommendation candidates built from discover
+    results, as Movie records and as dicts. The strings and genre lists are shared with the
+    results in both cases, so the difference is the per-movie container.
+
+    :return: Dictionary representation -> bytes per candidate.
+    """
+    results = synthetic_discover_results(size)
+    footprint = {}
+    for name, build in (("dict", _as_dict), ("Movie", Movie.from_discover)):
+        gc.collect()
+        tracemalloc.start()
+        pool = [build(r) for r in results]
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        footprint[name] = round(held / size, 1)
+        del pool
+    return footprint
+
+
+def _format_bytes(value):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(value) < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TiB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for CineMood hot paths.")
+    parser.add_argument("--only", help="Run only benchmarks whose name contains this text.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma separated input sizes for the movie benchmarks.")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Minimum seconds per timing batch.")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    sizes = tuple(int(s) for s in args.sizes.split(","))
+    rows = []
+    print(f"{'benchmark':<30}{'size':>8}{'ops/sec':>14}{'per op':>14}{'peak mem':>12}{'retained':>12}")
+    for name, (factory, fixed_sizes) in BENCHMARKS.items():
+        if args.only and args.only.lower() not in name.lower():
+            continue
+        for size in fixed_sizes or sizes:
+            result = measure(factory(size), min_time=args.min_time)
+            rows.append({"benchmark": name, "size": size, **result})
+            print(f"{name:<30}{size:>8}{result['ops_per_sec']:>14,.1f}"
+                  f"{result['sec_per_op'] * 1e3:>11.3f} ms"
+                  f"{_format_bytes(result['peak_bytes']):>12}{_format_bytes(result['retained_bytes']):>12}",
+                  flush=True)
+
+    footprint = {}
+    if not args.only or args.only.lower() in "footprint":
+        print(f"\n{'candidate footprint':<30}{'size':>8}{'dict':>14}{'Movie':>14}")
+        for size in sizes:
+            footprint[size] = candidate_footprint(size)
+            print(f"{'bytes per candidate':<30}{size:>8}{footprint[size]['dict']:>14,.1f}"
+                  f"{footprint[size]['Movie']:>14,.1f}", flush=True)
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": rows,
+                       "candidate_footprint": footprint}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
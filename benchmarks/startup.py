@@ -0,0 +1,106 @@
+"""
+Cold-start benchmark for the backend entry point.
+
+Each run starts a fresh interpreter with `python -X importtime`, imports app.py and calls
+create_app(), then reports the wall time of both steps and the modules that took longest
+to import (cumulative time, as printed by -X importtime):
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 10 --top 15 --budget 1.0 --json benchmarks/results/startup.json
+
+With --budget the script exits with status 1 when the median startup time exceeds it.
+No database or TMDb connection is needed as long as LAZY_STARTUP is on (the default).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import harness
+
+# Runs inside the child interpreter; the timings go to stdout, -X importtime writes to stderr
+CHILD_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "create_app_s": created - imported}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Parses the output of -X importtime.
+
+    :return: List of (module, self microseconds, cumulative microseconds, depth).
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def run_once(python, env):
+    """
+    Starts one interpreter and imports the backend.
+
+    :return: Dictionary with wall time, import and create_app time, and the parsed import table.
+    """
+    start = time.perf_counter()
+    child = subprocess.run([python, "-X", "importtime", "-c", CHILD_SCRIPT], cwd=harness.BACKEND_DIR,
+                           env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if child.returncode != 0:
+        raise SystemExit(f"Backend failed to start:\n{child.stderr[-2000:]}")
+    timings = json.loads(child.stdout.strip().splitlines()[-1])
+    return {"wall_s": wall, **timings, "imports": parse_importtime(child.stderr)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold start of the CineMood backend.")
+    parser.add_argument("--runs", type=int, default=5, help="Interpreter starts to measure.")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list.")
+    parser.add_argument("--eager", action="store_true", help="Measure with LAZY_STARTUP=false.")
+    parser.add_argument("--budget", type=float, help="Fail when the median wall time exceeds this (s).")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    env = dict(os.environ, LAZY_STARTUP="false" if args.eager else "true")
+    run_once(sys.executable, env)  # populate __pycache__ so every measured run is comparable
+    runs = [run_once(sys.executable, env) for _ in range(args.runs)]
+
+    summary = {key: round(statistics.median(r[key] for r in runs), 4)
+               for key in ("wall_s", "import_s", "create_app_s")}
+    print(f"median of {args.runs} runs: wall {summary['wall_s'] * 1e3:.1f} ms, "
+          f"import app {summary['import_s'] * 1e3:.1f} ms, create_app {summary['create_app_s'] * 1e3:.1f} ms")
+
+    # Top-level imports (depth 1) of the last run, the ones app.py pulls in directly or via site
+    slowest = sorted((row for row in runs[-1]["imports"] if row[3] <= 1), key=lambda row: -row[2])[:args.top]
+    print(f"\n{'module':<40}{'cumulative':>12}{'self':>10}")
+    for name, self_us, cumulative_us, _ in slowest:
+        print(f"{name:<40}{cumulative_us / 1e3:>9.1f} ms{self_us / 1e3:>7.1f} ms")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "lazy": not args.eager,
+                       "median": summary,
+                       "slowest_imports": [{"module": n, "cumulative_us": c, "self_us": s}
+                                           for n, s, c, _ in slowest]}, f, indent=2)
+
+    if args.budget is not None and summary["wall_s"] > args.budget:
+        print(f"\nMedian startup {summary['wall_s']:.3f}s exceeds the budget of {args.budget}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
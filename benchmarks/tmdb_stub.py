@@ -0,0 +1,235 @@
+"""
+Local stand-in for the TMDb v3 API, used by the benchmark suite.
+
+Serves deterministic synthetic data for the endpoints the backend calls
+(/discover/movie, /search/movie, /movie/<id>, /movie/<id>/credits, /movie/changes and
+/authentication)
+with a configurable artificial latency, so runs are reproducible and never touch the
+real API quota. A share of responses can be made much slower than the rest to model
+TMDb's latency tail.
+
+Run standalone with:
+    python benchmarks/tmdb_stub.py --port 8500 --latency 0.05 --jitter 0.02 --tail-rate 0.02 --tail-latency 0.5
+and start the backend with TMDB_BASE_URL=http://127.0.0.1:8500/3
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+GENRE_IDS = [28, 12, 16, 35, 80, 99, 18, 10751, 14, 36, 27, 10402, 9648, 10749, 878, 10770, 53, 10752, 37]
+WORDS = ["night", "river", "secret", "last", "summer", "city", "dream", "shadow", "journey", "star",
+         "heart", "storm", "garden", "echo", "winter", "road", "island", "signal", "mirror", "fire"]
+PAGE_SIZE = 20
+CHANGES_PER_DAY = 150
+CHANGES_PAGE_SIZE = 100
+
+
+def synthetic_movie(movie_id):
+    """
+    Builds the discover/search representation of a movie. The same id always yields
+    the same movie.
+    """
+    rng = random.Random(movie_id)
+    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+    return {
+        "id": movie_id,
+        "title": f"{title} {movie_id}",
+        "release_date": f"{rng.randint(1950, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "overview": " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 60))).capitalize() + ".",
+        "genre_ids": rng.sample(GENRE_IDS, rng.randint(1, 3)),
+        "poster_path": f"/poster{movie_id}.jpg",
+        "popularity": round(rng.uniform(1, 500), 3),
+        "vote_average": round(rng.uniform(1, 10), 1),
+    }
+
+
+def synthetic_details(movie_id):
+    movie = synthetic_movie(movie_id)
+    rng = random.Random(-movie_id)
+    movie["genres"] = [{"id": g, "name": str(g)} for g in movie.pop("genre_ids")]
+    movie["production_countries"] = [{"iso_3166_1": rng.choice(["US", "GB", "FR", "ES", "PL", "JP"]),
+                                      "name": "Country"}]
+    movie["runtime"] = rng.randint(80, 180)
+    return movie
+
+
+def synthetic_changes(start_date, end_date):
+    """
+    :return: Change feed entries of the movies changed between two ISO dates, the same
+             ones for the same days.
+    """
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    entries = {}
+    for day in range(start.toordinal(), end.toordinal() + 1):
+        rng = random.Random(day)
+        for movie_id in rng.sample(range(1, 5_000_000), CHANGES_PER_DAY):
+            entries[movie_id] = {"id": movie_id, "adult": rng.random() < 0.05}
+    return list(entries.values())
+
+
+def synthetic_credits(movie_id):
+    rng = random.Random(movie_id * 7919)
+    cast = [{"id": 100000 + rng.randint(0, 50000), "name": f"Actor {i}", "character": f"Role {i}",
+             "order": i} for i in range(rng.randint(5, 15))]
+    crew = [{"id": 200000 + rng.randint(0, 5000), "name": "Director", "job": "Director",
+             "department": "Directing"}]
+    crew += [{"id": 300000 + rng.randint(0, 50000), "name": f"Crew {i}", "job": "Producer",
+              "department": "Production"} for i in range(rng.randint(1, 5))]
+    return {"id": movie_id, "cast": cast, "crew": crew}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "TMDbStub/1.0"
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        path = url.path[len(stub.prefix):] if url.path.startswith(stub.prefix) else url.path
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        stub.record(path)
+        stub.sleep()
+
+        status, body = stub.route(path, params)
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class TMDbStub:
+    """
+    Threaded fake TMDb server.
+
+    :param latency: Fixed delay added to every response, in seconds.
+    :param jitter: Extra uniformly distributed delay in [0, jitter] seconds.
+    :param host: Interface to bind.
+    :param port: Port to bind, 0 picks a free one.
+    :param tail_rate: Share of responses that get tail_latency added on top.
+    :param tail_latency: Extra delay of the slow responses, in seconds.
+    """
+
+    prefix = "/3"
+
+    def __init__(self, latency=0.0, jitter=0.0, host="127.0.0.1", port=0, tail_rate=0.0, tail_latency=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.prefix}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="tmdb-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def record(self, path):
+        # Collapse ids so counts are per endpoint rather than per movie
+        endpoint = re.sub(r"/\d+", "/{id}", path)
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def sleep(self):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if self.tail_rate and random.random() < self.tail_rate:
+            delay += self.tail_latency
+        if delay > 0:
+            time.sleep(delay)
+
+    def route(self, path, params):
+        """
+        :return: (status code, JSON body) for a request path relative to /3.
+        """
+        if path == "/discover/movie":
+            return 200, self._page(params, seed=int(str(params.get("with_genres", "0")).split(",")[0] or 0))
+        if path == "/search/movie":
+            query = params.get("query", "")
+            return 200, self._page(params, seed=sum(map(ord, query)), title_prefix=query)
+        if path == "/movie/changes":
+            today = date.today().isoformat()
+            entries = synthetic_changes(params.get("start_date", today), params.get("end_date", today))
+            page = int(params.get("page", 1))
+            return 200, {"page": page, "results": entries[(page - 1) * CHANGES_PAGE_SIZE:page * CHANGES_PAGE_SIZE],
+                         "total_pages": max(1, -(-len(entries) // CHANGES_PAGE_SIZE)), "total_results": len(entries)}
+        if path == "/authentication":
+            return 200, {"success": True, "status_code": 1, "status_message": "Success."}
+        match = re.fullmatch(r"/movie/(\d+)(/credits)?", path)
+        if match:
+            movie_id = int(match.group(1))
+            if match.group(2):
+                return 200, synthetic_credits(movie_id)
+            details = synthetic_details(movie_id)
+            if "credits" in params.get("append_to_response", "").split(","):
+                details["credits"] = synthetic_credits(movie_id)
+            return 200, details
+        return 404, {"success": False, "status_code": 34, "status_message": "The resource could not be found."}
+
+    @staticmethod
+    def _page(params, seed, title_prefix=None):
+        page = int(params.get("page", 1))
+        base = (seed * 1000 + (page - 1) * PAGE_SIZE) % 5_000_000 + 1
+        results = [synthetic_movie(base + i) for i in range(PAGE_SIZE)]
+        if seed and "with_genres" in params:
+            for movie in results:
+                if seed not in movie["genre_ids"]:
+                    movie["genre_ids"][0] = seed
+        if title_prefix:
+            for movie in results:
+                movie["title"] = f"{title_prefix} {movie['title']}"
+        return {"page": page, "results": results, "total_pages": 500, "total_results": 500 * PAGE_SIZE}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local TMDb stub server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8500)
+    parser.add_argument("--latency", type=float, default=0.0, help="Fixed delay per response (s).")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay per response (s).")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Share of responses that are slow.")
+    parser.add_argument("--tail-latency", type=float, default=0.0, help="Extra delay of slow responses (s).")
+    args = parser.parse_args()
+
+    stub = TMDbStub(args.latency, args.jitter, args.host, args.port, args.tail_rate, args.tail_latency)
+    print(f"TMDb stub listening on {stub.url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Multi-worker throughput test: serves the backend with gunicorn (backend/gunicorn.conf.py)
+at several worker counts and drives /recommendations against the TMDb stub, to check
+that throughput scales with workers and that preloaded workers do not share sockets.
+
+    python benchmarks/workers.py --workers 1,2,4 --duration 10 --concurrency 16
+
+/recommendations only talks to TMDb, so no database is needed. Requires gunicorn
+(not available on Windows).
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import harness
+from loadgen import drive
+from tmdb_stub import TMDbStub
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(url, process, timeout=30.0):
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"gunicorn exited with status {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise SystemExit(f"gunicorn did not answer on {url} within {timeout}s")
+
+
+def run_workers(workers, stub_url, duration, concurrency, warmup):
+    """
+    Starts gunicorn with the given number of workers and measures /recommendations. The
+    workers are the single-threaded ones of gunicorn.conf.py, so concurrency is the worker count.
+
+    :return: Result dictionary from loadgen.drive.
+    """
+    port = _free_port()
+    env = dict(os.environ, TMDB_BASE_URL=stub_url, TMDB_API_KEY=os.getenv("TMDB_API_KEY", "bench"),
+               SECRET_KEY=os.getenv("SECRET_KEY", "bench-secret"), LAZY_STARTUP="true")
+    command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}",
+               "--workers", str(workers), "wsgi:app"]
+    process = subprocess.Popen(command, cwd=harness.BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_up(base_url + "/", process)
+        moods = iter(harness.MOODS * 1_000_000)
+
+        def recommendations():
+            return "POST", "/recommendations", {"mood": next(moods)}
+
+        return drive(base_url, recommendations, duration, concurrency, warmup)
+    finally:
+        process.terminate()
+        process.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput of the backend per gunicorn worker count.")
+    parser.add_argument("--workers", default="1,2,4", help="Comma separated worker counts.")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--tmdb-latency", type=float, default=0.02)
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = {}
+    with TMDbStub(args.tmdb_latency) as stub:
+        for workers in (int(w) for w in args.workers.split(",")):
+            r = run_workers(workers, stub.url, args.duration, args.concurrency, args.warmup)
+            results[workers] = r
+            print(f"{workers:>3} workers: {r['throughput_rps']:>8} req/s  p50 {r['p50_ms']} ms  "
+                  f"p99 {r['p99_ms']} ms  statuses {r['status_counts']}  errors {r['errors']}", flush=True)
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
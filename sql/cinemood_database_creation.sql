@@ -122,6 +122,37 @@ CREATE TABLE IF NOT EXISTS recommendations (
 
 
 
+# Catalog change log: one row per change to a movie, its genres or a director (movie_id NULL),
+# read by the backend to refresh its in-memory catalog snapshot incrementally. The backend
+# deletes rows older than CATALOG_CHANGE_RETENTION seconds.
+CREATE TABLE IF NOT EXISTS catalog_changes (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    movie_id INT NULL,
+    changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS movie_insert_change AFTER INSERT ON movie
+    FOR EACH ROW INSERT INTO catalog_changes (movie_id) VALUES (NEW.id);
+CREATE TRIGGER IF NOT EXISTS movie_update_change AFTER UPDATE ON movie
+    FOR EACH ROW INSERT INTO catalog_changes (movie_id) VALUES (NEW.id);
+CREATE TRIGGER IF NOT EXISTS movie_delete_change AFTER DELETE ON movie
+    FOR EACH ROW INSERT INTO catalog_changes (movie_id) VALUES (OLD.id);
+CREATE TRIGGER IF NOT EXISTS movie_genre_insert_change AFTER INSERT ON movie_genre
+    FOR EACH ROW INSERT INTO catalog_changes (movie_id) VALUES (NEW.movie_id);
+CREATE TRIGGER IF NOT EXISTS movie_genre_delete_change AFTER DELETE ON movie_genre
+    FOR EACH ROW INSERT INTO catalog_changes (movie_id) VALUES (OLD.movie_id);
+CREATE TRIGGER IF NOT EXISTS director_insert_change AFTER INSERT ON director
+    FOR EACH ROW INSERT INTO catalog_changes (movie_id) VALUES (NULL);
+CREATE TRIGGER IF NOT EXISTS director_update_change AFTER UPDATE ON director
+    FOR EACH ROW INSERT INTO catalog_changes (movie_id) VALUES (NULL);
+
+# Progress of background jobs, e.g. the catalog sync checkpoint
+CREATE TABLE IF NOT EXISTS sync_state (
+    name VARCHAR(50) PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
 /*-----------------------------------------
 ----- FEEDING DB WITH STATIC DATA ---------
 -------------------------------------------*/
@@ -79,6 +79,17 @@ class TestAuthHandler(unittest.TestCase):
         cls.cursor.close()
         cls.conn.close()
 
+    def fetch_one(self, query, params):
+        """
+        Runs a query on the AuthHandler's connection and returns the first row as a dictionary.
+        """
+        cursor = self.auth.conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+
     def test_register_user_success(self):
         """
         Test successful registration of a new user.
@@ -90,8 +101,7 @@ class TestAuthHandler(unittest.TestCase):
         password = "Test@1234"
         self.auth.register_user(username, password)
         # Verify that the user was correctly inserted into the database
-        self.auth.cursor.execute("SELECT username FROM users WHERE username = %s", (username,))
-        result = self.auth.cursor.fetchone()
+        result = self.fetch_one("SELECT username FROM users WHERE username = %s", (username,))
         self.assertIsNotNone(result)  # Check if user exists
         self.assertEqual(result['username'], username)  # Verify correct username was inserted
 
@@ -157,8 +167,7 @@ class TestAuthHandler(unittest.TestCase):
         self.assertEqual(user_info['username'], username)
         self.assertFalse(user_info['is_guest'])
         # Check if failed_attempts reset to 0 after successful login
-        self.auth.cursor.execute("SELECT failed_attempts FROM users WHERE username = %s", (username,))
-        result = self.auth.cursor.fetchone()
+        result = self.fetch_one("SELECT failed_attempts FROM users WHERE username = %s", (username,))
         self.assertEqual(result['failed_attempts'], 0)
 
     def test_login_user_failure(self):
@@ -183,8 +192,7 @@ class TestAuthHandler(unittest.TestCase):
                 self.assertIn(f"Too many failed attempts. Account '{username}' is locked for", str(context.exception))
 
         # Check if account is locked by verifying lockout_time is set
-        self.auth.cursor.execute("SELECT lockout_time FROM users WHERE username = %s", (username,))
-        result = self.auth.cursor.fetchone()
+        result = self.fetch_one("SELECT lockout_time FROM users WHERE username = %s", (username,))
         self.assertIsNotNone(result['lockout_time'])
 
     def test_password_hashing(self):
@@ -221,8 +229,7 @@ class TestAuthHandler(unittest.TestCase):
                 self.auth.login_user(username, wrong_password)
 
         # Verify that the account is locked
-        self.auth.cursor.execute("SELECT lockout_time FROM users WHERE username = %s", (username,))
-        result = self.auth.cursor.fetchone()
+        result = self.fetch_one("SELECT lockout_time FROM users WHERE username = %s", (username,))
         self.assertIsNotNone(result['lockout_time'])
 
         # Simulate time after lockout duration to ensure account unlock works
@@ -238,8 +245,7 @@ class TestAuthHandler(unittest.TestCase):
             self.assertFalse(user_info['is_guest'])
 
         # Verify that failed_attempts counter is reset after successful login
-        self.auth.cursor.execute("SELECT failed_attempts FROM users WHERE username = %s", (username,))
-        result = self.auth.cursor.fetchone()
+        result = self.fetch_one("SELECT failed_attempts FROM users WHERE username = %s", (username,))
         self.assertEqual(result['failed_attempts'], 0)
 
     def test_login_guest(self):
@@ -267,8 +273,7 @@ class TestAuthHandler(unittest.TestCase):
         self.assertTrue(guest_info['is_guest'])
 
         # Verify that 'Guest' does not exist in the users table
-        self.auth.cursor.execute("SELECT * FROM users WHERE username = %s", ('Guest',))
-        result = self.auth.cursor.fetchone()
+        result = self.fetch_one("SELECT * FROM users WHERE username = %s", ('Guest',))
         self.assertIsNone(result)
 
 